@@ -16,6 +16,7 @@ libdirs = ['../src']
 libdirs.append(os.path.join(transsys_home, 'lib'))
 libs = []
 libs.append('trans')
+libs.append('pthread')
 
 
 clib = distutils.core.Extension('transsys.clib',
@@ -1,6 +1,8 @@
 #include <Python.h>
+#include <structmember.h>
 
 #include <stdlib.h>
+#include <math.h>
 #include <stdio.h>
 #include <stdarg.h>
 #include <string.h>
@@ -11,7 +13,7 @@
  * The API version must be changed manually each time the API is
  * changed.
  */
-static char clib_api_version[] = "350";
+static char clib_api_version[] = "365";
 
 /*
  * Struct to contain pointers to Python classes that directly correspond
@@ -572,114 +574,6 @@ static PyObject *getPythonClass(char *modulename, char *classname)
 }
 
 
-static void freePythonClasses(void)
-{
-  Py_XDECREF(pythonClasses.ExpressionNode);
-  Py_XDECREF(pythonClasses.ExpressionNodeValue);
-  Py_XDECREF(pythonClasses.ExpressionNodeIdentifier);
-  Py_XDECREF(pythonClasses.ExpressionNodeBinary);
-  Py_XDECREF(pythonClasses.ExpressionNodeMult);
-  Py_XDECREF(pythonClasses.ExpressionNodeDiv);
-  Py_XDECREF(pythonClasses.ExpressionNodeAdd);
-  Py_XDECREF(pythonClasses.ExpressionNodeSubtract);
-  Py_XDECREF(pythonClasses.ExpressionNodeLower);
-  Py_XDECREF(pythonClasses.ExpressionNodeLowerEqual);
-  Py_XDECREF(pythonClasses.ExpressionNodeGreater);
-  Py_XDECREF(pythonClasses.ExpressionNodeGreaterEqual);
-  Py_XDECREF(pythonClasses.ExpressionNodeEqual);
-  Py_XDECREF(pythonClasses.ExpressionNodeUnequal);
-  Py_XDECREF(pythonClasses.ExpressionNodeNot);
-  Py_XDECREF(pythonClasses.ExpressionNodeAnd);
-  Py_XDECREF(pythonClasses.ExpressionNodeOr);
-  Py_XDECREF(pythonClasses.ExpressionNodeFunction);
-  Py_XDECREF(pythonClasses.ExpressionNodeUniformRandom);
-  Py_XDECREF(pythonClasses.ExpressionNodeGaussianRandom);
-  Py_XDECREF(pythonClasses.ExpressionNodePower);
-  Py_XDECREF(pythonClasses.ExpressionNodeLogarithm);
-  Py_XDECREF(pythonClasses.ExpressionNodeAtan);
-  Py_XDECREF(pythonClasses.PromoterElement);
-  Py_XDECREF(pythonClasses.PromoterElementLink);
-  Py_XDECREF(pythonClasses.PromoterElementConstitutive);
-  Py_XDECREF(pythonClasses.PromoterElementActivate);
-  Py_XDECREF(pythonClasses.PromoterElementRepress);
-  Py_XDECREF(pythonClasses.Factor);
-  Py_XDECREF(pythonClasses.Gene);
-  Py_XDECREF(pythonClasses.TranssysProgram);
-  Py_XDECREF(pythonClasses.GraphicsPrimitive);
-  Py_XDECREF(pythonClasses.GraphicsPrimitiveMove);
-  Py_XDECREF(pythonClasses.GraphicsPrimitivePush);
-  Py_XDECREF(pythonClasses.GraphicsPrimitivePop);
-  Py_XDECREF(pythonClasses.GraphicsPrimitiveTurn);
-  Py_XDECREF(pythonClasses.GraphicsPrimitiveRoll);
-  Py_XDECREF(pythonClasses.GraphicsPrimitiveBank);
-  Py_XDECREF(pythonClasses.GraphicsPrimitiveSphere);
-  Py_XDECREF(pythonClasses.GraphicsPrimitiveCylinder);
-  Py_XDECREF(pythonClasses.GraphicsPrimitiveBox);
-  Py_XDECREF(pythonClasses.GraphicsPrimitiveColor);
-  Py_XDECREF(pythonClasses.Symbol);
-  Py_XDECREF(pythonClasses.Assignment);
-  Py_XDECREF(pythonClasses.LhsSymbol);
-  Py_XDECREF(pythonClasses.ProductionElement);
-  Py_XDECREF(pythonClasses.Rule);
-  Py_XDECREF(pythonClasses.LsysProgram);
-  Py_XDECREF(pythonClasses.TranssysInstance);
-  Py_XDECREF(pythonClasses.SymbolInstance);
-  Py_XDECREF(pythonClasses.LsysSymbolString);
-  pythonClasses.ExpressionNode = NULL;
-  pythonClasses.ExpressionNodeValue = NULL;
-  pythonClasses.ExpressionNodeIdentifier = NULL;
-  pythonClasses.ExpressionNodeBinary = NULL;
-  pythonClasses.ExpressionNodeMult = NULL;
-  pythonClasses.ExpressionNodeDiv = NULL;
-  pythonClasses.ExpressionNodeAdd = NULL;
-  pythonClasses.ExpressionNodeSubtract = NULL;
-  pythonClasses.ExpressionNodeLower = NULL;
-  pythonClasses.ExpressionNodeLowerEqual = NULL;
-  pythonClasses.ExpressionNodeGreater = NULL;
-  pythonClasses.ExpressionNodeGreaterEqual = NULL;
-  pythonClasses.ExpressionNodeEqual = NULL;
-  pythonClasses.ExpressionNodeUnequal = NULL;
-  pythonClasses.ExpressionNodeNot = NULL;
-  pythonClasses.ExpressionNodeAnd = NULL;
-  pythonClasses.ExpressionNodeOr = NULL;
-  pythonClasses.ExpressionNodeFunction = NULL;
-  pythonClasses.ExpressionNodeUniformRandom = NULL;
-  pythonClasses.ExpressionNodeGaussianRandom = NULL;
-  pythonClasses.ExpressionNodePower = NULL;
-  pythonClasses.ExpressionNodeLogarithm = NULL;
-  pythonClasses.ExpressionNodeAtan = NULL;
-  pythonClasses.PromoterElement = NULL;
-  pythonClasses.PromoterElementLink = NULL;
-  pythonClasses.PromoterElementConstitutive = NULL;
-  pythonClasses.PromoterElementActivate = NULL;
-  pythonClasses.PromoterElementRepress = NULL;
-  pythonClasses.Factor = NULL;
-  pythonClasses.Gene = NULL;
-  pythonClasses.TranssysProgram = NULL;
-  pythonClasses.GraphicsPrimitive = NULL;
-  pythonClasses.GraphicsPrimitiveMove = NULL;
-  pythonClasses.GraphicsPrimitivePush = NULL;
-  pythonClasses.GraphicsPrimitivePop = NULL;
-  pythonClasses.GraphicsPrimitiveTurn = NULL;
-  pythonClasses.GraphicsPrimitiveRoll = NULL;
-  pythonClasses.GraphicsPrimitiveBank = NULL;
-  pythonClasses.GraphicsPrimitiveSphere = NULL;
-  pythonClasses.GraphicsPrimitiveCylinder = NULL;
-  pythonClasses.GraphicsPrimitiveBox = NULL;
-  pythonClasses.GraphicsPrimitiveColor = NULL;
-  pythonClasses.Symbol = NULL;
-  pythonClasses.Assignment = NULL;
-  pythonClasses.LhsSymbol = NULL;
-  pythonClasses.ProductionElement = NULL;
-  pythonClasses.Rule = NULL;
-  pythonClasses.LsysProgram = NULL;
-  pythonClasses.TranssysInstance = NULL;
-  pythonClasses.SymbolInstance = NULL;
-  pythonClasses.LsysSymbolString = NULL;
-  pythonClasses.initialised = 0;
-}
-
-
 static void initExpressionNodetypeMap(const PYTHON_CLASSES *pc, EXPRESSION_NODETYPE_MAPENTRY map[])
 {
   int i = 0;
@@ -1183,6 +1077,37 @@ static PyObject *newTranssysInstance(PyObject *python_transsys, const TRANSSYS_I
 }
 
 
+/*
+ * Construct a new Python TranssysInstance object and set its timestep.
+ */
+static PyObject *newTranssysInstanceAtTimestep(PyObject *python_transsys, const TRANSSYS_INSTANCE *ti, long timestep)
+{
+  PyObject *python_ti, *python_ts;
+
+  python_ti = newTranssysInstance(python_transsys, ti);
+  if (python_ti == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "newTranssysInstanceAtTimestep: newTranssysInstance failed\n");
+    return (NULL);
+  }
+  python_ts = PyInt_FromLong(timestep);
+  if (python_ts == NULL)
+  {
+    Py_DECREF(python_ti);
+    return (NULL);
+  }
+  if (PyObject_SetAttrString(python_ti, "timestep", python_ts) == -1)
+  {
+    clib_message(CLIB_MSG_TRACE, "newTranssysInstanceAtTimestep: PyObject_SetAttrString failed for \"timestep\"\n");
+    Py_DECREF(python_ts);
+    Py_DECREF(python_ti);
+    return (NULL);
+  }
+  Py_DECREF(python_ts);
+  return (python_ti);
+}
+
+
 /*
  * Construct a new Python SymbolInstance object.
  */
@@ -1313,6 +1238,135 @@ static GRAPHICS_PRIMITIVE_TYPE identify_graphics_primitive_type(PyObject *python
 }
 
 
+/*
+ * Record of the value nodes created while extracting a program.
+ * While value_node_record is not NULL, extract_expression_value
+ * adds each value node it creates to the record, along with the
+ * Python ExpressionNodeValue instance that the node was extracted
+ * from. python_node_index maps the id of the Python node to its
+ * index in the record.
+ */
+typedef struct
+{
+  PyObject *python_node_list;
+  PyObject *python_node_index;
+  size_t num_value_nodes;
+  size_t array_size;
+  EXPRESSION_NODE **value_node;
+} VALUE_NODE_RECORD;
+
+
+static VALUE_NODE_RECORD *value_node_record = NULL;
+
+
+static void init_value_node_record(VALUE_NODE_RECORD *r)
+{
+  r->python_node_list = NULL;
+  r->python_node_index = NULL;
+  r->num_value_nodes = 0;
+  r->array_size = 0;
+  r->value_node = NULL;
+}
+
+
+static void free_value_node_record_components(VALUE_NODE_RECORD *r)
+{
+  Py_XDECREF(r->python_node_list);
+  Py_XDECREF(r->python_node_index);
+  if (r->value_node)
+  {
+    free(r->value_node);
+  }
+  init_value_node_record(r);
+}
+
+
+static int alloc_value_node_record_components(VALUE_NODE_RECORD *r)
+{
+  r->python_node_list = PyList_New(0);
+  if (r->python_node_list == NULL)
+  {
+    return (-1);
+  }
+  r->python_node_index = PyDict_New();
+  if (r->python_node_index == NULL)
+  {
+    free_value_node_record_components(r);
+    return (-1);
+  }
+  return (0);
+}
+
+
+static int add_value_node(VALUE_NODE_RECORD *r, PyObject *python_node, EXPRESSION_NODE *node)
+{
+  EXPRESSION_NODE **a;
+  PyObject *python_id, *python_i;
+  int return_value;
+
+  if (r->num_value_nodes == r->array_size)
+  {
+    a = (EXPRESSION_NODE **) realloc(r->value_node, (2 * r->array_size + 16) * sizeof(EXPRESSION_NODE *));
+    if (a == NULL)
+    {
+      PyErr_SetString(PyExc_MemoryError, "add_value_node: realloc failed");
+      return (-1);
+    }
+    r->value_node = a;
+    r->array_size = 2 * r->array_size + 16;
+  }
+  python_id = PyLong_FromVoidPtr(python_node);
+  if (python_id == NULL)
+  {
+    return (-1);
+  }
+  python_i = PyInt_FromLong(r->num_value_nodes);
+  if (python_i == NULL)
+  {
+    Py_DECREF(python_id);
+    return (-1);
+  }
+  return_value = PyDict_SetItem(r->python_node_index, python_id, python_i);
+  Py_DECREF(python_id);
+  Py_DECREF(python_i);
+  if (return_value != 0)
+  {
+    return (-1);
+  }
+  /* the list keeps the node alive, so its id cannot be reused */
+  if (PyList_Append(r->python_node_list, python_node) != 0)
+  {
+    return (-1);
+  }
+  r->value_node[r->num_value_nodes++] = node;
+  return (0);
+}
+
+
+/*
+ * Find the C level value node extracted from python_node. Returns
+ * NULL (with an exception set) if python_node is not in the record.
+ */
+static EXPRESSION_NODE *find_value_node(const VALUE_NODE_RECORD *r, PyObject *python_node)
+{
+  PyObject *python_id, *python_i;
+
+  python_id = PyLong_FromVoidPtr(python_node);
+  if (python_id == NULL)
+  {
+    return (NULL);
+  }
+  python_i = PyDict_GetItem(r->python_node_index, python_id);
+  Py_DECREF(python_id);
+  if (python_i == NULL)
+  {
+    PyErr_SetString(PyExc_ValueError, "find_value_node: node is not a value node of the compiled program");
+    return (NULL);
+  }
+  return (r->value_node[PyInt_AsLong(python_i)]);
+}
+
+
 static EXPRESSION_NODE *extract_expression_value(PyObject *python_node)
 {
   PyObject *v_obj;
@@ -1342,6 +1396,16 @@ static EXPRESSION_NODE *extract_expression_value(PyObject *python_node)
   if (expression == NULL)
   {
     clib_message(CLIB_MSG_ERROR, "extract_expression_value: new_expression_node failed\n");
+    return (NULL);
+  }
+  if (value_node_record)
+  {
+    if (add_value_node(value_node_record, python_node, expression) != 0)
+    {
+      clib_message(CLIB_MSG_TRACE, "extract_expression_value: add_value_node failed\n");
+      free_expression_tree(expression);
+      return (NULL);
+    }
   }
   return (expression);
 }
@@ -3195,7 +3259,7 @@ static int extract_initial_factor_concentrations(PyObject *python_ti, TRANSSYS_I
   num_factors = PyList_Size(python_fc_start);
   if (num_factors != ti->transsys->num_factors)
   {
-    clib_message(CLIB_MSG_ERROR, "extract_initial_factor_concentrations: python_ti and ti num_factors mismatch");
+    PyErr_SetString(PyExc_ValueError, "extract_initial_factor_concentrations: python_ti and ti num_factors mismatch");
     Py_DECREF(python_fc_start);
     return (-1);
   }
@@ -3225,100 +3289,267 @@ static int extract_initial_factor_concentrations(PyObject *python_ti, TRANSSYS_I
 
 
 /*
- * Construct a time series of transsys instances
+ * Simulations run with the global interpreter lock released, so that
+ * other Python threads (including other simulations) can proceed. This
+ * is not done for programs that use random numbers, because the state
+ * of the random number generator is global. Only C level structures
+ * that are not accessible from Python may be used while the lock is
+ * released.
  */
-static PyObject *transsysInstanceTimeSeries(PyObject *python_ti_start, long num_timesteps, long sampling_period)
+static PyThreadState *begin_simulation(int uses_random)
 {
-  TRANSSYS *tp;
-  TRANSSYS_INSTANCE *ti;
-  PyObject *python_tp, *python_ti_list, *python_ts;
-  long i;
-
-  if (!checkClass(python_ti_start, pythonClasses.TranssysInstance, "transsysInstanceTimeSeries: python_ti_start is not an instance of TranssysInstance"))
+  if (uses_random)
   {
     return (NULL);
   }
-  python_tp = PyObject_GetAttrString(python_ti_start, "transsys_program");
-  if (python_tp == NULL)
+  return (PyEval_SaveThread());
+}
+
+
+static void end_simulation(PyThreadState *thread_state)
+{
+  if (thread_state != NULL)
   {
-    clib_message(CLIB_MSG_TRACE, "transsysInstanceTimeSeries: PyObject_GetAttrString failed for \"transsys_program\"\n");
-    return (NULL);
+    PyEval_RestoreThread(thread_state);
   }
-  tp = extract_transsys(python_tp);
-  if (tp == NULL)
+}
+
+
+/*
+ * Set up the random number generator for a simulation. If python_seed
+ * is NULL or None, *seeded_state is set to NULL, indicating that the
+ * global random number generator is to be used. Otherwise, urandom_state
+ * is seeded with python_seed and *seeded_state is set to urandom_state.
+ */
+static int extract_urandom_state(PyObject *python_seed, URANDOM_STATE *urandom_state, URANDOM_STATE **seeded_state)
+{
+  unsigned long seed;
+
+  if ((python_seed == NULL) || (python_seed == Py_None))
   {
-    clib_message(CLIB_MSG_TRACE, "transsysInstanceTimeSeries: extract_transsys failed\n");
-    Py_DECREF(python_tp);
+    *seeded_state = NULL;
+    return (0);
+  }
+  if (!PyInt_Check(python_seed) && !PyLong_Check(python_seed))
+  {
+    PyErr_SetString(PyExc_TypeError, "extract_urandom_state: seed must be an integer or None");
+    return (-1);
+  }
+  seed = PyInt_AsUnsignedLongMask(python_seed);
+  if (PyErr_Occurred() != NULL)
+  {
+    return (-1);
+  }
+  urandom_state_seed(urandom_state, (unsigned int) seed);
+  *seeded_state = urandom_state;
+  return (0);
+}
+
+
+static long num_samples(long num_timesteps, long sampling_period)
+{
+  return ((num_timesteps > 0) ? (num_timesteps + sampling_period - 1) / sampling_period : 0);
+}
+
+
+/*
+ * The transsys program's expressions are compiled into bytecode for
+ * each simulation, so constant expressions are folded once per
+ * simulation and changes of the program's values between simulations
+ * take effect. If the program cannot be compiled, NULL is returned and
+ * expressions are evaluated by process_expression instead. As this
+ * happens for every simulation, it is reported at trace level only.
+ * The bytecode's registers are stored in *value.
+ */
+static TRANSSYS_BYTECODE *new_simulation_bytecode(const TRANSSYS *tp, double **value)
+{
+  TRANSSYS_BYTECODE *bc;
+
+  *value = NULL;
+  if (!transsys_bytecode_compilable(tp))
+  {
+    clib_message(CLIB_MSG_TRACE, "new_simulation_bytecode: transsys \"%s\" cannot be compiled, using process_expression\n", tp->name);
     return (NULL);
   }
+  bc = new_transsys_bytecode(tp);
+  if (bc != NULL)
+  {
+    *value = new_bytecode_registers(bc);
+    if (*value == NULL)
+    {
+      free_transsys_bytecode(bc);
+      bc = NULL;
+    }
+  }
+  return (bc);
+}
+
+
+static void free_simulation_bytecode(TRANSSYS_BYTECODE *bc, double *value)
+{
+  if (bc != NULL)
+  {
+    free(value);
+    free_transsys_bytecode(bc);
+  }
+}
+
+
+/*
+ * Run num_timesteps steps of expression on ti, storing the factor
+ * concentrations of every sampling_period-th step (starting with
+ * the initial state) in consecutive rows of sample, unless sample
+ * is NULL. Does not use the Python API.
+ */
+static void simulate_transsys_instance(TRANSSYS_INSTANCE *ti, long num_timesteps, long sampling_period, double *sample)
+{
+  size_t num_factors = ti->transsys->num_factors;
+  TRANSSYS_BYTECODE *bc;
+  double *value;
+  long i;
+
+  bc = new_simulation_bytecode(ti->transsys, &value);
+  for (i = 0; i < num_timesteps; i++)
+  {
+    if ((sample != NULL) && (i % sampling_period == 0))
+    {
+      memcpy(sample, ti->factor_concentration, num_factors * sizeof(double));
+      sample += num_factors;
+    }
+    if (bc != NULL)
+    {
+      process_expression_bytecode(ti, bc, value);
+    }
+    else
+    {
+      process_expression(ti);
+    }
+  }
+  free_simulation_bytecode(bc, value);
+}
+
+
+/*
+ * Construct a time series of transsys instances, using the C level
+ * transsys program tp, which must have been extracted from the
+ * Python transsys program python_tp. The transsys program is not
+ * altered (and not freed) by this function. Random numbers are
+ * drawn using urandom_state, or from the global generator if
+ * urandom_state is NULL. The simulation is run first, with the
+ * global interpreter lock released unless uses_random is nonzero
+ * and the global generator is used, the transsys instances are
+ * constructed afterwards.
+ */
+static PyObject *transsysTimeSeries(PyObject *python_tp, const TRANSSYS *tp, int uses_random, URANDOM_STATE *urandom_state, PyObject *python_ti_start, long num_timesteps, long sampling_period)
+{
+  TRANSSYS_INSTANCE *ti;
+  PyThreadState *thread_state;
+  PyObject *python_ti_list, *python_ts;
+  double *sample;
+  long i, n;
+
   ti = new_transsys_instance(tp);
   if (ti == NULL)
   {
-    clib_message(CLIB_MSG_TRACE, "transsysInstanceTimeSeries: new_transsys_instance failed\n");
-    free_transsys_list(tp);
-    Py_DECREF(python_tp);
+    clib_message(CLIB_MSG_TRACE, "transsysTimeSeries: new_transsys_instance failed\n");
+    PyErr_SetString(PyExc_MemoryError, "transsysTimeSeries: new_transsys_instance failed");
     return (NULL);
   }
   if (extract_initial_factor_concentrations(python_ti_start, ti) != 0)
   {
-    clib_message(CLIB_MSG_TRACE, "transsysInstanceTimeSeries: extract_initial_factor_concentrations failed\n");
+    clib_message(CLIB_MSG_TRACE, "transsysTimeSeries: extract_initial_factor_concentrations failed\n");
+    free_transsys_instance(ti);
+    return (NULL);
+  }
+  n = num_samples(num_timesteps, sampling_period);
+  sample = (double *) malloc((n * tp->num_factors > 0 ? n * tp->num_factors : 1) * sizeof(double));
+  if (sample == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "transsysTimeSeries: malloc failed\n");
+    PyErr_SetString(PyExc_MemoryError, "transsysTimeSeries: malloc failed");
     free_transsys_instance(ti);
-    free_transsys_list(tp);
-    Py_DECREF(python_tp);
     return (NULL);
   }
+  ti->urandom_state = urandom_state;
+  thread_state = begin_simulation(uses_random && (urandom_state == NULL));
+  simulate_transsys_instance(ti, num_timesteps, sampling_period, sample);
+  end_simulation(thread_state);
   python_ti_list = PyList_New(0);
   if (python_ti_list == NULL)
   {
-    clib_message(CLIB_MSG_TRACE, "transsysInstanceTimeSeries: PyList_New failed\n");
+    clib_message(CLIB_MSG_TRACE, "transsysTimeSeries: PyList_New failed\n");
+    free(sample);
     free_transsys_instance(ti);
-    free_transsys_list(tp);
-    Py_DECREF(python_tp);
     return (NULL);
   }
-  for (i = 0; i < num_timesteps; i++)
+  for (i = 0; i < n; i++)
   {
-    if (i % sampling_period == 0)
+    PyObject *python_ti;
+    clib_message(CLIB_MSG_TRACE, "transsysTimeSeries: time step %ld\n", i * sampling_period);
+    memcpy(ti->factor_concentration, sample + i * tp->num_factors, tp->num_factors * sizeof(double));
+    python_ti = newTranssysInstance(python_tp, ti);
+    if (python_ti == NULL)
     {
-      PyObject *python_ti;
-      clib_message(CLIB_MSG_TRACE, "transsysInstanceTimeSeries: time step %d\n", i);
-      python_ti = newTranssysInstance(python_tp, ti);
-      if (python_ti == NULL)
-      {
-	clib_message(CLIB_MSG_TRACE, "transsysInstanceTimeSeries: newTranssysInstance failed\n");
-	free_transsys_instance(ti);
-	free_transsys_list(tp);
-	Py_DECREF(python_tp);
-	Py_DECREF(python_ti_list);
-	return (NULL);
-      }
-      python_ts = PyInt_FromLong(i);
-      if (PyObject_SetAttrString(python_ti, "timestep", python_ts) == -1)
-      {
-	clib_message(CLIB_MSG_TRACE, "transsysInstanceTimeSeries: PyObject_SetAttrString failed for \"timestep\"\n");
-	free_transsys_instance(ti);
-	free_transsys_list(tp);
-	Py_DECREF(python_tp);
-	Py_DECREF(python_ti);
-	Py_DECREF(python_ti_list);
-	return (NULL);
-      }
-      Py_DECREF(python_ts);
-      if (PyList_Append(python_ti_list, python_ti) == -1)
-      {
-	clib_message(CLIB_MSG_TRACE, "transsysInstanceTimeSeries: PyList_Append failed for timestep %d\n", i);
-	free_transsys_instance(ti);
-	free_transsys_list(tp);
-	Py_DECREF(python_tp);
-	Py_DECREF(python_ti);
-	Py_DECREF(python_ti_list);
-	return (NULL);
-      }
+      clib_message(CLIB_MSG_TRACE, "transsysTimeSeries: newTranssysInstance failed\n");
+      free(sample);
+      free_transsys_instance(ti);
+      Py_DECREF(python_ti_list);
+      return (NULL);
+    }
+    python_ts = PyInt_FromLong(i * sampling_period);
+    if (PyObject_SetAttrString(python_ti, "timestep", python_ts) == -1)
+    {
+      clib_message(CLIB_MSG_TRACE, "transsysTimeSeries: PyObject_SetAttrString failed for \"timestep\"\n");
+      free(sample);
+      free_transsys_instance(ti);
       Py_DECREF(python_ti);
+      Py_DECREF(python_ti_list);
+      return (NULL);
+    }
+    Py_DECREF(python_ts);
+    if (PyList_Append(python_ti_list, python_ti) == -1)
+    {
+      clib_message(CLIB_MSG_TRACE, "transsysTimeSeries: PyList_Append failed for timestep %ld\n", i * sampling_period);
+      free(sample);
+      free_transsys_instance(ti);
+      Py_DECREF(python_ti);
+      Py_DECREF(python_ti_list);
+      return (NULL);
     }
-    process_expression(ti);
+    Py_DECREF(python_ti);
   }
+  free(sample);
   free_transsys_instance(ti);
+  return (python_ti_list);
+}
+
+
+/*
+ * Construct a time series of transsys instances
+ */
+static PyObject *transsysInstanceTimeSeries(PyObject *python_ti_start, long num_timesteps, long sampling_period, URANDOM_STATE *urandom_state)
+{
+  TRANSSYS *tp;
+  PyObject *python_tp, *python_ti_list;
+
+  if (!checkClass(python_ti_start, pythonClasses.TranssysInstance, "transsysInstanceTimeSeries: python_ti_start is not an instance of TranssysInstance"))
+  {
+    return (NULL);
+  }
+  python_tp = PyObject_GetAttrString(python_ti_start, "transsys_program");
+  if (python_tp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "transsysInstanceTimeSeries: PyObject_GetAttrString failed for \"transsys_program\"\n");
+    return (NULL);
+  }
+  tp = extract_transsys(python_tp);
+  if (tp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "transsysInstanceTimeSeries: extract_transsys failed\n");
+    Py_DECREF(python_tp);
+    return (NULL);
+  }
+  python_ti_list = transsysTimeSeries(python_tp, tp, transsys_uses_random(tp), urandom_state, python_ti_start, num_timesteps, sampling_period);
   free_transsys_list(tp);
   Py_DECREF(python_tp);
   return (python_ti_list);
@@ -3328,6 +3559,7 @@ static PyObject *transsysInstanceTimeSeries(PyObject *python_ti_start, long num_
 static PyObject *clib_timeseries(PyObject *self, PyObject *args)
 {
   PyObject *python_ti_start, *python_int, *python_ti_list;
+  URANDOM_STATE urandom_state, *seeded_state;
   long num_timesteps, sampling_period;
 
   refcountDebug_init();
@@ -3338,9 +3570,14 @@ static PyObject *clib_timeseries(PyObject *self, PyObject *args)
     refcountDebug_report("clib_timeseries returning exception", 0);
     return (NULL);
   }
-  if (PyTuple_Size(args) != 3)
+  if ((PyTuple_Size(args) != 3) && (PyTuple_Size(args) != 4))
+  {
+    PyErr_SetString(PyExc_TypeError, "3 or 4 arguments required: self (transsys instance), num_timesteps, sampling_period, [seed]");
+    refcountDebug_report("clib_timeseries returning exception", 0);
+    return (NULL);
+  }
+  if (extract_urandom_state((PyTuple_Size(args) == 4) ? PyTuple_GetItem(args, 3) : NULL, &urandom_state, &seeded_state) != 0)
   {
-    PyErr_SetString(PyExc_TypeError, "exactly 3 arguments required: self (transsys instance), num_timesteps, sampling_period");
     refcountDebug_report("clib_timeseries returning exception", 0);
     return (NULL);
   }
@@ -3378,6 +3615,12 @@ static PyObject *clib_timeseries(PyObject *self, PyObject *args)
   }
   sampling_period = PyInt_AsLong(python_int);
   Py_DECREF(python_int);
+  if (sampling_period < 1)
+  {
+    PyErr_SetString(PyExc_ValueError, "clib_timeseries: sampling period must be positive");
+    refcountDebug_report("clib_timeseries returning exception", 0);
+    return (NULL);
+  }
   python_ti_start = PyTuple_GetItem(args, 0);
   if (python_ti_start == NULL)
   {
@@ -3387,7 +3630,7 @@ static PyObject *clib_timeseries(PyObject *self, PyObject *args)
   }
   Py_INCREF(python_ti_start);
   clib_message(CLIB_MSG_TRACE, "num_timesteps = %ld, sampling_period = %ld\n", num_timesteps, sampling_period);
-  python_ti_list = transsysInstanceTimeSeries(python_ti_start, num_timesteps, sampling_period);
+  python_ti_list = transsysInstanceTimeSeries(python_ti_start, num_timesteps, sampling_period, seeded_state);
   if (python_ti_list == NULL)
   {
     clib_message(CLIB_MSG_TRACE, "transsysInstanceTimeSeries failed\n");
@@ -3585,90 +3828,121 @@ static PyObject *make_LsysSymbolString(PyObject *python_lsys, LSYS_STRING *lstr)
 }
 
 
-static PyObject *lsysStringSeries(PyObject *python_lsys, int num_timesteps, int sampling_period)
+/*
+ * Construct a Python lsys symbol string from lstr and set its timestep.
+ */
+static PyObject *makeLsysSymbolStringAtTimestep(PyObject *python_lsys, LSYS_STRING *lstr, long timestep)
 {
-  PyObject *python_lstring_list, *python_lstr, *python_timestep;
-  LSYS *lsys;
-  LSYS_STRING *lstr, *lstr_next;
-  int t;
+  PyObject *python_lstr, *python_timestep;
 
-  python_lstring_list = PyList_New(0);
-  clib_message(CLIB_MSG_TRACE, "lsysStringSeries: python_lstring_list = %p\n", (void *) python_lstring_list);
-  if (python_lstring_list == NULL)
+  python_lstr = make_LsysSymbolString(python_lsys, lstr);
+  if (python_lstr == NULL)
   {
-    clib_message(CLIB_MSG_TRACE, "lsysStringSeries: PyList_New failed\n");
+    clib_message(CLIB_MSG_TRACE, "makeLsysSymbolStringAtTimestep: make_LsysSymbolString failed\n");
     return (NULL);
   }
-  lsys = extract_lsys(python_lsys);
-  if (lsys == NULL)
+  python_timestep = PyInt_FromLong(timestep);
+  if (python_timestep == NULL)
   {
-    clib_message(CLIB_MSG_TRACE, "lsysStringSeries: extract_lsys failed\n");
-    Py_DECREF(python_lstring_list);
+    clib_message(CLIB_MSG_TRACE, "makeLsysSymbolStringAtTimestep: PyInt_FromLong failed\n");
+    Py_DECREF(python_lstr);
     return (NULL);
   }
-  clib_message(CLIB_MSG_TRACE, "lsysStringSeries: extract_lsys succeeded\n");
-  lstr = axiom_string(lsys);
-  if (lstr == NULL)
+  if (PyObject_SetAttrString(python_lstr, "timestep", python_timestep) == -1)
   {
-    clib_message(CLIB_MSG_TRACE, "lsysStringSeries: axiom_string failed\n");
-    Py_DECREF(python_lstring_list);
-    free_lsys_with_transsys(lsys);
+    clib_message(CLIB_MSG_TRACE, "makeLsysSymbolStringAtTimestep: PyObject_SetAttrString failed \"timestep\"\n");
+    Py_DECREF(python_timestep);
+    Py_DECREF(python_lstr);
     return (NULL);
   }
-  clib_message(CLIB_MSG_TRACE, "lsysStringSeries: axiom_string succeeded\n");
+  Py_DECREF(python_timestep);
+  return (python_lstr);
+}
+
+
+static PyObject *makeLsysSymbolStringColumns(PyObject *python_lsys, const LSYS_STRING *lstr, long timestep, PyObject *python_tp_filter);
+
+
+/*
+ * Construct a derivation series of lsys symbol strings, using the
+ * C level lsys, which must have been extracted from the Python lsys
+ * program python_lsys. The lsys is not freed by this function.
+ * Random numbers are drawn using urandom_state, or from the global
+ * generator if urandom_state is NULL. Each derivation step is computed
+ * with the global interpreter lock released unless uses_random is
+ * nonzero and the global generator is used. If columns is nonzero,
+ * the lsys strings are returned in columnar form, as constructed by
+ * makeLsysSymbolStringColumns. Expression, diffusion and derivation are
+ * computed using up to num_threads threads.
+ */
+static PyObject *lsysDerivationSeries(PyObject *python_lsys, const LSYS *lsys, int uses_random, URANDOM_STATE *urandom_state, int num_timesteps, int sampling_period, int columns, PyObject *python_tp_filter, int num_threads)
+{
+  PyThreadState *thread_state;
+  PyObject *python_lstring_list, *python_lstr;
+  LSYS_STRING_BUFFER buffer;
+  LSYS_STRING *lstr, *lstr_next;
+  int t;
+
+  python_lstring_list = PyList_New(0);
+  clib_message(CLIB_MSG_TRACE, "lsysDerivationSeries: python_lstring_list = %p\n", (void *) python_lstring_list);
+  if (python_lstring_list == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "lsysDerivationSeries: PyList_New failed\n");
+    return (NULL);
+  }
+  init_lsys_string_buffer(&buffer);
+  lstr = axiom_string_arena(lsys, urandom_state, lsys_string_buffer_next_arena(&buffer));
+  if (lstr == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "lsysDerivationSeries: axiom_string failed\n");
+    Py_DECREF(python_lstring_list);
+    free_lsys_string_buffer_components(&buffer);
+    return (NULL);
+  }
+  clib_message(CLIB_MSG_TRACE, "lsysDerivationSeries: axiom_string succeeded\n");
   for (t = 0; t < num_timesteps; t++)
   {
-    clib_message(CLIB_MSG_TRACE, "lsysStringSeries: time step %d, %lu symbols\n", t, (unsigned long) lstr->num_symbols);
-    lsys_string_expression(lstr);
-    lsys_string_diffusion(lstr);
-    lstr_next = derived_string(lstr);
+    clib_message(CLIB_MSG_TRACE, "lsysDerivationSeries: time step %d, %lu symbols\n", t, (unsigned long) lstr->num_symbols);
+    thread_state = begin_simulation(uses_random && (urandom_state == NULL));
+    lsys_string_expression_threads(lstr, num_threads);
+    lsys_string_diffusion_threads(lstr, num_threads);
+    lstr_next = derived_string_threads(lstr, lsys_string_buffer_next_arena(&buffer), num_threads);
+    end_simulation(thread_state);
     if (lstr_next == NULL)
     {
-      clib_message(CLIB_MSG_TRACE, "lsysStringSeries: derived_string failed\n");
+      clib_message(CLIB_MSG_TRACE, "lsysDerivationSeries: derived_string failed\n");
       Py_DECREF(python_lstring_list);
       free_lsys_string(lstr);
-      free_lsys_with_transsys(lsys);
+      free_lsys_string_buffer_components(&buffer);
       return (NULL);
     }
     if ((t % sampling_period) == 0)
     {
-      python_lstr = make_LsysSymbolString(python_lsys, lstr);
-      if (python_lstr == NULL)
+      if (columns)
       {
-	clib_message(CLIB_MSG_TRACE, "lsysStringSeries: make_LsysSymbolString failed\n");
-	Py_DECREF(python_lstring_list);
-	free_lsys_string(lstr);
-	free_lsys_with_transsys(lsys);
-	return (NULL);
+	python_lstr = makeLsysSymbolStringColumns(python_lsys, lstr, t, python_tp_filter);
       }
-      python_timestep = PyInt_FromLong(t);
-      if (python_timestep == NULL)
+      else
       {
-	clib_message(CLIB_MSG_TRACE, "lsysStringSeries: PyInt_FromLong failed\n");
-	Py_DECREF(python_lstring_list);
-	Py_DECREF(python_lstr);
-	free_lsys_string(lstr);
-	free_lsys_with_transsys(lsys);
-	return (NULL);
+	python_lstr = makeLsysSymbolStringAtTimestep(python_lsys, lstr, t);
       }
-      if (PyObject_SetAttrString(python_lstr, "timestep", python_timestep) == -1)
+      if (python_lstr == NULL)
       {
-	clib_message(CLIB_MSG_TRACE, "lsysStringSeries: PyObject_SetAttrString failed \"timestep\"\n");
+	clib_message(CLIB_MSG_TRACE, "lsysDerivationSeries: failed to make lsys string\n");
 	Py_DECREF(python_lstring_list);
-	Py_DECREF(python_timestep);
-	Py_DECREF(python_lstr);
+	free_lsys_string(lstr_next);
 	free_lsys_string(lstr);
-	free_lsys_with_transsys(lsys);
+	free_lsys_string_buffer_components(&buffer);
 	return (NULL);
       }
-      Py_DECREF(python_timestep);
       if (PyList_Append(python_lstring_list, python_lstr) != 0)
       {
-	clib_message(CLIB_MSG_TRACE, "lsysStringSeries: PyList_Append failed\n");
+	clib_message(CLIB_MSG_TRACE, "lsysDerivationSeries: PyList_Append failed\n");
 	Py_DECREF(python_lstring_list);
 	Py_DECREF(python_lstr);
+	free_lsys_string(lstr_next);
 	free_lsys_string(lstr);
-	free_lsys_with_transsys(lsys);
+	free_lsys_string_buffer_components(&buffer);
 	return (NULL);
       }
       Py_DECREF(python_lstr);
@@ -3677,6 +3951,24 @@ static PyObject *lsysStringSeries(PyObject *python_lsys, int num_timesteps, int
     lstr = lstr_next;
   }
   free_lsys_string(lstr);
+  free_lsys_string_buffer_components(&buffer);
+  return (python_lstring_list);
+}
+
+
+static PyObject *lsysStringSeries(PyObject *python_lsys, int num_timesteps, int sampling_period, URANDOM_STATE *urandom_state, int num_threads)
+{
+  PyObject *python_lstring_list;
+  LSYS *lsys;
+
+  lsys = extract_lsys(python_lsys);
+  if (lsys == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "lsysStringSeries: extract_lsys failed\n");
+    return (NULL);
+  }
+  clib_message(CLIB_MSG_TRACE, "lsysStringSeries: extract_lsys succeeded\n");
+  python_lstring_list = lsysDerivationSeries(python_lsys, lsys, lsys_uses_random(lsys), urandom_state, num_timesteps, sampling_period, 0, NULL, num_threads);
   free_lsys_with_transsys(lsys);
   return (python_lstring_list);
 }
@@ -3685,7 +3977,8 @@ static PyObject *lsysStringSeries(PyObject *python_lsys, int num_timesteps, int
 static PyObject *clib_stringseries(PyObject *self, PyObject *args)
 {
   PyObject *python_lsys, *python_int, *python_lstring_list;
-  int num_timesteps, sampling_period;
+  URANDOM_STATE urandom_state, *seeded_state;
+  int num_timesteps, sampling_period, num_threads = 1;
 
   refcountDebug_report("clib_stringseries starting", 0);
   /* refcountDebug_init(); */
@@ -3695,11 +3988,30 @@ static PyObject *clib_stringseries(PyObject *self, PyObject *args)
     refcountDebug_report("clib_stringseries returning exception", 0);
     return (NULL);
   }
-  if (PyTuple_Size(args) != 3)
+  if ((PyTuple_Size(args) < 3) || (PyTuple_Size(args) > 5))
+  {
+    PyErr_SetString(PyExc_TypeError, "3 to 5 arguments required: lsys, num_timesteps, sampling_period, [seed, [num_threads]]");
+    return (NULL);
+  }
+  if (extract_urandom_state((PyTuple_Size(args) >= 4) ? PyTuple_GetItem(args, 3) : NULL, &urandom_state, &seeded_state) != 0)
   {
-    PyErr_SetString(PyExc_TypeError, "exactly 3 arguments required: lsys, num_timesteps, sampling_period");
     return (NULL);
   }
+  if (PyTuple_Size(args) == 5)
+  {
+    python_int = PyTuple_GetItem(args, 4);
+    if (!PyInt_Check(python_int))
+    {
+      PyErr_SetString(PyExc_TypeError, "argument 5 (num_threads) must be an int");
+      return (NULL);
+    }
+    num_threads = PyInt_AsLong(python_int);
+    if (num_threads < 1)
+    {
+      PyErr_SetString(PyExc_ValueError, "clib_stringseries: number of threads must be positive");
+      return (NULL);
+    }
+  }
   python_lsys = PyTuple_GetItem(args, 0);
   if (python_lsys == NULL)
   {
@@ -3739,14 +4051,13 @@ static PyObject *clib_stringseries(PyObject *self, PyObject *args)
   }
   sampling_period = PyInt_AsLong(python_int);
   Py_DECREF(python_int);
-  python_lstring_list = lsysStringSeries(python_lsys, num_timesteps, sampling_period);
+  python_lstring_list = lsysStringSeries(python_lsys, num_timesteps, sampling_period, seeded_state, num_threads);
   Py_DECREF(python_lsys);
   if (python_lstring_list == NULL)
   {
     clib_message(CLIB_MSG_TRACE, "clib_stringseries: lsysStringSeries failed\n");
     return (NULL);
   }
-  freePythonClasses();
   if (PyErr_Occurred() != NULL)
   {
     clib_message(CLIB_MSG_ERROR, "clib_stringseries: exception raised at regular return\n");
@@ -3760,55 +4071,3219 @@ static PyObject *clib_stringseries(PyObject *self, PyObject *args)
 }
 
 
-static PyObject *clib_setverbose(PyObject *self, PyObject *args)
+static PyObject *clib_stringseries_columns(PyObject *self, PyObject *args)
 {
-  if (!PyArg_ParseTuple(args, "i", &message_importance_threshold))
+  PyObject *python_lsys, *python_seed = Py_None, *python_tp_filter = Py_None, *python_lstring_list;
+  URANDOM_STATE urandom_state, *seeded_state;
+  int num_timesteps, sampling_period = 1;
+  LSYS *lsys;
+
+  if (!PyArg_ParseTuple(args, "Oi|iOO", &python_lsys, &num_timesteps, &sampling_period, &python_seed, &python_tp_filter))
   {
     return (NULL);
   }
-  clib_message(CLIB_MSG_TRACE, "transsys.clib: verbosity level set to %d\n", message_importance_threshold);
-  Py_INCREF(Py_None);
-  return (Py_None);
+  if (sampling_period < 1)
+  {
+    PyErr_SetString(PyExc_ValueError, "clib_stringseries_columns: sampling period must be positive");
+    return (NULL);
+  }
+  if (extract_urandom_state(python_seed, &urandom_state, &seeded_state) != 0)
+  {
+    return (NULL);
+  }
+  if (initPythonClasses() != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "clib_stringseries_columns: initPythonClasses failed\n");
+    return (NULL);
+  }
+  if (!checkClass(python_lsys, pythonClasses.LsysProgram, "clib_stringseries_columns: not an instance of LsysProgram"))
+  {
+    return (NULL);
+  }
+  lsys = extract_lsys(python_lsys);
+  if (lsys == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "clib_stringseries_columns: extract_lsys failed\n");
+    return (NULL);
+  }
+  python_lstring_list = lsysDerivationSeries(python_lsys, lsys, lsys_uses_random(lsys), seeded_state, num_timesteps, sampling_period, 1, python_tp_filter, 1);
+  free_lsys_with_transsys(lsys);
+  return (python_lstring_list);
 }
 
 
-static PyObject *clib_srandom(PyObject *self, PyObject *args)
+/*
+ * Concentration arrays: contiguous, C ordered arrays of doubles with
+ * up to CONCENTRATION_ARRAY_MAXDIM dimensions, used to return
+ * simulation results without creating a Python object per value.
+ * The last dimension indexes factors. The data is exposed read-only
+ * through the buffer interface (both the old style and the new style
+ * one), so it can be wrapped without copying, e.g. by
+ * numpy.asarray.
+ */
+#define CONCENTRATION_ARRAY_MAXDIM 3
+
+typedef struct
 {
-  unsigned long rndseed;
-  if (!PyArg_ParseTuple(args, "k", &rndseed))
+  PyObject_HEAD
+  int ndim;
+  Py_ssize_t shape[CONCENTRATION_ARRAY_MAXDIM];
+  Py_ssize_t strides[CONCENTRATION_ARRAY_MAXDIM];
+  Py_ssize_t size;
+  double *data;
+} ConcentrationArray;
+
+
+static PyTypeObject ConcentrationArrayType = {
+  PyObject_HEAD_INIT(NULL)
+  0,
+  "transsys.clib.ConcentrationArray",
+  sizeof(ConcentrationArray)
+};
+
+
+static ConcentrationArray *newConcentrationArray(int ndim, const Py_ssize_t *shape)
+{
+  ConcentrationArray *a;
+  Py_ssize_t size = 1;
+  int i;
+
+  if ((ndim < 1) || (ndim > CONCENTRATION_ARRAY_MAXDIM))
   {
+    PyErr_SetString(PyExc_ValueError, "newConcentrationArray: bad number of dimensions");
     return (NULL);
   }
-  clib_message(CLIB_MSG_TRACE, "clib_srandom: setting random seed %lu\n", rndseed);
-  ulong_srandom(rndseed);
-  Py_INCREF(Py_None);
-  return (Py_None);
+  /* check that the size in bytes fits into a Py_ssize_t */
+  for (i = ndim - 1; i >= 0; i--)
+  {
+    if (shape[i] < 0)
+    {
+      PyErr_SetString(PyExc_ValueError, "newConcentrationArray: negative dimension");
+      return (NULL);
+    }
+    if ((size > 0) && (shape[i] > (Py_ssize_t) (PY_SSIZE_T_MAX / sizeof(double)) / size))
+    {
+      PyErr_SetString(PyExc_MemoryError, "newConcentrationArray: array too large");
+      return (NULL);
+    }
+    size *= shape[i];
+  }
+  a = PyObject_New(ConcentrationArray, &ConcentrationArrayType);
+  if (a == NULL)
+  {
+    return (NULL);
+  }
+  a->ndim = ndim;
+  a->size = 1;
+  for (i = ndim - 1; i >= 0; i--)
+  {
+    a->shape[i] = shape[i];
+    a->strides[i] = a->size * sizeof(double);
+    a->size *= shape[i];
+  }
+  /* allocate at least one double so that data is never NULL */
+  a->data = (double *) malloc((a->size > 0 ? a->size : 1) * sizeof(double));
+  if (a->data == NULL)
+  {
+    PyErr_SetString(PyExc_MemoryError, "newConcentrationArray: malloc failed");
+    a->ob_type->tp_free((PyObject *) a);
+    return (NULL);
+  }
+  return (a);
 }
 
 
-static PyObject *clib_dummy(PyObject *self, PyObject *args)
+static void ConcentrationArray_dealloc(ConcentrationArray *self)
 {
-  Py_INCREF(Py_None);
-  return (Py_None);
+  free(self->data);
+  self->ob_type->tp_free((PyObject *) self);
 }
 
 
-static PyMethodDef clib_methods[] = {
-  {"timeseries", clib_timeseries, METH_VARARGS, "compute time series from a transsys instance"},
-  {"stringseries", clib_stringseries, METH_VARARGS, "compute derivation series from a lsys program"},
-  {"srandom", clib_srandom, METH_VARARGS, "set the random seed for clib transsys computations"},
-  {"dummy", clib_dummy, METH_VARARGS, "dummy test function for clib development"},
-  {"setverbose", clib_setverbose, METH_VARARGS, "set verbosity level for transsys.clib module"},
+static Py_ssize_t ConcentrationArray_length(ConcentrationArray *self)
+{
+  return (self->shape[0]);
+}
+
+
+static PyObject *ConcentrationArray_getshape(ConcentrationArray *self, void *closure)
+{
+  PyObject *python_shape;
+  int i;
+
+  python_shape = PyTuple_New(self->ndim);
+  if (python_shape == NULL)
+  {
+    return (NULL);
+  }
+  for (i = 0; i < self->ndim; i++)
+  {
+    PyObject *python_n = PyInt_FromSsize_t(self->shape[i]);
+
+    if (python_n == NULL)
+    {
+      Py_DECREF(python_shape);
+      return (NULL);
+    }
+    PyTuple_SET_ITEM(python_shape, i, python_n);
+  }
+  return (python_shape);
+}
+
+
+static PyObject *concentrationArrayList(const ConcentrationArray *a, int dim, const double *d)
+{
+  PyObject *python_list, *python_item;
+  Py_ssize_t i;
+
+  python_list = PyList_New(a->shape[dim]);
+  if (python_list == NULL)
+  {
+    return (NULL);
+  }
+  for (i = 0; i < a->shape[dim]; i++)
+  {
+    if (dim == a->ndim - 1)
+    {
+      python_item = PyFloat_FromDouble(d[i]);
+    }
+    else
+    {
+      python_item = concentrationArrayList(a, dim + 1, d + i * (a->strides[dim] / sizeof(double)));
+    }
+    if (python_item == NULL)
+    {
+      Py_DECREF(python_list);
+      return (NULL);
+    }
+    PyList_SET_ITEM(python_list, i, python_item);
+  }
+  return (python_list);
+}
+
+
+static PyObject *ConcentrationArray_tolist(ConcentrationArray *self, PyObject *args)
+{
+  return (concentrationArrayList(self, 0, self->data));
+}
+
+
+/*
+ * Return the values along the last (factor) dimension at the position
+ * specified by the arguments, which must be indices for all other
+ * dimensions.
+ */
+static PyObject *ConcentrationArray_row(ConcentrationArray *self, PyObject *args)
+{
+  const double *d = self->data;
+  Py_ssize_t i;
+  int dim;
+
+  if (PyTuple_Size(args) != self->ndim - 1)
+  {
+    PyErr_SetString(PyExc_TypeError, "ConcentrationArray.row: number of indices must be one less than number of dimensions");
+    return (NULL);
+  }
+  for (dim = 0; dim < self->ndim - 1; dim++)
+  {
+    i = PyInt_AsSsize_t(PyTuple_GET_ITEM(args, dim));
+    if ((i == -1) && (PyErr_Occurred() != NULL))
+    {
+      return (NULL);
+    }
+    if (i < 0)
+    {
+      i += self->shape[dim];
+    }
+    if ((i < 0) || (i >= self->shape[dim]))
+    {
+      PyErr_SetString(PyExc_IndexError, "ConcentrationArray.row: index out of range");
+      return (NULL);
+    }
+    d += i * (self->strides[dim] / sizeof(double));
+  }
+  return (concentrationArrayList(self, self->ndim - 1, d));
+}
+
+
+static Py_ssize_t ConcentrationArray_getreadbuffer(ConcentrationArray *self, Py_ssize_t segment, void **ptrptr)
+{
+  if (segment != 0)
+  {
+    PyErr_SetString(PyExc_SystemError, "ConcentrationArray: accessing non-existent buffer segment");
+    return (-1);
+  }
+  *ptrptr = self->data;
+  return (self->size * sizeof(double));
+}
+
+
+static Py_ssize_t ConcentrationArray_getsegcount(ConcentrationArray *self, Py_ssize_t *lenp)
+{
+  if (lenp)
+  {
+    *lenp = self->size * sizeof(double);
+  }
+  return (1);
+}
+
+
+static int ConcentrationArray_getbuffer(ConcentrationArray *self, Py_buffer *view, int flags)
+{
+  if ((flags & PyBUF_WRITABLE) == PyBUF_WRITABLE)
+  {
+    PyErr_SetString(PyExc_BufferError, "ConcentrationArray: buffer is read-only");
+    return (-1);
+  }
+  view->buf = self->data;
+  Py_INCREF(self);
+  view->obj = (PyObject *) self;
+  view->len = self->size * sizeof(double);
+  view->readonly = 1;
+  view->itemsize = sizeof(double);
+  view->format = (flags & PyBUF_FORMAT) ? "d" : NULL;
+  if ((flags & PyBUF_ND) == PyBUF_ND)
+  {
+    view->ndim = self->ndim;
+    view->shape = self->shape;
+  }
+  else
+  {
+    view->ndim = 1;
+    view->shape = NULL;
+  }
+  view->strides = ((flags & PyBUF_STRIDES) == PyBUF_STRIDES) ? self->strides : NULL;
+  view->suboffsets = NULL;
+  view->internal = NULL;
+  return (0);
+}
+
+
+static PySequenceMethods ConcentrationArray_as_sequence = {
+  (lenfunc) ConcentrationArray_length
+};
+
+
+static PyBufferProcs ConcentrationArray_as_buffer = {
+  (readbufferproc) ConcentrationArray_getreadbuffer,
+  NULL,
+  (segcountproc) ConcentrationArray_getsegcount,
+  NULL,
+  (getbufferproc) ConcentrationArray_getbuffer,
+  NULL
+};
+
+
+static PyGetSetDef ConcentrationArray_getset[] = {
+  {"shape", (getter) ConcentrationArray_getshape, NULL, "tuple of array dimensions", NULL},
+  {NULL, NULL, NULL, NULL, NULL}
+};
+
+
+static PyMethodDef ConcentrationArray_methods[] = {
+  {"tolist", (PyCFunction) ConcentrationArray_tolist, METH_NOARGS, "return the array as a nested list"},
+  {"row", (PyCFunction) ConcentrationArray_row, METH_VARARGS, "return factor concentrations at the given leading indices as a list"},
   {NULL, NULL, 0, NULL}
 };
 
 
-PyMODINIT_FUNC initclib(void)
+/*
+ * Construct an array.array of C ints (type code 'i') containing
+ * the n values of data.
+ */
+static PyObject *newIntArray(const int *data, Py_ssize_t n)
 {
-  PyObject *clib_module;
+  PyObject *python_array_module, *python_data, *python_array;
+
+  python_array_module = PyImport_ImportModule("array");
+  if (python_array_module == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "newIntArray: PyImport_ImportModule failed for \"array\"\n");
+    return (NULL);
+  }
+  python_data = PyString_FromStringAndSize((const char *) data, n * sizeof(int));
+  if (python_data == NULL)
+  {
+    Py_DECREF(python_array_module);
+    return (NULL);
+  }
+  python_array = PyObject_CallMethod(python_array_module, "array", "sO", "i", python_data);
+  Py_DECREF(python_data);
+  Py_DECREF(python_array_module);
+  return (python_array);
+}
+
+
+/*
+ * Determine which symbols of lsys are selected for the columnar form
+ * of lsys strings, and group the selected symbols by their transsys
+ * programs. selected[k] is set to nonzero if the transsys program of
+ * symbol k of python_lsys is python_tp_filter, or for all symbols if
+ * python_tp_filter is NULL. group[k] is set to the index of the group
+ * of symbol k, or -1 if it has no transsys program or is not selected,
+ * and group_transsys is set to the C level transsys programs of the
+ * groups. Returns the number of groups, or -1 upon failure.
+ */
+static int lsys_symbol_groups(PyObject *python_symbol_list, const LSYS *lsys, PyObject *python_tp_filter, int *selected, int *group, const TRANSSYS **group_transsys)
+{
+  PyObject *python_tp;
+  int num_groups = 0, k, g;
+
+  for (k = 0; k < lsys->num_symbols; k++)
+  {
+    python_tp = PyObject_GetAttrString(PyList_GET_ITEM(python_symbol_list, k), "transsys");
+    if (python_tp == NULL)
+    {
+      clib_message(CLIB_MSG_TRACE, "lsys_symbol_groups: PyObject_GetAttrString failed for \"transsys\"\n");
+      return (-1);
+    }
+    selected[k] = (python_tp_filter == NULL) || (python_tp == python_tp_filter);
+    Py_DECREF(python_tp);
+    group[k] = -1;
+    if (selected[k] && (lsys->symbol_list[k].transsys != NULL))
+    {
+      for (g = 0; (g < num_groups) && (group_transsys[g] != lsys->symbol_list[k].transsys); g++)
+	;
+      if (g == num_groups)
+      {
+	group_transsys[num_groups++] = lsys->symbol_list[k].transsys;
+      }
+      group[k] = g;
+    }
+  }
+  return (num_groups);
+}
+
+
+/*
+ * Construct the entry of transsys group g for the columnar form of lsys
+ * string lstr, i.e. a tuple (row_index, concentration), see
+ * makeLsysSymbolStringColumns. row_index must provide space for
+ * lstr->num_symbols ints.
+ */
+static PyObject *lsysStringTranssysColumns(const LSYS_STRING *lstr, const int *selected, const int *group, int g, const TRANSSYS *transsys, int *row_index)
+{
+  PyObject *python_row_index;
+  ConcentrationArray *a;
+  Py_ssize_t shape[2];
+  int i, k, num_selected = 0, num_rows = 0;
+
+  for (i = 0; i < lstr->num_symbols; i++)
+  {
+    k = lstr->symbol[i].symbol_index;
+    if (selected[k])
+    {
+      if (group[k] == g)
+      {
+	row_index[num_rows++] = num_selected;
+      }
+      num_selected++;
+    }
+  }
+  shape[0] = num_rows;
+  shape[1] = transsys->num_factors;
+  a = newConcentrationArray(2, shape);
+  if (a == NULL)
+  {
+    return (NULL);
+  }
+  num_rows = 0;
+  for (i = 0; i < lstr->num_symbols; i++)
+  {
+    if (group[lstr->symbol[i].symbol_index] == g)
+    {
+      memcpy(a->data + num_rows * transsys->num_factors, lstr->symbol[i].transsys_instance.factor_concentration, transsys->num_factors * sizeof(double));
+      num_rows++;
+    }
+  }
+  python_row_index = newIntArray(row_index, num_rows);
+  if (python_row_index == NULL)
+  {
+    Py_DECREF(a);
+    return (NULL);
+  }
+  return (Py_BuildValue("(NN)", python_row_index, (PyObject *) a));
+}
+
+
+/*
+ * Construct the columnar form of an lsys string, as a tuple
+ * (timestep, symbol_index, rule_index, transsys_columns). symbol_index
+ * and rule_index are int arrays (array.array('i')) of the symbol and
+ * rule indices of the symbol instances, the rule index is -1 for
+ * instances to which no rule was applied. transsys_columns is a
+ * dictionary mapping the names of the transsys programs of the lsys
+ * symbols to tuples (row_index, concentration), where concentration
+ * is a concentration array of the factor concentrations of the symbol
+ * instances of that transsys program, and row_index is an int array
+ * of the positions of these instances in symbol_index. If
+ * python_tp_filter is not NULL or None, only instances of symbols
+ * whose transsys program is python_tp_filter are included.
+ */
+static PyObject *makeLsysSymbolStringColumns(PyObject *python_lsys, const LSYS_STRING *lstr, long timestep, PyObject *python_tp_filter)
+{
+  const LSYS *lsys = lstr->lsys;
+  PyObject *python_symbol_list, *python_columns, *python_entry;
+  PyObject *python_symbol_index, *python_rule_index;
+  const TRANSSYS **group_transsys;
+  int *selected, *group, *symbol_index, *rule_index;
+  int num_groups, num_selected = 0, i, k, g;
+
+  if (python_tp_filter == Py_None)
+  {
+    python_tp_filter = NULL;
+  }
+  python_symbol_list = PyObject_GetAttrString(python_lsys, "symbols");
+  if (python_symbol_list == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "makeLsysSymbolStringColumns: PyObject_GetAttrString failed for \"symbols\"\n");
+    return (NULL);
+  }
+  if (!PyList_Check(python_symbol_list) || (PyList_Size(python_symbol_list) != lsys->num_symbols))
+  {
+    PyErr_SetString(PyExc_RuntimeError, "makeLsysSymbolStringColumns: python_lsys and lstr are incompatible");
+    Py_DECREF(python_symbol_list);
+    return (NULL);
+  }
+  selected = (int *) malloc((2 * lsys->num_symbols + 2 * lstr->num_symbols + 1) * sizeof(int));
+  group_transsys = (const TRANSSYS **) malloc((lsys->num_symbols + 1) * sizeof(TRANSSYS *));
+  if ((selected == NULL) || (group_transsys == NULL))
+  {
+    PyErr_SetString(PyExc_MemoryError, "makeLsysSymbolStringColumns: malloc failed");
+    free(selected);
+    free(group_transsys);
+    Py_DECREF(python_symbol_list);
+    return (NULL);
+  }
+  group = selected + lsys->num_symbols;
+  symbol_index = group + lsys->num_symbols;
+  rule_index = symbol_index + lstr->num_symbols;
+  num_groups = lsys_symbol_groups(python_symbol_list, lsys, python_tp_filter, selected, group, group_transsys);
+  Py_DECREF(python_symbol_list);
+  if (num_groups < 0)
+  {
+    free(selected);
+    free(group_transsys);
+    return (NULL);
+  }
+  python_columns = PyDict_New();
+  if (python_columns == NULL)
+  {
+    free(selected);
+    free(group_transsys);
+    return (NULL);
+  }
+  /* rule_index is used as workspace for row indices here */
+  for (g = 0; g < num_groups; g++)
+  {
+    python_entry = lsysStringTranssysColumns(lstr, selected, group, g, group_transsys[g], rule_index);
+    if ((python_entry == NULL) || (PyDict_SetItemString(python_columns, group_transsys[g]->name, python_entry) != 0))
+    {
+      Py_XDECREF(python_entry);
+      Py_DECREF(python_columns);
+      free(selected);
+      free(group_transsys);
+      return (NULL);
+    }
+    Py_DECREF(python_entry);
+  }
+  for (i = 0; i < lstr->num_symbols; i++)
+  {
+    k = lstr->symbol[i].symbol_index;
+    if (selected[k])
+    {
+      symbol_index[num_selected] = k;
+      rule_index[num_selected] = lstr->symbol[i].rule_index;
+      num_selected++;
+    }
+  }
+  python_symbol_index = newIntArray(symbol_index, num_selected);
+  python_rule_index = newIntArray(rule_index, num_selected);
+  free(selected);
+  free(group_transsys);
+  if ((python_symbol_index == NULL) || (python_rule_index == NULL))
+  {
+    Py_XDECREF(python_symbol_index);
+    Py_XDECREF(python_rule_index);
+    Py_DECREF(python_columns);
+    return (NULL);
+  }
+  return (Py_BuildValue("(lNNN)", timestep, python_symbol_index, python_rule_index, python_columns));
+}
+
+
+/*
+ * Compute a time series of factor concentrations, starting from
+ * the concentrations of python_ti_start, and return it as a
+ * concentration array of shape (number of samples, number of factors).
+ * Random numbers are drawn as by transsysTimeSeries.
+ */
+static PyObject *transsysTimeSeriesArray(const TRANSSYS *tp, int uses_random, URANDOM_STATE *urandom_state, PyObject *python_ti_start, long num_timesteps, long sampling_period)
+{
+  TRANSSYS_INSTANCE *ti;
+  PyThreadState *thread_state;
+  ConcentrationArray *a;
+  Py_ssize_t shape[2];
+
+  ti = new_transsys_instance(tp);
+  if (ti == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "transsysTimeSeriesArray: new_transsys_instance failed\n");
+    PyErr_SetString(PyExc_MemoryError, "transsysTimeSeriesArray: new_transsys_instance failed");
+    return (NULL);
+  }
+  if (extract_initial_factor_concentrations(python_ti_start, ti) != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "transsysTimeSeriesArray: extract_initial_factor_concentrations failed\n");
+    free_transsys_instance(ti);
+    return (NULL);
+  }
+  shape[0] = num_samples(num_timesteps, sampling_period);
+  shape[1] = tp->num_factors;
+  a = newConcentrationArray(2, shape);
+  if (a == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "transsysTimeSeriesArray: newConcentrationArray failed\n");
+    free_transsys_instance(ti);
+    return (NULL);
+  }
+  ti->urandom_state = urandom_state;
+  thread_state = begin_simulation(uses_random && (urandom_state == NULL));
+  simulate_transsys_instance(ti, num_timesteps, sampling_period, a->data);
+  end_simulation(thread_state);
+  free_transsys_instance(ti);
+  return ((PyObject *) a);
+}
+
+
+/*
+ * Run num_timesteps steps of expression, starting from the
+ * concentrations of python_ti_start, and return the final state as a
+ * transsys instance, without constructing any intermediate Python
+ * objects. Random numbers are drawn as by transsysTimeSeries.
+ */
+static PyObject *transsysFinalState(PyObject *python_tp, const TRANSSYS *tp, int uses_random, URANDOM_STATE *urandom_state, PyObject *python_ti_start, long num_timesteps)
+{
+  TRANSSYS_INSTANCE *ti;
+  PyThreadState *thread_state;
+  PyObject *python_ti;
+
+  ti = new_transsys_instance(tp);
+  if (ti == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "transsysFinalState: new_transsys_instance failed\n");
+    PyErr_SetString(PyExc_MemoryError, "transsysFinalState: new_transsys_instance failed");
+    return (NULL);
+  }
+  if (extract_initial_factor_concentrations(python_ti_start, ti) != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "transsysFinalState: extract_initial_factor_concentrations failed\n");
+    free_transsys_instance(ti);
+    return (NULL);
+  }
+  if (num_timesteps < 0)
+  {
+    num_timesteps = 0;
+  }
+  ti->urandom_state = urandom_state;
+  thread_state = begin_simulation(uses_random && (urandom_state == NULL));
+  simulate_transsys_instance(ti, num_timesteps, 1, NULL);
+  end_simulation(thread_state);
+  python_ti = newTranssysInstanceAtTimestep(python_tp, ti, num_timesteps);
+  free_transsys_instance(ti);
+  return (python_ti);
+}
+
+
+/*
+ * Simulate, starting from the concentrations of python_ti_start, until
+ * an attractor is found or max_timesteps steps have been done (see
+ * find_attractor). Random numbers are drawn as by transsysTimeSeries.
+ * Returns a tuple (ti, kind, period), where ti is the final transsys
+ * instance with its timestep set to the number of steps done, kind
+ * is "fixedpoint", "limitcycle" or None if no attractor was found,
+ * and period is the attractor's period (0 if none was found).
+ */
+static PyObject *transsysAttractor(PyObject *python_tp, const TRANSSYS *tp, int uses_random, URANDOM_STATE *urandom_state, PyObject *python_ti_start, long max_timesteps, double tolerance, int max_period)
+{
+  TRANSSYS_INSTANCE *ti;
+  TRANSSYS_BYTECODE *bc;
+  double *value;
+  PyThreadState *thread_state;
+  ATTRACTOR_INFO attractor;
+  PyObject *python_ti;
+  int return_value;
+
+  ti = new_transsys_instance(tp);
+  if (ti == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "transsysAttractor: new_transsys_instance failed\n");
+    PyErr_SetString(PyExc_MemoryError, "transsysAttractor: new_transsys_instance failed");
+    return (NULL);
+  }
+  if (extract_initial_factor_concentrations(python_ti_start, ti) != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "transsysAttractor: extract_initial_factor_concentrations failed\n");
+    free_transsys_instance(ti);
+    return (NULL);
+  }
+  ti->urandom_state = urandom_state;
+  thread_state = begin_simulation(uses_random && (urandom_state == NULL));
+  bc = new_simulation_bytecode(tp, &value);
+  return_value = find_attractor(ti, bc, value, max_timesteps, tolerance, max_period, &attractor);
+  free_simulation_bytecode(bc, value);
+  end_simulation(thread_state);
+  if (return_value != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "transsysAttractor: find_attractor failed\n");
+    PyErr_SetString(PyExc_MemoryError, "transsysAttractor: find_attractor failed");
+    free_transsys_instance(ti);
+    return (NULL);
+  }
+  python_ti = newTranssysInstanceAtTimestep(python_tp, ti, attractor.timestep);
+  free_transsys_instance(ti);
+  if (python_ti == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "transsysAttractor: newTranssysInstanceAtTimestep failed\n");
+    return (NULL);
+  }
+  switch (attractor.type)
+  {
+  case ATTRACTOR_FIXEDPOINT:
+    return (Py_BuildValue("(Nsi)", python_ti, "fixedpoint", attractor.period));
+  case ATTRACTOR_LIMITCYCLE:
+    return (Py_BuildValue("(Nsi)", python_ti, "limitcycle", attractor.period));
+  default:
+    return (Py_BuildValue("(NOi)", python_ti, Py_None, attractor.period));
+  }
+}
+
+
+/*
+ * Extract a matrix of doubles with rows of length row_length. The
+ * matrix can be provided as an object supporting the buffer interface
+ * and containing C doubles in row major order (e.g. an array.array('d')
+ * or a C contiguous NumPy array), or as a sequence of sequences
+ * of numbers. The matrix is returned as a newly allocated array,
+ * the number of rows is stored in *num_rows.
+ */
+static double *extract_double_matrix(PyObject *python_matrix, size_t row_length, size_t *num_rows)
+{
+  PyObject *python_row_seq, *python_row;
+  const void *buffer;
+  Py_ssize_t buffer_length, i, j;
+  double *m;
+
+  if (PyObject_CheckReadBuffer(python_matrix) && !PyString_Check(python_matrix))
+  {
+    if (PyObject_AsReadBuffer(python_matrix, &buffer, &buffer_length) != 0)
+    {
+      return (NULL);
+    }
+    if ((row_length == 0) || (buffer_length % (row_length * sizeof(double))))
+    {
+      PyErr_SetString(PyExc_ValueError, "extract_double_matrix: buffer size is not a multiple of the row size");
+      return (NULL);
+    }
+    *num_rows = buffer_length / (row_length * sizeof(double));
+    m = (double *) malloc(buffer_length > 0 ? buffer_length : 1);
+    if (m == NULL)
+    {
+      PyErr_SetString(PyExc_MemoryError, "extract_double_matrix: malloc failed");
+      return (NULL);
+    }
+    memcpy(m, buffer, buffer_length);
+    return (m);
+  }
+  python_row_seq = PySequence_Fast(python_matrix, "extract_double_matrix: matrix must be a buffer of doubles or a sequence of sequences");
+  if (python_row_seq == NULL)
+  {
+    return (NULL);
+  }
+  *num_rows = PySequence_Fast_GET_SIZE(python_row_seq);
+  m = (double *) malloc((*num_rows * row_length > 0 ? *num_rows * row_length : 1) * sizeof(double));
+  if (m == NULL)
+  {
+    PyErr_SetString(PyExc_MemoryError, "extract_double_matrix: malloc failed");
+    Py_DECREF(python_row_seq);
+    return (NULL);
+  }
+  for (i = 0; i < (Py_ssize_t) *num_rows; i++)
+  {
+    python_row = PySequence_Fast(PySequence_Fast_GET_ITEM(python_row_seq, i), "extract_double_matrix: matrix rows must be sequences");
+    if (python_row == NULL)
+    {
+      free(m);
+      Py_DECREF(python_row_seq);
+      return (NULL);
+    }
+    if (PySequence_Fast_GET_SIZE(python_row) != (Py_ssize_t) row_length)
+    {
+      PyErr_SetString(PyExc_ValueError, "extract_double_matrix: bad row length");
+      free(m);
+      Py_DECREF(python_row);
+      Py_DECREF(python_row_seq);
+      return (NULL);
+    }
+    for (j = 0; j < (Py_ssize_t) row_length; j++)
+    {
+      m[i * row_length + j] = PyFloat_AsDouble(PySequence_Fast_GET_ITEM(python_row, j));
+      if (PyErr_Occurred() != NULL)
+      {
+	free(m);
+	Py_DECREF(python_row);
+	Py_DECREF(python_row_seq);
+	return (NULL);
+      }
+    }
+    Py_DECREF(python_row);
+  }
+  Py_DECREF(python_row_seq);
+  return (m);
+}
+
+
+/*
+ * Compute time series for an ensemble of initial states, given
+ * as rows of a matrix of factor concentrations, and return them
+ * as a concentration array of shape (number of initial states,
+ * number of samples, number of factors). The instances are
+ * simulated one after another, so the results are identical to
+ * those of individual time series computed in the same order.
+ */
+static PyObject *transsysEnsembleTimeSeriesArray(const TRANSSYS *tp, int uses_random, PyObject *python_initial, long num_timesteps, long sampling_period)
+{
+  TRANSSYS_INSTANCE *ti;
+  PyThreadState *thread_state;
+  ConcentrationArray *a;
+  Py_ssize_t shape[3];
+  double *initial, *d;
+  size_t num_instances, n;
+
+  initial = extract_double_matrix(python_initial, tp->num_factors, &num_instances);
+  if (initial == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "transsysEnsembleTimeSeriesArray: extract_double_matrix failed\n");
+    return (NULL);
+  }
+  ti = new_transsys_instance(tp);
+  if (ti == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "transsysEnsembleTimeSeriesArray: new_transsys_instance failed\n");
+    PyErr_SetString(PyExc_MemoryError, "transsysEnsembleTimeSeriesArray: new_transsys_instance failed");
+    free(initial);
+    return (NULL);
+  }
+  shape[0] = num_instances;
+  shape[1] = num_samples(num_timesteps, sampling_period);
+  shape[2] = tp->num_factors;
+  a = newConcentrationArray(3, shape);
+  if (a == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "transsysEnsembleTimeSeriesArray: newConcentrationArray failed\n");
+    free_transsys_instance(ti);
+    free(initial);
+    return (NULL);
+  }
+  d = a->data;
+  thread_state = begin_simulation(uses_random);
+  for (n = 0; n < num_instances; n++)
+  {
+    memcpy(ti->factor_concentration, initial + n * tp->num_factors, tp->num_factors * sizeof(double));
+    simulate_transsys_instance(ti, num_timesteps, sampling_period, d);
+    d += shape[1] * tp->num_factors;
+  }
+  end_simulation(thread_state);
+  free_transsys_instance(ti);
+  free(initial);
+  return ((PyObject *) a);
+}
+
+
+static PyObject *clib_timeseries_array(PyObject *self, PyObject *args)
+{
+  PyObject *python_ti_start, *python_tp, *python_seed = Py_None, *python_a;
+  URANDOM_STATE urandom_state, *seeded_state;
+  long num_timesteps, sampling_period = 1;
+  TRANSSYS *tp;
+
+  if (!PyArg_ParseTuple(args, "Ol|lO", &python_ti_start, &num_timesteps, &sampling_period, &python_seed))
+  {
+    return (NULL);
+  }
+  if (sampling_period < 1)
+  {
+    PyErr_SetString(PyExc_ValueError, "clib_timeseries_array: sampling period must be positive");
+    return (NULL);
+  }
+  if (extract_urandom_state(python_seed, &urandom_state, &seeded_state) != 0)
+  {
+    return (NULL);
+  }
+  if (initPythonClasses() != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "clib_timeseries_array: initPythonClasses failed\n");
+    return (NULL);
+  }
+  if (!checkClass(python_ti_start, pythonClasses.TranssysInstance, "clib_timeseries_array: not an instance of TranssysInstance"))
+  {
+    return (NULL);
+  }
+  python_tp = PyObject_GetAttrString(python_ti_start, "transsys_program");
+  if (python_tp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "clib_timeseries_array: PyObject_GetAttrString failed for \"transsys_program\"\n");
+    return (NULL);
+  }
+  tp = extract_transsys(python_tp);
+  Py_DECREF(python_tp);
+  if (tp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "clib_timeseries_array: extract_transsys failed\n");
+    return (NULL);
+  }
+  python_a = transsysTimeSeriesArray(tp, transsys_uses_random(tp), seeded_state, python_ti_start, num_timesteps, sampling_period);
+  free_transsys_list(tp);
+  return (python_a);
+}
+
+
+static PyObject *clib_final_state(PyObject *self, PyObject *args)
+{
+  PyObject *python_ti_start, *python_tp, *python_seed = Py_None, *python_ti;
+  URANDOM_STATE urandom_state, *seeded_state;
+  long num_timesteps;
+  TRANSSYS *tp;
+
+  if (!PyArg_ParseTuple(args, "Ol|O", &python_ti_start, &num_timesteps, &python_seed))
+  {
+    return (NULL);
+  }
+  if (extract_urandom_state(python_seed, &urandom_state, &seeded_state) != 0)
+  {
+    return (NULL);
+  }
+  if (initPythonClasses() != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "clib_final_state: initPythonClasses failed\n");
+    return (NULL);
+  }
+  if (!checkClass(python_ti_start, pythonClasses.TranssysInstance, "clib_final_state: not an instance of TranssysInstance"))
+  {
+    return (NULL);
+  }
+  python_tp = PyObject_GetAttrString(python_ti_start, "transsys_program");
+  if (python_tp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "clib_final_state: PyObject_GetAttrString failed for \"transsys_program\"\n");
+    return (NULL);
+  }
+  tp = extract_transsys(python_tp);
+  if (tp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "clib_final_state: extract_transsys failed\n");
+    Py_DECREF(python_tp);
+    return (NULL);
+  }
+  python_ti = transsysFinalState(python_tp, tp, transsys_uses_random(tp), seeded_state, python_ti_start, num_timesteps);
+  free_transsys_list(tp);
+  Py_DECREF(python_tp);
+  return (python_ti);
+}
+
+
+static PyObject *clib_attractor(PyObject *self, PyObject *args)
+{
+  PyObject *python_ti_start, *python_tp, *python_seed = Py_None, *python_result;
+  URANDOM_STATE urandom_state, *seeded_state;
+  long max_timesteps;
+  double tolerance = 0.0;
+  int max_period = 100;
+  TRANSSYS *tp;
+
+  if (!PyArg_ParseTuple(args, "Ol|diO", &python_ti_start, &max_timesteps, &tolerance, &max_period, &python_seed))
+  {
+    return (NULL);
+  }
+  if (max_period < 1)
+  {
+    PyErr_SetString(PyExc_ValueError, "clib_attractor: maximal period must be positive");
+    return (NULL);
+  }
+  if (extract_urandom_state(python_seed, &urandom_state, &seeded_state) != 0)
+  {
+    return (NULL);
+  }
+  if (initPythonClasses() != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "clib_attractor: initPythonClasses failed\n");
+    return (NULL);
+  }
+  if (!checkClass(python_ti_start, pythonClasses.TranssysInstance, "clib_attractor: not an instance of TranssysInstance"))
+  {
+    return (NULL);
+  }
+  python_tp = PyObject_GetAttrString(python_ti_start, "transsys_program");
+  if (python_tp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "clib_attractor: PyObject_GetAttrString failed for \"transsys_program\"\n");
+    return (NULL);
+  }
+  tp = extract_transsys(python_tp);
+  if (tp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "clib_attractor: extract_transsys failed\n");
+    Py_DECREF(python_tp);
+    return (NULL);
+  }
+  python_result = transsysAttractor(python_tp, tp, transsys_uses_random(tp), seeded_state, python_ti_start, max_timesteps, tolerance, max_period);
+  free_transsys_list(tp);
+  Py_DECREF(python_tp);
+  return (python_result);
+}
+
+
+/*
+ * Compiled programs: objects that keep the C level structures
+ * extracted from a Python transsys or lsys program, so that these
+ * can be simulated repeatedly without re-extracting the program for
+ * each simulation. Notice that changes made to the Python program
+ * after compilation are not reflected by the compiled program.
+ *
+ * Value nodes of a compiled transsys program can be bound to
+ * positions in a parameter vector (see the bind method), the
+ * parameter vector can then be set in one call (set_values).
+ *
+ * Since simulations run with the global interpreter lock released,
+ * other threads may call methods of a compiled program while it is
+ * being simulated. num_active_runs counts the simulations currently
+ * using a compiled transsys program, its values cannot be changed
+ * while this is nonzero. modifying is set while a parameter series
+ * changes the values, no other simulations can be run then.
+ */
+typedef struct
+{
+  PyObject_HEAD
+  PyObject *python_tp;
+  TRANSSYS *transsys;
+  int uses_random;
+  int num_active_runs;
+  int modifying;
+  VALUE_NODE_RECORD value_nodes;
+  size_t num_bound_nodes;
+  EXPRESSION_NODE **bound_node;
+} CompiledTranssysProgram;
+
+
+typedef struct
+{
+  PyObject_HEAD
+  PyObject *python_lsys;
+  LSYS *lsys;
+  int uses_random;
+  int num_active_runs;
+} CompiledLsysProgram;
+
+
+static PyTypeObject CompiledTranssysProgramType = {
+  PyObject_HEAD_INIT(NULL)
+  0,
+  "transsys.clib.CompiledTranssysProgram",
+  sizeof(CompiledTranssysProgram)
+};
+
+
+static PyTypeObject CompiledLsysProgramType = {
+  PyObject_HEAD_INIT(NULL)
+  0,
+  "transsys.clib.CompiledLsysProgram",
+  sizeof(CompiledLsysProgram)
+};
+
+
+static void CompiledTranssysProgram_dealloc(CompiledTranssysProgram *self)
+{
+  if (self->transsys)
+  {
+    free_transsys_list(self->transsys);
+  }
+  if (self->bound_node)
+  {
+    free(self->bound_node);
+  }
+  free_value_node_record_components(&(self->value_nodes));
+  Py_XDECREF(self->python_tp);
+  self->ob_type->tp_free((PyObject *) self);
+}
+
+
+static void CompiledLsysProgram_dealloc(CompiledLsysProgram *self)
+{
+  if (self->lsys)
+  {
+    free_lsys_with_transsys(self->lsys);
+  }
+  Py_XDECREF(self->python_lsys);
+  self->ob_type->tp_free((PyObject *) self);
+}
+
+
+static PyObject *newCompiledTranssysProgram(PyObject *python_tp)
+{
+  CompiledTranssysProgram *ctp;
+  TRANSSYS *tp;
+  VALUE_NODE_RECORD value_nodes;
+
+  init_value_node_record(&value_nodes);
+  if (alloc_value_node_record_components(&value_nodes) != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "newCompiledTranssysProgram: alloc_value_node_record_components failed\n");
+    return (NULL);
+  }
+  value_node_record = &value_nodes;
+  tp = extract_transsys(python_tp);
+  value_node_record = NULL;
+  if (tp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "newCompiledTranssysProgram: extract_transsys failed\n");
+    free_value_node_record_components(&value_nodes);
+    return (NULL);
+  }
+  ctp = PyObject_New(CompiledTranssysProgram, &CompiledTranssysProgramType);
+  if (ctp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "newCompiledTranssysProgram: PyObject_New failed\n");
+    free_transsys_list(tp);
+    free_value_node_record_components(&value_nodes);
+    return (NULL);
+  }
+  Py_INCREF(python_tp);
+  ctp->python_tp = python_tp;
+  ctp->transsys = tp;
+  ctp->uses_random = transsys_uses_random(tp);
+  ctp->num_active_runs = 0;
+  ctp->modifying = 0;
+  ctp->value_nodes = value_nodes;
+  ctp->num_bound_nodes = 0;
+  ctp->bound_node = NULL;
+  return ((PyObject *) ctp);
+}
+
+
+static PyObject *newCompiledLsysProgram(PyObject *python_lsys)
+{
+  CompiledLsysProgram *clp;
+  LSYS *lsys;
+
+  lsys = extract_lsys(python_lsys);
+  if (lsys == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "newCompiledLsysProgram: extract_lsys failed\n");
+    return (NULL);
+  }
+  clp = PyObject_New(CompiledLsysProgram, &CompiledLsysProgramType);
+  if (clp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "newCompiledLsysProgram: PyObject_New failed\n");
+    free_lsys_with_transsys(lsys);
+    return (NULL);
+  }
+  Py_INCREF(python_lsys);
+  clp->python_lsys = python_lsys;
+  clp->lsys = lsys;
+  clp->uses_random = lsys_uses_random(lsys);
+  clp->num_active_runs = 0;
+  return ((PyObject *) clp);
+}
+
+
+static int check_not_modifying(const CompiledTranssysProgram *self)
+{
+  if (self->modifying)
+  {
+    PyErr_SetString(PyExc_RuntimeError, "compiled program is busy with a parameter series");
+    return (-1);
+  }
+  return (0);
+}
+
+
+static int check_idle(const CompiledTranssysProgram *self)
+{
+  if (check_not_modifying(self) != 0)
+  {
+    return (-1);
+  }
+  if (self->num_active_runs > 0)
+  {
+    PyErr_SetString(PyExc_RuntimeError, "compiled program is being simulated");
+    return (-1);
+  }
+  return (0);
+}
+
+
+/*
+ * Time series iterators: objects that compute a time series lazily,
+ * sample by sample, keeping only the current state of the transsys
+ * instance, so that memory use does not depend on the length of the
+ * series. The transsys program is either extracted when the iterator
+ * is created and owned by the iterator, or it is that of a compiled
+ * transsys program. In the latter case, the iterator counts as an
+ * active run of the compiled program until it is exhausted or
+ * deallocated, so the compiled program's values cannot be changed
+ * while it is in use. num_timesteps is negative for unbounded series.
+ */
+typedef struct
+{
+  PyObject_HEAD
+  PyObject *python_tp;
+  CompiledTranssysProgram *ctp;
+  TRANSSYS *transsys;
+  int uses_random;
+  TRANSSYS_INSTANCE *ti;
+  URANDOM_STATE urandom_state;
+  TRANSSYS_BYTECODE *bc;
+  double *value;
+  long num_timesteps;
+  long sampling_period;
+  long timestep;
+  int running;
+} TimeSeriesIterator;
+
+
+static PyTypeObject TimeSeriesIteratorType = {
+  PyObject_HEAD_INIT(NULL)
+  0,
+  "transsys.clib.TimeSeriesIterator",
+  sizeof(TimeSeriesIterator)
+};
+
+
+/*
+ * Free the C level structures of a time series iterator, and release
+ * the compiled program, if any. Subsequent calls to next raise
+ * StopIteration.
+ */
+static void finishTimeSeriesIterator(TimeSeriesIterator *self)
+{
+  if (self->ti != NULL)
+  {
+    free_simulation_bytecode(self->bc, self->value);
+    self->bc = NULL;
+    self->value = NULL;
+    free_transsys_instance(self->ti);
+    self->ti = NULL;
+    if (self->ctp != NULL)
+    {
+      self->ctp->num_active_runs--;
+    }
+  }
+  if (self->transsys != NULL)
+  {
+    free_transsys_list(self->transsys);
+    self->transsys = NULL;
+  }
+}
+
+
+static void TimeSeriesIterator_dealloc(TimeSeriesIterator *self)
+{
+  finishTimeSeriesIterator(self);
+  Py_XDECREF((PyObject *) self->ctp);
+  Py_XDECREF(self->python_tp);
+  self->ob_type->tp_free((PyObject *) self);
+}
+
+
+/*
+ * Construct a time series iterator starting from the concentrations
+ * of python_ti_start. If ctp is NULL, ownership of tp is taken over
+ * by the iterator (and tp is freed if construction fails), otherwise
+ * tp must be the transsys program of ctp.
+ */
+static PyObject *newTimeSeriesIterator(PyObject *python_tp, CompiledTranssysProgram *ctp, TRANSSYS *tp, int uses_random, PyObject *python_seed, PyObject *python_ti_start, long num_timesteps, long sampling_period)
+{
+  TimeSeriesIterator *tsi;
+  URANDOM_STATE *seeded_state;
+
+  tsi = PyObject_New(TimeSeriesIterator, &TimeSeriesIteratorType);
+  if (tsi == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "newTimeSeriesIterator: PyObject_New failed\n");
+    if (ctp == NULL)
+    {
+      free_transsys_list(tp);
+    }
+    return (NULL);
+  }
+  Py_INCREF(python_tp);
+  tsi->python_tp = python_tp;
+  Py_XINCREF((PyObject *) ctp);
+  tsi->ctp = ctp;
+  tsi->transsys = (ctp == NULL) ? tp : NULL;
+  tsi->uses_random = uses_random;
+  tsi->ti = NULL;
+  tsi->bc = NULL;
+  tsi->value = NULL;
+  tsi->num_timesteps = num_timesteps;
+  tsi->sampling_period = sampling_period;
+  tsi->timestep = -1;
+  tsi->running = 0;
+  if (extract_urandom_state(python_seed, &(tsi->urandom_state), &seeded_state) != 0)
+  {
+    Py_DECREF(tsi);
+    return (NULL);
+  }
+  tsi->ti = new_transsys_instance(tp);
+  if (tsi->ti == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "newTimeSeriesIterator: new_transsys_instance failed\n");
+    PyErr_SetString(PyExc_MemoryError, "newTimeSeriesIterator: new_transsys_instance failed");
+    Py_DECREF(tsi);
+    return (NULL);
+  }
+  if (ctp != NULL)
+  {
+    ctp->num_active_runs++;
+  }
+  tsi->ti->urandom_state = seeded_state;
+  if (extract_initial_factor_concentrations(python_ti_start, tsi->ti) != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "newTimeSeriesIterator: extract_initial_factor_concentrations failed\n");
+    Py_DECREF(tsi);
+    return (NULL);
+  }
+  tsi->bc = new_simulation_bytecode(tp, &(tsi->value));
+  return ((PyObject *) tsi);
+}
+
+
+static PyObject *TimeSeriesIterator_next(TimeSeriesIterator *self)
+{
+  PyThreadState *thread_state;
+  long i;
+
+  if (self->ti == NULL)
+  {
+    return (NULL);
+  }
+  if (self->running)
+  {
+    PyErr_SetString(PyExc_ValueError, "TimeSeriesIterator.next: iterator already executing");
+    return (NULL);
+  }
+  if (self->timestep < 0)
+  {
+    self->timestep = 0;
+  }
+  else
+  {
+    self->running = 1;
+    thread_state = begin_simulation(self->uses_random && (self->ti->urandom_state == NULL));
+    for (i = 0; i < self->sampling_period; i++)
+    {
+      if (self->bc != NULL)
+      {
+	process_expression_bytecode(self->ti, self->bc, self->value);
+      }
+      else
+      {
+	process_expression(self->ti);
+      }
+    }
+    end_simulation(thread_state);
+    self->running = 0;
+    self->timestep += self->sampling_period;
+  }
+  if ((self->num_timesteps >= 0) && (self->timestep >= self->num_timesteps))
+  {
+    finishTimeSeriesIterator(self);
+    return (NULL);
+  }
+  return (newTranssysInstanceAtTimestep(self->python_tp, self->ti, self->timestep));
+}
+
+
+/*
+ * Extract the number of time steps of a time series iterator, None
+ * specifies an unbounded series (-1).
+ */
+static int extract_num_timesteps(PyObject *python_num_timesteps, long *num_timesteps)
+{
+  if (python_num_timesteps == Py_None)
+  {
+    *num_timesteps = -1;
+    return (0);
+  }
+  *num_timesteps = PyInt_AsLong(python_num_timesteps);
+  if ((*num_timesteps == -1) && PyErr_Occurred())
+  {
+    return (-1);
+  }
+  if (*num_timesteps < 0)
+  {
+    *num_timesteps = 0;
+  }
+  return (0);
+}
+
+
+static PyObject *clib_timeseries_iter(PyObject *self, PyObject *args)
+{
+  PyObject *python_ti_start, *python_tp, *python_num_timesteps, *python_seed = Py_None, *python_tsi;
+  long num_timesteps, sampling_period = 1;
+  TRANSSYS *tp;
+
+  if (!PyArg_ParseTuple(args, "OO|lO", &python_ti_start, &python_num_timesteps, &sampling_period, &python_seed))
+  {
+    return (NULL);
+  }
+  if (extract_num_timesteps(python_num_timesteps, &num_timesteps) != 0)
+  {
+    return (NULL);
+  }
+  if (sampling_period < 1)
+  {
+    PyErr_SetString(PyExc_ValueError, "clib_timeseries_iter: sampling period must be positive");
+    return (NULL);
+  }
+  if (initPythonClasses() != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "clib_timeseries_iter: initPythonClasses failed\n");
+    return (NULL);
+  }
+  if (!checkClass(python_ti_start, pythonClasses.TranssysInstance, "clib_timeseries_iter: not an instance of TranssysInstance"))
+  {
+    return (NULL);
+  }
+  python_tp = PyObject_GetAttrString(python_ti_start, "transsys_program");
+  if (python_tp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "clib_timeseries_iter: PyObject_GetAttrString failed for \"transsys_program\"\n");
+    return (NULL);
+  }
+  tp = extract_transsys(python_tp);
+  if (tp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "clib_timeseries_iter: extract_transsys failed\n");
+    Py_DECREF(python_tp);
+    return (NULL);
+  }
+  python_tsi = newTimeSeriesIterator(python_tp, NULL, tp, transsys_uses_random(tp), python_seed, python_ti_start, num_timesteps, sampling_period);
+  Py_DECREF(python_tp);
+  return (python_tsi);
+}
+
+
+static PyObject *CompiledTranssysProgram_timeseries(CompiledTranssysProgram *self, PyObject *args)
+{
+  PyObject *python_ti_start, *python_tp, *python_seed = Py_None, *python_ti_list;
+  URANDOM_STATE urandom_state, *seeded_state;
+  long num_timesteps, sampling_period = 1;
+
+  if (!PyArg_ParseTuple(args, "Ol|lO", &python_ti_start, &num_timesteps, &sampling_period, &python_seed))
+  {
+    return (NULL);
+  }
+  if (sampling_period < 1)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledTranssysProgram.timeseries: sampling period must be positive");
+    return (NULL);
+  }
+  if (extract_urandom_state(python_seed, &urandom_state, &seeded_state) != 0)
+  {
+    return (NULL);
+  }
+  if (initPythonClasses() != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "CompiledTranssysProgram_timeseries: initPythonClasses failed\n");
+    return (NULL);
+  }
+  if (!checkClass(python_ti_start, pythonClasses.TranssysInstance, "CompiledTranssysProgram.timeseries: not an instance of TranssysInstance"))
+  {
+    return (NULL);
+  }
+  python_tp = PyObject_GetAttrString(python_ti_start, "transsys_program");
+  if (python_tp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "CompiledTranssysProgram_timeseries: PyObject_GetAttrString failed for \"transsys_program\"\n");
+    return (NULL);
+  }
+  Py_DECREF(python_tp);
+  if (python_tp != self->python_tp)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledTranssysProgram.timeseries: transsys instance is not an instance of the compiled program");
+    return (NULL);
+  }
+  if (check_not_modifying(self) != 0)
+  {
+    return (NULL);
+  }
+  self->num_active_runs++;
+  python_ti_list = transsysTimeSeries(self->python_tp, self->transsys, self->uses_random, seeded_state, python_ti_start, num_timesteps, sampling_period);
+  self->num_active_runs--;
+  if (python_ti_list == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "CompiledTranssysProgram_timeseries: transsysTimeSeries failed\n");
+    return (NULL);
+  }
+  return (python_ti_list);
+}
+
+
+static PyObject *CompiledTranssysProgram_timeseries_array(CompiledTranssysProgram *self, PyObject *args)
+{
+  PyObject *python_ti_start, *python_tp, *python_seed = Py_None, *python_a;
+  URANDOM_STATE urandom_state, *seeded_state;
+  long num_timesteps, sampling_period = 1;
+
+  if (!PyArg_ParseTuple(args, "Ol|lO", &python_ti_start, &num_timesteps, &sampling_period, &python_seed))
+  {
+    return (NULL);
+  }
+  if (sampling_period < 1)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledTranssysProgram.timeseries_array: sampling period must be positive");
+    return (NULL);
+  }
+  if (extract_urandom_state(python_seed, &urandom_state, &seeded_state) != 0)
+  {
+    return (NULL);
+  }
+  if (initPythonClasses() != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "CompiledTranssysProgram_timeseries_array: initPythonClasses failed\n");
+    return (NULL);
+  }
+  if (!checkClass(python_ti_start, pythonClasses.TranssysInstance, "CompiledTranssysProgram.timeseries_array: not an instance of TranssysInstance"))
+  {
+    return (NULL);
+  }
+  python_tp = PyObject_GetAttrString(python_ti_start, "transsys_program");
+  if (python_tp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "CompiledTranssysProgram_timeseries_array: PyObject_GetAttrString failed for \"transsys_program\"\n");
+    return (NULL);
+  }
+  Py_DECREF(python_tp);
+  if (python_tp != self->python_tp)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledTranssysProgram.timeseries_array: transsys instance is not an instance of the compiled program");
+    return (NULL);
+  }
+  if (check_not_modifying(self) != 0)
+  {
+    return (NULL);
+  }
+  self->num_active_runs++;
+  python_a = transsysTimeSeriesArray(self->transsys, self->uses_random, seeded_state, python_ti_start, num_timesteps, sampling_period);
+  self->num_active_runs--;
+  return (python_a);
+}
+
+
+static PyObject *CompiledTranssysProgram_final_state(CompiledTranssysProgram *self, PyObject *args)
+{
+  PyObject *python_ti_start, *python_tp, *python_seed = Py_None, *python_ti;
+  URANDOM_STATE urandom_state, *seeded_state;
+  long num_timesteps;
+
+  if (!PyArg_ParseTuple(args, "Ol|O", &python_ti_start, &num_timesteps, &python_seed))
+  {
+    return (NULL);
+  }
+  if (extract_urandom_state(python_seed, &urandom_state, &seeded_state) != 0)
+  {
+    return (NULL);
+  }
+  if (initPythonClasses() != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "CompiledTranssysProgram_final_state: initPythonClasses failed\n");
+    return (NULL);
+  }
+  if (!checkClass(python_ti_start, pythonClasses.TranssysInstance, "CompiledTranssysProgram.final_state: not an instance of TranssysInstance"))
+  {
+    return (NULL);
+  }
+  python_tp = PyObject_GetAttrString(python_ti_start, "transsys_program");
+  if (python_tp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "CompiledTranssysProgram_final_state: PyObject_GetAttrString failed for \"transsys_program\"\n");
+    return (NULL);
+  }
+  Py_DECREF(python_tp);
+  if (python_tp != self->python_tp)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledTranssysProgram.final_state: transsys instance is not an instance of the compiled program");
+    return (NULL);
+  }
+  if (check_not_modifying(self) != 0)
+  {
+    return (NULL);
+  }
+  self->num_active_runs++;
+  python_ti = transsysFinalState(self->python_tp, self->transsys, self->uses_random, seeded_state, python_ti_start, num_timesteps);
+  self->num_active_runs--;
+  return (python_ti);
+}
+
+
+static PyObject *CompiledTranssysProgram_attractor(CompiledTranssysProgram *self, PyObject *args)
+{
+  PyObject *python_ti_start, *python_tp, *python_seed = Py_None, *python_result;
+  URANDOM_STATE urandom_state, *seeded_state;
+  long max_timesteps;
+  double tolerance = 0.0;
+  int max_period = 100;
+
+  if (!PyArg_ParseTuple(args, "Ol|diO", &python_ti_start, &max_timesteps, &tolerance, &max_period, &python_seed))
+  {
+    return (NULL);
+  }
+  if (max_period < 1)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledTranssysProgram.attractor: maximal period must be positive");
+    return (NULL);
+  }
+  if (extract_urandom_state(python_seed, &urandom_state, &seeded_state) != 0)
+  {
+    return (NULL);
+  }
+  if (initPythonClasses() != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "CompiledTranssysProgram_attractor: initPythonClasses failed\n");
+    return (NULL);
+  }
+  if (!checkClass(python_ti_start, pythonClasses.TranssysInstance, "CompiledTranssysProgram.attractor: not an instance of TranssysInstance"))
+  {
+    return (NULL);
+  }
+  python_tp = PyObject_GetAttrString(python_ti_start, "transsys_program");
+  if (python_tp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "CompiledTranssysProgram_attractor: PyObject_GetAttrString failed for \"transsys_program\"\n");
+    return (NULL);
+  }
+  Py_DECREF(python_tp);
+  if (python_tp != self->python_tp)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledTranssysProgram.attractor: transsys instance is not an instance of the compiled program");
+    return (NULL);
+  }
+  if (check_not_modifying(self) != 0)
+  {
+    return (NULL);
+  }
+  self->num_active_runs++;
+  python_result = transsysAttractor(self->python_tp, self->transsys, self->uses_random, seeded_state, python_ti_start, max_timesteps, tolerance, max_period);
+  self->num_active_runs--;
+  return (python_result);
+}
+
+
+static PyObject *CompiledTranssysProgram_timeseries_iter(CompiledTranssysProgram *self, PyObject *args)
+{
+  PyObject *python_ti_start, *python_tp, *python_num_timesteps, *python_seed = Py_None;
+  long num_timesteps, sampling_period = 1;
+
+  if (!PyArg_ParseTuple(args, "OO|lO", &python_ti_start, &python_num_timesteps, &sampling_period, &python_seed))
+  {
+    return (NULL);
+  }
+  if (extract_num_timesteps(python_num_timesteps, &num_timesteps) != 0)
+  {
+    return (NULL);
+  }
+  if (sampling_period < 1)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledTranssysProgram.timeseries_iter: sampling period must be positive");
+    return (NULL);
+  }
+  if (initPythonClasses() != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "CompiledTranssysProgram_timeseries_iter: initPythonClasses failed\n");
+    return (NULL);
+  }
+  if (!checkClass(python_ti_start, pythonClasses.TranssysInstance, "CompiledTranssysProgram.timeseries_iter: not an instance of TranssysInstance"))
+  {
+    return (NULL);
+  }
+  python_tp = PyObject_GetAttrString(python_ti_start, "transsys_program");
+  if (python_tp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "CompiledTranssysProgram_timeseries_iter: PyObject_GetAttrString failed for \"transsys_program\"\n");
+    return (NULL);
+  }
+  Py_DECREF(python_tp);
+  if (python_tp != self->python_tp)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledTranssysProgram.timeseries_iter: transsys instance is not an instance of the compiled program");
+    return (NULL);
+  }
+  if (check_not_modifying(self) != 0)
+  {
+    return (NULL);
+  }
+  return (newTimeSeriesIterator(self->python_tp, self, self->transsys, self->uses_random, python_seed, python_ti_start, num_timesteps, sampling_period));
+}
+
+
+static PyObject *CompiledTranssysProgram_ensemble_timeseries(CompiledTranssysProgram *self, PyObject *args)
+{
+  PyObject *python_initial, *python_a;
+  long num_timesteps, sampling_period = 1;
+
+  if (!PyArg_ParseTuple(args, "Ol|l", &python_initial, &num_timesteps, &sampling_period))
+  {
+    return (NULL);
+  }
+  if (sampling_period < 1)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledTranssysProgram.ensemble_timeseries: sampling period must be positive");
+    return (NULL);
+  }
+  if (check_not_modifying(self) != 0)
+  {
+    return (NULL);
+  }
+  self->num_active_runs++;
+  python_a = transsysEnsembleTimeSeriesArray(self->transsys, self->uses_random, python_initial, num_timesteps, sampling_period);
+  self->num_active_runs--;
+  return (python_a);
+}
+
+
+/*
+ * Simulate the compiled program for each row of a matrix of values
+ * for the bound nodes, starting from the factor concentrations of
+ * python_ti_start. If final_only is nonzero, only the state after
+ * num_timesteps steps is recorded, resulting in a concentration array
+ * of shape (number of parameter sets, number of factors). Otherwise,
+ * a time series is recorded as by transsysTimeSeriesArray for each
+ * parameter set, resulting in a concentration array of shape
+ * (number of parameter sets, number of samples, number of factors).
+ * The values of the bound nodes are restored when done. No other
+ * simulations of the compiled program can be run in the meantime.
+ */
+static PyObject *compiledParameterSeries(CompiledTranssysProgram *self, PyObject *python_ti_start, PyObject *python_parameters, long num_timesteps, long sampling_period, int final_only)
+{
+  const TRANSSYS *tp = self->transsys;
+  TRANSSYS_INSTANCE *ti;
+  PyThreadState *thread_state;
+  ConcentrationArray *a;
+  Py_ssize_t shape[3];
+  double *parameters, *saved_values, *initial, *d;
+  size_t num_parameter_sets, n, j;
+
+  if (initPythonClasses() != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "compiledParameterSeries: initPythonClasses failed\n");
+    return (NULL);
+  }
+  if (self->num_bound_nodes == 0)
+  {
+    PyErr_SetString(PyExc_ValueError, "compiledParameterSeries: no bound nodes");
+    return (NULL);
+  }
+  if (check_idle(self) != 0)
+  {
+    return (NULL);
+  }
+  parameters = extract_double_matrix(python_parameters, self->num_bound_nodes, &num_parameter_sets);
+  if (parameters == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "compiledParameterSeries: extract_double_matrix failed\n");
+    return (NULL);
+  }
+  ti = new_transsys_instance(tp);
+  if (ti == NULL)
+  {
+    PyErr_SetString(PyExc_MemoryError, "compiledParameterSeries: new_transsys_instance failed");
+    free(parameters);
+    return (NULL);
+  }
+  if (extract_initial_factor_concentrations(python_ti_start, ti) != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "compiledParameterSeries: extract_initial_factor_concentrations failed\n");
+    free_transsys_instance(ti);
+    free(parameters);
+    return (NULL);
+  }
+  saved_values = (double *) malloc((self->num_bound_nodes + tp->num_factors) * sizeof(double));
+  if (saved_values == NULL)
+  {
+    PyErr_SetString(PyExc_MemoryError, "compiledParameterSeries: malloc failed");
+    free_transsys_instance(ti);
+    free(parameters);
+    return (NULL);
+  }
+  initial = saved_values + self->num_bound_nodes;
+  memcpy(initial, ti->factor_concentration, tp->num_factors * sizeof(double));
+  shape[0] = num_parameter_sets;
+  if (final_only)
+  {
+    shape[1] = tp->num_factors;
+    a = newConcentrationArray(2, shape);
+  }
+  else
+  {
+    shape[1] = num_samples(num_timesteps, sampling_period);
+    shape[2] = tp->num_factors;
+    a = newConcentrationArray(3, shape);
+  }
+  if (a == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "compiledParameterSeries: newConcentrationArray failed\n");
+    free(saved_values);
+    free_transsys_instance(ti);
+    free(parameters);
+    return (NULL);
+  }
+  for (j = 0; j < self->num_bound_nodes; j++)
+  {
+    saved_values[j] = self->bound_node[j]->content.value;
+  }
+  d = a->data;
+  self->modifying = 1;
+  thread_state = begin_simulation(self->uses_random);
+  for (n = 0; n < num_parameter_sets; n++)
+  {
+    for (j = 0; j < self->num_bound_nodes; j++)
+    {
+      self->bound_node[j]->content.value = parameters[n * self->num_bound_nodes + j];
+    }
+    memcpy(ti->factor_concentration, initial, tp->num_factors * sizeof(double));
+    if (final_only)
+    {
+      simulate_transsys_instance(ti, num_timesteps, sampling_period, NULL);
+      memcpy(d, ti->factor_concentration, tp->num_factors * sizeof(double));
+      d += tp->num_factors;
+    }
+    else
+    {
+      simulate_transsys_instance(ti, num_timesteps, sampling_period, d);
+      d += shape[1] * tp->num_factors;
+    }
+  }
+  for (j = 0; j < self->num_bound_nodes; j++)
+  {
+    self->bound_node[j]->content.value = saved_values[j];
+  }
+  end_simulation(thread_state);
+  self->modifying = 0;
+  free(saved_values);
+  free_transsys_instance(ti);
+  free(parameters);
+  return ((PyObject *) a);
+}
+
+
+static PyObject *CompiledTranssysProgram_parameter_timeseries(CompiledTranssysProgram *self, PyObject *args)
+{
+  PyObject *python_ti_start, *python_parameters;
+  long num_timesteps, sampling_period = 1;
+
+  if (!PyArg_ParseTuple(args, "OOl|l", &python_ti_start, &python_parameters, &num_timesteps, &sampling_period))
+  {
+    return (NULL);
+  }
+  if (sampling_period < 1)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledTranssysProgram.parameter_timeseries: sampling period must be positive");
+    return (NULL);
+  }
+  return (compiledParameterSeries(self, python_ti_start, python_parameters, num_timesteps, sampling_period, 0));
+}
+
+
+static PyObject *CompiledTranssysProgram_parameter_final_states(CompiledTranssysProgram *self, PyObject *args)
+{
+  PyObject *python_ti_start, *python_parameters;
+  long num_timesteps;
+
+  if (!PyArg_ParseTuple(args, "OOl", &python_ti_start, &python_parameters, &num_timesteps))
+  {
+    return (NULL);
+  }
+  return (compiledParameterSeries(self, python_ti_start, python_parameters, num_timesteps, 1, 1));
+}
+
+
+static PyObject *CompiledTranssysProgram_bind(CompiledTranssysProgram *self, PyObject *args)
+{
+  PyObject *python_node_list, *python_node_seq;
+  EXPRESSION_NODE **bound_node;
+  Py_ssize_t num_nodes, i;
+
+  if (!PyArg_ParseTuple(args, "O", &python_node_list))
+  {
+    return (NULL);
+  }
+  if (check_idle(self) != 0)
+  {
+    return (NULL);
+  }
+  python_node_seq = PySequence_Fast(python_node_list, "CompiledTranssysProgram.bind: argument must be a sequence of value nodes");
+  if (python_node_seq == NULL)
+  {
+    return (NULL);
+  }
+  num_nodes = PySequence_Fast_GET_SIZE(python_node_seq);
+  bound_node = (EXPRESSION_NODE **) malloc((num_nodes + 1) * sizeof(EXPRESSION_NODE *));
+  if (bound_node == NULL)
+  {
+    PyErr_SetString(PyExc_MemoryError, "CompiledTranssysProgram.bind: malloc failed");
+    Py_DECREF(python_node_seq);
+    return (NULL);
+  }
+  for (i = 0; i < num_nodes; i++)
+  {
+    bound_node[i] = find_value_node(&(self->value_nodes), PySequence_Fast_GET_ITEM(python_node_seq, i));
+    if (bound_node[i] == NULL)
+    {
+      clib_message(CLIB_MSG_TRACE, "CompiledTranssysProgram_bind: find_value_node failed for node #%ld\n", (long) i);
+      free(bound_node);
+      Py_DECREF(python_node_seq);
+      return (NULL);
+    }
+  }
+  Py_DECREF(python_node_seq);
+  if (self->bound_node)
+  {
+    free(self->bound_node);
+  }
+  self->bound_node = bound_node;
+  self->num_bound_nodes = num_nodes;
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
+/*
+ * Set the values of the bound nodes. The values can be provided
+ * as an object supporting the buffer interface and containing
+ * C doubles (e.g. an array.array('d')), this is done by copying
+ * the buffer's contents directly. Otherwise, the values can be any
+ * sequence of numbers.
+ */
+static PyObject *CompiledTranssysProgram_set_values(CompiledTranssysProgram *self, PyObject *args)
+{
+  PyObject *python_values, *python_value_seq;
+  const void *buffer;
+  const double *v;
+  Py_ssize_t buffer_length;
+  size_t i;
+
+  if (!PyArg_ParseTuple(args, "O", &python_values))
+  {
+    return (NULL);
+  }
+  if (check_idle(self) != 0)
+  {
+    return (NULL);
+  }
+  if (PyObject_CheckReadBuffer(python_values) && !PyString_Check(python_values))
+  {
+    if (PyObject_AsReadBuffer(python_values, &buffer, &buffer_length) != 0)
+    {
+      return (NULL);
+    }
+    if ((size_t) buffer_length != self->num_bound_nodes * sizeof(double))
+    {
+      PyErr_SetString(PyExc_ValueError, "CompiledTranssysProgram.set_values: buffer size does not match number of bound nodes");
+      return (NULL);
+    }
+    v = (const double *) buffer;
+    for (i = 0; i < self->num_bound_nodes; i++)
+    {
+      self->bound_node[i]->content.value = v[i];
+    }
+    Py_INCREF(Py_None);
+    return (Py_None);
+  }
+  python_value_seq = PySequence_Fast(python_values, "CompiledTranssysProgram.set_values: argument must be a buffer of doubles or a sequence");
+  if (python_value_seq == NULL)
+  {
+    return (NULL);
+  }
+  if ((size_t) PySequence_Fast_GET_SIZE(python_value_seq) != self->num_bound_nodes)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledTranssysProgram.set_values: number of values does not match number of bound nodes");
+    Py_DECREF(python_value_seq);
+    return (NULL);
+  }
+  for (i = 0; i < self->num_bound_nodes; i++)
+  {
+    double x = PyFloat_AsDouble(PySequence_Fast_GET_ITEM(python_value_seq, i));
+
+    if (PyErr_Occurred() != NULL)
+    {
+      Py_DECREF(python_value_seq);
+      return (NULL);
+    }
+    self->bound_node[i]->content.value = x;
+  }
+  Py_DECREF(python_value_seq);
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
+static PyObject *CompiledTranssysProgram_get_values(CompiledTranssysProgram *self, PyObject *args)
+{
+  PyObject *python_value_list, *python_value;
+  size_t i;
+
+  if (check_not_modifying(self) != 0)
+  {
+    return (NULL);
+  }
+  python_value_list = PyList_New(self->num_bound_nodes);
+  if (python_value_list == NULL)
+  {
+    return (NULL);
+  }
+  for (i = 0; i < self->num_bound_nodes; i++)
+  {
+    python_value = PyFloat_FromDouble(self->bound_node[i]->content.value);
+    if (python_value == NULL)
+    {
+      Py_DECREF(python_value_list);
+      return (NULL);
+    }
+    PyList_SET_ITEM(python_value_list, i, python_value);
+  }
+  return (python_value_list);
+}
+
+
+/*
+ * Derivation series iterators: objects that compute a derivation
+ * series lazily, returning one sampled lsys symbol string at a time
+ * and keeping only the current C level lsys string, so that the
+ * strings of earlier steps can be freed while the derivation goes on.
+ * The lsys is either extracted when the iterator is created and owned
+ * by the iterator, or it is that of a compiled lsys program, which
+ * then counts the iterator as an active run until it is exhausted or
+ * deallocated. num_timesteps is negative for unbounded series.
+ * A derivation can be resumed from a snapshot saved by an iterator,
+ * timestep then continues from the time step of the snapshot.
+ */
+typedef struct
+{
+  PyObject_HEAD
+  PyObject *python_lsys;
+  CompiledLsysProgram *clp;
+  LSYS *lsys;
+  int uses_random;
+  URANDOM_STATE urandom_state;
+  LSYS_STRING_BUFFER buffer;
+  LSYS_STRING *lstr;
+  long num_timesteps;
+  long sampling_period;
+  long timestep;
+  int running;
+} DerivationSeriesIterator;
+
+
+static PyTypeObject DerivationSeriesIteratorType = {
+  PyObject_HEAD_INIT(NULL)
+  0,
+  "transsys.clib.DerivationSeriesIterator",
+  sizeof(DerivationSeriesIterator)
+};
+
+
+static void finishDerivationSeriesIterator(DerivationSeriesIterator *self)
+{
+  if (self->lstr != NULL)
+  {
+    free_lsys_string(self->lstr);
+    self->lstr = NULL;
+    if (self->clp != NULL)
+    {
+      self->clp->num_active_runs--;
+    }
+  }
+  free_lsys_string_buffer_components(&(self->buffer));
+  if (self->lsys != NULL)
+  {
+    free_lsys_with_transsys(self->lsys);
+    self->lsys = NULL;
+  }
+}
+
+
+static void DerivationSeriesIterator_dealloc(DerivationSeriesIterator *self)
+{
+  finishDerivationSeriesIterator(self);
+  Py_XDECREF((PyObject *) self->clp);
+  Py_XDECREF(self->python_lsys);
+  self->ob_type->tp_free((PyObject *) self);
+}
+
+
+/*
+ * Set up the lsys string of a derivation series iterator from the
+ * snapshot file python_snapshot. The random number generator state
+ * saved in the snapshot is restored to the iterator's generator,
+ * unless python_seed is not None, in which case the derivation is
+ * forked by seeding the generator with python_seed.
+ */
+static int loadDerivationSeriesIteratorSnapshot(DerivationSeriesIterator *dsi, const LSYS *lsys, PyObject *python_snapshot, PyObject *python_seed)
+{
+  URANDOM_STATE *seeded_state;
+  unsigned long timestep;
+
+  if (!PyString_Check(python_snapshot))
+  {
+    PyErr_SetString(PyExc_TypeError, "newDerivationSeriesIterator: snapshot must be a file name or None");
+    return (-1);
+  }
+  dsi->lstr = load_lsys_string_snapshot(PyString_AsString(python_snapshot), lsys, &(dsi->urandom_state), lsys_string_buffer_next_arena(&(dsi->buffer)), &timestep);
+  if (dsi->lstr == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "loadDerivationSeriesIteratorSnapshot: load_lsys_string_snapshot failed\n");
+    PyErr_SetString(PyExc_IOError, "newDerivationSeriesIterator: failed to load snapshot");
+    return (-1);
+  }
+  if (timestep > LONG_MAX)
+  {
+    PyErr_SetString(PyExc_ValueError, "newDerivationSeriesIterator: time step of snapshot out of range");
+    return (-1);
+  }
+  dsi->timestep = (long) timestep;
+  if ((python_seed != NULL) && (python_seed != Py_None))
+  {
+    if (extract_urandom_state(python_seed, &(dsi->urandom_state), &seeded_state) != 0)
+    {
+      return (-1);
+    }
+    set_lsys_string_urandom_state(dsi->lstr, seeded_state);
+  }
+  return (0);
+}
+
+
+/*
+ * Construct a derivation series iterator. If clp is NULL, ownership
+ * of lsys is taken over by the iterator (and lsys is freed if
+ * construction fails), otherwise lsys must be the lsys of clp. The
+ * derivation starts from the axiom, or from the snapshot in the file
+ * python_snapshot unless that is None.
+ */
+static PyObject *newDerivationSeriesIterator(PyObject *python_lsys, CompiledLsysProgram *clp, LSYS *lsys, int uses_random, PyObject *python_seed, PyObject *python_snapshot, long num_timesteps, long sampling_period)
+{
+  DerivationSeriesIterator *dsi;
+  URANDOM_STATE *seeded_state;
+
+  dsi = PyObject_New(DerivationSeriesIterator, &DerivationSeriesIteratorType);
+  if (dsi == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "newDerivationSeriesIterator: PyObject_New failed\n");
+    if (clp == NULL)
+    {
+      free_lsys_with_transsys(lsys);
+    }
+    return (NULL);
+  }
+  Py_INCREF(python_lsys);
+  dsi->python_lsys = python_lsys;
+  Py_XINCREF((PyObject *) clp);
+  dsi->clp = clp;
+  dsi->lsys = (clp == NULL) ? lsys : NULL;
+  dsi->uses_random = uses_random;
+  init_lsys_string_buffer(&(dsi->buffer));
+  dsi->lstr = NULL;
+  dsi->num_timesteps = num_timesteps;
+  dsi->sampling_period = sampling_period;
+  dsi->timestep = 0;
+  dsi->running = 0;
+  if ((python_snapshot != NULL) && (python_snapshot != Py_None))
+  {
+    if (loadDerivationSeriesIteratorSnapshot(dsi, lsys, python_snapshot, python_seed) != 0)
+    {
+      if (dsi->lstr != NULL)
+      {
+	free_lsys_string(dsi->lstr);
+	dsi->lstr = NULL;
+      }
+      Py_DECREF(dsi);
+      return (NULL);
+    }
+    if (clp != NULL)
+    {
+      clp->num_active_runs++;
+    }
+    return ((PyObject *) dsi);
+  }
+  if (extract_urandom_state(python_seed, &(dsi->urandom_state), &seeded_state) != 0)
+  {
+    Py_DECREF(dsi);
+    return (NULL);
+  }
+  dsi->lstr = axiom_string_arena(lsys, seeded_state, lsys_string_buffer_next_arena(&(dsi->buffer)));
+  if (dsi->lstr == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "newDerivationSeriesIterator: axiom_string_arena failed\n");
+    PyErr_SetString(PyExc_MemoryError, "newDerivationSeriesIterator: axiom_string_arena failed");
+    Py_DECREF(dsi);
+    return (NULL);
+  }
+  if (clp != NULL)
+  {
+    clp->num_active_runs++;
+  }
+  return ((PyObject *) dsi);
+}
+
+
+/*
+ * Carry out derivation steps up to the next sampled one, as done by
+ * lsysDerivationSeries, and return the sampled lsys symbol string.
+ */
+static PyObject *DerivationSeriesIterator_next(DerivationSeriesIterator *self)
+{
+  PyThreadState *thread_state;
+  PyObject *python_lstr = NULL;
+  LSYS_STRING *lstr_next;
+
+  if (self->lstr == NULL)
+  {
+    return (NULL);
+  }
+  if (self->running)
+  {
+    PyErr_SetString(PyExc_ValueError, "DerivationSeriesIterator.next: iterator already executing");
+    return (NULL);
+  }
+  while ((self->num_timesteps < 0) || (self->timestep < self->num_timesteps))
+  {
+    self->running = 1;
+    thread_state = begin_simulation(self->uses_random && (self->lstr->urandom_state == NULL));
+    lsys_string_expression(self->lstr);
+    lsys_string_diffusion(self->lstr);
+    lstr_next = derived_string_arena(self->lstr, lsys_string_buffer_next_arena(&(self->buffer)));
+    end_simulation(thread_state);
+    self->running = 0;
+    if (lstr_next == NULL)
+    {
+      clib_message(CLIB_MSG_TRACE, "DerivationSeriesIterator_next: derived_string_arena failed\n");
+      PyErr_SetString(PyExc_MemoryError, "DerivationSeriesIterator.next: derived_string_arena failed");
+      finishDerivationSeriesIterator(self);
+      return (NULL);
+    }
+    if ((self->timestep % self->sampling_period) == 0)
+    {
+      python_lstr = makeLsysSymbolStringAtTimestep(self->python_lsys, self->lstr, self->timestep);
+    }
+    free_lsys_string(self->lstr);
+    self->lstr = lstr_next;
+    self->timestep++;
+    if (python_lstr != NULL)
+    {
+      return (python_lstr);
+    }
+    if (PyErr_Occurred())
+    {
+      clib_message(CLIB_MSG_TRACE, "DerivationSeriesIterator_next: makeLsysSymbolStringAtTimestep failed\n");
+      return (NULL);
+    }
+  }
+  finishDerivationSeriesIterator(self);
+  return (NULL);
+}
+
+
+/*
+ * Save a snapshot of the current lsys string of the iterator, i.e. of
+ * the string at time step timestep, which has not been sampled yet.
+ */
+static PyObject *DerivationSeriesIterator_save_snapshot(DerivationSeriesIterator *self, PyObject *args)
+{
+  const char *filename;
+
+  if (!PyArg_ParseTuple(args, "s", &filename))
+  {
+    return (NULL);
+  }
+  if (self->running)
+  {
+    PyErr_SetString(PyExc_ValueError, "DerivationSeriesIterator.save_snapshot: iterator executing");
+    return (NULL);
+  }
+  if (self->lstr == NULL)
+  {
+    PyErr_SetString(PyExc_ValueError, "DerivationSeriesIterator.save_snapshot: iterator exhausted");
+    return (NULL);
+  }
+  if (save_lsys_string_snapshot(filename, self->lstr, (unsigned long) self->timestep) != 0)
+  {
+    PyErr_SetString(PyExc_IOError, "DerivationSeriesIterator.save_snapshot: failed to save snapshot");
+    return (NULL);
+  }
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
+static PyObject *clib_stringseries_iter(PyObject *self, PyObject *args)
+{
+  PyObject *python_lsys, *python_num_timesteps, *python_seed = Py_None, *python_snapshot = Py_None;
+  long num_timesteps, sampling_period = 1;
+  LSYS *lsys;
+
+  if (!PyArg_ParseTuple(args, "OO|lOO", &python_lsys, &python_num_timesteps, &sampling_period, &python_seed, &python_snapshot))
+  {
+    return (NULL);
+  }
+  if (extract_num_timesteps(python_num_timesteps, &num_timesteps) != 0)
+  {
+    return (NULL);
+  }
+  if (sampling_period < 1)
+  {
+    PyErr_SetString(PyExc_ValueError, "clib_stringseries_iter: sampling period must be positive");
+    return (NULL);
+  }
+  if (initPythonClasses() != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "clib_stringseries_iter: initPythonClasses failed\n");
+    return (NULL);
+  }
+  if (!checkClass(python_lsys, pythonClasses.LsysProgram, "clib_stringseries_iter: not an instance of LsysProgram"))
+  {
+    return (NULL);
+  }
+  lsys = extract_lsys(python_lsys);
+  if (lsys == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "clib_stringseries_iter: extract_lsys failed\n");
+    return (NULL);
+  }
+  return (newDerivationSeriesIterator(python_lsys, NULL, lsys, lsys_uses_random(lsys), python_seed, python_snapshot, num_timesteps, sampling_period));
+}
+
+
+static PyObject *CompiledLsysProgram_stringseries_iter(CompiledLsysProgram *self, PyObject *args)
+{
+  PyObject *python_num_timesteps, *python_seed = Py_None, *python_snapshot = Py_None;
+  long num_timesteps, sampling_period = 1;
+
+  if (!PyArg_ParseTuple(args, "O|lOO", &python_num_timesteps, &sampling_period, &python_seed, &python_snapshot))
+  {
+    return (NULL);
+  }
+  if (extract_num_timesteps(python_num_timesteps, &num_timesteps) != 0)
+  {
+    return (NULL);
+  }
+  if (sampling_period < 1)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledLsysProgram.stringseries_iter: sampling period must be positive");
+    return (NULL);
+  }
+  if (initPythonClasses() != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "CompiledLsysProgram_stringseries_iter: initPythonClasses failed\n");
+    return (NULL);
+  }
+  return (newDerivationSeriesIterator(self->python_lsys, self, self->lsys, self->uses_random, python_seed, python_snapshot, num_timesteps, sampling_period));
+}
+
+
+static PyObject *CompiledLsysProgram_stringseries(CompiledLsysProgram *self, PyObject *args)
+{
+  PyObject *python_lstring_list, *python_seed = Py_None;
+  URANDOM_STATE urandom_state, *seeded_state;
+  int num_timesteps, sampling_period = 1, num_threads = 1;
+
+  if (!PyArg_ParseTuple(args, "i|iOi", &num_timesteps, &sampling_period, &python_seed, &num_threads))
+  {
+    return (NULL);
+  }
+  if (sampling_period < 1)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledLsysProgram.stringseries: sampling period must be positive");
+    return (NULL);
+  }
+  if (num_threads < 1)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledLsysProgram.stringseries: number of threads must be positive");
+    return (NULL);
+  }
+  if (extract_urandom_state(python_seed, &urandom_state, &seeded_state) != 0)
+  {
+    return (NULL);
+  }
+  if (initPythonClasses() != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "CompiledLsysProgram_stringseries: initPythonClasses failed\n");
+    return (NULL);
+  }
+  self->num_active_runs++;
+  python_lstring_list = lsysDerivationSeries(self->python_lsys, self->lsys, self->uses_random, seeded_state, num_timesteps, sampling_period, 0, NULL, num_threads);
+  self->num_active_runs--;
+  if (python_lstring_list == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "CompiledLsysProgram_stringseries: lsysDerivationSeries failed\n");
+    return (NULL);
+  }
+  return (python_lstring_list);
+}
+
+
+static PyObject *CompiledLsysProgram_stringseries_columns(CompiledLsysProgram *self, PyObject *args)
+{
+  PyObject *python_lstring_list, *python_seed = Py_None, *python_tp_filter = Py_None;
+  URANDOM_STATE urandom_state, *seeded_state;
+  int num_timesteps, sampling_period = 1;
+
+  if (!PyArg_ParseTuple(args, "i|iOO", &num_timesteps, &sampling_period, &python_seed, &python_tp_filter))
+  {
+    return (NULL);
+  }
+  if (sampling_period < 1)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledLsysProgram.stringseries_columns: sampling period must be positive");
+    return (NULL);
+  }
+  if (extract_urandom_state(python_seed, &urandom_state, &seeded_state) != 0)
+  {
+    return (NULL);
+  }
+  if (initPythonClasses() != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "CompiledLsysProgram_stringseries_columns: initPythonClasses failed\n");
+    return (NULL);
+  }
+  self->num_active_runs++;
+  python_lstring_list = lsysDerivationSeries(self->python_lsys, self->lsys, self->uses_random, seeded_state, num_timesteps, sampling_period, 1, python_tp_filter, 1);
+  self->num_active_runs--;
+  return (python_lstring_list);
+}
+
+
+/*
+ * Update the values of the transsys program of the compiled lsys
+ * program that has the name of python_tp, which must differ from the
+ * compiled transsys program by values only. This allows simulating
+ * an lsys program with different transsys parameters without
+ * extracting the lsys program again. The transsys programs of the
+ * symbols of the Python lsys program are not changed, these determine
+ * the transsys programs of the transsys instances in derivation series.
+ */
+static PyObject *CompiledLsysProgram_set_transsys(CompiledLsysProgram *self, PyObject *args)
+{
+  PyObject *python_tp;
+  TRANSSYS *tp, *lsys_tp = NULL;
+  int i;
+
+  if (!PyArg_ParseTuple(args, "O", &python_tp))
+  {
+    return (NULL);
+  }
+  if (initPythonClasses() != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "CompiledLsysProgram_set_transsys: initPythonClasses failed\n");
+    return (NULL);
+  }
+  if (!checkClass(python_tp, pythonClasses.TranssysProgram, "CompiledLsysProgram.set_transsys: not an instance of TranssysProgram"))
+  {
+    return (NULL);
+  }
+  if (self->num_active_runs > 0)
+  {
+    PyErr_SetString(PyExc_RuntimeError, "compiled program is being simulated");
+    return (NULL);
+  }
+  tp = extract_transsys(python_tp);
+  if (tp == NULL)
+  {
+    clib_message(CLIB_MSG_TRACE, "CompiledLsysProgram_set_transsys: extract_transsys failed\n");
+    return (NULL);
+  }
+  for (i = 0; i < self->lsys->num_symbols; i++)
+  {
+    if ((self->lsys->symbol_list[i].transsys != NULL) && !strcmp(self->lsys->symbol_list[i].transsys->name, tp->name))
+    {
+      /* cast from const TRANSSYS * so the values can be altered */
+      lsys_tp = (TRANSSYS *) self->lsys->symbol_list[i].transsys;
+      break;
+    }
+  }
+  if (lsys_tp == NULL)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledLsysProgram.set_transsys: no transsys program of that name in compiled lsys program");
+    free_transsys_list(tp);
+    return (NULL);
+  }
+  if (copy_transsys_values(lsys_tp, tp) != 0)
+  {
+    PyErr_SetString(PyExc_ValueError, "CompiledLsysProgram.set_transsys: transsys program differs from compiled one in structure");
+    free_transsys_list(tp);
+    return (NULL);
+  }
+  free_transsys_list(tp);
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
+static PyMethodDef CompiledTranssysProgram_methods[] = {
+  {"timeseries", (PyCFunction) CompiledTranssysProgram_timeseries, METH_VARARGS, "compute time series from a transsys instance of the compiled program"},
+  {"timeseries_array", (PyCFunction) CompiledTranssysProgram_timeseries_array, METH_VARARGS, "compute time series from a transsys instance of the compiled program as a concentration array"},
+  {"timeseries_iter", (PyCFunction) CompiledTranssysProgram_timeseries_iter, METH_VARARGS, "iterate over the time series of a transsys instance of the compiled program"},
+  {"final_state", (PyCFunction) CompiledTranssysProgram_final_state, METH_VARARGS, "compute the final state of a transsys instance of the compiled program"},
+  {"attractor", (PyCFunction) CompiledTranssysProgram_attractor, METH_VARARGS, "simulate a transsys instance of the compiled program until an attractor is reached"},
+  {"ensemble_timeseries", (PyCFunction) CompiledTranssysProgram_ensemble_timeseries, METH_VARARGS, "compute time series for a matrix of initial factor concentrations as a concentration array"},
+  {"parameter_timeseries", (PyCFunction) CompiledTranssysProgram_parameter_timeseries, METH_VARARGS, "compute time series for a matrix of values of the bound nodes as a concentration array"},
+  {"parameter_final_states", (PyCFunction) CompiledTranssysProgram_parameter_final_states, METH_VARARGS, "compute final states for a matrix of values of the bound nodes as a concentration array"},
+  {"bind", (PyCFunction) CompiledTranssysProgram_bind, METH_VARARGS, "bind a list of value nodes of the compiled program for set_values"},
+  {"set_values", (PyCFunction) CompiledTranssysProgram_set_values, METH_VARARGS, "set the values of the bound nodes"},
+  {"get_values", (PyCFunction) CompiledTranssysProgram_get_values, METH_NOARGS, "get the values of the bound nodes"},
+  {NULL, NULL, 0, NULL}
+};
+
+
+static PyMethodDef CompiledLsysProgram_methods[] = {
+  {"stringseries", (PyCFunction) CompiledLsysProgram_stringseries, METH_VARARGS, "compute derivation series from the compiled lsys program"},
+  {"stringseries_columns", (PyCFunction) CompiledLsysProgram_stringseries_columns, METH_VARARGS, "compute derivation series from the compiled lsys program in columnar form"},
+  {"stringseries_iter", (PyCFunction) CompiledLsysProgram_stringseries_iter, METH_VARARGS, "iterate over the derivation series of the compiled lsys program"},
+  {"set_transsys", (PyCFunction) CompiledLsysProgram_set_transsys, METH_VARARGS, "update the values of a transsys program of the compiled lsys program"},
+  {NULL, NULL, 0, NULL}
+};
+
+
+static PyMethodDef DerivationSeriesIterator_methods[] = {
+  {"save_snapshot", (PyCFunction) DerivationSeriesIterator_save_snapshot, METH_VARARGS, "save a snapshot of the current lsys string to a file"},
+  {NULL, NULL, 0, NULL}
+};
+
+
+static PyMemberDef DerivationSeriesIterator_members[] = {
+  {"timestep", T_LONG, offsetof(DerivationSeriesIterator, timestep), READONLY, "the time step of the next derivation step"},
+  {NULL, 0, 0, 0, NULL}
+};
+
+
+static PyMemberDef CompiledTranssysProgram_members[] = {
+  {"transsys_program", T_OBJECT, offsetof(CompiledTranssysProgram, python_tp), READONLY, "the transsys program that was compiled"},
+  {NULL, 0, 0, 0, NULL}
+};
+
+
+static PyMemberDef CompiledLsysProgram_members[] = {
+  {"lsys_program", T_OBJECT, offsetof(CompiledLsysProgram, python_lsys), READONLY, "the lsys program that was compiled"},
+  {NULL, 0, 0, 0, NULL}
+};
+
+
+static PyObject *clib_compile(PyObject *self, PyObject *args)
+{
+  PyObject *python_program;
+
+  if (!PyArg_ParseTuple(args, "O", &python_program))
+  {
+    return (NULL);
+  }
+  if (initPythonClasses() != 0)
+  {
+    clib_message(CLIB_MSG_TRACE, "clib_compile: initPythonClasses failed\n");
+    return (NULL);
+  }
+  if (PyObject_IsInstance(python_program, pythonClasses.TranssysProgram))
+  {
+    return (newCompiledTranssysProgram(python_program));
+  }
+  if (PyObject_IsInstance(python_program, pythonClasses.LsysProgram))
+  {
+    return (newCompiledLsysProgram(python_program));
+  }
+  PyErr_SetString(PyExc_TypeError, "clib_compile: argument must be a TranssysProgram or a LsysProgram");
+  return (NULL);
+}
+
+
+/*
+ * Disparity scores quantify how well the concentration of a factor
+ * discriminates between the symbol instances to which a rule was
+ * applied (the active set) and all other instances (the inactive set).
+ * These are native implementations of the disparity functions of
+ * transsys.optim (stddev_disparity, difference_sign_disparity and
+ * overlap_disparity). They compute scores for one factor from a column
+ * of concentrations v and the rule indices of the instances, and
+ * they produce results identical to those of the Python functions,
+ * so floating point operations are carried out in the same order.
+ */
+typedef enum
+{
+  DISPARITY_STDDEV,
+  DISPARITY_DIFFSIGN,
+  DISPARITY_OVERLAP
+} DISPARITY_KIND;
+
+
+/*
+ * Compute mean and standard deviation of the active (if active is
+ * non-zero) or the inactive set, as transsys.utils.mean_and_stddev
+ * does. The set must contain at least two values.
+ */
+static void disparity_mean_and_stddev(const double *v, const int *rule_index, size_t n, int r, int active, double *mean, double *stddev)
+{
+  size_t i, num = 0;
+  double s = 0.0, d, d2 = 0.0;
+
+  for (i = 0; i < n; i++)
+  {
+    if ((rule_index[i] == r) == active)
+    {
+      s += v[i];
+      num++;
+    }
+  }
+  *mean = s / (double) num;
+  for (i = 0; i < n; i++)
+  {
+    if ((rule_index[i] == r) == active)
+    {
+      d = v[i] - *mean;
+      d2 += d * d;
+    }
+  }
+  *stddev = sqrt(d2 / (double) (num - 1));
+}
+
+
+static double stddev_disparity_score(const double *v, const int *rule_index, size_t n, int r, size_t num_active)
+{
+  size_t i, num_inactive = n - num_active;
+  double m_active, s_active, m_inactive, s_inactive, m_diff, m_ratio;
+
+  if ((num_active == 0) || (num_inactive == 0))
+  {
+    return (0.0);
+  }
+  for (i = 0; rule_index[i] != r; i++)
+    ;
+  if (num_active > 1)
+  {
+    disparity_mean_and_stddev(v, rule_index, n, r, 1, &m_active, &s_active);
+  }
+  else
+  {
+    m_active = v[i];
+    s_active = 0.0;
+  }
+  if (num_inactive > 1)
+  {
+    disparity_mean_and_stddev(v, rule_index, n, r, 0, &m_inactive, &s_inactive);
+  }
+  else
+  {
+    /* like stddev_disparity, use the first active value as the mean
+       of an inactive set consisting of one value */
+    m_inactive = v[i];
+    s_inactive = 0.0;
+  }
+  m_diff = fabs(m_active - m_inactive);
+  if (m_diff < 1e-100)
+  {
+    return (1.0);
+  }
+  m_ratio = m_diff / (fabs(m_active) + fabs(m_inactive));
+  if (m_ratio < 1e-10)
+  {
+    return (1.0);
+  }
+  return (1.0 - 1.0 / (1.0 + (s_active + s_inactive) / m_diff));
+}
+
+
+static int compare_double(const void *p1, const void *p2)
+{
+  double x1 = *((const double *) p1), x2 = *((const double *) p2);
+
+  if (x1 < x2)
+  {
+    return (-1);
+  }
+  if (x1 > x2)
+  {
+    return (1);
+  }
+  return (0);
+}
+
+
+/*
+ * Count the values less than x (if less is non-zero) or greater than
+ * x in the sorted array s of n values.
+ */
+static size_t count_sorted(const double *s, size_t n, double x, int less)
+{
+  size_t lo = 0, hi = n, m;
+
+  while (lo < hi)
+  {
+    m = lo + (hi - lo) / 2;
+    if (less ? (s[m] < x) : (s[m] <= x))
+    {
+      lo = m + 1;
+    }
+    else
+    {
+      hi = m;
+    }
+  }
+  return (less ? lo : n - lo);
+}
+
+
+/*
+ * The numbers of (active, inactive) pairs with the active value less
+ * than and greater than the inactive value are determined by counting
+ * the values less than and greater than each active value among all
+ * values and subtracting the counts among the active values. sorted
+ * contains the num_sorted values of v that are not NaN in ascending
+ * order, NaN values are not counted as they compare neither less nor
+ * greater than any value. active must provide space for n doubles.
+ */
+static double diffsign_disparity_score(const double *v, const int *rule_index, size_t n, int r, size_t num_active, const double *sorted, size_t num_sorted, double *active)
+{
+  size_t i, num_active_sorted = 0;
+  unsigned long n_minus = 0, n_plus = 0, n_all;
+
+  if ((num_active == 0) || (num_active == n))
+  {
+    return (0.0);
+  }
+  for (i = 0; i < n; i++)
+  {
+    if ((rule_index[i] == r) && (v[i] == v[i]))
+    {
+      active[num_active_sorted++] = v[i];
+    }
+  }
+  qsort(active, num_active_sorted, sizeof(double), compare_double);
+  for (i = 0; i < num_active_sorted; i++)
+  {
+    n_minus += count_sorted(sorted, num_sorted, active[i], 0) - count_sorted(active, num_active_sorted, active[i], 0);
+    n_plus += count_sorted(sorted, num_sorted, active[i], 1) - count_sorted(active, num_active_sorted, active[i], 1);
+  }
+  n_all = n_minus + n_plus;
+  if (n_all == 0)
+  {
+    return (1.0);
+  }
+  return ((double) (n_minus < n_plus ? n_minus : n_plus) / (double) n_all * 2.0);
+}
+
+
+static double overlap_disparity_score(const double *v, const int *rule_index, size_t n, int r, size_t num_active)
+{
+  size_t i, num_intersection = 0;
+  double a_min = 0.0, a_max = 0.0, i_min = 0.0, i_max = 0.0, lower, upper;
+  int a_first = 1, i_first = 1;
+
+  if ((num_active == 0) || (num_active == n))
+  {
+    return (1.0);
+  }
+  /* minima and maxima are determined like by Python's min and max */
+  for (i = 0; i < n; i++)
+  {
+    if (rule_index[i] == r)
+    {
+      if (a_first || (v[i] < a_min))
+      {
+	a_min = v[i];
+      }
+      if (a_first || (v[i] > a_max))
+      {
+	a_max = v[i];
+      }
+      a_first = 0;
+    }
+    else
+    {
+      if (i_first || (v[i] < i_min))
+      {
+	i_min = v[i];
+      }
+      if (i_first || (v[i] > i_max))
+      {
+	i_max = v[i];
+      }
+      i_first = 0;
+    }
+  }
+  if (((a_min <= i_min) && (a_max >= i_max)) || ((i_min <= a_min) && (i_max >= a_max)))
+  {
+    return (1.0);
+  }
+  if ((a_max < i_min) || (i_max < a_min))
+  {
+    return (0.0);
+  }
+  if (a_min < i_min)
+  {
+    lower = i_min;
+    upper = a_max;
+  }
+  else
+  {
+    lower = a_min;
+    upper = i_max;
+  }
+  for (i = 0; i < n; i++)
+  {
+    if ((lower <= v[i]) && (v[i] <= upper))
+    {
+      num_intersection++;
+    }
+  }
+  return ((double) num_intersection / (double) n);
+}
+
+
+/*
+ * Compute the disparity scores of num_rules rules for each of the
+ * num_columns columns of n concentrations stored consecutively in
+ * column. score must provide space for num_rules * num_columns
+ * doubles, the score of rule r and column j is stored in
+ * score[r * num_columns + j].
+ */
+static int disparity_table(DISPARITY_KIND kind, const double *column, const int *rule_index, size_t n, size_t num_columns, int num_rules, double *score)
+{
+  size_t *num_active;
+  double *sorted, *active;
+  size_t i, j, num_sorted;
+  int r;
+
+  num_active = (size_t *) malloc((num_rules > 0 ? num_rules : 1) * sizeof(size_t));
+  if (num_active == NULL)
+  {
+    fprintf(stderr, "disparity_table: malloc failed\n");
+    return (-1);
+  }
+  sorted = (double *) malloc(2 * (n > 0 ? n : 1) * sizeof(double));
+  if (sorted == NULL)
+  {
+    fprintf(stderr, "disparity_table: malloc failed\n");
+    free(num_active);
+    return (-1);
+  }
+  active = sorted + n;
+  for (r = 0; r < num_rules; r++)
+  {
+    num_active[r] = 0;
+  }
+  for (i = 0; i < n; i++)
+  {
+    if ((rule_index[i] >= 0) && (rule_index[i] < num_rules))
+    {
+      num_active[rule_index[i]]++;
+    }
+  }
+  for (j = 0; j < num_columns; j++)
+  {
+    const double *v = column + j * n;
+
+    if (kind == DISPARITY_DIFFSIGN)
+    {
+      num_sorted = 0;
+      for (i = 0; i < n; i++)
+      {
+	if (v[i] == v[i])
+	{
+	  sorted[num_sorted++] = v[i];
+	}
+      }
+      qsort(sorted, num_sorted, sizeof(double), compare_double);
+    }
+    for (r = 0; r < num_rules; r++)
+    {
+      switch (kind)
+      {
+      case DISPARITY_STDDEV:
+	score[r * num_columns + j] = stddev_disparity_score(v, rule_index, n, r, num_active[r]);
+	break;
+      case DISPARITY_DIFFSIGN:
+	score[r * num_columns + j] = diffsign_disparity_score(v, rule_index, n, r, num_active[r], sorted, num_sorted, active);
+	break;
+      case DISPARITY_OVERLAP:
+	score[r * num_columns + j] = overlap_disparity_score(v, rule_index, n, r, num_active[r]);
+	break;
+      }
+    }
+  }
+  free(sorted);
+  free(num_active);
+  return (0);
+}
+
+
+/*
+ * Extract an array of C ints from an object supporting the buffer
+ * interface (e.g. an array.array('i')). The returned pointer refers
+ * to the object's buffer, the number of ints is stored in *n.
+ */
+static const int *extract_int_buffer(PyObject *python_array, Py_ssize_t *n)
+{
+  const void *buffer;
+  Py_ssize_t buffer_length;
+
+  if (PyObject_AsReadBuffer(python_array, &buffer, &buffer_length) != 0)
+  {
+    return (NULL);
+  }
+  if (buffer_length % sizeof(int))
+  {
+    PyErr_SetString(PyExc_ValueError, "extract_int_buffer: buffer size is not a multiple of the int size");
+    return (NULL);
+  }
+  *n = buffer_length / sizeof(int);
+  return ((const int *) buffer);
+}
+
+
+/*
+ * Copy the concentrations of the factors given by factor_index and the
+ * rule indices of the instances described by the columnar lsys string
+ * components in python_column_seq (see clib_disparity_table) into
+ * column and rule_index, starting at row offset. If column is NULL,
+ * the components are only checked and the total number of rows is
+ * stored in *n.
+ */
+static int extract_disparity_columns(PyObject *python_column_seq, const long *factor_index, size_t num_columns, size_t n, double *column, int *rule_index, size_t *num_rows)
+{
+  PyObject *python_rule_index, *python_row_index;
+  ConcentrationArray *a;
+  const int *ri, *row;
+  Py_ssize_t num_ri, num_row, num_array_rows, num_factors, k, i;
+  size_t j, offset = 0;
+
+  for (k = 0; k < PySequence_Fast_GET_SIZE(python_column_seq); k++)
+  {
+    if (!PyArg_ParseTuple(PySequence_Fast_GET_ITEM(python_column_seq, k), "OOO!:disparity_table", &python_rule_index, &python_row_index, &ConcentrationArrayType, &a))
+    {
+      return (-1);
+    }
+    ri = extract_int_buffer(python_rule_index, &num_ri);
+    if (ri == NULL)
+    {
+      return (-1);
+    }
+    row = extract_int_buffer(python_row_index, &num_row);
+    if (row == NULL)
+    {
+      return (-1);
+    }
+    num_factors = a->shape[a->ndim - 1];
+    num_array_rows = 1;
+    for (i = 0; i < a->ndim - 1; i++)
+    {
+      num_array_rows *= a->shape[i];
+    }
+    if (num_array_rows != num_row)
+    {
+      PyErr_SetString(PyExc_ValueError, "disparity_table: concentration array does not match row index");
+      return (-1);
+    }
+    for (j = 0; j < num_columns; j++)
+    {
+      if ((factor_index[j] < 0) || (factor_index[j] >= num_factors))
+      {
+	PyErr_SetString(PyExc_IndexError, "disparity_table: factor index out of range");
+	return (-1);
+      }
+    }
+    for (i = 0; i < num_row; i++)
+    {
+      if ((row[i] < 0) || (row[i] >= num_ri))
+      {
+	PyErr_SetString(PyExc_IndexError, "disparity_table: row index out of range");
+	return (-1);
+      }
+      if (column != NULL)
+      {
+	rule_index[offset] = ri[row[i]];
+	for (j = 0; j < num_columns; j++)
+	{
+	  column[j * n + offset] = a->data[i * num_factors + factor_index[j]];
+	}
+      }
+      offset++;
+    }
+  }
+  *num_rows = offset;
+  return (0);
+}
+
+
+/*
+ * Compute a table of disparity scores from a derivation series in
+ * columnar form, for all rules and the factors given by their indices.
+ * Arguments are the kind of disparity ("stddev", "diffsign" or
+ * "overlap"), a sequence of tuples (rule_index, row_index,
+ * concentration) taken from the columnar lsys strings (the rule
+ * indices of the instances and the row indices and concentration
+ * array of one transsys program, where concentration arrays with more
+ * than two dimensions are treated as arrays of factor concentration
+ * rows in row major order), the number of rules and a sequence
+ * of factor indices. The instances of all lsys strings are pooled,
+ * and the scores are returned as a list containing a list of scores
+ * (one per factor index) for each rule.
+ */
+static PyObject *clib_disparity_table(PyObject *self, PyObject *args)
+{
+  const char *kind_name;
+  DISPARITY_KIND kind;
+  PyObject *python_column_list, *python_factor_indices, *python_column_seq, *python_factor_seq, *python_table, *python_row;
+  int num_rules, r, return_value;
+  long *factor_index;
+  size_t num_columns, n, j;
+  double *column, *score;
+  int *rule_index;
+  PyThreadState *thread_state;
+
+  if (!PyArg_ParseTuple(args, "sOiO", &kind_name, &python_column_list, &num_rules, &python_factor_indices))
+  {
+    return (NULL);
+  }
+  if (!strcmp(kind_name, "stddev"))
+  {
+    kind = DISPARITY_STDDEV;
+  }
+  else if (!strcmp(kind_name, "diffsign"))
+  {
+    kind = DISPARITY_DIFFSIGN;
+  }
+  else if (!strcmp(kind_name, "overlap"))
+  {
+    kind = DISPARITY_OVERLAP;
+  }
+  else
+  {
+    PyErr_Format(PyExc_ValueError, "clib_disparity_table: unknown disparity \"%s\"", kind_name);
+    return (NULL);
+  }
+  if (num_rules < 0)
+  {
+    PyErr_SetString(PyExc_ValueError, "clib_disparity_table: negative number of rules");
+    return (NULL);
+  }
+  python_factor_seq = PySequence_Fast(python_factor_indices, "clib_disparity_table: factor indices must be a sequence");
+  if (python_factor_seq == NULL)
+  {
+    return (NULL);
+  }
+  num_columns = PySequence_Fast_GET_SIZE(python_factor_seq);
+  factor_index = (long *) malloc((num_columns > 0 ? num_columns : 1) * sizeof(long));
+  if (factor_index == NULL)
+  {
+    Py_DECREF(python_factor_seq);
+    return (PyErr_NoMemory());
+  }
+  for (j = 0; j < num_columns; j++)
+  {
+    factor_index[j] = PyInt_AsLong(PySequence_Fast_GET_ITEM(python_factor_seq, j));
+    if (PyErr_Occurred() != NULL)
+    {
+      free(factor_index);
+      Py_DECREF(python_factor_seq);
+      return (NULL);
+    }
+  }
+  Py_DECREF(python_factor_seq);
+  python_column_seq = PySequence_Fast(python_column_list, "clib_disparity_table: columns must be a sequence");
+  if (python_column_seq == NULL)
+  {
+    free(factor_index);
+    return (NULL);
+  }
+  if (extract_disparity_columns(python_column_seq, factor_index, num_columns, 0, NULL, NULL, &n) != 0)
+  {
+    free(factor_index);
+    Py_DECREF(python_column_seq);
+    return (NULL);
+  }
+  column = (double *) malloc((num_columns * n + num_rules * num_columns + 1) * sizeof(double));
+  rule_index = (int *) malloc((n > 0 ? n : 1) * sizeof(int));
+  if ((column == NULL) || (rule_index == NULL))
+  {
+    free(column);
+    free(rule_index);
+    free(factor_index);
+    Py_DECREF(python_column_seq);
+    return (PyErr_NoMemory());
+  }
+  score = column + num_columns * n;
+  extract_disparity_columns(python_column_seq, factor_index, num_columns, n, column, rule_index, &n);
+  free(factor_index);
+  Py_DECREF(python_column_seq);
+  thread_state = PyEval_SaveThread();
+  return_value = disparity_table(kind, column, rule_index, n, num_columns, num_rules, score);
+  PyEval_RestoreThread(thread_state);
+  free(rule_index);
+  if (return_value != 0)
+  {
+    free(column);
+    PyErr_SetString(PyExc_MemoryError, "clib_disparity_table: disparity_table failed");
+    return (NULL);
+  }
+  python_table = PyList_New(num_rules);
+  if (python_table == NULL)
+  {
+    free(column);
+    return (NULL);
+  }
+  for (r = 0; r < num_rules; r++)
+  {
+    python_row = PyList_New(num_columns);
+    if (python_row == NULL)
+    {
+      free(column);
+      Py_DECREF(python_table);
+      return (NULL);
+    }
+    PyList_SET_ITEM(python_table, r, python_row);
+    for (j = 0; j < num_columns; j++)
+    {
+      PyObject *python_score = PyFloat_FromDouble(score[r * num_columns + j]);
+      if (python_score == NULL)
+      {
+	free(column);
+	Py_DECREF(python_table);
+	return (NULL);
+      }
+      PyList_SET_ITEM(python_row, j, python_score);
+    }
+  }
+  free(column);
+  return (python_table);
+}
+
+
+static PyObject *clib_setverbose(PyObject *self, PyObject *args)
+{
+  if (!PyArg_ParseTuple(args, "i", &message_importance_threshold))
+  {
+    return (NULL);
+  }
+  clib_message(CLIB_MSG_TRACE, "transsys.clib: verbosity level set to %d\n", message_importance_threshold);
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
+static PyObject *clib_srandom(PyObject *self, PyObject *args)
+{
+  unsigned long rndseed;
+  if (!PyArg_ParseTuple(args, "k", &rndseed))
+  {
+    return (NULL);
+  }
+  clib_message(CLIB_MSG_TRACE, "clib_srandom: setting random seed %lu\n", rndseed);
+  ulong_srandom(rndseed);
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
+static PyObject *clib_dummy(PyObject *self, PyObject *args)
+{
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
+static PyMethodDef clib_methods[] = {
+  {"timeseries", clib_timeseries, METH_VARARGS, "compute time series from a transsys instance"},
+  {"timeseries_array", clib_timeseries_array, METH_VARARGS, "compute time series from a transsys instance as a concentration array"},
+  {"timeseries_iter", clib_timeseries_iter, METH_VARARGS, "iterate over the time series of a transsys instance"},
+  {"final_state", clib_final_state, METH_VARARGS, "compute the final state of a transsys instance"},
+  {"attractor", clib_attractor, METH_VARARGS, "simulate a transsys instance until an attractor is reached"},
+  {"compile", clib_compile, METH_VARARGS, "compile a transsys or lsys program for repeated simulation"},
+  {"stringseries", clib_stringseries, METH_VARARGS, "compute derivation series from a lsys program"},
+  {"stringseries_columns", clib_stringseries_columns, METH_VARARGS, "compute derivation series from a lsys program in columnar form"},
+  {"stringseries_iter", clib_stringseries_iter, METH_VARARGS, "iterate over the derivation series of a lsys program"},
+  {"disparity_table", clib_disparity_table, METH_VARARGS, "compute disparity scores of rules and factors from a derivation series in columnar form"},
+  {"srandom", clib_srandom, METH_VARARGS, "set the random seed for clib transsys computations"},
+  {"dummy", clib_dummy, METH_VARARGS, "dummy test function for clib development"},
+  {"setverbose", clib_setverbose, METH_VARARGS, "set verbosity level for transsys.clib module"},
+  {NULL, NULL, 0, NULL}
+};
+
+
+PyMODINIT_FUNC initclib(void)
+{
+  PyObject *clib_module;
+
+  CompiledTranssysProgramType.tp_dealloc = (destructor) CompiledTranssysProgram_dealloc;
+  CompiledTranssysProgramType.tp_flags = Py_TPFLAGS_DEFAULT;
+  CompiledTranssysProgramType.tp_doc = "transsys program compiled for repeated simulation";
+  CompiledTranssysProgramType.tp_methods = CompiledTranssysProgram_methods;
+  CompiledTranssysProgramType.tp_members = CompiledTranssysProgram_members;
+  if (PyType_Ready(&CompiledTranssysProgramType) < 0)
+  {
+    return;
+  }
+  CompiledLsysProgramType.tp_dealloc = (destructor) CompiledLsysProgram_dealloc;
+  CompiledLsysProgramType.tp_flags = Py_TPFLAGS_DEFAULT;
+  CompiledLsysProgramType.tp_doc = "lsys program compiled for repeated simulation";
+  CompiledLsysProgramType.tp_methods = CompiledLsysProgram_methods;
+  CompiledLsysProgramType.tp_members = CompiledLsysProgram_members;
+  if (PyType_Ready(&CompiledLsysProgramType) < 0)
+  {
+    return;
+  }
+  ConcentrationArrayType.tp_dealloc = (destructor) ConcentrationArray_dealloc;
+  ConcentrationArrayType.tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_NEWBUFFER;
+  ConcentrationArrayType.tp_doc = "contiguous array of factor concentrations";
+  ConcentrationArrayType.tp_as_sequence = &ConcentrationArray_as_sequence;
+  ConcentrationArrayType.tp_as_buffer = &ConcentrationArray_as_buffer;
+  ConcentrationArrayType.tp_methods = ConcentrationArray_methods;
+  ConcentrationArrayType.tp_getset = ConcentrationArray_getset;
+  if (PyType_Ready(&ConcentrationArrayType) < 0)
+  {
+    return;
+  }
+  TimeSeriesIteratorType.tp_dealloc = (destructor) TimeSeriesIterator_dealloc;
+  TimeSeriesIteratorType.tp_flags = Py_TPFLAGS_DEFAULT;
+  TimeSeriesIteratorType.tp_doc = "iterator computing a time series sample by sample";
+  TimeSeriesIteratorType.tp_iter = PyObject_SelfIter;
+  TimeSeriesIteratorType.tp_iternext = (iternextfunc) TimeSeriesIterator_next;
+  if (PyType_Ready(&TimeSeriesIteratorType) < 0)
+  {
+    return;
+  }
+  DerivationSeriesIteratorType.tp_dealloc = (destructor) DerivationSeriesIterator_dealloc;
+  DerivationSeriesIteratorType.tp_flags = Py_TPFLAGS_DEFAULT;
+  DerivationSeriesIteratorType.tp_doc = "iterator computing a derivation series step by step";
+  DerivationSeriesIteratorType.tp_iter = PyObject_SelfIter;
+  DerivationSeriesIteratorType.tp_iternext = (iternextfunc) DerivationSeriesIterator_next;
+  DerivationSeriesIteratorType.tp_methods = DerivationSeriesIterator_methods;
+  DerivationSeriesIteratorType.tp_members = DerivationSeriesIterator_members;
+  if (PyType_Ready(&DerivationSeriesIteratorType) < 0)
+  {
+    return;
+  }
   clib_module = Py_InitModule("transsys.clib", clib_methods);
   /* FIXME: should not ignore return value */
   PyModule_AddStringConstant(clib_module, "clib_api_version", clib_api_version);
+  Py_INCREF(&CompiledTranssysProgramType);
+  PyModule_AddObject(clib_module, "CompiledTranssysProgram", (PyObject *) &CompiledTranssysProgramType);
+  Py_INCREF(&CompiledLsysProgramType);
+  PyModule_AddObject(clib_module, "CompiledLsysProgram", (PyObject *) &CompiledLsysProgramType);
+  Py_INCREF(&ConcentrationArrayType);
+  PyModule_AddObject(clib_module, "ConcentrationArray", (PyObject *) &ConcentrationArrayType);
+  Py_INCREF(&TimeSeriesIteratorType);
+  PyModule_AddObject(clib_module, "TimeSeriesIterator", (PyObject *) &TimeSeriesIteratorType);
+  Py_INCREF(&DerivationSeriesIteratorType);
+  PyModule_AddObject(clib_module, "DerivationSeriesIterator", (PyObject *) &DerivationSeriesIteratorType);
 }
 
 /* don't forget to change the clib_api_version */
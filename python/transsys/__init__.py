@@ -130,6 +130,8 @@ import StringIO
 import math
 import re
 import random
+import mmap
+import struct
 
 import clib
 
@@ -142,7 +144,7 @@ import utils
 
 # compatibility check based on manually managed version names.
 # (unfortunately subversion does not provide anything suitable for this).
-required_clib_api_version = '350'
+required_clib_api_version = '365'
 if clib.clib_api_version != required_clib_api_version :
   raise StandardError, 'transsys module requires clib API version %s but actual API version is %s' % (required_clib_api_version, clib.clib_api_version)
 
@@ -1842,6 +1844,48 @@ relying on this property is strongly recommended against.
     return True
 
 
+  def compiled(self) :
+    """Compile this transsys program for repeated simulation.
+
+The C level representation of the program is constructed once and
+kept in the returned object, whose C{timeseries} method computes
+time series from instances of this program without the cost of
+converting the program for each call. Notice that changes made
+to this program after compilation are not reflected by the
+compiled program.
+
+@return: the compiled program
+@rtype: C{clib.CompiledTranssysProgram}
+"""
+    return clib.compile(self)
+
+
+  def ensemble_time_series(self, initial_concentrations, num_timesteps, sampling_period = 1, compiled_program = None) :
+    """Compute time series for an ensemble of initial states.
+
+All time series are computed within one call to C{clib}, without
+constructing a transsys instance per initial state or per time step.
+
+@param initial_concentrations: matrix of initial factor concentrations,
+  one row per initial state, given either as a buffer of doubles
+  in row major order (e.g. an C{array.array('d')} or a contiguous
+  NumPy array) or as a sequence of sequences of numbers
+@param num_timesteps: number of time steps, as for
+  L{TranssysInstance.time_series}
+@param sampling_period: period of sampling
+@param compiled_program: compiled version of this program, or C{None}
+  to compile the program for this call
+@return: factor concentrations, with shape (number of initial states,
+  number of samples, number of factors)
+@rtype: C{clib.ConcentrationArray}
+"""
+    if compiled_program is None :
+      compiled_program = self.compiled()
+    elif compiled_program.transsys_program is not self :
+      raise StandardError, 'compiled program is not compiled from this transsys program'
+    return compiled_program.ensemble_timeseries(initial_concentrations, num_timesteps, sampling_period)
+
+
 class GraphicsPrimitive(object) :
 
   def __init__(self) :
@@ -2283,8 +2327,104 @@ class LsysProgram(object) :
     return self.rules[i]
 
 
-  def derivation_series(self, nsteps, sampling_period = 1) :
-    return clib.stringseries(self, nsteps, sampling_period)
+  def derivation_series(self, nsteps, sampling_period = 1, seed = None, num_threads = 1) :
+    """Compute a series of lsys strings derived from the axiom.
+
+@param nsteps: number of derivation steps
+@param sampling_period: period of sampling
+@param seed: if not C{None}, random numbers are drawn from a
+  generator seeded with C{seed} and used by this derivation only,
+  so the result does not depend on other simulations. Otherwise,
+  the global generator (see C{clib.srandom}) is used.
+@param num_threads: number of threads used for computing expression,
+  diffusion and derivation of successor strings. The result does not
+  depend on the number of threads. Strings with transsys programs that
+  use random functions are processed by one thread only, and so are
+  derivations if the lsys program uses random functions.
+@return: list of lsys strings
+"""
+    if num_threads != 1 :
+      return clib.stringseries(self, nsteps, sampling_period, seed, num_threads)
+    if seed is None :
+      return clib.stringseries(self, nsteps, sampling_period)
+    return clib.stringseries(self, nsteps, sampling_period, seed)
+
+
+  def derivation_series_columns(self, nsteps, sampling_period = 1, seed = None, transsys_program = None, compiled_program = None) :
+    """Compute a series of lsys strings in columnar form.
+
+This is equivalent to L{derivation_series} but represents the lsys
+strings by L{LsysSymbolStringColumns} instances, so no symbol
+instances and transsys instances are constructed.
+
+@param nsteps: number of derivation steps
+@param sampling_period: period of sampling
+@param seed: seed for random numbers, as for L{derivation_series}
+@param transsys_program: if not C{None}, only instances of symbols
+  associated with this transsys program are included
+@param compiled_program: a compiled version of this lsys program,
+  or C{None}
+@return: list of lsys strings in columnar form
+@rtype: C{list}
+"""
+    if compiled_program is None :
+      series = clib.stringseries_columns(self, nsteps, sampling_period, seed, transsys_program)
+    else :
+      series = compiled_program.stringseries_columns(nsteps, sampling_period, seed, transsys_program)
+    return map(lambda c : LsysSymbolStringColumns(self, c[0], c[1], c[2], c[3]), series)
+
+
+  def derivation_series_iter(self, nsteps = None, sampling_period = 1, seed = None, snapshot = None) :
+    """Iterate over a series of lsys strings derived from the axiom.
+
+The iterator yields the same lsys strings as L{derivation_series},
+but derives them one step at a time, so the strings of earlier steps
+can be freed while the derivation proceeds (as long as they are not
+referenced by the caller), and the derivation stops when iteration
+is stopped.
+
+The iterator's C{save_snapshot(filename)} method saves the lsys
+string of its current time step (available as its C{timestep}
+attribute) to a binary snapshot file, e.g. to checkpoint a long
+derivation every few steps. Passing the name of such a file as
+C{snapshot} resumes the derivation from the snapshot rather than
+starting it from the axiom. Time steps then continue from that of
+the snapshot, so the iterator yields the strings that the
+checkpointed iterator would have yielded next. Random numbers
+continue from the generator state saved in the snapshot, unless
+C{seed} is given, which forks the derivation. Snapshots of
+derivations using the global random number generator (C{seed} of
+C{None}) do not contain a generator state.
+
+@param nsteps: number of derivation steps (counted from the axiom
+  also when resuming), or C{None} for an unbounded series
+@param sampling_period: period of sampling
+@param seed: seed for random numbers, as for L{derivation_series}
+@param snapshot: name of a snapshot file to resume from, or C{None}
+@return: an iterator over lsys strings
+"""
+    return clib.stringseries_iter(self, nsteps, sampling_period, seed, snapshot)
+
+
+  def compiled(self) :
+    """Compile this lsys program for repeated simulation.
+
+The returned object's C{stringseries(nsteps, sampling_period, seed, num_threads)}
+method is equivalent to L{derivation_series} but does not convert the
+lsys program (and its transsys programs) for each call. Changes made
+to this lsys program after compilation are not reflected by the
+compiled program, except that the values of a transsys program can be
+updated by C{set_transsys(transsys_program)}, where C{transsys_program}
+must differ from the compiled transsys program of the same name by
+values only (C{ValueError} is raised otherwise). The transsys
+instances of derivation series are instances of the transsys programs
+associated with the symbols of this lsys program, so it should be
+associated with C{transsys_program} as well.
+
+@return: the compiled program
+@rtype: C{clib.CompiledLsysProgram}
+"""
+    return clib.compile(self)
 
 
 class TranssysInstance(object) :
@@ -2422,10 +2562,98 @@ one.
   # FIXME: num_timesteps is a badly named parameter as it really specifies the number of
   #     instances to be created, not the number of timesteps (number of timesteps is effectively
   #     num_timesteps - 1
-  def time_series(self, num_timesteps, sampling_period = 1, lsys_lines = None, lsys_symbol = None) :
+  # if seed is not None, random numbers are drawn from a generator seeded
+  # with seed and used by this simulation only, rather than from the
+  # global generator (seeded by clib.srandom).
+  def time_series(self, num_timesteps, sampling_period = 1, lsys_lines = None, lsys_symbol = None, seed = None) :
     if lsys_lines is not None or lsys_symbol is not None :
       raise StandardError, 'lsys_lines and lsys_symbol are no longer supported -- try using time_series_old'
-    return clib.timeseries(self, num_timesteps, sampling_period)
+    if seed is None :
+      return clib.timeseries(self, num_timesteps, sampling_period)
+    return clib.timeseries(self, num_timesteps, sampling_period, seed)
+
+
+  def simulate(self, num_timesteps, compiled_program = None, seed = None) :
+    """Compute the state reached after a number of time steps.
+
+Only the final state is constructed, which is much cheaper than
+taking the last element of a time series.
+
+@param num_timesteps: number of time steps
+@param compiled_program: a compiled version of this instance's
+  transsys program, or C{None}
+@param seed: seed for random numbers, as for L{time_series}
+@return: the final state, with C{timestep} set to C{num_timesteps}
+@rtype: C{TranssysInstance}
+"""
+    if compiled_program is None :
+      return clib.final_state(self, num_timesteps, seed)
+    return compiled_program.final_state(self, num_timesteps, seed)
+
+
+  def time_series_array(self, num_timesteps, sampling_period = 1, compiled_program = None, seed = None) :
+    """Compute a time series stored as an array of factor concentrations.
+
+This is equivalent to L{time_series} but does not construct a
+transsys instance per time step, see L{TimeSeriesArray}.
+
+@param num_timesteps: number of time steps, as for L{time_series}
+@param sampling_period: period of sampling
+@param compiled_program: a compiled version of this instance's
+  transsys program, or C{None}
+@param seed: seed for random numbers, as for L{time_series}
+@return: the time series
+@rtype: L{TimeSeriesArray}
+"""
+    return TimeSeriesArray(self, num_timesteps, sampling_period, compiled_program, seed)
+
+
+  def time_series_iter(self, num_timesteps = None, sampling_period = 1, compiled_program = None, seed = None) :
+    """Iterate over a time series, computing it lazily.
+
+The iterator yields the same transsys instances as L{time_series},
+but each sample is computed only when it is requested, so memory use
+does not depend on the length of the series, and simulation stops
+when iteration is stopped (e.g. by C{itertools.islice} or
+C{itertools.takewhile}). If C{compiled_program} is given, its values
+cannot be changed until the iterator is exhausted or deleted.
+
+@param num_timesteps: number of time steps, as for L{time_series},
+  or C{None} for an unbounded series
+@param sampling_period: period of sampling
+@param compiled_program: a compiled version of this instance's
+  transsys program, or C{None}
+@param seed: seed for random numbers, as for L{time_series}
+@return: an iterator over transsys instances
+"""
+    if compiled_program is None :
+      return clib.timeseries_iter(self, num_timesteps, sampling_period, seed)
+    return compiled_program.timeseries_iter(self, num_timesteps, sampling_period, seed)
+
+
+  def attractor(self, max_timesteps, tolerance = 0.0, max_period = 100, compiled_program = None, seed = None) :
+    """Simulate until a fixed point or a limit cycle is reached.
+
+After each time step, the factor concentrations are compared to
+those of the preceding C{max_period} time steps. The simulation
+stops as soon as all concentrations are within C{tolerance} of
+those of an earlier step, or after C{max_timesteps} steps.
+
+@param max_timesteps: maximal number of time steps
+@param tolerance: maximal absolute difference of concentrations
+  considered equal
+@param max_period: maximal period of limit cycles to be detected
+@param compiled_program: a compiled version of this instance's
+  transsys program, or C{None}
+@param seed: seed for random numbers, as for L{time_series}
+@return: the attractor
+@rtype: L{Attractor}
+"""
+    if compiled_program is None :
+      ti, kind, period = clib.attractor(self, max_timesteps, tolerance, max_period, seed)
+    else :
+      ti, kind, period = compiled_program.attractor(self, max_timesteps, tolerance, max_period, seed)
+    return Attractor(ti, kind, period)
 
 
 class CollectionStatistics(object) :
@@ -2646,6 +2874,233 @@ class TimeSeries(TranssysInstanceCollection) :
     return self.series
 
 
+class TimeSeriesArray(TranssysInstanceCollection) :
+  """Time series of factor concentrations stored in a contiguous array.
+
+The factor concentrations are kept in a C{clib.ConcentrationArray}
+of shape (number of samples, number of factors), which supports the
+buffer interface. Thus, C{numpy.asarray(tsa.array)} gives a NumPy
+view of the series without copying. Transsys instances are created
+only on demand, by indexing or by L{transsys_instance_list}.
+
+@ivar transsys_program: the transsys program
+@type transsys_program: C{TranssysProgram}
+@ivar sampling_period: the sampling period
+@type sampling_period: C{int}
+@ivar array: the factor concentrations
+@type array: C{clib.ConcentrationArray}
+"""
+
+  def __init__(self, ti, num_timesteps, sampling_period = 1, compiled_program = None, seed = None) :
+    self.transsys_program = ti.transsys_program
+    self.sampling_period = sampling_period
+    if compiled_program is None :
+      self.array = clib.timeseries_array(ti, num_timesteps, sampling_period, seed)
+    else :
+      self.array = compiled_program.timeseries_array(ti, num_timesteps, sampling_period, seed)
+
+
+  def __len__(self) :
+    return len(self.array)
+
+
+  def __getitem__(self, i) :
+    ti = TranssysInstance(self.transsys_program)
+    ti.factor_concentration = self.array.row(i)
+    if i < 0 :
+      i = i + len(self.array)
+    ti.timestep = i * self.sampling_period
+    return ti
+
+
+  def get_transsys_program(self) :
+    return self.transsys_program
+
+
+  def transsys_instance_list(self) :
+    return map(lambda i : self[i], xrange(len(self.array)))
+
+
+  def get_factor_expression_list(self, factor) :
+    j = self.transsys_program.find_factor_index(factor)
+    if j < 0 :
+      raise StandardError, 'no factor "%s" in transsys %s' % (factor, self.transsys_program.name)
+    return map(lambda row : row[j], self.array.tolist())
+
+
+class BinaryTable(object) :
+  """Table written by C{transexpr -b} or C{ltransexpr -b}.
+
+A binary table consists of a text header, specifying the names of
+the columns and, for tables produced from an lsys, the names of the
+symbols and rules, followed by rows of doubles. The file is memory
+mapped, so the rows are not read until they are accessed. The number
+of rows is determined from the size of the file, an incomplete last
+row (e.g. of a table that is still being written) is ignored.
+
+C{data} supports the buffer interface, so
+C{numpy.frombuffer(t.data, numpy.float64).reshape(t.shape)} gives a
+NumPy view of the table without copying (if the byte order of the
+table is that of the machine).
+
+@ivar kind: the kind of table, e.g. C{'transexpr 1.0'}
+@type kind: C{str}
+@ivar byteorder: byte order of the doubles, C{'little'} or C{'big'}
+@type byteorder: C{str}
+@ivar transsys_name: name of the transsys
+@type transsys_name: C{str}
+@ivar lsys_name: name of the lsys, or C{None}
+@type lsys_name: C{str}
+@ivar symbol_names: names of the lsys symbols, symbol index columns
+  refer to this list
+@type symbol_names: C{list} of C{str}
+@ivar rule_names: names of the lsys rules, rule index columns refer
+  to this list
+@type rule_names: C{list} of C{str}
+@ivar column_names: names of the columns
+@type column_names: C{list} of C{str}
+@ivar shape: number of rows and number of columns
+@type shape: C{tuple}
+@ivar data: the rows
+@type data: C{buffer}
+"""
+
+  def __init__(self, filename) :
+    self.kind = None
+    self.byteorder = None
+    self.transsys_name = None
+    self.lsys_name = None
+    self.symbol_names = []
+    self.rule_names = []
+    self.column_names = []
+    f = open(filename, 'rb')
+    try :
+      header_size = self.parse_header(f)
+      self.mmap = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+    finally :
+      f.close()
+    if self.byteorder == 'little' :
+      self.row_format = '<%dd' % len(self.column_names)
+    elif self.byteorder == 'big' :
+      self.row_format = '>%dd' % len(self.column_names)
+    else :
+      raise StandardError, 'BinaryTable: unknown byte order "%s"' % self.byteorder
+    self.row_size = struct.calcsize(self.row_format)
+    self.header_size = header_size
+    num_rows = (len(self.mmap) - header_size) / self.row_size
+    self.shape = (num_rows, len(self.column_names))
+    self.data = buffer(self.mmap, header_size, num_rows * self.row_size)
+
+
+  def parse_header(self, f) :
+    line = f.readline()
+    if line[:22] != 'transsys binary table ' :
+      raise StandardError, 'BinaryTable: not a binary table'
+    num_columns = None
+    while True :
+      line = f.readline()
+      if line == '' :
+        raise StandardError, 'BinaryTable: premature end of header'
+      l = string.split(string.strip(line), None, 1)
+      if l == ['end'] :
+        break
+      if len(l) != 2 :
+        raise StandardError, 'BinaryTable: malformed header line "%s"' % string.strip(line)
+      if l[0] == 'byteorder' :
+        self.byteorder = l[1]
+      elif l[0] == 'kind' :
+        self.kind = l[1]
+      elif l[0] == 'transsys' :
+        self.transsys_name = l[1]
+      elif l[0] == 'lsys' :
+        self.lsys_name = l[1]
+      elif l[0] == 'symbol' :
+        self.symbol_names.append(l[1])
+      elif l[0] == 'rule' :
+        self.rule_names.append(l[1])
+      elif l[0] == 'columns' :
+        num_columns = int(l[1])
+      elif l[0] == 'column' :
+        self.column_names.append(l[1])
+      else :
+        raise StandardError, 'BinaryTable: unknown header line "%s"' % string.strip(line)
+    if num_columns != len(self.column_names) :
+      raise StandardError, 'BinaryTable: %s columns declared but %d columns named' % (str(num_columns), len(self.column_names))
+    header_size = f.tell()
+    return header_size + (8 - header_size % 8) % 8
+
+
+  def __len__(self) :
+    return self.shape[0]
+
+
+  def __getitem__(self, i) :
+    if i < 0 :
+      i = i + self.shape[0]
+    if i < 0 or i >= self.shape[0] :
+      raise IndexError, 'BinaryTable: row index out of range'
+    return list(struct.unpack_from(self.row_format, self.mmap, self.header_size + i * self.row_size))
+
+
+  def column_index(self, name) :
+    if name not in self.column_names :
+      raise StandardError, 'BinaryTable: no column "%s"' % name
+    return self.column_names.index(name)
+
+
+  def column(self, name) :
+    """Values of the column named C{name}, as a list."""
+    j = self.column_index(name)
+    value_format = self.row_format[0] + 'd'
+    offset = self.header_size + j * struct.calcsize(value_format)
+    return map(lambda i : struct.unpack_from(value_format, self.mmap, offset + i * self.row_size)[0], xrange(self.shape[0]))
+
+
+  def close(self) :
+    self.data = None
+    self.mmap.close()
+
+
+class Attractor(object) :
+  """Attractor reached by a transsys instance, see
+L{TranssysInstance.attractor}.
+
+@ivar kind: C{'fixedpoint'}, C{'limitcycle'}, or C{None} if no
+  attractor was found
+@ivar transsys_instance: the state at which the simulation stopped,
+  its C{timestep} is the number of time steps done
+@type transsys_instance: C{TranssysInstance}
+@ivar period: the period of the attractor (1 for fixed points,
+  0 if no attractor was found)
+@type period: C{int}
+"""
+
+  def __init__(self, transsys_instance, kind, period) :
+    self.transsys_instance = transsys_instance
+    self.kind = kind
+    self.period = period
+
+
+  def __str__(self) :
+    if self.kind is None :
+      return 'no attractor after %d time steps' % self.num_timesteps()
+    return '%s, period %d, reached at time step %d' % (self.kind, self.period, self.phase())
+
+
+  def num_timesteps(self) :
+    """Number of time steps simulated."""
+    return self.transsys_instance.timestep
+
+
+  def phase(self) :
+    """Length of the transient, i.e. the first time step at which the
+attractor was reached, or C{None} if no attractor was found.
+"""
+    if self.kind is None :
+      return None
+    return self.transsys_instance.timestep - self.period
+
+
 class SymbolInstance(object) :
 
   def __init__(self, symbol, transsys_instance = None, rule = None) :
@@ -2710,6 +3165,50 @@ class LsysSymbolString(TranssysInstanceCollection) :
     return ti_list
 
 
+class LsysSymbolStringColumns(object) :
+  """Columnar representation of an lsys string, as computed by
+L{LsysProgram.derivation_series_columns}.
+
+Symbol instances are represented by their positions in
+C{symbol_index} and C{rule_index}. The factor concentrations of the
+instances of each transsys program are kept in one array, without
+constructing symbol instances or transsys instances.
+
+@ivar lsys: the lsys program
+@ivar timestep: the time step
+@ivar symbol_index: indices of the symbols of the instances in
+  the lsys program's symbol list
+@type symbol_index: C{array.array('i')}
+@ivar rule_index: indices of the rules applied to the instances in
+  the lsys program's rule list, -1 for instances to which no rule
+  was applied
+@type rule_index: C{array.array('i')}
+@ivar concentration: dictionary mapping transsys program names to
+  concentration arrays of shape (number of instances of that program,
+  number of factors)
+@type concentration: C{dict}
+@ivar row_index: dictionary mapping transsys program names to the
+  positions (in C{symbol_index}) of the instances corresponding to
+  the rows of C{concentration}
+@type row_index: C{dict}
+"""
+
+  def __init__(self, lsys, timestep, symbol_index, rule_index, transsys_columns) :
+    self.lsys = lsys
+    self.timestep = timestep
+    self.symbol_index = symbol_index
+    self.rule_index = rule_index
+    self.concentration = {}
+    self.row_index = {}
+    for transsys_name, (row_index, concentration) in transsys_columns.iteritems() :
+      self.row_index[transsys_name] = row_index
+      self.concentration[transsys_name] = concentration
+
+
+  def __len__(self) :
+    return len(self.symbol_index)
+
+
 class DotParameters(object) :
 
   def __init__(self) :
@@ -3999,8 +4498,7 @@ class ArraySeries(object) :
     self.initial_state.factor_concentration = copy.deepcopy(initial_state.factor_concentration)
     self.num_timesteps_init = num_timesteps_init
     self.array_data = {}
-    ts = self.initial_state.time_series(self.num_timesteps_init, self.num_timesteps_init - 1)
-    self.reference_state = ts[self.num_timesteps_init - 1]
+    self.reference_state = self.initial_state.simulate(self.num_timesteps_init - 1)
     for f in self.transsys_program.factor_list :
       self.array_data[f.name] = []
 
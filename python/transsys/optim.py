@@ -2,6 +2,7 @@
 
 import sys
 import copy
+import array
 import math
 import types
 import os
@@ -171,6 +172,37 @@ not activating rule."""
   return float(n) / float(len(complete_set))
 
 
+# disparity functions that are implemented natively by
+# clib.disparity_table, mapped to the names used there
+native_disparity_names = {
+  stddev_disparity : 'stddev',
+  difference_sign_disparity : 'diffsign',
+  overlap_disparity : 'overlap'
+}
+
+
+def native_disparity_table(lsys_program, transsys_program, factor_indices, num_timesteps, disparity, compiled_lsys = None) :
+  """Compute disparity scores for all rules of C{lsys_program} and
+the factors of C{transsys_program} specified by C{factor_indices}
+natively, using a derivation series in columnar form (see
+L{transsys.LsysProgram.derivation_series_columns}).
+
+The scores are identical to those computed by applying C{disparity},
+which must be one of the functions in C{native_disparity_names}, to
+the symbol instances of C{transsys_program}.
+
+@return: a list containing a list of scores, one per factor index,
+  for each rule
+@rtype: C{list}
+"""
+  column_series = lsys_program.derivation_series_columns(num_timesteps, transsys_program = transsys_program, compiled_program = compiled_lsys)
+  column_list = []
+  for lcol in column_series :
+    if transsys_program.name in lcol.concentration :
+      column_list.append((lcol.rule_index, lcol.row_index[transsys_program.name], lcol.concentration[transsys_program.name]))
+  return transsys.clib.disparity_table(native_disparity_names[disparity], column_list, len(lsys_program.rules), factor_indices)
+
+
 class FitnessResult(object) :
   """Base class for results of objective (or fitness) functions.
 
@@ -251,10 +283,17 @@ def flat_symbol_instance_list(lstring_list, transsys_program = None) :
   return flat_list
 
 
-def disparity_fitness(lsys_program, transsys_program, factor_names, num_timesteps, disparity) :
+def disparity_fitness(lsys_program, transsys_program, factor_names, num_timesteps, disparity, compiled_lsys = None) :
   """Objective function quantifying disparity of expression levels
 between instances that activate and that do not activate rules.
 
+If C{compiled_lsys} is not C{None}, it must be a compiled version
+of C{lsys_program}, which is then used for the derivation.
+
+The disparity functions listed in C{native_disparity_names} are
+computed by L{native_disparity_table}, other functions are applied
+to the symbol instances of the derivation series.
+
 This should be rewritten as a proper L{AbstractObjectiveFunction} subclass.
   """
   if len(transsys_program.factor_list) == 0 :
@@ -265,11 +304,22 @@ This should be rewritten as a proper L{AbstractObjectiveFunction} subclass.
   factor_indices = []
   for factor_name in factor_names :
     factor_indices.append(transsys_program.find_factor_index(factor_name))
-  instance_series = flat_symbol_instance_list(lsys_program.derivation_series(num_timesteps), transsys_program)
-  for rule in lsys_program.rules :
+  if disparity in native_disparity_names :
+    native_table = native_disparity_table(lsys_program, transsys_program, factor_indices, num_timesteps, disparity, compiled_lsys)
+    disparity_score = lambda r, j : native_table[r][j]
+  else :
+    if compiled_lsys is None :
+      lsys_series = lsys_program.derivation_series(num_timesteps)
+    else :
+      lsys_series = compiled_lsys.stringseries(num_timesteps)
+    instance_series = flat_symbol_instance_list(lsys_series, transsys_program)
+    disparity_score = lambda r, j : disparity(lsys_program.rules[r], instance_series, factor_indices[j])
+  for r in xrange(len(lsys_program.rules)) :
+    rule = lsys_program.rules[r]
     fmin = None
-    for factor_index in factor_indices :
-      f = disparity(rule, instance_series, factor_index)
+    for j in xrange(len(factor_indices)) :
+      factor_index = factor_indices[j]
+      f = disparity_score(r, j)
       score_table.append((rule.name, transsys_program.factor_list[factor_index].name, f, ))
       if fmin is None :
         fmin = f
@@ -701,8 +751,11 @@ affected by the design change.
   optimised
 @type gene_name_list: C{list} of C{string}s
 @ivar target_node_list: list of expression nodes holding the values subject to
-  optimisation
+  optimisation, in the order of the parameters handled by C{setParameters}
 @type target_node_list: C{list} of C{ExpressionNodeValue}
+@ivar compiled_program: compiled version of C{transsys_program} to which
+  the target nodes are bound, see L{bindCompiledProgram}
+@type compiled_program: C{clib.CompiledTranssysProgram}
 """
 
   savefile_magic = 'ParameterTransformer'
@@ -714,6 +767,7 @@ affected by the design change.
     self.factor_name_list = None
     self.gene_name_list = None
     self.target_node_list = None
+    self.compiled_program = None
 
 
   def __str__(self) :
@@ -806,10 +860,96 @@ it should be overridden by subclasses.
 """
     if self.transsys_program is None :
       raise StandardError, 'no transsys program, cannot set parameters'
+    value_list = self.transformParameters(parameter_list)
+    for i in xrange(len(value_list)) :
+      self.target_node_list[i].value = value_list[i]
+
+
+  def transformParameters(self, parameter_list) :
+    """Transform optimiser space values to the values of the target nodes.
+
+@param parameter_list: the optimiser space values
+@return: the values for the nodes in C{target_node_list}
+@rtype: C{list} of C{float}s
+@raise StandardError: if the parameter list is too long or too short
+"""
     if len(self.target_node_list) != len(parameter_list) :
       raise StandardError,  'parameter list incompatible with transsys program'
-    for i in xrange(len(parameter_list)) :
-      self.target_node_list[i].value = parameter_list[i]
+    return list(parameter_list)
+
+
+  def bindCompiledProgram(self, compiled_program) :
+    """Bind the target nodes to the corresponding nodes of a compiled program.
+
+After binding, L{setCompiledParameters} sets the parameters in
+the compiled program directly, without modifying C{transsys_program}
+and without compiling it again.
+
+@param compiled_program: the compiled program, obtained from
+  C{transsys_program.compiled()}
+@type compiled_program: C{clib.CompiledTranssysProgram}
+"""
+    if self.transsys_program is None :
+      raise StandardError, 'no transsys program, cannot bind'
+    if compiled_program.transsys_program is not self.transsys_program :
+      raise StandardError, 'compiled program is not compiled from the transsys program'
+    compiled_program.bind(self.target_node_list)
+    self.compiled_program = compiled_program
+
+
+  def setCompiledParameters(self, parameter_list) :
+    """Set parameters in the bound compiled program according to the
+optimiser space values provided by C{parameter_list}.
+
+Notice that C{transsys_program} is not modified by this method.
+"""
+    if self.compiled_program is None :
+      raise StandardError, 'no compiled program bound, cannot set parameters'
+    self.compiled_program.set_values(array.array('d', self.transformParameters(parameter_list)))
+
+
+  def transformParameterMatrix(self, parameter_list_list) :
+    """Transform a list of optimiser space parameter lists into a matrix
+of target node values, suitable for the population methods of the
+compiled program.
+
+@return: the values, one row per parameter list, in row major order
+@rtype: C{array.array} of doubles
+"""
+    value_array = array.array('d')
+    for parameter_list in parameter_list_list :
+      value_array.extend(self.transformParameters(parameter_list))
+    return value_array
+
+
+  def compiledPopulationTimeSeries(self, ti, parameter_list_list, num_timesteps, sampling_period = 1) :
+    """Compute time series for a population of parameter lists using
+the bound compiled program.
+
+@param ti: the initial transsys instance
+@param parameter_list_list: list of optimiser space parameter lists
+@return: factor concentrations, with shape (number of parameter lists,
+  number of samples, number of factors)
+@rtype: C{clib.ConcentrationArray}
+"""
+    if self.compiled_program is None :
+      raise StandardError, 'no compiled program bound, cannot compute time series'
+    return self.compiled_program.parameter_timeseries(ti, self.transformParameterMatrix(parameter_list_list), num_timesteps, sampling_period)
+
+
+  def compiledPopulationFinalStates(self, ti, parameter_list_list, num_timesteps) :
+    """Compute the states reached after C{num_timesteps} time steps for a
+population of parameter lists using the bound compiled program.
+
+@param ti: the initial transsys instance
+@param parameter_list_list: list of optimiser space parameter lists
+@return: factor concentrations, with shape (number of parameter lists,
+  number of factors)
+@rtype: C{clib.ConcentrationArray}
+"""
+    if self.compiled_program is None :
+      raise StandardError, 'no compiled program bound, cannot compute final states'
+    return self.compiled_program.parameter_final_states(ti, self.transformParameterMatrix(parameter_list_list), num_timesteps)
 
 
 class TranssysTypedParameterTransformer(ParameterTransformer) :
@@ -1018,6 +1158,7 @@ effects and may be disabled in the future.
         self.amax_nodes.extend(gene.getActivateMaxValueNodes())
         self.rspec_nodes.extend(gene.getRepressSpecValueNodes())
         self.rmax_nodes.extend(gene.getRepressMaxValueNodes())
+    self.target_node_list = self.decay_nodes + self.diffusibility_nodes + self.synthesis_nodes + self.constitutive_nodes + self.aspec_nodes + self.amax_nodes + self.rspec_nodes + self.rmax_nodes
 
 
   def clipParameters(self) :
@@ -1066,8 +1207,8 @@ effects and may be disabled in the future.
     return parameter_list
 
 
-  def setParameters(self, parameter_list) :
-    """Set values in a transsys program based on a list of unconstrained parameters.
+  def transformParameters(self, parameter_list) :
+    """Transform a list of unconstrained parameters to values of the target nodes.
 
 Notice that the parameter list must have the same length as that obtained
 by C{getParameters}.
@@ -1076,31 +1217,46 @@ by C{getParameters}.
 """
     if len(parameter_list) != len(self.decay_nodes) + len(self.diffusibility_nodes) + len(self.synthesis_nodes) + len(self.constitutive_nodes) + len(self.aspec_nodes) + len(self.amax_nodes) + len(self.rspec_nodes) + len(self.rmax_nodes):
       raise StandardError, 'parameter list incompatible with transsys program'
+    value_list = []
     i = 0
     for n in self.decay_nodes :
-      n.value = self.decayTransformation(parameter_list[i])
+      value_list.append(self.decayTransformation(parameter_list[i]))
       i = i + 1
     for n in self.diffusibility_nodes :
-      n.value = self.diffusibilityTransformation(parameter_list[i])
+      value_list.append(self.diffusibilityTransformation(parameter_list[i]))
       i = i + 1
     for n in self.synthesis_nodes :
-      n.value = self.synthesisTransformation(parameter_list[i])
+      value_list.append(self.synthesisTransformation(parameter_list[i]))
       i = i + 1
     for n in self.constitutive_nodes :
-      n.value = self.constitutiveTransformation(parameter_list[i])
+      value_list.append(self.constitutiveTransformation(parameter_list[i]))
       i = i + 1
     for n in self.aspec_nodes :
-      n.value = self.aspecTransformation(parameter_list[i])
+      value_list.append(self.aspecTransformation(parameter_list[i]))
       i = i + 1
     for n in self.amax_nodes :
-      n.value = self.amaxTransformation(parameter_list[i])
+      value_list.append(self.amaxTransformation(parameter_list[i]))
       i = i + 1
     for n in self.rspec_nodes :
-      n.value = self.rspecTransformation(parameter_list[i])
+      value_list.append(self.rspecTransformation(parameter_list[i]))
       i = i + 1
     for n in self.rmax_nodes :
-      n.value = self.rmaxTransformation(parameter_list[i])
+      value_list.append(self.rmaxTransformation(parameter_list[i]))
       i = i + 1
+    return value_list
+
+
+  def setParameters(self, parameter_list) :
+    """Set values in a transsys program based on a list of unconstrained parameters.
+
+Notice that the parameter list must have the same length as that obtained
+by C{getParameters}.
+
+@raise StandardError: if the parameter list is too long or too short
+"""
+    value_list = self.transformParameters(parameter_list)
+    for i in xrange(len(value_list)) :
+      self.target_node_list[i].value = value_list[i]
 
 
 def parse_parameter_transformer(f) :
@@ -2140,11 +2296,16 @@ def parse_optimiser(f) :
 
 class LsysObjectiveFunction(AbstractObjectiveFunction) :
 
+  # the lsys program is compiled once and kept in compiled_lsys, which
+  # is updated with the values of the transsys program to be evaluated
+  # as long as its structure remains the same.
+
   def __init__(self, lsys, control_transsys, disparity_function, num_timesteps) :
     self.lsys = copy.deepcopy(lsys)
     self.control_transsys = copy.deepcopy(control_transsys)
     self.disparity_function = disparity_function
     self.num_timesteps = num_timesteps
+    self.compiled_lsys = None
 
 
   def __call__(self, tp) :
@@ -2152,7 +2313,14 @@ class LsysObjectiveFunction(AbstractObjectiveFunction) :
     transsys_program.merge(tp)
     self.lsys.associate_transsys(transsys_program)
     # print self.lsys
-    fitness = disparity_fitness(self.lsys, transsys_program, tp.factor_names(), self.num_timesteps, self.disparity_function)
+    if self.compiled_lsys is not None :
+      try :
+        self.compiled_lsys.set_transsys(transsys_program)
+      except ValueError :
+        self.compiled_lsys = None
+    if self.compiled_lsys is None :
+      self.compiled_lsys = self.lsys.compiled()
+    fitness = disparity_fitness(self.lsys, transsys_program, tp.factor_names(), self.num_timesteps, self.disparity_function, self.compiled_lsys)
     self.lsys.dissociate_transsys()
     return fitness
 
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+# $Id$
+
+"""Parallel computation of time series and derivation series.
+
+The simulation functions of C{clib} release the global interpreter
+lock while they compute, so simulations can run concurrently in
+multiple threads and use multiple processor cores. Programs that
+use the C{random} or C{gauss} functions run concurrently only if
+a seed is given, so that each simulation draws random numbers from
+its own generator. Without a seed, they are simulated while holding
+the global interpreter lock because the global random number
+generator is shared.
+"""
+
+import sys
+import threading
+import Queue
+
+
+def default_num_threads() :
+  """Determine the default number of threads, i.e. the number of
+processors.
+
+@return: the number of processors, or 1 if it cannot be determined
+@rtype: C{int}
+"""
+  try :
+    import multiprocessing
+    return multiprocessing.cpu_count()
+  except (ImportError, NotImplementedError) :
+    return 1
+
+
+class ThreadPool(object) :
+  """A pool of worker threads for running simulations.
+
+The worker threads are daemon threads that wait for jobs until
+the pool is closed. A pool can be used for any number of calls
+to L{map}, including concurrent calls from several threads.
+
+@ivar num_threads: the number of worker threads
+"""
+
+  def __init__(self, num_threads = None) :
+    if num_threads is None :
+      num_threads = default_num_threads()
+    if num_threads < 1 :
+      raise StandardError, 'ThreadPool: number of threads must be positive'
+    self.num_threads = num_threads
+    self.job_queue = Queue.Queue()
+    self.thread_list = []
+    for i in xrange(num_threads) :
+      t = threading.Thread(target = self.work)
+      t.setDaemon(True)
+      t.start()
+      self.thread_list.append(t)
+
+
+  def work(self) :
+    while True :
+      job = self.job_queue.get()
+      if job is None :
+        return
+      function, arg, result_list, index, finished = job
+      try :
+        result_list[index] = (True, function(arg))
+      except :
+        result_list[index] = (False, sys.exc_info())
+      finished.release()
+
+
+  def map(self, function, arg_list) :
+    """Apply a function to each element of a list, using the pool's
+threads.
+
+If any of the calls raises an exception, the exception of the
+first such call (in the order of C{arg_list}) is re-raised after
+all calls have finished.
+
+@param function: the function to apply
+@param arg_list: the list of arguments
+@return: the list of results, in the order of C{arg_list}
+@rtype: C{list}
+"""
+    if self.thread_list is None :
+      raise StandardError, 'ThreadPool.map: pool is closed'
+    arg_list = list(arg_list)
+    result_list = [None] * len(arg_list)
+    finished = threading.Semaphore(0)
+    for i in xrange(len(arg_list)) :
+      self.job_queue.put((function, arg_list[i], result_list, i, finished))
+    for i in xrange(len(arg_list)) :
+      finished.acquire()
+    for success, result in result_list :
+      if not success :
+        raise result[0], result[1], result[2]
+    return map(lambda r : r[1], result_list)
+
+
+  def close(self) :
+    """Terminate the worker threads after all pending jobs are done.
+"""
+    if self.thread_list is None :
+      return
+    for t in self.thread_list :
+      self.job_queue.put(None)
+    for t in self.thread_list :
+      t.join()
+    self.thread_list = None
+
+
+def parallel_map(function, arg_list, num_threads = None) :
+  """Apply a function to each element of a list, using a temporary
+pool of C{num_threads} threads. See L{ThreadPool.map}.
+"""
+  pool = ThreadPool(num_threads)
+  try :
+    return pool.map(function, arg_list)
+  finally :
+    pool.close()
+
+
+def job_seed_list(seed, num_jobs) :
+  if seed is None :
+    return [None] * num_jobs
+  return range(seed, seed + num_jobs)
+
+
+def time_series_parallel(ti_list, num_timesteps, sampling_period = 1, num_threads = None, compiled_program = None, seed = None) :
+  """Compute time series for a list of transsys instances in parallel.
+
+@param ti_list: the list of transsys instances
+@param num_timesteps: number of time steps, as for
+  L{transsys.TranssysInstance.time_series}
+@param sampling_period: period of sampling
+@param num_threads: number of threads, defaults to the number
+  of processors
+@param compiled_program: a compiled transsys program, which then
+  must be the compiled version of the transsys program of all
+  instances in C{ti_list}, or C{None}
+@param seed: if not C{None}, the time series of C{ti_list[i]} is
+  computed using random numbers seeded with C{seed + i}
+@return: the list of time series, in the order of C{ti_list}
+@rtype: C{list}
+"""
+  ti_list = list(ti_list)
+  if compiled_program is None :
+    f = lambda (ti, s) : ti.time_series(num_timesteps, sampling_period, seed = s)
+  else :
+    f = lambda (ti, s) : compiled_program.timeseries(ti, num_timesteps, sampling_period, s)
+  return parallel_map(f, zip(ti_list, job_seed_list(seed, len(ti_list))), num_threads)
+
+
+def derivation_series_parallel(lsys_list, nsteps, sampling_period = 1, num_threads = None, seed = None) :
+  """Compute derivation series for a list of lsys programs in parallel.
+
+The elements of C{lsys_list} may be lsys programs or compiled lsys
+programs (see L{transsys.LsysProgram.compiled}).
+
+@param lsys_list: the list of lsys programs
+@param nsteps: number of derivation steps
+@param sampling_period: period of sampling
+@param num_threads: number of threads, defaults to the number
+  of processors
+@param seed: if not C{None}, the derivation series of C{lsys_list[i]}
+  is computed using random numbers seeded with C{seed + i}
+@return: the list of derivation series, in the order of C{lsys_list}
+@rtype: C{list}
+"""
+  def derivation_series((lsys, s)) :
+    if hasattr(lsys, 'stringseries') :
+      return lsys.stringseries(nsteps, sampling_period, s)
+    return lsys.derivation_series(nsteps, sampling_period, s)
+  lsys_list = list(lsys_list)
+  return parallel_map(derivation_series, zip(lsys_list, job_seed_list(seed, len(lsys_list))), num_threads)
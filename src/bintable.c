@@ -0,0 +1,117 @@
+/* Copyright (C) 2001 Jan T. Kim <kim@inb.mu-luebeck.de> */
+
+/*
+ * $Id$
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "trconfig.h"
+#include "trtypes.h"
+#include "transsys.h"
+
+
+/*
+ * Binary tables: an alternative to the text output of transexpr and
+ * ltransexpr for large amounts of data. A binary table consists of a
+ * text header, which is padded with zero bytes to a multiple of 8
+ * bytes, followed by rows of doubles in the byte order of the writing
+ * machine, so the data can be memory mapped. The header lines are
+ *
+ *   transsys binary table <version>
+ *   byteorder little|big
+ *   kind <kind of table, e.g. "transexpr 1.0">
+ *   transsys <name of transsys>
+ *   lsys <name of lsys>          (if there is an lsys)
+ *   symbol <name>                (for each lsys symbol, in order)
+ *   rule <name>                  (for each lsys rule, in order)
+ *   columns <number of columns>
+ *   column <name>                (for each column)
+ *   end
+ *
+ * The number of rows is not stored, it is determined by the size of
+ * the file, so tables can be written while a simulation proceeds.
+ * Columns containing indices of symbols or rules refer to the
+ * symbol and rule lines, in the order in which they appear.
+ */
+
+static const char *binary_table_version = "1.0";
+
+
+static const char *host_byteorder(void)
+{
+  unsigned long one = 1;
+
+  return ((*((const unsigned char *) &one) == 1) ? "little" : "big");
+}
+
+
+/*
+ * Write the header of a binary table with num_leading_columns
+ * columns named leading_column, followed by a column for each
+ * combination of a factor of transsys and a suffix in factor_suffix,
+ * in order of factors. lsys may be NULL.
+ */
+
+int fprint_binary_table_header(FILE *f, const char *kind, const TRANSSYS *transsys, const LSYS *lsys, int num_leading_columns, const char **leading_column, int num_factor_suffixes, const char **factor_suffix)
+{
+  long header_size = 0;
+  int i, j, n;
+
+  header_size += fprintf(f, "transsys binary table %s\n", binary_table_version);
+  header_size += fprintf(f, "byteorder %s\n", host_byteorder());
+  header_size += fprintf(f, "kind %s\n", kind);
+  header_size += fprintf(f, "transsys %s\n", transsys->name);
+  if (lsys)
+  {
+    header_size += fprintf(f, "lsys %s\n", lsys->name);
+    for (i = 0; i < lsys->num_symbols; i++)
+    {
+      header_size += fprintf(f, "symbol %s\n", lsys->symbol_list[i].name);
+    }
+    for (i = 0; i < lsys->num_rules; i++)
+    {
+      header_size += fprintf(f, "rule %s\n", lsys->rule_list[i].name);
+    }
+  }
+  header_size += fprintf(f, "columns %d\n", num_leading_columns + transsys->num_factors * num_factor_suffixes);
+  for (i = 0; i < num_leading_columns; i++)
+  {
+    header_size += fprintf(f, "column %s\n", leading_column[i]);
+  }
+  for (i = 0; i < transsys->num_factors; i++)
+  {
+    for (j = 0; j < num_factor_suffixes; j++)
+    {
+      header_size += fprintf(f, "column %s%s\n", transsys->factor_list[i].name, factor_suffix[j]);
+    }
+  }
+  header_size += fprintf(f, "end\n");
+  for (n = (8 - header_size % 8) % 8; n > 0; n--)
+  {
+    if (putc(0, f) == EOF)
+    {
+      fprintf(stderr, "fprint_binary_table_header: write error\n");
+      return (-1);
+    }
+  }
+  if (ferror(f))
+  {
+    fprintf(stderr, "fprint_binary_table_header: write error\n");
+    return (-1);
+  }
+  return (0);
+}
+
+
+int fwrite_binary_table_row(FILE *f, size_t num_columns, const double *row)
+{
+  if (fwrite(row, sizeof(double), num_columns, f) != num_columns)
+  {
+    fprintf(stderr, "fwrite_binary_table_row: write error\n");
+    return (-1);
+  }
+  return (0);
+}
@@ -0,0 +1,722 @@
+/* Copyright (C) 2001 Jan T. Kim <kim@inb.mu-luebeck.de> */
+
+/*
+ * $Id$
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+
+#include "trconfig.h"
+#include "trtypes.h"
+#include "transsys.h"
+
+
+/*
+ * Instructions are emitted in the order in which evaluate_expression
+ * and process_expression visit the expression nodes, so random
+ * numbers are drawn in the same sequence. Instructions drawing random
+ * numbers are never shared.
+ */
+
+typedef struct
+{
+  TRANSSYS_BYTECODE *bytecode;
+  int num_buckets;
+  int *bucket;
+  int *next;
+  double *constant_value;
+} BYTECODE_BUILDER;
+
+
+static int count_expression_nodes(const EXPRESSION_NODE *expr)
+{
+  switch (expr->type)
+  {
+  case NT_VALUE:
+  case NT_IDENTIFIER:
+  case NT_RAW_IDENTIFIER:
+    return (1);
+  case NT_NOT:
+  case NT_ATAN:
+    return (1 + count_expression_nodes(expr->content.argument[0]));
+  default:
+    return (1 + count_expression_nodes(expr->content.argument[0]) + count_expression_nodes(expr->content.argument[1]));
+  }
+}
+
+
+static int count_transsys_expression_nodes(const TRANSSYS *transsys)
+{
+  const PROMOTER_ELEMENT *a;
+  int i, n = 0;
+
+  for (i = 0; i < transsys->num_factors; i++)
+  {
+    if (transsys->factor_list[i].decay_expression)
+    {
+      n += count_expression_nodes(transsys->factor_list[i].decay_expression);
+    }
+    if (transsys->factor_list[i].synthesis_expression)
+    {
+      n += count_expression_nodes(transsys->factor_list[i].synthesis_expression);
+    }
+  }
+  for (i = 0; i < transsys->num_genes; i++)
+  {
+    for (a = transsys->gene_list[i].promoter_list; a; a = a->next)
+    {
+      switch (a->type)
+      {
+      case PROMOTERELEMENT_CONSTITUTIVE:
+	n += count_expression_nodes(a->expr1);
+	break;
+      case PROMOTERELEMENT_ACTIVATE:
+      case PROMOTERELEMENT_REPRESS:
+	n += count_expression_nodes(a->expr1) + count_expression_nodes(a->expr2);
+	break;
+      default:
+	break;
+      }
+    }
+  }
+  return (n);
+}
+
+
+static int expression_compilable(const EXPRESSION_NODE *expr)
+{
+  switch (expr->type)
+  {
+  case NT_VALUE:
+    return (1);
+  case NT_IDENTIFIER:
+    return (expr->content.identifier.lhs_symbol_index <= 0);
+  case NT_RAW_IDENTIFIER:
+    return (0);
+  case NT_NOT:
+  case NT_ATAN:
+    return (expression_compilable(expr->content.argument[0]));
+  case NT_LOGICAL_OR:
+  case NT_LOGICAL_AND:
+  case NT_LOWER:
+  case NT_LOWER_EQUAL:
+  case NT_GREATER:
+  case NT_GREATER_EQUAL:
+  case NT_EQUAL:
+  case NT_UNEQUAL:
+  case NT_ADD:
+  case NT_SUBTRACT:
+  case NT_MULT:
+  case NT_DIV:
+  case NT_RANDOM:
+  case NT_GAUSS:
+  case NT_POW:
+  case NT_LOG:
+    return (expression_compilable(expr->content.argument[0]) && expression_compilable(expr->content.argument[1]));
+  default:
+    return (0);
+  }
+}
+
+
+/*
+ * Determine whether new_transsys_bytecode can compile transsys,
+ * without reporting why it cannot. This allows callers which fall
+ * back to process_expression to do so quietly.
+ */
+
+int transsys_bytecode_compilable(const TRANSSYS *transsys)
+{
+  const PROMOTER_ELEMENT *a;
+  int i;
+
+  if (!transsys->arrayed)
+  {
+    return (0);
+  }
+  for (i = 0; i < transsys->num_factors; i++)
+  {
+    if (transsys->factor_list[i].decay_expression && !expression_compilable(transsys->factor_list[i].decay_expression))
+    {
+      return (0);
+    }
+    if (transsys->factor_list[i].synthesis_expression && !expression_compilable(transsys->factor_list[i].synthesis_expression))
+    {
+      return (0);
+    }
+  }
+  for (i = 0; i < transsys->num_genes; i++)
+  {
+    for (a = transsys->gene_list[i].promoter_list; a; a = a->next)
+    {
+      switch (a->type)
+      {
+      case PROMOTERELEMENT_CONSTITUTIVE:
+	if (!expression_compilable(a->expr1))
+	{
+	  return (0);
+	}
+	break;
+      case PROMOTERELEMENT_ACTIVATE:
+      case PROMOTERELEMENT_REPRESS:
+	if (!expression_compilable(a->expr1) || !expression_compilable(a->expr2))
+	{
+	  return (0);
+	}
+	break;
+      default:
+	break;
+      }
+    }
+  }
+  return (1);
+}
+
+
+static void count_transsys_promoter_elements(const TRANSSYS *transsys, int *num_promoters, int *num_binding_factors)
+{
+  const PROMOTER_ELEMENT *a;
+  int i;
+
+  *num_promoters = 0;
+  *num_binding_factors = 0;
+  for (i = 0; i < transsys->num_genes; i++)
+  {
+    for (a = transsys->gene_list[i].promoter_list; a; a = a->next)
+    {
+      (*num_promoters)++;
+      if ((a->type == PROMOTERELEMENT_ACTIVATE) || (a->type == PROMOTERELEMENT_REPRESS))
+      {
+	*num_binding_factors += a->num_binding_factors;
+      }
+    }
+  }
+}
+
+
+static unsigned int instruction_hashvalue(const BYTECODE_INSTRUCTION *instruction)
+{
+  unsigned int h;
+  unsigned char b[sizeof(double)];
+  size_t i;
+
+  h = (unsigned int) instruction->type;
+  h = h * 31 + (unsigned int) instruction->argument[0];
+  h = h * 31 + (unsigned int) instruction->argument[1];
+  h = h * 31 + (unsigned int) instruction->factor_index;
+  memcpy(b, &(instruction->value), sizeof(double));
+  for (i = 0; i < sizeof(double); i++)
+  {
+    h = h * 31 + b[i];
+  }
+  return (h);
+}
+
+
+static int instructions_equal(const BYTECODE_INSTRUCTION *i1, const BYTECODE_INSTRUCTION *i2)
+{
+  return ((i1->type == i2->type)
+	  && (i1->argument[0] == i2->argument[0])
+	  && (i1->argument[1] == i2->argument[1])
+	  && (i1->factor_index == i2->factor_index)
+	  && !memcmp(&(i1->value), &(i2->value), sizeof(double)));
+}
+
+
+/*
+ * Append an instruction, or find an identical one emitted before.
+ * Returns the register computed by the instruction.
+ */
+static int emit_instruction(BYTECODE_BUILDER *builder, const BYTECODE_INSTRUCTION *instruction)
+{
+  TRANSSYS_BYTECODE *bc = builder->bytecode;
+  int b, r;
+
+  if ((instruction->type == NT_RANDOM) || (instruction->type == NT_GAUSS))
+  {
+    bc->instruction[bc->num_instructions] = *instruction;
+    return (bc->num_instructions++);
+  }
+  b = instruction_hashvalue(instruction) % builder->num_buckets;
+  for (r = builder->bucket[b]; r != NO_INDEX; r = builder->next[r])
+  {
+    if (instructions_equal(bc->instruction + r, instruction))
+    {
+      return (r);
+    }
+  }
+  r = bc->num_instructions++;
+  bc->instruction[r] = *instruction;
+  builder->next[r] = builder->bucket[b];
+  builder->bucket[b] = r;
+  return (r);
+}
+
+
+static double evaluate_instruction(const BYTECODE_INSTRUCTION *instruction, const double *value, const TRANSSYS_INSTANCE *ti);
+
+
+/*
+ * An instruction is constant if it does not draw random numbers
+ * and all its arguments are constant. Constant instructions are
+ * folded into values at compile time.
+ */
+static int is_constant_instruction(const TRANSSYS_BYTECODE *bc, const BYTECODE_INSTRUCTION *instruction)
+{
+  int i;
+
+  switch (instruction->type)
+  {
+  case NT_IDENTIFIER:
+  case NT_RANDOM:
+  case NT_GAUSS:
+    return (0);
+  default:
+    for (i = 0; i < 2; i++)
+    {
+      if ((instruction->argument[i] != NO_INDEX) && (bc->instruction[instruction->argument[i]].type != NT_VALUE))
+      {
+	return (0);
+      }
+    }
+    return (1);
+  }
+}
+
+
+static int compile_expression(BYTECODE_BUILDER *builder, const EXPRESSION_NODE *expr)
+{
+  BYTECODE_INSTRUCTION instruction;
+  int r;
+  const TRANSSYS *transsys = builder->bytecode->transsys;
+
+  instruction.type = expr->type;
+  instruction.argument[0] = NO_INDEX;
+  instruction.argument[1] = NO_INDEX;
+  instruction.factor_index = NO_INDEX;
+  instruction.value = 0.0;
+  switch (expr->type)
+  {
+  case NT_VALUE:
+    instruction.value = expr->content.value;
+    break;
+  case NT_IDENTIFIER:
+    if (expr->content.identifier.lhs_symbol_index > 0)
+    {
+      fprintf(stderr, "compile_expression: cannot compile identifier referring to lhs symbol %d\n", expr->content.identifier.lhs_symbol_index);
+      return (NO_INDEX);
+    }
+    if ((expr->content.identifier.factor_index < 0) || (expr->content.identifier.factor_index >= transsys->num_factors))
+    {
+      fprintf(stderr, "Identifier index %d out of range [0, %d] for transsys \"%s\"\n", expr->content.identifier.factor_index, transsys->num_factors - 1, transsys->name);
+      instruction.type = NT_VALUE;
+    }
+    else
+    {
+      instruction.factor_index = expr->content.identifier.factor_index;
+    }
+    break;
+  case NT_RAW_IDENTIFIER:
+    fprintf(stderr, "compile_expression: cannot compile raw identifier \"%s\"\n", expr->content.raw_identifier.factor_name);
+    return (NO_INDEX);
+  case NT_NOT:
+  case NT_ATAN:
+    instruction.argument[0] = compile_expression(builder, expr->content.argument[0]);
+    if (instruction.argument[0] == NO_INDEX)
+    {
+      return (NO_INDEX);
+    }
+    break;
+  case NT_LOGICAL_OR:
+  case NT_LOGICAL_AND:
+  case NT_LOWER:
+  case NT_LOWER_EQUAL:
+  case NT_GREATER:
+  case NT_GREATER_EQUAL:
+  case NT_EQUAL:
+  case NT_UNEQUAL:
+  case NT_ADD:
+  case NT_SUBTRACT:
+  case NT_MULT:
+  case NT_DIV:
+  case NT_RANDOM:
+  case NT_GAUSS:
+  case NT_POW:
+  case NT_LOG:
+    instruction.argument[0] = compile_expression(builder, expr->content.argument[0]);
+    if (instruction.argument[0] == NO_INDEX)
+    {
+      return (NO_INDEX);
+    }
+    instruction.argument[1] = compile_expression(builder, expr->content.argument[1]);
+    if (instruction.argument[1] == NO_INDEX)
+    {
+      return (NO_INDEX);
+    }
+    break;
+  default:
+    fprintf(stderr, "compile_expression: unknown expression type %d\n", (int) expr->type);
+    return (NO_INDEX);
+  }
+  if (is_constant_instruction(builder->bytecode, &instruction))
+  {
+    instruction.value = evaluate_instruction(&instruction, builder->constant_value, NULL);
+    instruction.type = NT_VALUE;
+    instruction.argument[0] = NO_INDEX;
+    instruction.argument[1] = NO_INDEX;
+  }
+  r = emit_instruction(builder, &instruction);
+  if (instruction.type == NT_VALUE)
+  {
+    builder->constant_value[r] = instruction.value;
+  }
+  return (r);
+}
+
+
+void free_transsys_bytecode(TRANSSYS_BYTECODE *bc)
+{
+  if (bc->instruction)
+  {
+    free(bc->instruction);
+  }
+  if (bc->dynamic_instruction)
+  {
+    free(bc->dynamic_instruction);
+  }
+  if (bc->decay_register)
+  {
+    free(bc->decay_register);
+  }
+  if (bc->synthesis_register)
+  {
+    free(bc->synthesis_register);
+  }
+  if (bc->gene_product)
+  {
+    free(bc->gene_product);
+  }
+  if (bc->gene_promoter_start)
+  {
+    free(bc->gene_promoter_start);
+  }
+  if (bc->promoter_type)
+  {
+    free(bc->promoter_type);
+  }
+  if (bc->promoter_binding_start)
+  {
+    free(bc->promoter_binding_start);
+  }
+  if (bc->binding_factor)
+  {
+    free(bc->binding_factor);
+  }
+  if (bc->promoter_register1)
+  {
+    free(bc->promoter_register1);
+  }
+  if (bc->promoter_register2)
+  {
+    free(bc->promoter_register2);
+  }
+  free(bc);
+}
+
+
+static TRANSSYS_BYTECODE *alloc_transsys_bytecode(const TRANSSYS *transsys, int max_instructions, int num_promoters, int num_binding_factors)
+{
+  TRANSSYS_BYTECODE *bc;
+
+  bc = (TRANSSYS_BYTECODE *) malloc(sizeof(TRANSSYS_BYTECODE));
+  if (bc == NULL)
+  {
+    return (NULL);
+  }
+  bc->transsys = transsys;
+  bc->num_instructions = 0;
+  bc->num_dynamic_instructions = 0;
+  bc->num_promoters = num_promoters;
+  bc->instruction = (BYTECODE_INSTRUCTION *) malloc((max_instructions > 0 ? max_instructions : 1) * sizeof(BYTECODE_INSTRUCTION));
+  bc->dynamic_instruction = (int *) malloc((max_instructions > 0 ? max_instructions : 1) * sizeof(int));
+  bc->decay_register = (int *) malloc((transsys->num_factors > 0 ? transsys->num_factors : 1) * sizeof(int));
+  bc->synthesis_register = (int *) malloc((transsys->num_factors > 0 ? transsys->num_factors : 1) * sizeof(int));
+  bc->gene_product = (int *) malloc((transsys->num_genes > 0 ? transsys->num_genes : 1) * sizeof(int));
+  bc->gene_promoter_start = (int *) malloc((transsys->num_genes + 1) * sizeof(int));
+  bc->promoter_type = (PROMOTERELEMENT_TYPE *) malloc((num_promoters > 0 ? num_promoters : 1) * sizeof(PROMOTERELEMENT_TYPE));
+  bc->promoter_binding_start = (int *) malloc((num_promoters + 1) * sizeof(int));
+  bc->binding_factor = (int *) malloc((num_binding_factors > 0 ? num_binding_factors : 1) * sizeof(int));
+  bc->promoter_register1 = (int *) malloc((num_promoters > 0 ? num_promoters : 1) * sizeof(int));
+  bc->promoter_register2 = (int *) malloc((num_promoters > 0 ? num_promoters : 1) * sizeof(int));
+  if ((bc->instruction == NULL) || (bc->dynamic_instruction == NULL) || (bc->decay_register == NULL) || (bc->synthesis_register == NULL)
+      || (bc->gene_product == NULL) || (bc->gene_promoter_start == NULL) || (bc->promoter_type == NULL) || (bc->promoter_binding_start == NULL)
+      || (bc->binding_factor == NULL) || (bc->promoter_register1 == NULL) || (bc->promoter_register2 == NULL))
+  {
+    free_transsys_bytecode(bc);
+    return (NULL);
+  }
+  return (bc);
+}
+
+
+static int compile_transsys(BYTECODE_BUILDER *builder)
+{
+  TRANSSYS_BYTECODE *bc = builder->bytecode;
+  const TRANSSYS *transsys = bc->transsys;
+  const PROMOTER_ELEMENT *a;
+  int i, j, p, b;
+
+  for (i = 0; i < transsys->num_factors; i++)
+  {
+    bc->decay_register[i] = NO_INDEX;
+    if (transsys->factor_list[i].decay_expression)
+    {
+      bc->decay_register[i] = compile_expression(builder, transsys->factor_list[i].decay_expression);
+      if (bc->decay_register[i] == NO_INDEX)
+      {
+	return (-1);
+      }
+    }
+    bc->synthesis_register[i] = NO_INDEX;
+    if (transsys->factor_list[i].synthesis_expression)
+    {
+      bc->synthesis_register[i] = compile_expression(builder, transsys->factor_list[i].synthesis_expression);
+      if (bc->synthesis_register[i] == NO_INDEX)
+      {
+	return (-1);
+      }
+    }
+  }
+  p = 0;
+  b = 0;
+  for (i = 0; i < transsys->num_genes; i++)
+  {
+    bc->gene_product[i] = transsys->gene_list[i].product_index;
+    bc->gene_promoter_start[i] = p;
+    for (a = transsys->gene_list[i].promoter_list; a; a = a->next)
+    {
+      bc->promoter_type[p] = a->type;
+      bc->promoter_binding_start[p] = b;
+      bc->promoter_register1[p] = NO_INDEX;
+      bc->promoter_register2[p] = NO_INDEX;
+      if ((a->type == PROMOTERELEMENT_CONSTITUTIVE) || (a->type == PROMOTERELEMENT_ACTIVATE) || (a->type == PROMOTERELEMENT_REPRESS))
+      {
+	bc->promoter_register1[p] = compile_expression(builder, a->expr1);
+	if (bc->promoter_register1[p] == NO_INDEX)
+	{
+	  return (-1);
+	}
+      }
+      if ((a->type == PROMOTERELEMENT_ACTIVATE) || (a->type == PROMOTERELEMENT_REPRESS))
+      {
+	for (j = 0; j < a->num_binding_factors; j++)
+	{
+	  bc->binding_factor[b++] = a->factor_index[j];
+	}
+	bc->promoter_register2[p] = compile_expression(builder, a->expr2);
+	if (bc->promoter_register2[p] == NO_INDEX)
+	{
+	  return (-1);
+	}
+      }
+      p++;
+    }
+  }
+  bc->gene_promoter_start[transsys->num_genes] = p;
+  bc->promoter_binding_start[p] = b;
+  return (0);
+}
+
+
+static void free_bytecode_builder_components(BYTECODE_BUILDER *builder)
+{
+  if (builder->bucket)
+  {
+    free(builder->bucket);
+  }
+  if (builder->next)
+  {
+    free(builder->next);
+  }
+  if (builder->constant_value)
+  {
+    free(builder->constant_value);
+  }
+}
+
+
+/*
+ * Compile the expressions of an (arrayed) transsys program into
+ * bytecode. Subexpressions that depend neither on factor
+ * concentrations nor on random numbers are folded into constants,
+ * so the bytecode must be recompiled if the program's values are
+ * changed. Returns NULL upon failure.
+ */
+
+TRANSSYS_BYTECODE *new_transsys_bytecode(const TRANSSYS *transsys)
+{
+  BYTECODE_BUILDER builder;
+  TRANSSYS_BYTECODE *bc;
+  int max_instructions, num_promoters, num_binding_factors, i, r;
+
+  if (!transsys->arrayed)
+  {
+    fprintf(stderr, "new_transsys_bytecode: transsys not arrayed\n");
+    return (NULL);
+  }
+  max_instructions = count_transsys_expression_nodes(transsys);
+  count_transsys_promoter_elements(transsys, &num_promoters, &num_binding_factors);
+  bc = alloc_transsys_bytecode(transsys, max_instructions, num_promoters, num_binding_factors);
+  if (bc == NULL)
+  {
+    fprintf(stderr, "new_transsys_bytecode: alloc_transsys_bytecode failed\n");
+    return (NULL);
+  }
+  builder.bytecode = bc;
+  builder.num_buckets = 2 * max_instructions + 1;
+  builder.bucket = (int *) malloc(builder.num_buckets * sizeof(int));
+  builder.next = (int *) malloc((max_instructions > 0 ? max_instructions : 1) * sizeof(int));
+  builder.constant_value = (double *) malloc((max_instructions > 0 ? max_instructions : 1) * sizeof(double));
+  if ((builder.bucket == NULL) || (builder.next == NULL) || (builder.constant_value == NULL))
+  {
+    fprintf(stderr, "new_transsys_bytecode: malloc failed\n");
+    free_bytecode_builder_components(&builder);
+    free_transsys_bytecode(bc);
+    return (NULL);
+  }
+  for (i = 0; i < builder.num_buckets; i++)
+  {
+    builder.bucket[i] = NO_INDEX;
+  }
+  if (compile_transsys(&builder) != 0)
+  {
+    fprintf(stderr, "new_transsys_bytecode: failed to compile transsys \"%s\"\n", transsys->name);
+    free_bytecode_builder_components(&builder);
+    free_transsys_bytecode(bc);
+    return (NULL);
+  }
+  free_bytecode_builder_components(&builder);
+  bc->num_dynamic_instructions = 0;
+  for (r = 0; r < bc->num_instructions; r++)
+  {
+    if (bc->instruction[r].type != NT_VALUE)
+    {
+      bc->dynamic_instruction[bc->num_dynamic_instructions++] = r;
+    }
+  }
+  return (bc);
+}
+
+
+/*
+ * Compute the value of a single instruction from the registers
+ * computed by preceding instructions. ti may be NULL if the
+ * instruction is not an identifier and does not draw random numbers.
+ */
+
+static double evaluate_instruction(const BYTECODE_INSTRUCTION *instruction, const double *value, const TRANSSYS_INSTANCE *ti)
+{
+  double arg1, arg2;
+
+  switch (instruction->type)
+  {
+  case NT_VALUE:
+    return (instruction->value);
+  case NT_IDENTIFIER:
+    return (ti->factor_concentration[instruction->factor_index]);
+  case NT_LOGICAL_OR:
+    return ((value[instruction->argument[0]] || value[instruction->argument[1]]) ? 1.0 : 0.0);
+  case NT_LOGICAL_AND:
+    return ((value[instruction->argument[0]] && value[instruction->argument[1]]) ? 1.0 : 0.0);
+  case NT_LOWER:
+    return ((value[instruction->argument[0]] < value[instruction->argument[1]]) ? 1.0 : 0.0);
+  case NT_LOWER_EQUAL:
+    return ((value[instruction->argument[0]] <= value[instruction->argument[1]]) ? 1.0 : 0.0);
+  case NT_GREATER:
+    return ((value[instruction->argument[0]] > value[instruction->argument[1]]) ? 1.0 : 0.0);
+  case NT_GREATER_EQUAL:
+    return ((value[instruction->argument[0]] >= value[instruction->argument[1]]) ? 1.0 : 0.0);
+  case NT_EQUAL:
+    return ((value[instruction->argument[0]] == value[instruction->argument[1]]) ? 1.0 : 0.0);
+  case NT_UNEQUAL:
+    return ((value[instruction->argument[0]] != value[instruction->argument[1]]) ? 1.0 : 0.0);
+  case NT_NOT:
+    return ((value[instruction->argument[0]] != 0.0) ? 1.0 : 0.0);
+  case NT_ADD:
+    return (value[instruction->argument[0]] + value[instruction->argument[1]]);
+  case NT_SUBTRACT:
+    return (value[instruction->argument[0]] - value[instruction->argument[1]]);
+  case NT_MULT:
+    return (value[instruction->argument[0]] * value[instruction->argument[1]]);
+  case NT_DIV:
+    return (value[instruction->argument[0]] / value[instruction->argument[1]]);
+  case NT_RANDOM:
+    arg1 = value[instruction->argument[0]];
+    arg2 = value[instruction->argument[1]];
+    if (arg1 < arg2)
+      return (arg1 + (arg2 - arg1) * (ti->urandom_state ? urandom_state_double(ti->urandom_state) : urandom_double()));
+    else
+      return (arg2 + (arg1 - arg2) * (ti->urandom_state ? urandom_state_double(ti->urandom_state) : urandom_double()));
+  case NT_GAUSS:
+    return (value[instruction->argument[0]] + value[instruction->argument[1]] * (ti->urandom_state ? urandom_state_gauss(ti->urandom_state) : urandom_gauss()));
+  case NT_POW:
+    return (pow(value[instruction->argument[0]], value[instruction->argument[1]]));
+  case NT_LOG:
+    return (log(value[instruction->argument[0]]) / log(value[instruction->argument[1]]));
+  case NT_ATAN:
+    return (atan(value[instruction->argument[0]]));
+  default:
+    fprintf(stderr, "evaluate_instruction: unknown instruction type %d\n", (int) instruction->type);
+    return (0.0);
+  }
+}
+
+
+/*
+ * Allocate registers for evaluating bc, and store the values of
+ * constant instructions, which are not computed by evaluate_bytecode.
+ * Returns NULL upon failure.
+ */
+
+double *new_bytecode_registers(const TRANSSYS_BYTECODE *bc)
+{
+  double *value;
+  int r;
+
+  value = (double *) malloc((bc->num_instructions > 0 ? bc->num_instructions : 1) * sizeof(double));
+  if (value == NULL)
+  {
+    fprintf(stderr, "new_bytecode_registers: malloc failed\n");
+    return (NULL);
+  }
+  for (r = 0; r < bc->num_instructions; r++)
+  {
+    if (bc->instruction[r].type == NT_VALUE)
+    {
+      value[r] = bc->instruction[r].value;
+    }
+  }
+  return (value);
+}
+
+
+/*
+ * Compute the registers of bc that depend on factor concentrations
+ * of ti or on random numbers. value must have been obtained from
+ * new_bytecode_registers(bc). Random numbers are drawn using
+ * ti->urandom_state, as by process_expression.
+ */
+
+void evaluate_bytecode(const TRANSSYS_BYTECODE *bc, const TRANSSYS_INSTANCE *ti, double *value)
+{
+  int i, r;
+
+  for (i = 0; i < bc->num_dynamic_instructions; i++)
+  {
+    r = bc->dynamic_instruction[i];
+    value[r] = evaluate_instruction(bc->instruction + r, value, ti);
+  }
+}
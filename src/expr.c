@@ -15,13 +15,19 @@
 #include <stdio.h>
 #include <stdlib.h>
 #include <math.h>
+#include <string.h>
 
 #include "trconfig.h"
 #include "trtypes.h"
 #include "transsys.h"
 
 
-double evaluate_expression(const EXPRESSION_NODE *expr, const TRANSSYS_INSTANCE **ti_list)
+/*
+ * Evaluate an expression, using urandom_state for random numbers.
+ * If urandom_state is NULL, the global random number generator is used.
+ */
+
+double evaluate_expression_urandom(const EXPRESSION_NODE *expr, const TRANSSYS_INSTANCE **ti_list, URANDOM_STATE *urandom_state)
 {
   double arg1, arg2, return_value;
   int transsys_index;
@@ -45,85 +51,85 @@ double evaluate_expression(const EXPRESSION_NODE *expr, const TRANSSYS_INSTANCE
     /* fprintf(stderr, "returning value(%s) = %g\n", ti_list[transsys_index]->transsys->factor_list[expr->content.identifier.factor_index].name, concentration[expr->content.identifier.factor_index]); */
     return (ti_list[transsys_index]->factor_concentration[expr->content.identifier.factor_index]);
   case NT_LOGICAL_OR:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
-    arg2 = evaluate_expression(expr->content.argument[1], ti_list);
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
+    arg2 = evaluate_expression_urandom(expr->content.argument[1], ti_list, urandom_state);
     return ((arg1 || arg2) ? 1.0 : 0.0);
   case NT_LOGICAL_AND:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
-    arg2 = evaluate_expression(expr->content.argument[1], ti_list);
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
+    arg2 = evaluate_expression_urandom(expr->content.argument[1], ti_list, urandom_state);
     return ((arg1 && arg2) ? 1.0 : 0.0);
   case NT_LOWER:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
-    arg2 = evaluate_expression(expr->content.argument[1], ti_list);
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
+    arg2 = evaluate_expression_urandom(expr->content.argument[1], ti_list, urandom_state);
     return ((arg1 < arg2) ? 1.0 : 0.0);
   case NT_LOWER_EQUAL:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
-    arg2 = evaluate_expression(expr->content.argument[1], ti_list);
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
+    arg2 = evaluate_expression_urandom(expr->content.argument[1], ti_list, urandom_state);
     return ((arg1 <= arg2) ? 1.0 : 0.0);
   case NT_GREATER:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
-    arg2 = evaluate_expression(expr->content.argument[1], ti_list);
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
+    arg2 = evaluate_expression_urandom(expr->content.argument[1], ti_list, urandom_state);
     return ((arg1 > arg2) ? 1.0 : 0.0);
   case NT_GREATER_EQUAL:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
-    arg2 = evaluate_expression(expr->content.argument[1], ti_list);
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
+    arg2 = evaluate_expression_urandom(expr->content.argument[1], ti_list, urandom_state);
     return ((arg1 >= arg2) ? 1.0 : 0.0);
   case NT_EQUAL:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
-    arg2 = evaluate_expression(expr->content.argument[1], ti_list);
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
+    arg2 = evaluate_expression_urandom(expr->content.argument[1], ti_list, urandom_state);
     return ((arg1 == arg2) ? 1.0 : 0.0);
   case NT_UNEQUAL:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
-    arg2 = evaluate_expression(expr->content.argument[1], ti_list);
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
+    arg2 = evaluate_expression_urandom(expr->content.argument[1], ti_list, urandom_state);
     return ((arg1 != arg2) ? 1.0 : 0.0);
   case NT_NOT:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
     return ((arg1 != 0.0) ? 1.0 : 0.0);
   case NT_ADD:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
-    arg2 = evaluate_expression(expr->content.argument[1], ti_list);
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
+    arg2 = evaluate_expression_urandom(expr->content.argument[1], ti_list, urandom_state);
     /* fprintf(stderr, "returning %g + %g\n", arg1, arg2); */
     return (arg1 + arg2);
   case NT_SUBTRACT:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
-    arg2 = evaluate_expression(expr->content.argument[1], ti_list);
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
+    arg2 = evaluate_expression_urandom(expr->content.argument[1], ti_list, urandom_state);
     /* fprintf(stderr, "returning %g - %g\n", arg1, arg2); */
     return (arg1 - arg2);
   case NT_MULT:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
-    arg2 = evaluate_expression(expr->content.argument[1], ti_list);
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
+    arg2 = evaluate_expression_urandom(expr->content.argument[1], ti_list, urandom_state);
     /* fprintf(stderr, "returning %g * %g\n", arg1, arg2); */
     return (arg1 * arg2);
   case NT_DIV:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
-    arg2 = evaluate_expression(expr->content.argument[1], ti_list);
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
+    arg2 = evaluate_expression_urandom(expr->content.argument[1], ti_list, urandom_state);
     /* fprintf(stderr, "returning %g / %g\n", arg1, arg2); */
     return (arg1 / arg2);
   case NT_RANDOM:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
-    arg2 = evaluate_expression(expr->content.argument[1], ti_list);
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
+    arg2 = evaluate_expression_urandom(expr->content.argument[1], ti_list, urandom_state);
     if (arg1 < arg2)
-      return_value = arg1 + (arg2 - arg1) * urandom_double();
+      return_value = arg1 + (arg2 - arg1) * (urandom_state ? urandom_state_double(urandom_state) : urandom_double());
     else
-      return_value = arg2 + (arg1 - arg2) * urandom_double();
+      return_value = arg2 + (arg1 - arg2) * (urandom_state ? urandom_state_double(urandom_state) : urandom_double());
 /*     fprintf(stderr, "evaluate_expression: random(%g, %g) = %g\n", arg1, arg2, return_value); */
     return (return_value);
   case NT_GAUSS:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
-    arg2 = evaluate_expression(expr->content.argument[1], ti_list);
-    return (arg1 + arg2 * urandom_gauss());
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
+    arg2 = evaluate_expression_urandom(expr->content.argument[1], ti_list, urandom_state);
+    return (arg1 + arg2 * (urandom_state ? urandom_state_gauss(urandom_state) : urandom_gauss()));
   case NT_POW:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
-    arg2 = evaluate_expression(expr->content.argument[1], ti_list);
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
+    arg2 = evaluate_expression_urandom(expr->content.argument[1], ti_list, urandom_state);
     /* FIXME: should check for valid arguments (positive base etc.) */
     return (pow(arg1, arg2));
   case NT_LOG:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
-    arg2 = evaluate_expression(expr->content.argument[1], ti_list);
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
+    arg2 = evaluate_expression_urandom(expr->content.argument[1], ti_list, urandom_state);
     /* FIXME: should check for valid arguments */
     return (log(arg1) / log(arg2));
   case NT_ATAN:
-    arg1 = evaluate_expression(expr->content.argument[0], ti_list);
+    arg1 = evaluate_expression_urandom(expr->content.argument[0], ti_list, urandom_state);
     return (atan(arg1));
   case NT_RAW_IDENTIFIER:
     fprintf(stderr, "evaluate_expression: attempt to evaluate raw identifier \"%s\"\n", expr->content.raw_identifier.factor_name);
@@ -133,3 +139,191 @@ double evaluate_expression(const EXPRESSION_NODE *expr, const TRANSSYS_INSTANCE
     return (0.0);
   }
 }
+
+
+double evaluate_expression(const EXPRESSION_NODE *expr, const TRANSSYS_INSTANCE **ti_list)
+{
+  return (evaluate_expression_urandom(expr, ti_list, NULL));
+}
+
+
+/*
+ * Determine whether evaluating an expression draws random numbers,
+ * i.e. whether it contains random or gauss function nodes.
+ */
+
+int expression_uses_random(const EXPRESSION_NODE *expr)
+{
+  if (expr == NULL)
+  {
+    return (0);
+  }
+  switch(expr->type)
+  {
+  case NT_RANDOM:
+  case NT_GAUSS:
+    return (1);
+  case NT_VALUE:
+  case NT_IDENTIFIER:
+  case NT_RAW_IDENTIFIER:
+    return (0);
+  case NT_NOT:
+  case NT_ATAN:
+    return (expression_uses_random(expr->content.argument[0]));
+  default:
+    return (expression_uses_random(expr->content.argument[0]) || expression_uses_random(expr->content.argument[1]));
+  }
+}
+
+
+int transsys_uses_random(const TRANSSYS *transsys)
+{
+  const PROMOTER_ELEMENT *a;
+  int i;
+
+  for (i = 0; i < transsys->num_factors; i++)
+  {
+    if (expression_uses_random(transsys->factor_list[i].decay_expression)
+	|| expression_uses_random(transsys->factor_list[i].diffusibility_expression)
+	|| expression_uses_random(transsys->factor_list[i].synthesis_expression))
+    {
+      return (1);
+    }
+  }
+  for (i = 0; i < transsys->num_genes; i++)
+  {
+    for (a = transsys->gene_list[i].promoter_list; a; a = a->next)
+    {
+      if (expression_uses_random(a->expr1)
+	  || ((a->type != PROMOTERELEMENT_CONSTITUTIVE) && expression_uses_random(a->expr2)))
+      {
+	return (1);
+      }
+    }
+  }
+  return (0);
+}
+
+
+/*
+ * Check whether expressions dest and src have the same structure,
+ * i.e. differ by the values of value nodes only. If copy is nonzero,
+ * the values of src are copied to dest as the expressions are
+ * traversed. Returns -1 if the structures differ.
+ */
+
+static int transfer_expression_values(EXPRESSION_NODE *dest, const EXPRESSION_NODE *src, int copy)
+{
+  if ((dest == NULL) || (src == NULL))
+  {
+    return ((dest == src) ? 0 : -1);
+  }
+  if (dest->type != src->type)
+  {
+    return (-1);
+  }
+  switch(src->type)
+  {
+  case NT_VALUE:
+    if (copy)
+    {
+      dest->content.value = src->content.value;
+    }
+    return (0);
+  case NT_IDENTIFIER:
+    if ((dest->content.identifier.lhs_symbol_index != src->content.identifier.lhs_symbol_index)
+	|| (dest->content.identifier.factor_index != src->content.identifier.factor_index))
+    {
+      return (-1);
+    }
+    return (0);
+  case NT_RAW_IDENTIFIER:
+    return (-1);
+  case NT_NOT:
+  case NT_ATAN:
+    return (transfer_expression_values(dest->content.argument[0], src->content.argument[0], copy));
+  default:
+    if (transfer_expression_values(dest->content.argument[0], src->content.argument[0], copy) != 0)
+    {
+      return (-1);
+    }
+    return (transfer_expression_values(dest->content.argument[1], src->content.argument[1], copy));
+  }
+}
+
+
+static int transfer_transsys_values(TRANSSYS *dest, const TRANSSYS *src, int copy)
+{
+  PROMOTER_ELEMENT *a_dest;
+  const PROMOTER_ELEMENT *a_src;
+  int i, j;
+
+  if ((dest->num_factors != src->num_factors) || (dest->num_genes != src->num_genes))
+  {
+    return (-1);
+  }
+  for (i = 0; i < src->num_factors; i++)
+  {
+    if (strcmp(dest->factor_list[i].name, src->factor_list[i].name)
+	|| (transfer_expression_values(dest->factor_list[i].decay_expression, src->factor_list[i].decay_expression, copy) != 0)
+	|| (transfer_expression_values(dest->factor_list[i].diffusibility_expression, src->factor_list[i].diffusibility_expression, copy) != 0)
+	|| (transfer_expression_values(dest->factor_list[i].synthesis_expression, src->factor_list[i].synthesis_expression, copy) != 0))
+    {
+      return (-1);
+    }
+  }
+  for (i = 0; i < src->num_genes; i++)
+  {
+    if (dest->gene_list[i].product_index != src->gene_list[i].product_index)
+    {
+      return (-1);
+    }
+    a_dest = dest->gene_list[i].promoter_list;
+    for (a_src = src->gene_list[i].promoter_list; a_src; a_src = a_src->next)
+    {
+      if ((a_dest == NULL) || (a_dest->type != a_src->type) || (a_dest->num_binding_factors != a_src->num_binding_factors))
+      {
+	return (-1);
+      }
+      for (j = 0; j < a_src->num_binding_factors; j++)
+      {
+	if (a_dest->factor_index[j] != a_src->factor_index[j])
+	{
+	  return (-1);
+	}
+      }
+      if (transfer_expression_values(a_dest->expr1, a_src->expr1, copy) != 0)
+      {
+	return (-1);
+      }
+      if ((a_src->type != PROMOTERELEMENT_CONSTITUTIVE) && (transfer_expression_values(a_dest->expr2, a_src->expr2, copy) != 0))
+      {
+	return (-1);
+      }
+      a_dest = a_dest->next;
+    }
+    if (a_dest != NULL)
+    {
+      return (-1);
+    }
+  }
+  return (0);
+}
+
+
+/*
+ * Copy the values of the value nodes of transsys program src to those
+ * of dest. Both programs must have the same structure, i.e. the same
+ * factors (in the same order), genes with the same promoters and
+ * products, and expressions that differ by values only. Otherwise,
+ * -1 is returned and dest is not changed.
+ */
+
+int copy_transsys_values(TRANSSYS *dest, const TRANSSYS *src)
+{
+  if (transfer_transsys_values(dest, src, 0) != 0)
+  {
+    return (-1);
+  }
+  return (transfer_transsys_values(dest, src, 1));
+}
@@ -15,8 +15,10 @@
  *
  */
 
+#include <math.h>
 #include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
 
 #include "transsys.h"
 
@@ -25,7 +27,7 @@
  * find the minimum of concentrations of factors in a set
  * (regulating factor part of link element)
  */
-static double minimal_concentration(int num_binding_factors, int *fi, double *fc)
+static double minimal_concentration(int num_binding_factors, const int *fi, const double *fc)
 {
   int i;
   double c;
@@ -76,7 +78,7 @@ int process_expression(TRANSSYS_INSTANCE *ti)
     d = 0.0;
     if (ti->transsys->factor_list[i].decay_expression)
     {
-      d = evaluate_expression(ti->transsys->factor_list[i].decay_expression, &const_ti);
+      d = evaluate_expression_urandom(ti->transsys->factor_list[i].decay_expression, &const_ti, ti->urandom_state);
     }
     /* fprintf(stderr, "process_expression: decay is %f\n", d); */
     /* fprintf(stderr, "factor_concentration[%d] is currently %e\n", i, ti->factor_concentration[i]); */
@@ -92,7 +94,7 @@ int process_expression(TRANSSYS_INSTANCE *ti)
     s = 0.0;
     if (ti->transsys->factor_list[i].synthesis_expression)
     {
-      s = evaluate_expression(ti->transsys->factor_list[i].synthesis_expression, &const_ti);
+      s = evaluate_expression_urandom(ti->transsys->factor_list[i].synthesis_expression, &const_ti, ti->urandom_state);
     }
     if (s < 0.0)
     {
@@ -111,18 +113,18 @@ int process_expression(TRANSSYS_INSTANCE *ti)
       switch (ae->type)
       {
       case PROMOTERELEMENT_CONSTITUTIVE:
-	a += evaluate_expression(ae->expr1, &const_ti);
+	a += evaluate_expression_urandom(ae->expr1, &const_ti, ti->urandom_state);
 	break;
       case PROMOTERELEMENT_ACTIVATE:
 	cmin = minimal_concentration(ae->num_binding_factors, ae->factor_index, ti->factor_concentration);
-	km = evaluate_expression(ae->expr1, &const_ti);
-	max = evaluate_expression(ae->expr2, &const_ti);
+	km = evaluate_expression_urandom(ae->expr1, &const_ti, ti->urandom_state);
+	max = evaluate_expression_urandom(ae->expr2, &const_ti, ti->urandom_state);
 	a += michaelis_menten(km, max, cmin);
 	break;
       case PROMOTERELEMENT_REPRESS:
 	cmin = minimal_concentration(ae->num_binding_factors, ae->factor_index, ti->factor_concentration);
-	km = evaluate_expression(ae->expr1, &const_ti);
-	max = evaluate_expression(ae->expr2, &const_ti);
+	km = evaluate_expression_urandom(ae->expr1, &const_ti, ti->urandom_state);
+	max = evaluate_expression_urandom(ae->expr2, &const_ti, ti->urandom_state);
 	r += michaelis_menten(km, max, cmin);
 	break;
       default:
@@ -151,3 +153,187 @@ int process_expression(TRANSSYS_INSTANCE *ti)
   return (0);
 }
 
+
+
+/*
+ * Equivalent to process_expression, using expressions compiled into
+ * bytecode bc, which must have been compiled from ti->transsys.
+ * value must have been obtained from new_bytecode_registers(bc).
+ */
+
+int process_expression_bytecode(TRANSSYS_INSTANCE *ti, const TRANSSYS_BYTECODE *bc, double *value)
+{
+  double *nc;
+  int i, p, b;
+  double d, s;
+  double a, r, cmin, f_inc;
+
+  if (ti->transsys == NULL)
+    return (0);
+  if (bc->transsys != ti->transsys)
+  {
+    fprintf(stderr, "process_expression_bytecode: bytecode not compiled from transsys \"%s\"\n", ti->transsys->name);
+    return (-1);
+  }
+  evaluate_bytecode(bc, ti, value);
+  for (i = 0; i < ti->transsys->num_factors; i++)
+  {
+    d = 0.0;
+    if (bc->decay_register[i] != NO_INDEX)
+    {
+      d = value[bc->decay_register[i]];
+    }
+    if (d < 0.0)
+    {
+      d = 0.0;
+    }
+    if (d > 1.0)
+    {
+      d = 1.0;
+    }
+    s = 0.0;
+    if (bc->synthesis_register[i] != NO_INDEX)
+    {
+      s = value[bc->synthesis_register[i]];
+    }
+    if (s < 0.0)
+    {
+      s = 0.0;
+    }
+    ti->new_concentration[i] = ti->factor_concentration[i] * (1.0 - d) + s;
+  }
+  p = 0;
+  for (i = 0; i < ti->transsys->num_genes; i++)
+  {
+    a = 0.0;
+    r = 0.0;
+    for (; p < bc->gene_promoter_start[i + 1]; p++)
+    {
+      b = bc->promoter_binding_start[p];
+      switch (bc->promoter_type[p])
+      {
+      case PROMOTERELEMENT_CONSTITUTIVE:
+	a += value[bc->promoter_register1[p]];
+	break;
+      case PROMOTERELEMENT_ACTIVATE:
+	cmin = minimal_concentration(bc->promoter_binding_start[p + 1] - b, bc->binding_factor + b, ti->factor_concentration);
+	a += michaelis_menten(value[bc->promoter_register1[p]], value[bc->promoter_register2[p]], cmin);
+	break;
+      case PROMOTERELEMENT_REPRESS:
+	cmin = minimal_concentration(bc->promoter_binding_start[p + 1] - b, bc->binding_factor + b, ti->factor_concentration);
+	r += michaelis_menten(value[bc->promoter_register1[p]], value[bc->promoter_register2[p]], cmin);
+	break;
+      default:
+	fprintf(stderr, "process_expression_bytecode: unknown activation type %d\n", (int) bc->promoter_type[p]);
+	break;
+      }
+    }
+    f_inc = a - r;
+    if (f_inc < 0.0)
+    {
+      f_inc = 0.0;
+    }
+    if ((bc->gene_product[i] >= 0) && (bc->gene_product[i] < ti->transsys->num_factors))
+    {
+      ti->new_concentration[bc->gene_product[i]] += f_inc;
+    }
+    else
+    {
+      fprintf(stderr, "process_expression_bytecode: transsys \"%s\", gene \"%s\": product index %d out of range\n",
+	      ti->transsys->name, ti->transsys->gene_list[i].name, bc->gene_product[i]);
+    }
+  }
+  nc = ti->new_concentration;
+  ti->new_concentration = ti->factor_concentration;
+  ti->factor_concentration = nc;
+  return (0);
+}
+
+
+static int states_within_tolerance(int num_factors, const double *c1, const double *c2, double tolerance)
+{
+  int i;
+
+  for (i = 0; i < num_factors; i++)
+  {
+    if (!(fabs(c1[i] - c2[i]) <= tolerance))
+    {
+      return (0);
+    }
+  }
+  return (1);
+}
+
+
+/*
+ * Run expression on ti for at most max_timesteps steps, stopping as
+ * soon as an attractor is found. After each step, the factor
+ * concentrations are compared to those of the preceding max_period
+ * steps, most recent first. If all concentrations differ by no more
+ * than tolerance from those period steps ago, a fixed point (period 1)
+ * or a limit cycle has been reached. Expressions are evaluated using
+ * bytecode bc with registers value if bc is not NULL, and by
+ * process_expression otherwise. The attractor found is stored in
+ * *attractor, its type is ATTRACTOR_NONE if none was found, and
+ * ti is left at the state in which the search stopped.
+ */
+
+int find_attractor(TRANSSYS_INSTANCE *ti, const TRANSSYS_BYTECODE *bc, double *value, long max_timesteps, double tolerance, int max_period, ATTRACTOR_INFO *attractor)
+{
+  int num_factors = ti->transsys->num_factors;
+  double *history;
+  long t;
+  int lag, max_lag;
+
+  attractor->type = ATTRACTOR_NONE;
+  attractor->timestep = 0;
+  attractor->period = 0;
+  if (max_period < 1)
+  {
+    fprintf(stderr, "find_attractor: max_period must be positive\n");
+    return (-1);
+  }
+  history = (double *) malloc((max_period * num_factors > 0 ? max_period * num_factors : 1) * sizeof(double));
+  if (history == NULL)
+  {
+    fprintf(stderr, "find_attractor: malloc failed\n");
+    return (-1);
+  }
+  /* state t is stored in row t % max_period of history */
+  memcpy(history, ti->factor_concentration, num_factors * sizeof(double));
+  for (t = 1; t <= max_timesteps; t++)
+  {
+    if (bc)
+    {
+      if (process_expression_bytecode(ti, bc, value) != 0)
+      {
+	free(history);
+	return (-1);
+      }
+    }
+    else
+    {
+      if (process_expression(ti) != 0)
+      {
+	free(history);
+	return (-1);
+      }
+    }
+    max_lag = (t < max_period) ? t : max_period;
+    for (lag = 1; lag <= max_lag; lag++)
+    {
+      if (states_within_tolerance(num_factors, ti->factor_concentration, history + ((t - lag) % max_period) * num_factors, tolerance))
+      {
+	attractor->type = (lag == 1) ? ATTRACTOR_FIXEDPOINT : ATTRACTOR_LIMITCYCLE;
+	attractor->timestep = t;
+	attractor->period = lag;
+	free(history);
+	return (0);
+      }
+    }
+    memcpy(history + (t % max_period) * num_factors, ti->factor_concentration, num_factors * sizeof(double));
+  }
+  attractor->timestep = (max_timesteps > 0) ? max_timesteps : 0;
+  free(history);
+  return (0);
+}
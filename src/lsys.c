@@ -65,6 +65,7 @@
 #include <stdlib.h>
 #include <string.h>
 #include <math.h>
+#include <pthread.h>
 
 #include "trconfig.h"
 #include "transsys.h"
@@ -73,53 +74,13 @@
 int tolerate_negative_concentrations = 0;
 
 
-static void free_transsys_instance_list(const TRANSSYS_INSTANCE **ti_list)
-{
-  free(ti_list);
-}
-
-
-/*
- * Assemble an array of pointers to the transsys instances associated with
- * a substring of symbol instances, starting at symbol_list, and with a length
- * determined by the lhs of the rule.
- */
-
-static const TRANSSYS_INSTANCE **transsys_instance_list(const SYMBOL_INSTANCE *symbol_list, const RULE_ELEMENT *rule)
-{
-  int i;
-  const TRANSSYS_INSTANCE **ti_list;
-  const SYMBOL_INSTANCE *si;
-
-  ti_list = (const TRANSSYS_INSTANCE **) malloc(rule->lhs->num_symbols * sizeof(TRANSSYS_INSTANCE *));
-  if (ti_list == NULL)
-  {
-    fprintf(stderr, "transsys_instance_list: malloc() failed\n");
-    return (NULL);
-  }
-  si = symbol_list;
-  for (i = 0; i < rule->lhs->num_symbols; i++)
-  {
-    if ((si == NULL) || (si->symbol_index != rule->lhs->symbol_list[i].symbol_index))
-    {
-      fprintf(stderr, "transsys_instance_list: rule mismatch in rule \"%s\"-- expected symbol #%d, found #%d\n", rule->name, rule->lhs->symbol_list[i].symbol_index, si->symbol_index);
-      free_transsys_instance_list(ti_list);
-      return (NULL);
-    }
-    ti_list[i] = &(si->transsys_instance);
-    si = si->next;
-  }
-  return (ti_list);
-}
-
-
 /* now, rewrite evaluate_assignment and evaluate_production routines to process ti_lists rather than single ti contexts */
 
 static int evaluate_assignment(TRANSSYS_INSTANCE *target, const ASSIGNMENT *a, const TRANSSYS_INSTANCE **ti_list)
 {
   double x;
 
-  x = evaluate_expression(a->value, ti_list);
+  x = evaluate_expression_urandom(a->value, ti_list, target->urandom_state);
   target->factor_concentration[a->factor_index] = x;
   return (0);
 }
@@ -149,18 +110,18 @@ size_t lsys_string_length(const LSYS_STRING *lstr)
 }
 
 
-static SYMBOL_INSTANCE *evaluate_production(const LSYS_STRING *lstr, const PRODUCTION_ELEMENT *pe, const TRANSSYS_INSTANCE **ti_list)
+/*
+ * Set the factor concentrations of si, a new instance of the symbol
+ * of production element pe, from the template symbol and the
+ * assignments of pe.
+ */
+
+static void set_production_values(SYMBOL_INSTANCE *si, const PRODUCTION_ELEMENT *pe, const TRANSSYS_INSTANCE **ti_list)
 {
-  SYMBOL_INSTANCE *si;
   ASSIGNMENT *a;
   int return_value;
   int i;
 
-  si = new_symbol_instance(lstr, pe->symbol_index);
-  if (si == NULL)
-  {
-    return (NULL);
-  }
   /* fprintf(stderr, "evaluate_production: template_lhs_symbol_index = %d\n", pe->template_lhs_symbol_index); */
   if (pe->template_lhs_symbol_index != NO_INDEX)
   {
@@ -184,6 +145,19 @@ static SYMBOL_INSTANCE *evaluate_production(const LSYS_STRING *lstr, const PRODU
       fprintf(stderr, "evaluate_production: evaluate_assignment() returned %d\n", return_value);
     }
   }
+}
+
+
+static SYMBOL_INSTANCE *evaluate_production(const LSYS_STRING *lstr, const PRODUCTION_ELEMENT *pe, const TRANSSYS_INSTANCE **ti_list)
+{
+  SYMBOL_INSTANCE *si;
+
+  si = new_symbol_instance(lstr, pe->symbol_index);
+  if (si == NULL)
+  {
+    return (NULL);
+  }
+  set_production_values(si, pe, ti_list);
   return (si);
 }
 
@@ -222,9 +196,9 @@ static int connect_symbol_group(LSYS_STRING *lstr, int group_start, int group_le
   {
     for (j = group_start; j < i; j++)
     {
-      if (connect_lsys_string_symbols(lstr, i, j, 1) != 0)
+      if (add_lsys_string_contact_edge(&(lstr->contact_graph), i, j, 1) != 0)
       {
-	fprintf(stderr, "connect_symbol_group: connect_lsys_string_symbols failed\n");
+	fprintf(stderr, "connect_symbol_group: add_lsys_string_contact_edge failed\n");
 	return (-1);
       }
     }
@@ -240,16 +214,85 @@ static int connect_symbol_group(LSYS_STRING *lstr, int group_start, int group_le
  * no complex spatial structure has yet differentiated.
  */
 
-LSYS_STRING *axiom_string(const LSYS *lsys)
+static int production_uses_random(const SYMBOL_PRODUCTION *production)
+{
+  const PRODUCTION_ELEMENT *pe;
+  const ASSIGNMENT *a;
+
+  if (production == NULL)
+  {
+    return (0);
+  }
+  for (pe = production->production_list; pe; pe = pe->next)
+  {
+    for (a = pe->assignment_list; a; a = a->next)
+    {
+      if (expression_uses_random(a->value))
+      {
+	return (1);
+      }
+    }
+  }
+  return (0);
+}
+
+
+/*
+ * Determine whether deriving an lsys draws random numbers, either
+ * in its rules or in the transsys programs associated with its symbols.
+ * The lsys must be arrayed.
+ */
+
+int lsys_uses_random(const LSYS *lsys)
+{
+  const RULE_ELEMENT *rule;
+  int i;
+
+  if (production_uses_random(lsys->axiom))
+  {
+    return (1);
+  }
+  for (rule = lsys->rule_list; rule; rule = rule->next)
+  {
+    if (expression_uses_random(rule->condition) || production_uses_random(rule->rhs))
+    {
+      return (1);
+    }
+  }
+  for (i = 0; i < lsys->num_symbols; i++)
+  {
+    if (lsys->symbol_list[i].transsys && transsys_uses_random(lsys->symbol_list[i].transsys))
+    {
+      return (1);
+    }
+  }
+  return (0);
+}
+
+
+/*
+ * Construct the axiom string of lsys, in arena unless arena is NULL.
+ * Random numbers for the axiom and for all strings derived from it
+ * are drawn using urandom_state, or from the global random number
+ * generator if urandom_state is NULL.
+ */
+
+LSYS_STRING *axiom_string_arena(const LSYS *lsys, URANDOM_STATE *urandom_state, MEM_ARENA *arena)
 {
   LSYS_STRING *axiom;
 
-  axiom = new_lsys_string(lsys);
+  axiom = new_lsys_string_arena(lsys, arena);
+  if (axiom == NULL)
+  {
+    fprintf(stderr, "axiom_string: new_lsys_string_arena failed\n");
+    return (NULL);
+  }
+  axiom->urandom_state = urandom_state;
   axiom->symbol = evaluate_production_list(axiom, lsys->axiom->production_list, NULL);
   arrange_lsys_string_arrays(axiom);
-  if (alloc_lsys_string_contact_graph_components(&(axiom->contact_graph), axiom->num_symbols * (axiom->num_symbols - 1) / 2))
+  if (alloc_lsys_string_contact_edges(axiom, axiom->num_symbols * (axiom->num_symbols - 1) / 2))
   {
-    fprintf(stderr, "axiom_string: alloc_lsys_string_contact_graph_components failed\n");
+    fprintf(stderr, "axiom_string: alloc_lsys_string_contact_edges failed\n");
     free_lsys_string(axiom);
     return (NULL);
   }
@@ -259,19 +302,39 @@ LSYS_STRING *axiom_string(const LSYS *lsys)
     free_lsys_string(axiom);
     return (NULL);
   }
+  if (connect_lsys_string_contact_graph(axiom) != 0)
+  {
+    fprintf(stderr, "axiom_string: connect_lsys_string_contact_graph failed\n");
+    free_lsys_string(axiom);
+    return (NULL);
+  }
   return(axiom);
 }
 
 
+LSYS_STRING *axiom_string_urandom(const LSYS *lsys, URANDOM_STATE *urandom_state)
+{
+  return (axiom_string_arena(lsys, urandom_state, NULL));
+}
+
+
+LSYS_STRING *axiom_string(const LSYS *lsys)
+{
+  return (axiom_string_urandom(lsys, NULL));
+}
+
+
 /*
- * FIXME??? (is this already fixed?)
- * preliminary: use single (i.e. first) symbol for obtaining transsys...
+ * Check whether rule applies to the substring of symbol instances
+ * starting at symbol. The transsys instances of the symbols matched
+ * by the lhs are stored in ti_list, which must have space for
+ * lsys->max_lhs_length elements, so they can be used for evaluating
+ * the condition and the production of the rule.
  */
 
-static int rule_match(const SYMBOL_INSTANCE *symbol, const RULE_ELEMENT *rule)
+static int rule_match(const SYMBOL_INSTANCE *symbol, const RULE_ELEMENT *rule, const TRANSSYS_INSTANCE **ti_list)
 {
   const SYMBOL_INSTANCE *s;
-  const TRANSSYS_INSTANCE **ti_list;
   double return_value;
   int i;
 
@@ -280,19 +343,13 @@ static int rule_match(const SYMBOL_INSTANCE *symbol, const RULE_ELEMENT *rule)
   {
     if ((s == NULL) || (s->symbol_index != rule->lhs->symbol_list[i].symbol_index))
       return (0);
+    ti_list[i] = &(s->transsys_instance);
     s = s->next;
   }
   if (rule->condition == NULL)
     return (1);
   /* fprintf(stderr, "rule_match: rule \"%s\" has %d lhs symbols\n", rule->name, rule->lhs->num_symbols); */
-  ti_list = transsys_instance_list(symbol, rule);
-  if (ti_list == NULL)
-  {
-    fprintf(stderr, "rule_match: transsys_instance_list() failed\n");
-    return (-1);
-  }
-  return_value = evaluate_expression(rule->condition, ti_list);
-  free_transsys_instance_list(ti_list);
+  return_value = evaluate_expression_urandom(rule->condition, ti_list, symbol->lsys_string->urandom_state);
   /* fprintf(stderr, "rule_match: rule \"%s\": condition returns %f, symbol sequence\n", rule->name, return_value); */
 /*
   s = symbol;
@@ -311,11 +368,151 @@ static int rule_match(const SYMBOL_INSTANCE *symbol, const RULE_ELEMENT *rule)
 }
 
 
-int lsys_string_expression(LSYS_STRING *lstr)
+/*
+ * Symbol instances of arrayed lsys strings are processed by up to
+ * num_threads threads, each processing a contiguous range of at least
+ * LSYS_STRING_THREAD_MIN_SYMBOLS symbols. Each thread writes only to
+ * data of its own symbols, so results do not depend on the number of
+ * threads. Random numbers must be drawn in sequence, therefore strings
+ * of lsys programs with transsys programs that use random functions
+ * are processed by the calling thread only.
+ */
+
+#define LSYS_STRING_MAX_THREADS 64
+#define LSYS_STRING_THREAD_MIN_SYMBOLS 1024
+
+typedef struct tag_lsys_string_task
+{
+  void (*process)(struct tag_lsys_string_task *task);
+  LSYS_STRING *lstr;
+  size_t group;
+  int factor_index;
+  void *data;
+  size_t start, end;
+  int return_value;
+} LSYS_STRING_TASK;
+
+
+static void *lsys_string_task_thread(void *task)
+{
+  ((LSYS_STRING_TASK *) task)->process((LSYS_STRING_TASK *) task);
+  return (NULL);
+}
+
+
+static int lsys_string_num_threads(const LSYS_STRING *lstr, int num_threads)
+{
+  int i;
+
+  if (num_threads <= 1)
+  {
+    return (1);
+  }
+  for (i = 0; i < lstr->lsys->num_symbols; i++)
+  {
+    if (lstr->lsys->symbol_list[i].transsys && transsys_uses_random(lstr->lsys->symbol_list[i].transsys))
+    {
+      return (1);
+    }
+  }
+  if (num_threads > LSYS_STRING_MAX_THREADS)
+  {
+    return (LSYS_STRING_MAX_THREADS);
+  }
+  return (num_threads);
+}
+
+
+/*
+ * Process items 0 ... num_items - 1 by splitting them into contiguous
+ * ranges processed by up to num_threads threads. The calling thread
+ * processes the first range, and all ranges for which no thread could
+ * be started.
+ */
+
+static int run_lsys_string_tasks(LSYS_STRING *lstr, size_t group, int factor_index, void *data, size_t num_items, int num_threads, void (*process)(LSYS_STRING_TASK *))
+{
+  LSYS_STRING_TASK task[LSYS_STRING_MAX_THREADS];
+  pthread_t thread[LSYS_STRING_MAX_THREADS];
+  int t, num_tasks, num_started;
+
+  num_tasks = num_threads;
+  if ((size_t) num_tasks > num_items / LSYS_STRING_THREAD_MIN_SYMBOLS)
+  {
+    num_tasks = num_items / LSYS_STRING_THREAD_MIN_SYMBOLS;
+  }
+  if (num_tasks < 1)
+  {
+    num_tasks = 1;
+  }
+  for (t = 0; t < num_tasks; t++)
+  {
+    task[t].process = process;
+    task[t].lstr = lstr;
+    task[t].group = group;
+    task[t].factor_index = factor_index;
+    task[t].data = data;
+    task[t].start = num_items * t / num_tasks;
+    task[t].end = num_items * (t + 1) / num_tasks;
+    task[t].return_value = 0;
+  }
+  for (num_started = 1; num_started < num_tasks; num_started++)
+  {
+    if (pthread_create(thread + num_started, NULL, lsys_string_task_thread, task + num_started) != 0)
+    {
+      fprintf(stderr, "run_lsys_string_tasks: pthread_create failed, continuing in calling thread\n");
+      break;
+    }
+  }
+  process(task);
+  for (t = num_started; t < num_tasks; t++)
+  {
+    process(task + t);
+  }
+  for (t = 1; t < num_started; t++)
+  {
+    pthread_join(thread[t], NULL);
+  }
+  for (t = 0; t < num_tasks; t++)
+  {
+    if (task[t].return_value != 0)
+    {
+      return (task[t].return_value);
+    }
+  }
+  return (0);
+}
+
+
+static void expression_task(LSYS_STRING_TASK *task)
+{
+  size_t i;
+
+  for (i = task->start; i < task->end; i++)
+  {
+    task->return_value = process_expression(&(task->lstr->symbol[i].transsys_instance));
+    if (task->return_value)
+    {
+      break;
+    }
+  }
+}
+
+
+/*
+ * Process expression in all symbol instances of lstr, using up to
+ * num_threads threads if lstr is arrayed.
+ */
+
+int lsys_string_expression_threads(LSYS_STRING *lstr, int num_threads)
 {
   SYMBOL_INSTANCE *symbol;
   int return_value = 0;
 
+  if (lstr->arrayed)
+  {
+    return (run_lsys_string_tasks(lstr, 0, 0, NULL, lstr->num_symbols, lsys_string_num_threads(lstr, num_threads), expression_task));
+  }
   for (symbol = lstr->symbol; symbol; symbol = symbol->next)
   {
     return_value = process_expression(&(symbol->transsys_instance));
@@ -328,6 +525,12 @@ int lsys_string_expression(LSYS_STRING *lstr)
 }
 
 
+int lsys_string_expression(LSYS_STRING *lstr)
+{
+  return (lsys_string_expression_threads(lstr, 1));
+}
+
+
 /*
  * for all symbol instances, initialise all elements in new_concentration
  * to 0.0.
@@ -354,14 +557,14 @@ static void diffusion_init_new_concentration(LSYS_STRING *lstr)
 }
 
 
-static void diffusion_init_contact_edges(LSYS_STRING_CONTACT_EDGE **edge)
+static void diffusion_init_contact_edges(LSYS_STRING_CONTACT_EDGE **edge, size_t num_edges)
 {
-  LSYS_STRING_CONTACT_EDGE **e;
+  size_t e;
 
-  for (e = edge; *e; e++)
+  for (e = 0; e < num_edges; e++)
   {
-    (*e)->amount_diffused = 0.0;
-    (*e)->amount_valid = 0;
+    edge[e]->amount_diffused = 0.0;
+    edge[e]->amount_valid = 0;
   }
 }
 
@@ -424,7 +627,7 @@ static const TRANSSYS **lsys_string_transsys_list(const LSYS_STRING *lstr)
       }
       if (j == num_transsys)
       {
-	tl1 = (const TRANSSYS **) realloc(tlist, (num_transsys + 1) * sizeof(const TRANSSYS *));
+	tl1 = (const TRANSSYS **) realloc(tlist, (num_transsys + 2) * sizeof(const TRANSSYS *));
 	if (tl1 == NULL)
 	{
 	  fprintf(stderr, "lsys_string_transsys_list: realloc failed\n");
@@ -456,183 +659,338 @@ int other_symbol_instance_index(const LSYS_STRING_CONTACT_EDGE *edge, int si_ind
 }
 
 
-typedef struct
-{
-  int num_neighbours;
-  int *neighbour_index;
-  int *edge_index;
-  double *gradient;
-  double mean_concentration;
-  double gradient_sum;
-} NEIGHBOURHOOD;
-
-
-static void free_neighbourhood(int num_symbols, NEIGHBOURHOOD *neighbourhood)
+/*
+ * Compute the neighbourhoods of the symbols of lstr for diffusion,
+ * see LSYS_STRING_NEIGHBOURHOOD. Symbols are grouped by transsys in
+ * the order in which the transsys programs first occur in lstr.
+ */
+static LSYS_STRING_NEIGHBOURHOOD *lsys_string_neighbourhood(const LSYS_STRING *lstr)
 {
-  int i;
+  LSYS_STRING_NEIGHBOURHOOD *neighbourhood;
+  const TRANSSYS **tlist;
+  const SYMBOL_INSTANCE *si;
+  const LSYS_STRING_CONTACT_EDGE *edge;
+  size_t num_transsys, num_group_symbols = 0, num_edges = 0, num_neighbours = 0, i, e, g, n, *fill;
+  int *group, k, other_index;
 
-  for (i = 0; i < num_symbols; i++)
+  tlist = lsys_string_transsys_list(lstr);
+  if (tlist == NULL)
+  {
+    return (NULL);
+  }
+  for (num_transsys = 0; tlist[num_transsys]; num_transsys++)
+    ;
+  if (num_transsys == 0)
   {
-    if (neighbourhood[i].num_neighbours > 0)
+    free_lsys_string_transsys_list(tlist);
+    neighbourhood = new_lsys_string_neighbourhood(0, 0, 0, 0, 0);
+    if (neighbourhood == NULL)
     {
-      if (neighbourhood[i].neighbour_index)
-      {
-	free(neighbourhood[i].neighbour_index);
-      }
-      if (neighbourhood[i].edge_index)
-      {
-	free(neighbourhood[i].edge_index);
-      }
-      if (neighbourhood[i].gradient)
-      {
-	free(neighbourhood[i].gradient);
-      }
+      fprintf(stderr, "lsys_string_neighbourhood: new_lsys_string_neighbourhood failed\n");
+      return (NULL);
     }
+    neighbourhood->symbol_start[0] = 0;
+    neighbourhood->edge_start[0] = 0;
+    neighbourhood->neighbour_start[0] = 0;
+    return (neighbourhood);
   }
-  free(neighbourhood);
-}
-
-
-static void get_neighbourhood_factor_data(const LSYS_STRING *lstr, int factor_index, NEIGHBOURHOOD *neighbourhood)
-{
-  int symbol_index, n;
-  SYMBOL_INSTANCE *si;
-
-  for (symbol_index = 0; symbol_index < lstr->num_symbols; symbol_index++)
+  group = (int *) malloc((lstr->num_symbols > 0 ? lstr->num_symbols : 1) * sizeof(int));
+  if (group == NULL)
+  {
+    fprintf(stderr, "lsys_string_neighbourhood: malloc failed\n");
+    free_lsys_string_transsys_list(tlist);
+    return (NULL);
+  }
+  fill = (size_t *) malloc((num_transsys + 1) * sizeof(size_t));
+  if (fill == NULL)
+  {
+    fprintf(stderr, "lsys_string_neighbourhood: malloc failed\n");
+    free(group);
+    free_lsys_string_transsys_list(tlist);
+    return (NULL);
+  }
+  for (i = 0; i < lstr->num_symbols; i++)
+  {
+    group[i] = -1;
+    if (lstr->symbol[i].transsys_instance.transsys)
+    {
+      for (g = 0; tlist[g] != lstr->symbol[i].transsys_instance.transsys; g++)
+	;
+      group[i] = g;
+    }
+  }
+  for (i = 0; i < lstr->num_symbols; i++)
   {
-    if (neighbourhood[symbol_index].num_neighbours > 0)
+    si = lstr->symbol + i;
+    n = 0;
+    if (group[i] != -1)
     {
-      si = lstr->symbol + symbol_index;
-      neighbourhood[symbol_index].mean_concentration = si->transsys_instance.factor_concentration[factor_index];
-      neighbourhood[symbol_index].gradient_sum = 0.0;
-      for (n = 0; n < neighbourhood[symbol_index].num_neighbours; n++)
+      for (k = 0; k < si->num_contact_edges; k++)
       {
-	neighbourhood[symbol_index].gradient[n] = lstr->symbol[neighbourhood[symbol_index].neighbour_index[n]].transsys_instance.factor_concentration[factor_index] - si->transsys_instance.factor_concentration[factor_index];
-	neighbourhood[symbol_index].gradient_sum += neighbourhood[symbol_index].gradient[n];
-	neighbourhood[symbol_index].mean_concentration += lstr->symbol[neighbourhood[symbol_index].neighbour_index[n]].transsys_instance.factor_concentration[factor_index];
+	other_index = other_symbol_instance_index(si->contact_edge[k], i);
+	if (group[other_index] == group[i])
+	{
+	  n++;
+	}
       }
-      neighbourhood[symbol_index].mean_concentration /= (neighbourhood[symbol_index].num_neighbours + 1);
+    }
+    if (n > 0)
+    {
+      num_group_symbols++;
+      num_neighbours += n;
     }
   }
-}
-
-
-static NEIGHBOURHOOD *get_neighbourhood(const LSYS_STRING *lstr, const TRANSSYS *transsys)
-{
-  NEIGHBOURHOOD *neighbourhood = (NEIGHBOURHOOD *) malloc(lstr->num_symbols * sizeof(NEIGHBOURHOOD));
-  int symbol_index, i, n, other_index;
-  const SYMBOL_INSTANCE *si;
-
+  for (e = 0; e < lstr->contact_graph.num_edges; e++)
+  {
+    edge = lstr->contact_graph.edge + e;
+    if ((group[edge->i1] != -1) && (group[edge->i1] == group[edge->i2]))
+    {
+      num_edges++;
+    }
+  }
+  if (num_edges == 0)
+  {
+    /* no diffusion takes place, so no transsys groups are needed */
+    num_transsys = 0;
+  }
+  neighbourhood = new_lsys_string_neighbourhood(num_edges > 0 ? lstr->num_symbols : 0, num_transsys, num_group_symbols, num_edges, num_neighbours);
   if (neighbourhood == NULL)
   {
-    fprintf(stderr, "get_neighbourhood: malloc failed\n");
+    fprintf(stderr, "lsys_string_neighbourhood: new_lsys_string_neighbourhood failed\n");
+    free(fill);
+    free(group);
+    free_lsys_string_transsys_list(tlist);
     return (NULL);
   }
-  /* set num_neighbours components to 0 first, so we can use free_neighbourhood
-   * upon bailing out */
-  for (symbol_index = 0; symbol_index < lstr->num_symbols; symbol_index++)
+  for (g = 0; g <= num_transsys; g++)
+  {
+    neighbourhood->symbol_start[g] = 0;
+    neighbourhood->edge_start[g] = 0;
+  }
+  if (num_edges == 0)
+  {
+    neighbourhood->neighbour_start[0] = 0;
+    free(fill);
+    free(group);
+    free_lsys_string_transsys_list(tlist);
+    return (neighbourhood);
+  }
+  for (g = 0; g < num_transsys; g++)
   {
-    neighbourhood[symbol_index].num_neighbours = 0;
-    neighbourhood[symbol_index].neighbour_index = NULL;
-    neighbourhood[symbol_index].edge_index = NULL;
-    neighbourhood[symbol_index].gradient = NULL;
-    neighbourhood[symbol_index].mean_concentration = 0.0;
-    neighbourhood[symbol_index].gradient_sum = 0.0;
+    neighbourhood->transsys[g] = tlist[g];
   }
-  for (symbol_index = 0; symbol_index < lstr->num_symbols; symbol_index++)
+  n = 0;
+  for (i = 0; i < lstr->num_symbols; i++)
   {
-    si = lstr->symbol + symbol_index;
-    if (transsys == si->transsys_instance.transsys)
+    si = lstr->symbol + i;
+    neighbourhood->neighbour_start[i] = n;
+    if (group[i] != -1)
     {
-      for (i = 0; i < si->num_contact_edges; i++)
+      for (k = 0; k < si->num_contact_edges; k++)
       {
-	other_index = other_symbol_instance_index(si->contact_edge[i], symbol_index);
-	if (lstr->symbol[other_index].transsys_instance.transsys == transsys)
+	other_index = other_symbol_instance_index(si->contact_edge[k], i);
+	if (group[other_index] == group[i])
 	{
-	  neighbourhood[symbol_index].num_neighbours++;
+	  neighbourhood->neighbour_index[n] = other_index;
+	  neighbourhood->neighbour_edge[n] = si->contact_edge[k];
+	  n++;
 	}
       }
-      if (neighbourhood[symbol_index].num_neighbours > 0)
+      if (n > neighbourhood->neighbour_start[i])
       {
-	neighbourhood[symbol_index].neighbour_index = (int *) malloc(neighbourhood[symbol_index].num_neighbours * sizeof(int));
-	if (neighbourhood[symbol_index].neighbour_index == NULL)
-	{
-	  fprintf(stderr, "get_neighbourhood: malloc for neighbour_index failed\n");
-	  free_neighbourhood(lstr->num_symbols, neighbourhood);
-	  return (NULL);
-	}
-	neighbourhood[symbol_index].edge_index = (int *) malloc(neighbourhood[symbol_index].num_neighbours * sizeof(int));
-	if (neighbourhood[symbol_index].neighbour_index == NULL)
-	{
-	  fprintf(stderr, "get_neighbourhood: malloc for neighbour_index failed\n");
-	  free_neighbourhood(lstr->num_symbols, neighbourhood);
-	  return (NULL);
-	}
-	neighbourhood[symbol_index].gradient = (double *) malloc(neighbourhood[symbol_index].num_neighbours * sizeof(double));
-	if (neighbourhood[symbol_index].gradient == NULL)
-	{
-	  fprintf(stderr, "get_neighbourhood: malloc for gradient failed\n");
-	  free_neighbourhood(lstr->num_symbols, neighbourhood);
-	  return (NULL);
-	}
-      }
-      n = 0;
-      for (i = 0; i < si->num_contact_edges; i++)
-      {
-	other_index = other_symbol_instance_index(si->contact_edge[i], symbol_index);
-	if (lstr->symbol[other_index].transsys_instance.transsys == transsys)
-	{
-	  neighbourhood[symbol_index].neighbour_index[n] = other_index;
-	  neighbourhood[symbol_index].edge_index[n] = i;
-	  neighbourhood[symbol_index].gradient[n] = 0.0;
-	  n++;
-	}
+	neighbourhood->symbol_start[group[i] + 1]++;
       }
     }
   }
+  neighbourhood->neighbour_start[lstr->num_symbols] = n;
+  for (e = 0; e < lstr->contact_graph.num_edges; e++)
+  {
+    edge = lstr->contact_graph.edge + e;
+    if ((group[edge->i1] != -1) && (group[edge->i1] == group[edge->i2]))
+    {
+      neighbourhood->edge_start[group[edge->i1] + 1]++;
+    }
+  }
+  for (g = 0; g < num_transsys; g++)
+  {
+    neighbourhood->symbol_start[g + 1] += neighbourhood->symbol_start[g];
+    neighbourhood->edge_start[g + 1] += neighbourhood->edge_start[g];
+  }
+  for (g = 0; g < num_transsys; g++)
+  {
+    fill[g] = neighbourhood->symbol_start[g];
+  }
+  for (i = 0; i < lstr->num_symbols; i++)
+  {
+    if (neighbourhood->neighbour_start[i + 1] > neighbourhood->neighbour_start[i])
+    {
+      neighbourhood->symbol[fill[group[i]]++] = i;
+    }
+  }
+  for (g = 0; g < num_transsys; g++)
+  {
+    fill[g] = neighbourhood->edge_start[g];
+  }
+  for (e = 0; e < lstr->contact_graph.num_edges; e++)
+  {
+    edge = lstr->contact_graph.edge + e;
+    if ((group[edge->i1] != -1) && (group[edge->i1] == group[edge->i2]))
+    {
+      neighbourhood->edge[fill[group[edge->i1]]++] = lstr->contact_graph.edge + e;
+    }
+  }
+  free(fill);
+  free(group);
+  free_lsys_string_transsys_list(tlist);
   return (neighbourhood);
 }
 
 
-static int diffuse_along_contact_edges(const LSYS_STRING *lstr, LSYS_STRING_CONTACT_EDGE **edge, int factor_index)
+/*
+ * Compute the gradients of factor factor_index from the symbols
+ * neighbourhood->symbol[k_start] ... neighbourhood->symbol[k_end - 1]
+ * to their neighbours, the sums of these gradients and the mean
+ * concentrations within the local neighbourhoods.
+ */
+static void neighbourhood_factor_data(const LSYS_STRING *lstr, LSYS_STRING_NEIGHBOURHOOD *neighbourhood, size_t k_start, size_t k_end, int factor_index)
 {
-  LSYS_STRING_CONTACT_EDGE **e;
+  size_t k, n;
+  int symbol_index;
+  double c, c_neighbour;
+
+  for (k = k_start; k < k_end; k++)
+  {
+    symbol_index = neighbourhood->symbol[k];
+    c = lstr->symbol[symbol_index].transsys_instance.factor_concentration[factor_index];
+    neighbourhood->mean_concentration[k] = c;
+    neighbourhood->gradient_sum[k] = 0.0;
+    for (n = neighbourhood->neighbour_start[symbol_index]; n < neighbourhood->neighbour_start[symbol_index + 1]; n++)
+    {
+      c_neighbour = lstr->symbol[neighbourhood->neighbour_index[n]].transsys_instance.factor_concentration[factor_index];
+      neighbourhood->gradient[n] = c_neighbour - c;
+      neighbourhood->gradient_sum[k] += neighbourhood->gradient[n];
+      neighbourhood->mean_concentration[k] += c_neighbour;
+    }
+    neighbourhood->mean_concentration[k] /= (neighbourhood->neighbour_start[symbol_index + 1] - neighbourhood->neighbour_start[symbol_index] + 1);
+  }
+}
+
+
+static int diffuse_along_contact_edges(const LSYS_STRING *lstr, LSYS_STRING_CONTACT_EDGE **edge, size_t num_edges, int factor_index)
+{
+  size_t e;
   SYMBOL_INSTANCE *s1, *s2;
 
-  for (e = edge; *e; e++)
+  for (e = 0; e < num_edges; e++)
   {
-    s1 = lstr->symbol + (*e)->i1;
-    s2 = lstr->symbol + (*e)->i2;
-    s1->transsys_instance.factor_concentration[factor_index] += (*e)->amount_diffused;
-    s2->transsys_instance.factor_concentration[factor_index] -= (*e)->amount_diffused;
+    s1 = lstr->symbol + edge[e]->i1;
+    s2 = lstr->symbol + edge[e]->i2;
+    s1->transsys_instance.factor_concentration[factor_index] += edge[e]->amount_diffused;
+    s2->transsys_instance.factor_concentration[factor_index] -= edge[e]->amount_diffused;
   }
   return (0);
 }
 
 
-/* FIXME: this should perhaps be merged with get_neighbourhood ... with a proper neighbourhood struct */
-static LSYS_STRING_CONTACT_EDGE **diffusion_edge_list(const LSYS_STRING *lstr, const TRANSSYS *transsys)
+/*
+ * Determine whether a factor's diffusibility is zero in all transsys
+ * instances, i.e. whether it has no diffusibility expression or a
+ * constant one that is not positive. Nothing is diffused for such
+ * factors, so they can be skipped.
+ */
+static int zero_diffusibility(const FACTOR_ELEMENT *factor)
 {
-  /* FIXME? this wastes space but saves the time for counting the number of edges actually required */
-  LSYS_STRING_CONTACT_EDGE **diffusion_edge = (LSYS_STRING_CONTACT_EDGE **) malloc((lstr->contact_graph.num_edges + 1) * sizeof(LSYS_STRING_CONTACT_EDGE *));
-  int e, n;
+  if (factor->diffusibility_expression == NULL)
+  {
+    return (1);
+  }
+  if (factor->diffusibility_expression->type == NT_VALUE)
+  {
+    return (factor->diffusibility_expression->content.value <= 0.0);
+  }
+  return (0);
+}
+
+
+/*
+ * Compute the amounts of factor task->factor_index to be transferred
+ * from the symbols of transsys group task->group to their neighbours,
+ * for symbols task->start ... task->end - 1 of the group.
+ */
 
-  if (diffusion_edge == NULL)
+static void diffusion_task(LSYS_STRING_TASK *task)
+{
+  const LSYS_STRING *lstr = task->lstr;
+  LSYS_STRING_NEIGHBOURHOOD *neighbourhood = lstr->neighbourhood;
+  const TRANSSYS *transsys = neighbourhood->transsys[task->group];
+  const TRANSSYS_INSTANCE *ti;
+  const SYMBOL_INSTANCE *si;
+  int i, f = task->factor_index;
+  size_t k, n, k_start, k_end;
+  double diffusibility, d;
+
+  k_start = neighbourhood->symbol_start[task->group] + task->start;
+  k_end = neighbourhood->symbol_start[task->group] + task->end;
+  neighbourhood_factor_data(lstr, neighbourhood, k_start, k_end, f);
+  for (k = k_start; k < k_end; k++)
   {
-    fprintf(stderr, "diffusion_contact_graph: malloc failed\n");
-    return (NULL);
+    i = neighbourhood->symbol[k];
+    si = lstr->symbol + i;
+    ti = &(si->transsys_instance);
+    diffusibility = evaluate_expression_urandom(transsys->factor_list[f].diffusibility_expression, &ti, lstr->urandom_state);
+    if (diffusibility < 0.0)
+    {
+      diffusibility = 0.0;
+    }
+    if (diffusibility > 1.0)
+    {
+      diffusibility = 1.0;
+    }
+    for (n = neighbourhood->neighbour_start[i]; n < neighbourhood->neighbour_start[i + 1]; n++)
+    {
+      /* FIXME: this is numerically very unstable. Some more maths may help fixing this... */
+      if (neighbourhood->gradient_sum[k] == 0.0)
+      {
+	if (si->transsys_instance.factor_concentration[f] != neighbourhood->mean_concentration[k])
+	{
+	  double relative_error = (neighbourhood->mean_concentration[k] - si->transsys_instance.factor_concentration[f]) / (neighbourhood->mean_concentration[k] + si->transsys_instance.factor_concentration[f]) * 0.5;
+	  if (relative_error > 1e-15)
+	  {
+	    fprintf(stderr, "lsys_string_diffusion: gradient sum 0 but local mean - local concentration = %g, ratio = %g\n", neighbourhood->mean_concentration[k] - si->transsys_instance.factor_concentration[f], relative_error);
+	  }
+	}
+	d = diffusibility;
+      }
+      else
+      {
+	d = (neighbourhood->mean_concentration[k] - si->transsys_instance.factor_concentration[f]) / neighbourhood->gradient_sum[k] * diffusibility;
+      }
+      neighbourhood->transferred_amount[n] = d * neighbourhood->gradient[n];
+    }
   }
-  n = 0;
-  for (e = 0; e < lstr->contact_graph.num_edges; e++)
+}
+
+
+/*
+ * Set the amounts to be transferred along the contact edges of transsys
+ * group g. This is done sequentially, in the order of the symbols, so
+ * that the amount chosen for each edge does not depend on the number
+ * of threads used to compute the transferred amounts.
+ */
+
+static void diffusion_set_transferred_amounts(const LSYS_STRING_NEIGHBOURHOOD *neighbourhood, size_t g)
+{
+  size_t k, n;
+  int i;
+
+  for (k = neighbourhood->symbol_start[g]; k < neighbourhood->symbol_start[g + 1]; k++)
   {
-    if ((lstr->symbol[lstr->contact_graph.edge[e].i1].transsys_instance.transsys == transsys)
-	&& (lstr->symbol[lstr->contact_graph.edge[e].i2].transsys_instance.transsys == transsys))
+    i = neighbourhood->symbol[k];
+    for (n = neighbourhood->neighbour_start[i]; n < neighbourhood->neighbour_start[i + 1]; n++)
     {
-      diffusion_edge[n++] = lstr->contact_graph.edge + e;
+      diffusion_set_transferred_amount(neighbourhood->neighbour_edge[n], i, neighbourhood->transferred_amount[n]);
     }
   }
-  diffusion_edge[n] = NULL;
-  return (diffusion_edge);
 }
 
 
@@ -640,102 +998,63 @@ static LSYS_STRING_CONTACT_EDGE **diffusion_edge_list(const LSYS_STRING *lstr, c
  * diffusion concept: diffusibility = 1 means that total equilibration
  * *within local neighbourhood* takes place in one time step (to the extent
  * this is feasible).
+ * The transferred amounts are computed using up to num_threads threads.
  */
 
-int lsys_string_diffusion(LSYS_STRING *lstr)
+int lsys_string_diffusion_threads(LSYS_STRING *lstr, int num_threads)
 {
-  int i, j, f, t;
-  double diffusibility, d;
-  const TRANSSYS *transsys, **tlist;
-  const TRANSSYS_INSTANCE *ti;
-  SYMBOL_INSTANCE *si;
-  NEIGHBOURHOOD *neighbourhood;
+  int f;
+  size_t g;
+  const TRANSSYS *transsys;
+  LSYS_STRING_NEIGHBOURHOOD *neighbourhood;
   LSYS_STRING_CONTACT_EDGE **diffusion_edge;
+  size_t num_diffusion_edges;
 
   if (!lstr->arrayed)
   {
     fprintf(stderr, "lsys_string_diffusion: cannot process non-arrayed lsys string\n");
     return (-1);
   }
-  tlist = lsys_string_transsys_list(lstr);
-  if (tlist == NULL)
-  {
-    return (-1);
-  }
-  diffusion_init_new_concentration(lstr);
-  for (t = 0; tlist[t]; t++)
+  if (lstr->neighbourhood == NULL)
   {
-    neighbourhood = get_neighbourhood(lstr, tlist[t]);
-    if (neighbourhood == NULL)
+    lstr->neighbourhood = lsys_string_neighbourhood(lstr);
+    if (lstr->neighbourhood == NULL)
     {
-      fprintf(stderr, "lsys_string_diffusion: get_neighbourhood failed\n");
+      fprintf(stderr, "lsys_string_diffusion: lsys_string_neighbourhood failed\n");
       return (-1);
     }
-    diffusion_edge = diffusion_edge_list(lstr, tlist[t]);
-    if (diffusion_edge == NULL)
-    {
-      fprintf(stderr, "lsys_string_diffusion: diffusion_edge_list failed\n");
-      free_neighbourhood(lstr->num_symbols, neighbourhood);
-      return (-1);
-    }
-    for (f = 0; f < tlist[t]->num_factors; f++)
+  }
+  neighbourhood = lstr->neighbourhood;
+  num_threads = lsys_string_num_threads(lstr, num_threads);
+  diffusion_init_new_concentration(lstr);
+  for (g = 0; g < neighbourhood->num_transsys; g++)
+  {
+    transsys = neighbourhood->transsys[g];
+    diffusion_edge = neighbourhood->edge + neighbourhood->edge_start[g];
+    num_diffusion_edges = neighbourhood->edge_start[g + 1] - neighbourhood->edge_start[g];
+    for (f = 0; f < transsys->num_factors; f++)
     {
-      diffusion_init_contact_edges(diffusion_edge);
-      get_neighbourhood_factor_data(lstr, f, neighbourhood);
-      for (i = 0; i < lstr->num_symbols; i++)
+      if (zero_diffusibility(transsys->factor_list + f))
       {
-	if (neighbourhood[i].num_neighbours > 0)
-	{
-	  si = lstr->symbol + i;
-	  ti = &(si->transsys_instance);
-	  transsys = ti->transsys;
-	  diffusibility = 0.0;
-	  if (transsys->factor_list[f].diffusibility_expression != NULL)
-	  {
-	    diffusibility = evaluate_expression(transsys->factor_list[f].diffusibility_expression, &ti);
-	  }
-	  if (diffusibility < 0.0)
-	  {
-	    diffusibility = 0.0;
-	  }
-	  if (diffusibility > 1.0)
-	  {
-	    diffusibility = 1.0;
-	  }
-	  for (j = 0; j < neighbourhood[i].num_neighbours; j++)
-	  {
-	    /* FIXME: this is numerically very unstable. Some more maths may help fixing this... */
-	    if (neighbourhood[i].gradient_sum == 0.0)
-	    {
-	      if (si->transsys_instance.factor_concentration[f] != neighbourhood[i].mean_concentration)
-	      {
-		double relative_error = (neighbourhood[i].mean_concentration - si->transsys_instance.factor_concentration[f]) / (neighbourhood[i].mean_concentration + si->transsys_instance.factor_concentration[f]) * 0.5;
-		if (relative_error > 1e-15)
-		{
-		  fprintf(stderr, "lsys_string_diffusion: gradient sum 0 but local mean - local concentration = %g, ratio = %g\n", neighbourhood[i].mean_concentration - si->transsys_instance.factor_concentration[f], relative_error);
-		}
-	      }
-	      d = diffusibility;
-	    }
-	    else
-	    {
-	      d = (neighbourhood[i].mean_concentration - si->transsys_instance.factor_concentration[f]) / neighbourhood[i].gradient_sum * diffusibility;
-	    }
-	    diffusion_set_transferred_amount(si->contact_edge[neighbourhood[i].edge_index[j]], i, d * neighbourhood[i].gradient[j]);
-	  }
-	}
+	continue;
       }
+      diffusion_init_contact_edges(diffusion_edge, num_diffusion_edges);
+      run_lsys_string_tasks(lstr, g, f, NULL, neighbourhood->symbol_start[g + 1] - neighbourhood->symbol_start[g], num_threads, diffusion_task);
+      diffusion_set_transferred_amounts(neighbourhood, g);
       /* fprintf(stderr, "lsys_string_diffusion: diffusing #%d along edges\n", f); */
-      diffuse_along_contact_edges(lstr, diffusion_edge, f);
+      diffuse_along_contact_edges(lstr, diffusion_edge, num_diffusion_edges, f);
     }
-    free_neighbourhood(lstr->num_symbols, neighbourhood);
-    free(diffusion_edge);
   }
-  free_lsys_string_transsys_list(tlist);
   return (0);
 }
 
 
+int lsys_string_diffusion(LSYS_STRING *lstr)
+{
+  return (lsys_string_diffusion_threads(lstr, 1));
+}
+
+
 /*
  * IMPLEMENTME: a function to compute the total amount (sum of concentrations)
  * in an lsys string. To be used to check correct implementation of diffusion
@@ -743,134 +1062,196 @@ int lsys_string_diffusion(LSYS_STRING *lstr)
  */
 
 
-typedef struct tag_edge_list_element
+/*
+ * Table of edges between symbols, used to find the edge connecting
+ * two symbols i1 < i2. This is a hash table with open addressing
+ * (linear probing). The number of slots is a power of 2, the table
+ * is doubled in size whenever it becomes half full.
+ */
+
+typedef struct
 {
-  struct tag_edge_list_element *next;
-  int i1, i2, edge_index;
-} EDGE_LIST_ELEMENT;
+  int i1, i2, edge_index;  /* edge_index is -1 for empty slots */
+} EDGE_TABLE_SLOT;
 
 
 typedef struct
 {
+  size_t num_slots;
   size_t num_elements;
-  EDGE_LIST_ELEMENT **table;
-} EDGE_HASH;
+  EDGE_TABLE_SLOT *slot;
+} EDGE_TABLE;
 
 
-static int edge_hashvalue(int hashvalue_max, int i1, int i2)
+static size_t edge_table_hashvalue(size_t num_slots, int i1, int i2)
 {
-  double g = 1.6180339887498948; /* the golden mean */
+  unsigned long h;
 
-  return((int) floor(hashvalue_max * fmod(g * (((double) i1) * ((double) hashvalue_max) + ((double) i2)), 1.0)));
+  h = ((unsigned long) i1 * 2654435761UL + (unsigned long) i2) & 0xffffffffUL;
+  h ^= h >> 16;
+  h = (h * 2246822507UL) & 0xffffffffUL;
+  h ^= h >> 13;
+  return (((size_t) h) & (num_slots - 1));
 }
 
 
-static void free_edge_hash(EDGE_HASH *hash)
+static EDGE_TABLE_SLOT *new_edge_table_slots(size_t num_slots)
 {
-  int i;
-  EDGE_LIST_ELEMENT *e, *e_next;
+  EDGE_TABLE_SLOT *slot;
+  size_t i;
 
-  for (i = 0; i < hash->num_elements; i++)
+  slot = (EDGE_TABLE_SLOT *) malloc(num_slots * sizeof(EDGE_TABLE_SLOT));
+  if (slot == NULL)
   {
-    e = hash->table[i];
-    while (e)
-    {
-      e_next = e->next;
-      free(e);
-      e = e_next;
-    }
+    return (NULL);
   }
-  free(hash->table);
-  free(hash);
+  for (i = 0; i < num_slots; i++)
+  {
+    slot[i].edge_index = -1;
+  }
+  return (slot);
 }
 
 
-static EDGE_HASH *new_edge_hash(int num_elements)
+static void free_edge_table(EDGE_TABLE *table)
 {
-  EDGE_HASH *hash = (EDGE_HASH *) malloc(sizeof(EDGE_HASH));
-  int i;
+  free(table->slot);
+  free(table);
+}
 
 
-  if (hash == NULL)
+/*
+ * Create a table with sufficient slots for num_elements elements,
+ * more elements can be added as the table grows.
+ */
+
+static EDGE_TABLE *new_edge_table(size_t num_elements)
+{
+  EDGE_TABLE *table = (EDGE_TABLE *) malloc(sizeof(EDGE_TABLE));
+
+  if (table == NULL)
   {
-    fprintf(stderr, "new_edge_hash: malloc failed\n");
+    fprintf(stderr, "new_edge_table: malloc failed\n");
     return (NULL);
   }
-  hash->table = (EDGE_LIST_ELEMENT **) malloc(num_elements * sizeof(EDGE_LIST_ELEMENT *));
-  if (hash->table == NULL)
+  table->num_slots = 16;
+  while (table->num_slots < 2 * num_elements)
   {
-    fprintf(stderr, "new_edge_hash: malloc for table failed\n");
-    free(hash);
+    table->num_slots *= 2;
+  }
+  table->slot = new_edge_table_slots(table->num_slots);
+  if (table->slot == NULL)
+  {
+    fprintf(stderr, "new_edge_table: malloc for slots failed\n");
+    free(table);
     return (NULL);
   }
-  hash->num_elements = num_elements;
-  for (i = 0; i < hash->num_elements; i++)
+  table->num_elements = 0;
+  return (table);
+}
+
+
+static EDGE_TABLE_SLOT *edge_table_find_slot(const EDGE_TABLE *table, int i1, int i2)
+{
+  size_t h = edge_table_hashvalue(table->num_slots, i1, i2);
+
+  while (table->slot[h].edge_index != -1)
   {
-    hash->table[i] = NULL;
+    if ((table->slot[h].i1 == i1) && (table->slot[h].i2 == i2))
+    {
+      break;
+    }
+    h = (h + 1) & (table->num_slots - 1);
   }
-  return (hash);
+  return (table->slot + h);
 }
 
 
-static int edge_hash_add_element(EDGE_HASH *hash, int i1, int i2, int edge_index)
+static int edge_table_grow(EDGE_TABLE *table)
 {
-  EDGE_LIST_ELEMENT *e = (EDGE_LIST_ELEMENT *) malloc(sizeof(EDGE_LIST_ELEMENT));
-  int h = edge_hashvalue(hash->num_elements, i1, i2);
+  EDGE_TABLE_SLOT *old_slot = table->slot, *s;
+  size_t old_num_slots = table->num_slots, i;
 
-  if (e == NULL)
+  table->slot = new_edge_table_slots(2 * old_num_slots);
+  if (table->slot == NULL)
   {
-    fprintf(stderr, "edge_hash_add: malloc failed\n");
+    fprintf(stderr, "edge_table_grow: malloc failed\n");
+    table->slot = old_slot;
     return (-1);
   }
-  e->i1 = i1;
-  e->i2 = i2;
-  e->edge_index = edge_index;
-  e->next = hash->table[h];
-  hash->table[h] = e;
+  table->num_slots = 2 * old_num_slots;
+  for (i = 0; i < old_num_slots; i++)
+  {
+    if (old_slot[i].edge_index != -1)
+    {
+      s = edge_table_find_slot(table, old_slot[i].i1, old_slot[i].i2);
+      *s = old_slot[i];
+    }
+  }
+  free(old_slot);
   return (0);
 }
 
 
-static int edge_hash_find_index(const EDGE_HASH *hash, int i1, int i2)
+static int edge_table_add_element(EDGE_TABLE *table, int i1, int i2, int edge_index)
 {
-  EDGE_LIST_ELEMENT *e;
+  EDGE_TABLE_SLOT *s;
 
-  for (e = hash->table[edge_hashvalue(hash->num_elements, i1, i2)]; e; e = e->next)
+  if (2 * (table->num_elements + 1) > table->num_slots)
   {
-    if ((e->i1 == i1) && (e->i2 == i2))
+    if (edge_table_grow(table) != 0)
     {
-      return (e->edge_index);
+      fprintf(stderr, "edge_table_add_element: edge_table_grow failed\n");
+      return (-1);
     }
   }
-  return (-1);
+  s = edge_table_find_slot(table, i1, i2);
+  if (s->edge_index != -1)
+  {
+    fprintf(stderr, "edge_table_add_element: edge %d -- %d already present\n", i1, i2);
+    return (-1);
+  }
+  s->i1 = i1;
+  s->i2 = i2;
+  s->edge_index = edge_index;
+  table->num_elements++;
+  return (0);
 }
 
 
+static int edge_table_find_index(const EDGE_TABLE *table, int i1, int i2)
+{
+  return (edge_table_find_slot(table, i1, i2)->edge_index);
+}
+
+
+/*
+ * Compute the contact graph of the lhs groups of lstr, i.e. of the
+ * groups of symbols that are replaced by one rule application. The
+ * edges connect the first symbols of the groups, the distance of
+ * groups is the shortest distance between any of their symbols.
+ * Edges are in the order in which the groups' first contact appears
+ * in the contact graph of lstr.
+ */
+
 static LSYS_STRING_CONTACT_GRAPH *group_contact_graph(const LSYS_STRING *lstr)
 {
   LSYS_STRING_CONTACT_GRAPH *gcgraph;
-  int e, edge_index, i1, i2, return_value, ls1, ls2;
-  EDGE_HASH *hash;
+  int edge_index, i1, i2, ls1, ls2;
+  size_t e;
+  EDGE_TABLE *table;
 
-  gcgraph = (LSYS_STRING_CONTACT_GRAPH *) malloc(sizeof(LSYS_STRING_CONTACT_GRAPH));
+  gcgraph = new_lsys_string_contact_graph(lstr->contact_graph.num_edges);
   if (gcgraph == NULL)
   {
-    fprintf(stderr, "group_contact_graph: malloc failed\n");
-    return (NULL);
-  }
-  hash = new_edge_hash(lstr->num_symbols);
-  if (hash == NULL)
-  {
-    fprintf(stderr, "group_contact_graph: new_edge_hash failed\n");
-    free(gcgraph);
+    fprintf(stderr, "group_contact_graph: new_lsys_string_contact_graph failed\n");
     return (NULL);
   }
-  init_lsys_string_contact_graph_components(gcgraph);
-  return_value = alloc_lsys_string_contact_graph_components(gcgraph, lstr->contact_graph.num_edges);
-  if (return_value != 0)
+  table = new_edge_table(lstr->num_symbols);
+  if (table == NULL)
   {
-    fprintf(stderr, "group_contact_graph: alloc_lsys_string_contact_graph_components failed\n");
-    free(gcgraph);
+    fprintf(stderr, "group_contact_graph: new_edge_table failed\n");
+    free_lsys_string_contact_graph(gcgraph);
     return (NULL);
   }
   for (e = 0; e < lstr->contact_graph.num_edges; e++)
@@ -879,25 +1260,29 @@ static LSYS_STRING_CONTACT_GRAPH *group_contact_graph(const LSYS_STRING *lstr)
     i2 = lstr->contact_graph.edge[e].i2;
     ls1 = lstr->symbol[i1].lhs_group_start;
     ls2 = lstr->symbol[i2].lhs_group_start;
-    /* always have l1 < l2 in group ascertains uniqueness required for hasing */
+    /* always have l1 < l2 in group ascertains uniqueness required for hashing */
     if (ls1 > ls2)
     {
       int l_tmp = ls1;
       ls1 = ls2;
       ls2 = l_tmp;
     }
-    edge_index = edge_hash_find_index(hash, ls1, ls2);
+    edge_index = edge_table_find_index(table, ls1, ls2);
     if (edge_index == -1)
     {
       if (add_lsys_string_contact_edge(gcgraph, ls1, ls2, lstr->contact_graph.edge[e].distance) != 0)
       {
-	/* FIXME: should bail out here */
 	fprintf(stderr, "group_contact_graph: add_lsys_string_contact_edge failed\n");
+	free_edge_table(table);
+	free_lsys_string_contact_graph(gcgraph);
+	return (NULL);
       }
-      if (edge_hash_add_element(hash, ls1, ls2, gcgraph->num_edges - 1) != 0)
+      if (edge_table_add_element(table, ls1, ls2, gcgraph->num_edges - 1) != 0)
       {
-	/* FIXME: should bail out here */
-	fprintf(stderr, "group_contact_graph: edge_hash_add_element failed\n");
+	fprintf(stderr, "group_contact_graph: edge_table_add_element failed\n");
+	free_edge_table(table);
+	free_lsys_string_contact_graph(gcgraph);
+	return (NULL);
       }
     }
     else
@@ -908,16 +1293,43 @@ static LSYS_STRING_CONTACT_GRAPH *group_contact_graph(const LSYS_STRING *lstr)
       }
     }
   }
-  free_edge_hash(hash);
+  free_edge_table(table);
   return (gcgraph);
 }
 
 
+/*
+ * Distance between the successors of the groups connected by the
+ * group contact graph edge gedge. All successors of a group have
+ * the same distance from their predecessor, therefore all edges
+ * between successors of two contacting groups have the same distance.
+ */
+
+static int successor_distance(const LSYS_STRING *predecessor, const LSYS_STRING_CONTACT_EDGE *gedge)
+{
+  return (gedge->distance + predecessor->symbol[gedge->i1].successor_distance + predecessor->symbol[gedge->i2].successor_distance);
+}
+
+
+/*
+ * Compute the contact graph of lstr, which has been derived from
+ * predecessor. Successors of the same group of predecessor symbols
+ * are all connected with distance 1, successors of contacting groups
+ * are connected if their distance does not exceed the diffusion range
+ * of the lsys. The diffusion range bounds edge generation early:
+ * since the distance of successors depends on their predecessors
+ * only, pairs of groups too far apart are discarded without
+ * enumerating their successors. Therefore, the number of edges can
+ * be determined beforehand and each edge is generated only once.
+ */
+
 static int compute_contact_graph(LSYS_STRING *lstr, const LSYS_STRING *predecessor)
 {
-  int e, n, p_i1, p_i2, i, j, distance;
+  int i, j;
+  size_t e, n;
   const SYMBOL_INSTANCE *p1, *p2;
   LSYS_STRING_CONTACT_GRAPH *gcgraph;
+  int distance;
 
   if (!lstr->arrayed)
   {
@@ -929,115 +1341,100 @@ static int compute_contact_graph(LSYS_STRING *lstr, const LSYS_STRING *predecess
     fprintf(stderr, "compute_contact_graph: predecessor not arrayed\n");
     return (-1);
   }
+  for (i = 0; i < predecessor->num_symbols; i += predecessor->symbol[i].lhs_group_length)
+  {
+    if (predecessor->symbol[i].lhs_group_length == 0)
+    {
+      fprintf(stderr, "compute_contact_graph: lhs group info corrupted\n");
+      return (-1);
+    }
+  }
   gcgraph = group_contact_graph(predecessor);
   if (gcgraph == NULL)
   {
     fprintf(stderr, "compute_contact_graph: group_contact_graph failed\n");
     return (-1);
   }
-  /* FIXME: loop is repeatedly done for finding number of edges and for adding edges */
-  n = 0;
   /* edges between symbols with same predecessors */
-  i = 0;
-  while (i < predecessor->num_symbols)
+  n = 0;
+  for (i = 0; i < predecessor->num_symbols; i += predecessor->symbol[i].lhs_group_length)
   {
-    if (predecessor->symbol[i].lhs_group_length == 0)
-    {
-      fprintf(stderr, "compute_contact_graph: lhs group info corrupted\n");
-    }
-    else
+    if (predecessor->symbol[i].num_successors > 0)
     {
-      if (predecessor->symbol[i].num_successors > 0)
-      {
-	n += predecessor->symbol[i].num_successors * (predecessor->symbol[i].num_successors - 1) / 2;
-      }
-      i += predecessor->symbol[i].lhs_group_length;
+      n += (size_t) predecessor->symbol[i].num_successors * (predecessor->symbol[i].num_successors - 1) / 2;
     }
   }
   /* edges between symbols with different predecessors */
   for (e = 0; e < gcgraph->num_edges; e++)
   {
-    p_i1 = gcgraph->edge[e].i1;
-    p_i2 = gcgraph->edge[e].i2;
-    p1 = predecessor->symbol + p_i1;
-    p2 = predecessor->symbol + p_i2;
-    for (i = p1->successor_index; i < p1->successor_index + p1->num_successors; i++)
+    if (successor_distance(predecessor, gcgraph->edge + e) <= lstr->lsys->diffusion_range)
     {
-      /* FIXME: this could probably be improved in speed */
-      for (j = p2->successor_index; j < p2->successor_index + p2->num_successors; j++)
-      {
-	distance = gcgraph->edge[e].distance + p1->successor_distance + p2->successor_distance;
-	if (distance <= lstr->lsys->diffusion_range)
-	{
-	  n++;
-	}
-      }
+      n += (size_t) predecessor->symbol[gcgraph->edge[e].i1].num_successors * predecessor->symbol[gcgraph->edge[e].i2].num_successors;
     }
   }
-  if (alloc_lsys_string_contact_graph_components(&(lstr->contact_graph), n) != 0)
+  if (alloc_lsys_string_contact_edges(lstr, n) != 0)
   {
-    fprintf(stderr, "compute_contact_graph: alloc_lsys_string_contact_graph_components failed\n");
+    fprintf(stderr, "compute_contact_graph: alloc_lsys_string_contact_edges failed\n");
     free_lsys_string_contact_graph(gcgraph);
     return (-1);
   }
-  /* edges between symbols with same predecessors */
-  i = 0;
-  while (i < predecessor->num_symbols)
+  for (i = 0; i < predecessor->num_symbols; i += predecessor->symbol[i].lhs_group_length)
   {
-    if (predecessor->symbol[i].lhs_group_length == 0)
+    if (predecessor->symbol[i].num_successors > 0)
     {
-      fprintf(stderr, "compute_contact_graph: lhs group info corrupted\n");
-    }
-    else
-    {
-      if (predecessor->symbol[i].num_successors > 0)
+      if (connect_symbol_group(lstr, predecessor->symbol[i].successor_index, predecessor->symbol[i].num_successors) != 0)
       {
-	if (connect_symbol_group(lstr, predecessor->symbol[i].successor_index, predecessor->symbol[i].num_successors) != 0)
-	{
-	  /* FIXME: should bail out here */
-	  fprintf(stderr, "compute_contact_graph: connect_symbol_group failed\n");
-	}
+	fprintf(stderr, "compute_contact_graph: connect_symbol_group failed\n");
+	free_lsys_string_contact_graph(gcgraph);
+	return (-1);
       }
-      i += predecessor->symbol[i].lhs_group_length;
     }
   }
-  /* edges between symbols with different predecessors */
   for (e = 0; e < gcgraph->num_edges; e++)
   {
-    p_i1 = gcgraph->edge[e].i1;
-    p_i2 = gcgraph->edge[e].i2;
-    p1 = predecessor->symbol + p_i1;
-    p2 = predecessor->symbol + p_i2;
+    distance = successor_distance(predecessor, gcgraph->edge + e);
+    if (distance > lstr->lsys->diffusion_range)
+    {
+      continue;
+    }
+    p1 = predecessor->symbol + gcgraph->edge[e].i1;
+    p2 = predecessor->symbol + gcgraph->edge[e].i2;
     for (i = p1->successor_index; i < p1->successor_index + p1->num_successors; i++)
     {
-      /* FIXME: this could probably be improved in speed */
       for (j = p2->successor_index; j < p2->successor_index + p2->num_successors; j++)
       {
-	distance = gcgraph->edge[e].distance + p1->successor_distance + p2->successor_distance;
-	if (distance <= lstr->lsys->diffusion_range)
+	if (add_lsys_string_contact_edge(&(lstr->contact_graph), i, j, distance) != 0)
 	{
-	  if (connect_lsys_string_symbols(lstr, i, j, distance) != 0)
-	  {
-	    fprintf(stderr, "compute_contact_graph: connect_lsys_string_symbols failed\n");
-	  }
+	  fprintf(stderr, "compute_contact_graph: add_lsys_string_contact_edge failed\n");
+	  free_lsys_string_contact_graph(gcgraph);
+	  return (-1);
 	}
       }
     }
   }
   free_lsys_string_contact_graph(gcgraph);
+  if (connect_lsys_string_contact_graph(lstr) != 0)
+  {
+    fprintf(stderr, "compute_contact_graph: connect_lsys_string_contact_graph failed\n");
+    return (-1);
+  }
   return (0);
 }
 
 
-/* incomplete: successor info not stored in symbol instances (?) */
+/*
+ * Derive the successor of lstr, in arena unless arena is NULL.
+ * incomplete: successor info not stored in symbol instances (?)
+ */
 
-LSYS_STRING *derived_string(LSYS_STRING *lstr)
+static LSYS_STRING *derived_string_sequential(LSYS_STRING *lstr, MEM_ARENA *arena)
 {
   LSYS_STRING *dstr;
   SYMBOL_INSTANCE *target_tail = NULL, *target_symbol;
   const RULE_ELEMENT *rule;
+  const LSYS *lsys = lstr->lsys;
   const TRANSSYS_INSTANCE **ti_list;
-  int si_index, rule_index, i, lhs_length;
+  int si_index, rule_index, i, k, lhs_length, symbol_index;
   int num_successors, successor_index;
 
   if (!lstr->arrayed)
@@ -1045,49 +1442,53 @@ LSYS_STRING *derived_string(LSYS_STRING *lstr)
     fprintf(stderr, "derived_string: cannot derive from non-arrayed string\n");
     return (NULL);
   }
-  dstr = new_lsys_string(lstr->lsys);
+  /* one list for all rule applications, large enough for any lhs */
+  ti_list = (const TRANSSYS_INSTANCE **) malloc((lsys->max_lhs_length > 0 ? lsys->max_lhs_length : 1) * sizeof(TRANSSYS_INSTANCE *));
+  if (ti_list == NULL)
+  {
+    fprintf(stderr, "derived_string: malloc failed\n");
+    return (NULL);
+  }
+  dstr = new_lsys_string_arena(lsys, arena);
   if (dstr == NULL)
   {
     fprintf(stderr, "derived_string: could not allocate new symbol string\n");
+    free(ti_list);
     return (NULL);
   }
+  dstr->urandom_state = lstr->urandom_state;
   successor_index = 0;
   si_index = 0;
   while (si_index < lstr->num_symbols)
   {
-    rule_index = 0;
-    for (rule = lstr->lsys->rule_list; rule; rule = rule->next)
+    /* only the rules listed for the symbol in the dispatch index can match */
+    rule = NULL;
+    rule_index = NO_INDEX;
+    symbol_index = lstr->symbol[si_index].symbol_index;
+    for (k = lsys->rule_dispatch_start[symbol_index]; k < lsys->rule_dispatch_start[symbol_index + 1]; k++)
     {
-      if (rule_match(lstr->symbol + si_index, rule))
+      if (rule_match(lstr->symbol + si_index, lsys->rule_list + lsys->rule_dispatch[k], ti_list))
       {
+	rule_index = lsys->rule_dispatch[k];
+	rule = lsys->rule_list + rule_index;
 	/* fprintf(stderr, "derived_string: applying rule \"%s\"\n", rule->name); */
 	break;
       }
-      rule_index++;
     }
     if (rule)
     {
-      /* FIXME: should bail out if there's a problem here... */
-      ti_list = transsys_instance_list(lstr->symbol + si_index, rule);
-      if (ti_list == NULL)
-      {
-	fprintf(stderr, "derived_string: transsys_instance_list failed\n");
-	free_lsys_string(dstr);
-	return (NULL);
-      }
       lhs_length = rule->lhs->num_symbols;
       target_symbol = evaluate_production_list(dstr, rule->rhs->production_list, ti_list);
-      free_transsys_instance_list(ti_list);
       if (target_symbol == NULL)
       {
 	fprintf(stderr, "derived_string: failed to produce target symbol\n");
+	free(ti_list);
 	free_lsys_string(dstr);
 	return (NULL);
       }
     }
     else
     {
-      rule_index = NO_INDEX;
       target_symbol = clone_symbol_instance(lstr->symbol + si_index, dstr);
       lhs_length = 1;
     }
@@ -1136,6 +1537,7 @@ LSYS_STRING *derived_string(LSYS_STRING *lstr)
     }
     successor_index += num_successors;
   }
+  free(ti_list);
   if (arrange_lsys_string_arrays(dstr) != 0)
   {
     fprintf(stderr, "derived_string: arrange_lsys_string_arrays failed\n");
@@ -1151,3 +1553,307 @@ LSYS_STRING *derived_string(LSYS_STRING *lstr)
   /* fprint_lsys_string(stderr, dstr, "***\n"); */
   return (dstr);
 }
+
+
+/*
+ * Parallel derivation proceeds in three passes: The rule applied to the
+ * lhs group starting at each symbol of the predecessor is determined
+ * in parallel, as if a group started at every symbol. The lhs groups
+ * and the successor indices are then determined sequentially, and
+ * finally the successor symbols are constructed in parallel, in place
+ * in the symbol array of the successor string. Rules are matched in
+ * the same order as in sequential derivation, so the same string is
+ * derived, but conditions of rules may be evaluated at symbols that
+ * turn out not to start an lhs group. This is why strings of lsys
+ * programs using random functions are derived sequentially.
+ */
+
+typedef struct
+{
+  LSYS_STRING *dstr;
+  int *rule_index;
+  int *group_start;
+  size_t *concentration_offset;
+  double *concentration;
+} DERIVATION_TASK_DATA;
+
+
+static void derivation_match_task(LSYS_STRING_TASK *task)
+{
+  DERIVATION_TASK_DATA *data = (DERIVATION_TASK_DATA *) task->data;
+  const LSYS *lsys = task->lstr->lsys;
+  const TRANSSYS_INSTANCE **ti_list;
+  size_t i;
+  int k, symbol_index;
+
+  ti_list = (const TRANSSYS_INSTANCE **) malloc((lsys->max_lhs_length > 0 ? lsys->max_lhs_length : 1) * sizeof(TRANSSYS_INSTANCE *));
+  if (ti_list == NULL)
+  {
+    fprintf(stderr, "derivation_match_task: malloc failed\n");
+    task->return_value = -1;
+    return;
+  }
+  for (i = task->start; i < task->end; i++)
+  {
+    data->rule_index[i] = NO_INDEX;
+    symbol_index = task->lstr->symbol[i].symbol_index;
+    for (k = lsys->rule_dispatch_start[symbol_index]; k < lsys->rule_dispatch_start[symbol_index + 1]; k++)
+    {
+      if (rule_match(task->lstr->symbol + i, lsys->rule_list + lsys->rule_dispatch[k], ti_list))
+      {
+	data->rule_index[i] = lsys->rule_dispatch[k];
+	break;
+      }
+    }
+  }
+  free(ti_list);
+}
+
+
+static void derivation_fill_task(LSYS_STRING_TASK *task)
+{
+  DERIVATION_TASK_DATA *data = (DERIVATION_TASK_DATA *) task->data;
+  const LSYS_STRING *lstr = task->lstr;
+  const LSYS *lsys = lstr->lsys;
+  const SYMBOL_INSTANCE *source;
+  const RULE_ELEMENT *rule;
+  const PRODUCTION_ELEMENT *pe;
+  const TRANSSYS_INSTANCE **ti_list;
+  SYMBOL_INSTANCE *target;
+  double *concentration;
+  size_t k;
+  int i;
+
+  ti_list = (const TRANSSYS_INSTANCE **) malloc((lsys->max_lhs_length > 0 ? lsys->max_lhs_length : 1) * sizeof(TRANSSYS_INSTANCE *));
+  if (ti_list == NULL)
+  {
+    fprintf(stderr, "derivation_fill_task: malloc failed\n");
+    task->return_value = -1;
+    return;
+  }
+  for (k = task->start; k < task->end; k++)
+  {
+    source = lstr->symbol + data->group_start[k];
+    target = data->dstr->symbol + source->successor_index;
+    concentration = (data->concentration != NULL) ? data->concentration + data->concentration_offset[k] : NULL;
+    if (source->rule_index == NO_INDEX)
+    {
+      if (init_symbol_instance(target, data->dstr, source->symbol_index, concentration) != 0)
+      {
+	fprintf(stderr, "derivation_fill_task: init_symbol_instance failed\n");
+	task->return_value = -1;
+	break;
+      }
+      if (source->transsys_instance.transsys)
+      {
+	for (i = 0; i < source->transsys_instance.transsys->num_factors; i++)
+	{
+	  target->transsys_instance.factor_concentration[i] = source->transsys_instance.factor_concentration[i];
+	}
+      }
+      continue;
+    }
+    rule = lsys->rule_list + source->rule_index;
+    for (i = 0; i < rule->lhs->num_symbols; i++)
+    {
+      ti_list[i] = &(source[i].transsys_instance);
+    }
+    for (pe = rule->rhs->production_list; pe; pe = pe->next)
+    {
+      if (init_symbol_instance(target, data->dstr, pe->symbol_index, concentration) != 0)
+      {
+	fprintf(stderr, "derivation_fill_task: init_symbol_instance failed\n");
+	task->return_value = -1;
+	break;
+      }
+      set_production_values(target, pe, ti_list);
+      if ((concentration != NULL) && (target->transsys_instance.transsys != NULL))
+      {
+	concentration += 2 * target->transsys_instance.transsys->num_factors;
+      }
+      target++;
+    }
+    if (task->return_value != 0)
+    {
+      break;
+    }
+  }
+  free(ti_list);
+}
+
+
+static size_t symbol_concentration_size(const LSYS *lsys, int symbol_index)
+{
+  const TRANSSYS *transsys = lsys->symbol_list[symbol_index].transsys;
+
+  return ((transsys != NULL) ? 2 * transsys->num_factors : 0);
+}
+
+
+static void free_derivation_task_data(DERIVATION_TASK_DATA *data)
+{
+  free(data->rule_index);
+  free(data->group_start);
+  free(data->concentration_offset);
+}
+
+
+static LSYS_STRING *derived_string_parallel(LSYS_STRING *lstr, MEM_ARENA *arena, int num_threads)
+{
+  DERIVATION_TASK_DATA data;
+  LSYS_STRING *dstr;
+  const RULE_ELEMENT *rule;
+  const PRODUCTION_ELEMENT *pe;
+  const LSYS *lsys = lstr->lsys;
+  size_t num_groups, concentration_size, n;
+  int si_index, rule_index, i, lhs_length, num_successors, successor_index, successor_distance;
+
+  n = (lstr->num_symbols > 0) ? lstr->num_symbols : 1;
+  data.rule_index = (int *) malloc(n * sizeof(int));
+  data.group_start = (int *) malloc(n * sizeof(int));
+  data.concentration_offset = (size_t *) malloc(n * sizeof(size_t));
+  data.concentration = NULL;
+  if ((data.rule_index == NULL) || (data.group_start == NULL) || (data.concentration_offset == NULL))
+  {
+    fprintf(stderr, "derived_string: malloc failed\n");
+    free_derivation_task_data(&data);
+    return (NULL);
+  }
+  dstr = new_lsys_string_arena(lsys, arena);
+  if (dstr == NULL)
+  {
+    fprintf(stderr, "derived_string: could not allocate new symbol string\n");
+    free_derivation_task_data(&data);
+    return (NULL);
+  }
+  dstr->urandom_state = lstr->urandom_state;
+  data.dstr = dstr;
+  if (run_lsys_string_tasks(lstr, 0, 0, &data, lstr->num_symbols, num_threads, derivation_match_task) != 0)
+  {
+    fprintf(stderr, "derived_string: matching rules failed\n");
+    free_derivation_task_data(&data);
+    free_lsys_string(dstr);
+    return (NULL);
+  }
+  num_groups = 0;
+  concentration_size = 0;
+  successor_index = 0;
+  si_index = 0;
+  while (si_index < lstr->num_symbols)
+  {
+    rule_index = data.rule_index[si_index];
+    data.group_start[num_groups] = si_index;
+    data.concentration_offset[num_groups] = concentration_size;
+    num_groups++;
+    if (rule_index != NO_INDEX)
+    {
+      rule = lsys->rule_list + rule_index;
+      lhs_length = rule->lhs->num_symbols;
+      num_successors = 0;
+      for (pe = rule->rhs->production_list; pe; pe = pe->next)
+      {
+	concentration_size += symbol_concentration_size(lsys, pe->symbol_index);
+	num_successors++;
+      }
+      if (num_successors == 0)
+      {
+	fprintf(stderr, "derived_string: failed to produce target symbol\n");
+	free_derivation_task_data(&data);
+	free_lsys_string(dstr);
+	return (NULL);
+      }
+      successor_distance = 1;
+    }
+    else
+    {
+      lhs_length = 1;
+      num_successors = 1;
+      concentration_size += symbol_concentration_size(lsys, lstr->symbol[si_index].symbol_index);
+      successor_distance = 0;
+    }
+    for (i = 0; i < lhs_length; i++)
+    {
+      lstr->symbol[si_index + i].rule_index = rule_index;
+      /* an lhs group length of 0 indicates that this symbol is not the first one in an lhs group */
+      lstr->symbol[si_index + i].lhs_group_length = (i == 0) ? lhs_length : 0;
+      lstr->symbol[si_index + i].lhs_group_start = si_index;
+      lstr->symbol[si_index + i].num_successors = num_successors;
+      lstr->symbol[si_index + i].successor_index = successor_index;
+      lstr->symbol[si_index + i].successor_distance = successor_distance;
+    }
+    si_index += lhs_length;
+    successor_index += num_successors;
+  }
+  if (alloc_lsys_string_symbols(dstr, successor_index) != 0)
+  {
+    fprintf(stderr, "derived_string: alloc_lsys_string_symbols failed\n");
+    free_derivation_task_data(&data);
+    free_lsys_string(dstr);
+    return (NULL);
+  }
+  if ((arena != NULL) && (concentration_size > 0))
+  {
+    data.concentration = (double *) mem_arena_alloc(arena, concentration_size * sizeof(double));
+    if (data.concentration == NULL)
+    {
+      fprintf(stderr, "derived_string: mem_arena_alloc failed\n");
+      free_derivation_task_data(&data);
+      free_lsys_string(dstr);
+      return (NULL);
+    }
+  }
+  if (run_lsys_string_tasks(lstr, 0, 0, &data, num_groups, num_threads, derivation_fill_task) != 0)
+  {
+    fprintf(stderr, "derived_string: constructing successor symbols failed\n");
+    free_derivation_task_data(&data);
+    free_lsys_string(dstr);
+    return (NULL);
+  }
+  free_derivation_task_data(&data);
+  if (compute_contact_graph(dstr, lstr) != 0)
+  {
+    fprintf(stderr, "derived_string: compute_contact_graph failed\n");
+    free_lsys_string(dstr);
+    return (NULL);
+  }
+  return (dstr);
+}
+
+
+/*
+ * Derive the successor of lstr, in arena unless arena is NULL, using
+ * up to num_threads threads. Multiple threads are used only if the
+ * lsys does not use random functions, so the successor, and the
+ * successor information stored in lstr, are the same for any number
+ * of threads.
+ */
+
+LSYS_STRING *derived_string_threads(LSYS_STRING *lstr, MEM_ARENA *arena, int num_threads)
+{
+  if (!lstr->arrayed)
+  {
+    fprintf(stderr, "derived_string: cannot derive from non-arrayed string\n");
+    return (NULL);
+  }
+  if ((num_threads > 1) && (lstr->num_symbols >= 2 * LSYS_STRING_THREAD_MIN_SYMBOLS) && !lsys_uses_random(lstr->lsys))
+  {
+    if (num_threads > LSYS_STRING_MAX_THREADS)
+    {
+      num_threads = LSYS_STRING_MAX_THREADS;
+    }
+    return (derived_string_parallel(lstr, arena, num_threads));
+  }
+  return (derived_string_sequential(lstr, arena));
+}
+
+
+LSYS_STRING *derived_string_arena(LSYS_STRING *lstr, MEM_ARENA *arena)
+{
+  return (derived_string_threads(lstr, arena, 1));
+}
+
+
+LSYS_STRING *derived_string(LSYS_STRING *lstr)
+{
+  return (derived_string_arena(lstr, NULL));
+}
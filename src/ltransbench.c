@@ -0,0 +1,217 @@
+/* Copyright (C) 2001 Jan T. Kim <kim@inb.mu-luebeck.de> */
+
+/*
+ * $Id$
+ *
+ * Benchmark of lsys derivation: derivation series are computed for
+ * each lsys, and the CPU time used by expression, diffusion and
+ * derivation of successor strings is reported separately. A checksum
+ * of the factor concentrations of the final string is printed, so
+ * results of different implementations can be checked for identity.
+ * Strings are allocated in an lsys string buffer, and the number of
+ * allocations served by its arenas and the number of blocks allocated
+ * for the arenas are reported. Expression, diffusion and derivation can
+ * be computed by multiple threads, which should not change the checksums.
+ */
+
+#include <getopt.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#include "trconfig.h"
+#include "trtypes.h"
+#include "transsys.h"
+
+
+/*
+ * FNV-1a hash of the bytes of all factor concentrations in lstr.
+ */
+static unsigned long lsys_string_checksum(const LSYS_STRING *lstr)
+{
+  unsigned long h = 2166136261UL;
+  const unsigned char *b;
+  size_t i, j;
+  int f;
+
+  for (i = 0; i < lstr->num_symbols; i++)
+  {
+    if (lstr->symbol[i].transsys_instance.transsys)
+    {
+      for (f = 0; f < lstr->symbol[i].transsys_instance.transsys->num_factors; f++)
+      {
+	b = (const unsigned char *) (lstr->symbol[i].transsys_instance.factor_concentration + f);
+	for (j = 0; j < sizeof(double); j++)
+	{
+	  h = ((h ^ b[j]) * 16777619UL) & 0xffffffffUL;
+	}
+      }
+    }
+  }
+  return (h);
+}
+
+
+static int benchmark_lsys(FILE *outfile, const LSYS *lsys, unsigned long num_steps, int num_repeats, unsigned int rndseed, int use_buffer, int num_threads)
+{
+  URANDOM_STATE urandom_state;
+  LSYS_STRING_BUFFER buffer;
+  LSYS_STRING *lstr, *dstr;
+  clock_t c, expression_time = 0, diffusion_time = 0, derivation_time = 0;
+  unsigned long t, checksum = 0;
+  size_t num_symbols = 0;
+  int r;
+
+  if (lsys->axiom == NULL)
+  {
+    fprintf(outfile, "%s: no axiom\n", lsys->name);
+    return (0);
+  }
+  init_lsys_string_buffer(&buffer);
+  for (r = 0; r < num_repeats; r++)
+  {
+    urandom_state_seed(&urandom_state, rndseed);
+    lstr = axiom_string_arena(lsys, &urandom_state, use_buffer ? lsys_string_buffer_next_arena(&buffer) : NULL);
+    if (lstr == NULL)
+    {
+      fprintf(stderr, "benchmark_lsys: axiom_string_arena failed\n");
+      free_lsys_string_buffer_components(&buffer);
+      return (-1);
+    }
+    for (t = 0; t < num_steps; t++)
+    {
+      c = clock();
+      if (lsys_string_expression_threads(lstr, num_threads) != 0)
+      {
+	fprintf(stderr, "benchmark_lsys: lsys_string_expression failed\n");
+	free_lsys_string(lstr);
+	free_lsys_string_buffer_components(&buffer);
+	return (-1);
+      }
+      expression_time += clock() - c;
+      c = clock();
+      if (lsys_string_diffusion_threads(lstr, num_threads) != 0)
+      {
+	fprintf(stderr, "benchmark_lsys: lsys_string_diffusion failed\n");
+	free_lsys_string(lstr);
+	free_lsys_string_buffer_components(&buffer);
+	return (-1);
+      }
+      diffusion_time += clock() - c;
+      c = clock();
+      dstr = derived_string_threads(lstr, use_buffer ? lsys_string_buffer_next_arena(&buffer) : NULL, num_threads);
+      if (dstr == NULL)
+      {
+	fprintf(stderr, "benchmark_lsys: derived_string_threads failed\n");
+	free_lsys_string(lstr);
+	free_lsys_string_buffer_components(&buffer);
+	return (-1);
+      }
+      free_lsys_string(lstr);
+      lstr = dstr;
+      derivation_time += clock() - c;
+    }
+    num_symbols = lstr->num_symbols;
+    checksum = lsys_string_checksum(lstr);
+    free_lsys_string(lstr);
+  }
+  fprintf(outfile, "%s: %lu symbols, expression: %g s, diffusion: %g s, derivation: %g s, checksum: %08lx",
+	  lsys->name, (unsigned long) num_symbols, (double) expression_time / CLOCKS_PER_SEC,
+	  (double) diffusion_time / CLOCKS_PER_SEC, (double) derivation_time / CLOCKS_PER_SEC, checksum);
+  if (use_buffer)
+  {
+    fprintf(outfile, ", arena allocations: %lu, arena blocks: %lu",
+	    buffer.arena[0].num_allocations + buffer.arena[1].num_allocations,
+	    buffer.arena[0].num_block_allocations + buffer.arena[1].num_block_allocations);
+  }
+  fprintf(outfile, "\n");
+  free_lsys_string_buffer_components(&buffer);
+  return (0);
+}
+
+
+int main(int argc, char **argv)
+{
+  int oc;
+  extern char *optarg;
+  extern int optind;
+  int yyreturn;
+  unsigned long num_steps = 20;
+  int num_repeats = 1;
+  unsigned int rndseed = 1;
+  int use_buffer = 1;
+  int num_threads = 1;
+  const LSYS *lsys;
+  int return_value = 0;
+
+  while ((oc = getopt(argc, argv, "j:mn:r:s:h")) != -1)
+  {
+    switch(oc)
+    {
+    case 'j':
+      num_threads = strtol(optarg, NULL, 10);
+      break;
+    case 'm':
+      use_buffer = 0;
+      break;
+    case 'n':
+      num_steps = strtoul(optarg, NULL, 10);
+      break;
+    case 'r':
+      num_repeats = strtol(optarg, NULL, 10);
+      break;
+    case 's':
+      rndseed = strtoul(optarg, NULL, 10);
+      break;
+    case 'h':
+      printf("-j <num>: specify number of threads for expression, diffusion and derivation\n");
+      printf("-m: allocate each string separately rather than in a string buffer\n");
+      printf("-n <num>: specify number of derivation steps\n");
+      printf("-r <num>: specify number of repeats\n");
+      printf("-s <num>: specify random seed\n");
+      printf("-h: print this help and exit\n");
+      exit(EXIT_SUCCESS);
+    }
+  }
+  if (optind < argc)
+    yyin_name = argv[optind++];
+  if (yyin_name)
+  {
+    if ((yyin = fopen(yyin_name, "r")) == NULL)
+    {
+      fprintf(stderr, "Failed to open \"%s\" for input -- exit\n", yyin_name);
+      exit(EXIT_FAILURE);
+    }
+  }
+  else
+  {
+    yyin = stdin;
+    yyin_name = "stdin";
+  }
+  yyreturn = yyparse();
+  if (yyreturn)
+  {
+    fprintf(stderr, "Failed to parse from \"%s\" -- exit\n", yyin_name);
+    if (yyin != stdin)
+      fclose(yyin);
+    exit(EXIT_FAILURE);
+  }
+  for (lsys = parsed_lsys; lsys; lsys = lsys->next)
+  {
+    if (benchmark_lsys(stdout, lsys, num_steps, num_repeats, rndseed, use_buffer, num_threads) != 0)
+    {
+      return_value = -1;
+    }
+  }
+  free_lsys_list(parsed_lsys);
+  free_transsys_list(parsed_transsys);
+  if (yyin != stdin)
+    fclose(yyin);
+  if (return_value)
+  {
+    fprintf(stderr, "ltransbench: benchmark failed -- exit\n");
+    exit(EXIT_FAILURE);
+  }
+  return (EXIT_SUCCESS);
+}
@@ -82,10 +82,24 @@ static int fprint_symbol_line(FILE *outfile, const LSYS_STRING *lstr, size_t sym
 }
 
 
-static int fprint_header(FILE *outfile, const LSYS *lsys, const TRANSSYS *transsys)
+/*
+ * In binary tables (see bintable.c), symbol and rule names are
+ * replaced by their indices in the lsys, with a rule index of -1
+ * for copied symbols, and the transsys name is given in the header.
+ */
+
+static const char *binary_table_column[] = {"timestep", "symStringIndex", "symbolIndex", "ruleIndex"};
+static const char *binary_table_factor_suffix[] = {""};
+
+
+static int fprint_header(FILE *outfile, const LSYS *lsys, const TRANSSYS *transsys, int binary)
 {
   size_t f;
 
+  if (binary)
+  {
+    return (fprint_binary_table_header(outfile, "ltransexpr 1.0", transsys, lsys, 4, binary_table_column, 1, binary_table_factor_suffix));
+  }
   fprintf(outfile, "timestep symStringIndex symbolName ruleName transsysName");
   for (f = 0; f < transsys->num_factors; f++)
   {
@@ -120,26 +134,79 @@ static int symbol_filter(const LSYS_STRING *lstr, size_t i, const TRANSSYS *tran
 /*
  * print a table of lines, each line describing a symbol of the lsys string
  */
-static int fprint_lstr_table(FILE *outfile, const LSYS_STRING *lstr, const TRANSSYS *transsys, int symbol_index, unsigned long time_step)
+static int fwrite_symbol_row(FILE *outfile, const LSYS_STRING *lstr, size_t symbol_instance_index, unsigned long time_step, double *row)
+{
+  const SYMBOL_INSTANCE *si = lstr->symbol + symbol_instance_index;
+  int f;
+
+  row[0] = time_step;
+  row[1] = symbol_instance_index;
+  row[2] = si->symbol_index;
+  row[3] = si->rule_index;
+  for (f = 0; f < si->transsys_instance.transsys->num_factors; f++)
+  {
+    row[4 + f] = si->transsys_instance.factor_concentration[f];
+  }
+  return (fwrite_binary_table_row(outfile, 4 + si->transsys_instance.transsys->num_factors, row));
+}
+
+
+/*
+ * With binary nonzero, the symbols are written as rows of a binary
+ * table, this requires transsys to be specified.
+ */
+static int fprint_lstr_table(FILE *outfile, const LSYS_STRING *lstr, const TRANSSYS *transsys, int symbol_index, unsigned long time_step, int binary)
 {
+  double *row = NULL;
   size_t i;
 
+  if (binary)
+  {
+    row = (double *) malloc((4 + transsys->num_factors) * sizeof(double));
+    if (row == NULL)
+    {
+      fprintf(stderr, "fprint_lstr_table: malloc failed\n");
+      return (-1);
+    }
+  }
   for (i = 0; i < lstr->num_symbols; i++)
   {
     if (symbol_filter(lstr, i, transsys, symbol_index))
     {
-      fprintf(outfile, "%lu", time_step);
-      fprint_symbol_line(outfile, lstr, i);
+      if (binary)
+      {
+	if (fwrite_symbol_row(outfile, lstr, i, time_step, row) != 0)
+	{
+	  free(row);
+	  return (-1);
+	}
+      }
+      else
+      {
+	fprintf(outfile, "%lu", time_step);
+	fprint_symbol_line(outfile, lstr, i);
+      }
     }
   }
+  free(row);
   return (0);
 }
 
 
-static int ltransexpr(FILE *outfile, const LSYS *lsys, const TRANSSYS *transsys, const char *symbol_name, unsigned int rndseed, unsigned long num_timesteps, unsigned long output_period)
+/*
+ * If checkpoint_filename is not NULL, a snapshot of the lsys string is
+ * saved to it every checkpoint_period steps and after the last step.
+ * If resume_filename is not NULL, the derivation is resumed from the
+ * snapshot in that file rather than started from the axiom. Random
+ * numbers continue from the state saved in the snapshot, unless reseed
+ * is nonzero or the snapshot has no random number generator state, in
+ * which case the generator is seeded with rndseed.
+ */
+static int ltransexpr(FILE *outfile, const LSYS *lsys, const TRANSSYS *transsys, const char *symbol_name, unsigned int rndseed, unsigned long num_timesteps, unsigned long output_period, int num_threads, const char *checkpoint_filename, unsigned long checkpoint_period, const char *resume_filename, int reseed, int binary)
 {
+  URANDOM_STATE urandom_state;
   LSYS_STRING *lstr, *dstr;
-  unsigned long t;
+  unsigned long t, t_start = 0;
   int symbol_index = -2;  /* initialiser pacifies -Wall */
   int return_value;
 
@@ -158,32 +225,73 @@ static int ltransexpr(FILE *outfile, const LSYS *lsys, const TRANSSYS *transsys,
   }
   if (transsys)
   {
-    fprint_header(outfile, lsys, transsys);
+    if (fprint_header(outfile, lsys, transsys, binary) != 0)
+    {
+      return (-1);
+    }
+  }
+  urandom_state_seed(&urandom_state, rndseed);
+  if (resume_filename)
+  {
+    lstr = load_lsys_string_snapshot(resume_filename, lsys, &urandom_state, NULL, &t_start);
+    if ((lstr != NULL) && (reseed || (lstr->urandom_state == NULL)))
+    {
+      urandom_state_seed(&urandom_state, rndseed);
+      set_lsys_string_urandom_state(lstr, &urandom_state);
+    }
+  }
+  else
+  {
+    lstr = axiom_string_urandom(lsys, &urandom_state);
+  }
+  if (lstr == NULL)
+  {
+    fprintf(stderr, "ltransexpr: failed to set up initial string of lsys \"%s\"\n", lsys->name);
+    return (-1);
   }
-  ulong_srandom(rndseed);
-  lstr = axiom_string(lsys);
-  for (t = 0; t < num_timesteps; t++)
+  for (t = t_start; t < num_timesteps; t++)
   {
-    return_value = lsys_string_expression(lstr);
+    if (checkpoint_filename && (t > t_start) && (checkpoint_period > 0) && ((t % checkpoint_period) == 0))
+    {
+      if (save_lsys_string_snapshot(checkpoint_filename, lstr, t) != 0)
+      {
+	free_lsys_string(lstr);
+	return (-1);
+      }
+    }
+    return_value = lsys_string_expression_threads(lstr, num_threads);
     if (return_value != 0)
     {
       free_lsys_string(lstr);
       return (-1);
     }
-    return_value = lsys_string_diffusion(lstr);
+    return_value = lsys_string_diffusion_threads(lstr, num_threads);
     if (return_value != 0)
     {
       free_lsys_string(lstr);
       return (-1);
     } 
-    dstr = derived_string(lstr);
+    dstr = derived_string_threads(lstr, NULL, num_threads);
     if ((t % output_period) == 0)
     {
-      fprint_lstr_table(outfile, lstr, transsys, symbol_index, t);
+      if (fprint_lstr_table(outfile, lstr, transsys, symbol_index, t, binary) != 0)
+      {
+	free_lsys_string(lstr);
+	free_lsys_string(dstr);
+	return (-1);
+      }
     }
     free_lsys_string(lstr);
     lstr = dstr;
   }
+  if (checkpoint_filename)
+  {
+    if (save_lsys_string_snapshot(checkpoint_filename, lstr, t) != 0)
+    {
+      free_lsys_string(lstr);
+      return (-1);
+    }
+  }
   free_lsys_string(lstr);
   return (0);
 }
@@ -204,14 +312,34 @@ int main(int argc, char **argv)
   int return_value = 0;
   unsigned int rndseed = 1;
   const char *symbol_name = NULL;
+  int num_threads = 1;
+  const char *checkpoint_filename = NULL, *resume_filename = NULL;
+  unsigned long checkpoint_period = 0;
+  int reseed = 0;
+  int binary = 0;
 
-  while ((oc = getopt(argc, argv, "d:n:t:s:r:y:h")) != -1)
+  while ((oc = getopt(argc, argv, "bC:d:j:k:n:R:t:s:r:y:h")) != -1)
   {
     switch(oc)
     {
+    case 'b':
+      binary = 1;
+      break;
+    case 'C':
+      checkpoint_filename = optarg;
+      break;
     case 'd':
       output_period = strtoul(optarg, NULL, 10);
       break;
+    case 'j':
+      num_threads = strtol(optarg, NULL, 10);
+      break;
+    case 'k':
+      checkpoint_period = strtoul(optarg, NULL, 10);
+      break;
+    case 'R':
+      resume_filename = optarg;
+      break;
     case 't':
       transsys_name = optarg;
       break;
@@ -220,14 +348,20 @@ int main(int argc, char **argv)
       break;
     case 's':
       rndseed = strtoul(optarg, NULL, 10);
+      reseed = 1;
       break;
     case 'y':
       symbol_name = optarg;
       break;
     case 'h':
+      printf("-b: write output as binary table (header and rows of doubles), requires -t\n");
       printf("-c <filename>: specify gnuplot command file\n");
+      printf("-C <filename>: save snapshots of the lsys string to file (checkpoints)\n");
       printf("-d <intnum>: specify period of output (i.e. 0, d, 2*d etc. will be printed)\n");
+      printf("-j <num>: specify number of threads for expression, diffusion and derivation\n");
+      printf("-k <num>: specify period of checkpoints (default: only after last time step)\n");
       printf("-n <num>: specify number of time steps\n");
+      printf("-R <filename>: resume derivation from snapshot in file (fork it if -s is given)\n");
       printf("-t <name>: specify name of transsys to process\n");
       printf("-s <num>: specify random seed\n");
       printf("-y <name>: specify name of symbol to be monitored (lsys mode)\n");
@@ -287,9 +421,25 @@ int main(int argc, char **argv)
       return_value = -1;
     }
   }
-  for (lsys = parsed_lsys; lsys; lsys = lsys->next)
+  if (binary && (tr == NULL))
+  {
+    fprintf(stderr, "ltransexpr: binary output requires a transsys to be specified by name (-t)\n");
+    lsys = NULL;
+    return_value = -1;
+  }
+  else if (binary && parsed_lsys && parsed_lsys->next)
+  {
+    fprintf(stderr, "ltransexpr: binary output is restricted to files with one lsys\n");
+    lsys = NULL;
+    return_value = -1;
+  }
+  else
+  {
+    lsys = parsed_lsys;
+  }
+  for (; lsys; lsys = lsys->next)
   {
-    return_value = ltransexpr(outfile, lsys, tr, symbol_name, rndseed, num_timesteps, output_period);
+    return_value = ltransexpr(outfile, lsys, tr, symbol_name, rndseed, num_timesteps, output_period, num_threads, checkpoint_filename, checkpoint_period, resume_filename, reseed, binary);
     if (return_value != 0)
     {
       break;
@@ -1239,6 +1239,8 @@ static void free_lsys_components(LSYS *lsys)
     {
       free(lsys->transsys_list);
     }
+    free(lsys->rule_dispatch_start);
+    free(lsys->rule_dispatch);
   }
   else
   {
@@ -1304,7 +1306,7 @@ static const TRANSSYS **lsys_transsys_list(const LSYS *lsys)
 	;
       if (j == n)
       {
-	tl1 = (const TRANSSYS **) realloc(tl, (n + 1) * sizeof(TRANSSYS *));
+	tl1 = (const TRANSSYS **) realloc(tl, (n + 2) * sizeof(TRANSSYS *));
 	if (tl1 == NULL)
 	{
 	  fprintf(stderr, "lsys_transsys_list: realloc failed\n");
@@ -1369,6 +1371,9 @@ LSYS *new_lsys(const char *name)
   lsys->rule_list = NULL;
   lsys->num_transsys = 0;
   lsys->transsys_list = NULL;
+  lsys->rule_dispatch_start = NULL;
+  lsys->rule_dispatch = NULL;
+  lsys->max_lhs_length = 0;
   strncpy(lsys->name, name, IDENTIFIER_MAX);
   lsys->name[IDENTIFIER_MAX - 1] = '\0';
   return (lsys);
@@ -1425,6 +1430,81 @@ static int set_lsys_transsys_list(LSYS *lsys)
 }
 
 
+/*
+ * Set up the rule dispatch index of lsys, listing for each symbol the
+ * rules with a lhs starting with that symbol. Rules with an empty lhs
+ * are listed for all symbols.
+ */
+
+static int set_lsys_rule_dispatch(LSYS *lsys)
+{
+  const LHS_DESCRIPTOR *lhs;
+  int i, r, n;
+
+  lsys->rule_dispatch_start = (int *) malloc((lsys->num_symbols + 1) * sizeof(int));
+  if (lsys->rule_dispatch_start == NULL)
+  {
+    fprintf(stderr, "set_lsys_rule_dispatch: malloc failed\n");
+    return (-1);
+  }
+  for (i = 0; i <= lsys->num_symbols; i++)
+  {
+    lsys->rule_dispatch_start[i] = 0;
+  }
+  lsys->max_lhs_length = 0;
+  n = 0;
+  for (r = 0; r < lsys->num_rules; r++)
+  {
+    lhs = lsys->rule_list[r].lhs;
+    if (lhs->num_symbols > lsys->max_lhs_length)
+    {
+      lsys->max_lhs_length = lhs->num_symbols;
+    }
+    if (lhs->num_symbols > 0)
+    {
+      lsys->rule_dispatch_start[lhs->symbol_list[0].symbol_index]++;
+      n++;
+    }
+    else
+    {
+      for (i = 0; i < lsys->num_symbols; i++)
+      {
+	lsys->rule_dispatch_start[i]++;
+      }
+      n += lsys->num_symbols;
+    }
+  }
+  /* cumulate counts, so rule_dispatch_start[i] is the end of the rules of symbol i */
+  for (i = 1; i <= lsys->num_symbols; i++)
+  {
+    lsys->rule_dispatch_start[i] += lsys->rule_dispatch_start[i - 1];
+  }
+  lsys->rule_dispatch = (int *) malloc((n > 0 ? n : 1) * sizeof(int));
+  if (lsys->rule_dispatch == NULL)
+  {
+    fprintf(stderr, "set_lsys_rule_dispatch: malloc failed\n");
+    return (-1);
+  }
+  /* fill in backwards, so rule_dispatch_start[i] ends up at the start of the rules of symbol i */
+  for (r = lsys->num_rules - 1; r >= 0; r--)
+  {
+    lhs = lsys->rule_list[r].lhs;
+    if (lhs->num_symbols > 0)
+    {
+      lsys->rule_dispatch[--lsys->rule_dispatch_start[lhs->symbol_list[0].symbol_index]] = r;
+    }
+    else
+    {
+      for (i = 0; i < lsys->num_symbols; i++)
+      {
+	lsys->rule_dispatch[--lsys->rule_dispatch_start[i]] = r;
+      }
+    }
+  }
+  return (0);
+}
+
+
 int arrange_lsys_arrays(LSYS *lsys)
 {
   SYMBOL_ELEMENT *se_arr = NULL, *se, *se1;
@@ -1506,6 +1586,10 @@ int arrange_lsys_arrays(LSYS *lsys)
   {
     return (-1);
   }
+  if (set_lsys_rule_dispatch(lsys) != 0)
+  {
+    return (-1);
+  }
   return (0);
 }
 
@@ -1515,6 +1599,7 @@ void init_transsys_instance_components(TRANSSYS_INSTANCE *ti)
   ti->factor_concentration = NULL;
   ti->new_concentration = NULL;
   ti->transsys = NULL;
+  ti->urandom_state = NULL;
 }
 
 
@@ -1686,6 +1771,157 @@ CELL *new_cells(int num_cells, const TRANSSYS *transsys)
 }
 
 
+/*
+ * Memory in arenas is aligned suitably for all types stored in
+ * arenas, i.e. for the strictest alignment of the members of
+ * MEM_ARENA_ALIGN.
+ */
+
+typedef union
+{
+  double d;
+  long l;
+  void *p;
+} MEM_ARENA_ALIGN;
+
+#define MEM_ARENA_ROUND(n) ((((n) + sizeof(MEM_ARENA_ALIGN) - 1) / sizeof(MEM_ARENA_ALIGN)) * sizeof(MEM_ARENA_ALIGN))
+#define MEM_ARENA_HEADER_SIZE MEM_ARENA_ROUND(sizeof(MEM_ARENA_BLOCK))
+#define MEM_ARENA_BLOCK_SIZE_MIN 65536
+
+
+void init_mem_arena(MEM_ARENA *arena)
+{
+  arena->block = NULL;
+  arena->block_size = MEM_ARENA_BLOCK_SIZE_MIN;
+  arena->num_allocations = 0;
+  arena->num_block_allocations = 0;
+}
+
+
+void free_mem_arena_components(MEM_ARENA *arena)
+{
+  MEM_ARENA_BLOCK *b;
+
+  while (arena->block)
+  {
+    b = arena->block;
+    arena->block = b->next;
+    free(b);
+  }
+}
+
+
+static MEM_ARENA_BLOCK *new_mem_arena_block(MEM_ARENA *arena, size_t size)
+{
+  MEM_ARENA_BLOCK *b;
+
+  b = (MEM_ARENA_BLOCK *) malloc(MEM_ARENA_HEADER_SIZE + size);
+  if (b == NULL)
+  {
+    return (NULL);
+  }
+  b->size = size;
+  b->used = 0;
+  b->next = arena->block;
+  arena->block = b;
+  arena->num_block_allocations++;
+  return (b);
+}
+
+
+/*
+ * Allocate size bytes from arena. When the current block is full,
+ * a new block is allocated which is at least as large as all previous
+ * blocks together, so the number of blocks grows logarithmically.
+ */
+
+void *mem_arena_alloc(MEM_ARENA *arena, size_t size)
+{
+  MEM_ARENA_BLOCK *b = arena->block;
+  void *p;
+
+  /* guard against wrapping in rounding and in the block header */
+  if (size > ((size_t) -1) - 2 * MEM_ARENA_HEADER_SIZE)
+  {
+    fprintf(stderr, "mem_arena_alloc: size %lu too large\n", (unsigned long) size);
+    return (NULL);
+  }
+  size = MEM_ARENA_ROUND(size > 0 ? size : 1);
+  if ((b == NULL) || (b->size - b->used < size))
+  {
+    b = new_mem_arena_block(arena, arena->block_size > size ? arena->block_size : size);
+    if (b == NULL)
+    {
+      fprintf(stderr, "mem_arena_alloc: malloc failed\n");
+      return (NULL);
+    }
+    arena->block_size += b->size;
+  }
+  p = ((char *) b) + MEM_ARENA_HEADER_SIZE + b->used;
+  b->used += size;
+  arena->num_allocations++;
+  return (p);
+}
+
+
+/*
+ * Release all memory allocated from arena for reuse. If the arena
+ * comprises multiple blocks, these are replaced by a single block of
+ * their total size.
+ */
+
+void reset_mem_arena(MEM_ARENA *arena)
+{
+  MEM_ARENA_BLOCK *b;
+  size_t size = 0;
+
+  if (arena->block == NULL)
+  {
+    return;
+  }
+  if (arena->block->next == NULL)
+  {
+    arena->block->used = 0;
+    return;
+  }
+  for (b = arena->block; b; b = b->next)
+  {
+    size += b->size;
+  }
+  free_mem_arena_components(arena);
+  /* upon failure, the arena is just empty */
+  new_mem_arena_block(arena, size);
+}
+
+
+void init_lsys_string_buffer(LSYS_STRING_BUFFER *buffer)
+{
+  init_mem_arena(buffer->arena);
+  init_mem_arena(buffer->arena + 1);
+  buffer->current = 1;
+}
+
+
+void free_lsys_string_buffer_components(LSYS_STRING_BUFFER *buffer)
+{
+  free_mem_arena_components(buffer->arena);
+  free_mem_arena_components(buffer->arena + 1);
+}
+
+
+/*
+ * Switch to the other arena of buffer and reset it. All strings
+ * allocated in that arena must have been freed.
+ */
+
+MEM_ARENA *lsys_string_buffer_next_arena(LSYS_STRING_BUFFER *buffer)
+{
+  buffer->current = 1 - buffer->current;
+  reset_mem_arena(buffer->arena + buffer->current);
+  return (buffer->arena + buffer->current);
+}
+
+
 void free_symbol_instance_components(SYMBOL_INSTANCE *si)
 {
   if (si->num_contact_edges > 0)
@@ -1702,10 +1938,14 @@ void free_symbol_instance_list(SYMBOL_INSTANCE *slist)
 
   while (slist)
   {
-    free_symbol_instance_components(slist);
     si = slist;
     slist = slist->next;
-    free(si);
+    /* symbol instances in arenas are freed by resetting the arena */
+    if ((si->lsys_string == NULL) || (si->lsys_string->arena == NULL))
+    {
+      free_symbol_instance_components(si);
+      free(si);
+    }
   }
 }
 
@@ -1734,11 +1974,57 @@ int extend_symbol_contact_edge_array(SYMBOL_INSTANCE *si, LSYS_STRING_CONTACT_ED
 }
 
 
+/*
+ * Allocate a symbol instance for lsys_string, with transsys instance
+ * components for transsys, in the arena of lsys_string if it has one.
+ */
+
+static SYMBOL_INSTANCE *alloc_symbol_instance(const LSYS_STRING *lsys_string, const TRANSSYS *transsys)
+{
+  SYMBOL_INSTANCE *si;
+  int i;
+
+  if (lsys_string->arena == NULL)
+  {
+    si = (SYMBOL_INSTANCE *) malloc(sizeof(SYMBOL_INSTANCE));
+    if (si == NULL)
+      return (NULL);
+    init_transsys_instance_components(&(si->transsys_instance));
+    if (alloc_transsys_instance_components(&(si->transsys_instance), transsys) != 0)
+    {
+      free(si);
+      return (NULL);
+    }
+    return (si);
+  }
+  si = (SYMBOL_INSTANCE *) mem_arena_alloc(lsys_string->arena, sizeof(SYMBOL_INSTANCE));
+  if (si == NULL)
+    return (NULL);
+  init_transsys_instance_components(&(si->transsys_instance));
+  if (transsys == NULL)
+    return (si);
+  if (transsys->num_factors > 0)
+  {
+    si->transsys_instance.factor_concentration = (double *) mem_arena_alloc(lsys_string->arena, 2 * transsys->num_factors * sizeof(double));
+    if (si->transsys_instance.factor_concentration == NULL)
+      return (NULL);
+    si->transsys_instance.new_concentration = si->transsys_instance.factor_concentration + transsys->num_factors;
+    for (i = 0; i < transsys->num_factors; i++)
+    {
+      si->transsys_instance.factor_concentration[i] = 0.0;
+      si->transsys_instance.new_concentration[i] = 0.0;
+    }
+  }
+  si->transsys_instance.transsys = transsys;
+  return (si);
+}
+
+
 SYMBOL_INSTANCE *new_symbol_instance(const LSYS_STRING *lsys_string, int symbol_index)
 {
   SYMBOL_INSTANCE *si;
 
-  si = (SYMBOL_INSTANCE *) malloc(sizeof(SYMBOL_INSTANCE));
+  si = alloc_symbol_instance(lsys_string, lsys_string->lsys->symbol_list[symbol_index].transsys);
   if (si == NULL)
     return (NULL);
   si->next = NULL;
@@ -1750,12 +2036,7 @@ SYMBOL_INSTANCE *new_symbol_instance(const LSYS_STRING *lsys_string, int symbol_
   si->successor_distance = -1;
   si->num_contact_edges = 0;
   si->contact_edge = NULL;
-  init_transsys_instance_components(&(si->transsys_instance));
-  if (alloc_transsys_instance_components(&(si->transsys_instance), lsys_string->lsys->symbol_list[symbol_index].transsys) != 0)
-  {
-    free(si);
-    return (NULL);
-  }
+  si->transsys_instance.urandom_state = lsys_string->urandom_state;
   return (si);
 }
 
@@ -1765,7 +2046,7 @@ SYMBOL_INSTANCE *clone_symbol_instance(const SYMBOL_INSTANCE *source, const LSYS
   SYMBOL_INSTANCE *si;
   int i;
 
-  si = (SYMBOL_INSTANCE *) malloc(sizeof(SYMBOL_INSTANCE));
+  si = alloc_symbol_instance(lsys_string, source->transsys_instance.transsys);
   if (si == NULL)
     return (NULL);
   si->next = NULL;
@@ -1776,13 +2057,7 @@ SYMBOL_INSTANCE *clone_symbol_instance(const SYMBOL_INSTANCE *source, const LSYS
   si->successor_distance = -1;
   si->num_contact_edges = 0;    /* contact graph must be established by caller */
   si->contact_edge = NULL;
-  init_transsys_instance_components(&(si->transsys_instance));
-  if (alloc_transsys_instance_components(&(si->transsys_instance), source->transsys_instance.transsys) != 0)
-  {
-    free(si);
-    return (NULL);
-  }
-  si->transsys_instance.transsys = source->transsys_instance.transsys;
+  si->transsys_instance.urandom_state = lsys_string->urandom_state;
   if (source->transsys_instance.transsys)
   {
     for (i = 0; i < source->transsys_instance.transsys->num_factors; i++)
@@ -1796,6 +2071,54 @@ SYMBOL_INSTANCE *clone_symbol_instance(const SYMBOL_INSTANCE *source, const LSYS
 }
 
 
+/*
+ * Initialise si, an element of the symbol array of lsys_string set up
+ * by alloc_lsys_string_symbols, as an instance of symbol symbol_index.
+ * The factor concentrations are stored in concentration, which must
+ * provide space for twice the number of factors of the symbol's
+ * transsys, or are allocated by malloc if concentration is NULL. For
+ * strings in an arena, concentration must not be NULL, so that no
+ * arena allocation is required and elements can be initialised in
+ * multiple threads.
+ */
+
+int init_symbol_instance(SYMBOL_INSTANCE *si, const LSYS_STRING *lsys_string, int symbol_index, double *concentration)
+{
+  const TRANSSYS *transsys = lsys_string->lsys->symbol_list[symbol_index].transsys;
+  int i;
+
+  if (concentration == NULL)
+  {
+    if (alloc_transsys_instance_components(&(si->transsys_instance), transsys) != 0)
+    {
+      return (-1);
+    }
+  }
+  else if (transsys != NULL)
+  {
+    if (transsys->num_factors > 0)
+    {
+      si->transsys_instance.factor_concentration = concentration;
+      si->transsys_instance.new_concentration = concentration + transsys->num_factors;
+      for (i = 0; i < transsys->num_factors; i++)
+      {
+	si->transsys_instance.factor_concentration[i] = 0.0;
+	si->transsys_instance.new_concentration[i] = 0.0;
+      }
+    }
+    si->transsys_instance.transsys = transsys;
+  }
+  si->lsys_string = lsys_string;
+  si->symbol_index = symbol_index;
+  si->rule_index = NO_INDEX;
+  si->num_successors = 0;
+  si->successor_index = NO_INDEX;
+  si->successor_distance = -1;
+  si->transsys_instance.urandom_state = lsys_string->urandom_state;
+  return (0);
+}
+
+
 void init_lsys_string_contact_graph_components(LSYS_STRING_CONTACT_GRAPH *g)
 {
   g->array_size = 0;
@@ -1833,6 +2156,11 @@ int alloc_lsys_string_contact_graph_components(LSYS_STRING_CONTACT_GRAPH *g, siz
     free_lsys_string_contact_graph_components(g);
     return (0);
   }
+  if (array_size > ((size_t) -1) / sizeof(LSYS_STRING_CONTACT_EDGE))
+  {
+    fprintf(stderr, "alloc_lsys_string_contact_graph_components: too many edges (%lu)\n", (unsigned long) array_size);
+    return (-1);
+  }
   g->edge = (LSYS_STRING_CONTACT_EDGE *) malloc(array_size * sizeof(LSYS_STRING_CONTACT_EDGE));
   if (g->edge == NULL)
   {
@@ -1883,11 +2211,121 @@ int add_lsys_string_contact_edge(LSYS_STRING_CONTACT_GRAPH *g, int i1, int i2, i
 }
 
 
+void free_lsys_string_neighbourhood(LSYS_STRING_NEIGHBOURHOOD *n)
+{
+  free(n->transsys);
+  free(n->symbol_start);
+  free(n->symbol);
+  free(n->edge_start);
+  free(n->edge);
+  free(n->neighbour_start);
+  free(n->neighbour_index);
+  free(n->neighbour_edge);
+  free(n->gradient);
+  free(n->transferred_amount);
+  free(n->mean_concentration);
+  free(n->gradient_sum);
+  free(n);
+}
+
+
+/*
+ * Allocate a neighbourhood for num_symbols symbols, num_transsys transsys
+ * groups comprising num_group_symbols symbols with neighbours and
+ * num_edges edges altogether, and num_neighbours neighbours altogether.
+ */
+LSYS_STRING_NEIGHBOURHOOD *new_lsys_string_neighbourhood(size_t num_symbols, size_t num_transsys, size_t num_group_symbols, size_t num_edges, size_t num_neighbours)
+{
+  LSYS_STRING_NEIGHBOURHOOD *n = (LSYS_STRING_NEIGHBOURHOOD *) malloc(sizeof(LSYS_STRING_NEIGHBOURHOOD));
+
+  if (n == NULL)
+  {
+    fprintf(stderr, "new_lsys_string_neighbourhood: malloc failed\n");
+    return (NULL);
+  }
+  /* arrays are allocated with at least one element so that a NULL
+     pointer always indicates failure */
+  n->num_transsys = num_transsys;
+  n->transsys = (const TRANSSYS **) malloc((num_transsys > 0 ? num_transsys : 1) * sizeof(const TRANSSYS *));
+  n->symbol_start = (size_t *) malloc((num_transsys + 1) * sizeof(size_t));
+  n->symbol = (int *) malloc((num_group_symbols > 0 ? num_group_symbols : 1) * sizeof(int));
+  n->edge_start = (size_t *) malloc((num_transsys + 1) * sizeof(size_t));
+  n->edge = (LSYS_STRING_CONTACT_EDGE **) malloc((num_edges > 0 ? num_edges : 1) * sizeof(LSYS_STRING_CONTACT_EDGE *));
+  n->neighbour_start = (size_t *) malloc((num_symbols + 1) * sizeof(size_t));
+  n->neighbour_index = (int *) malloc((num_neighbours > 0 ? num_neighbours : 1) * sizeof(int));
+  n->neighbour_edge = (LSYS_STRING_CONTACT_EDGE **) malloc((num_neighbours > 0 ? num_neighbours : 1) * sizeof(LSYS_STRING_CONTACT_EDGE *));
+  n->gradient = (double *) malloc((num_neighbours > 0 ? num_neighbours : 1) * sizeof(double));
+  n->transferred_amount = (double *) malloc((num_neighbours > 0 ? num_neighbours : 1) * sizeof(double));
+  n->mean_concentration = (double *) malloc((num_group_symbols > 0 ? num_group_symbols : 1) * sizeof(double));
+  n->gradient_sum = (double *) malloc((num_group_symbols > 0 ? num_group_symbols : 1) * sizeof(double));
+  if ((n->transsys == NULL) || (n->symbol_start == NULL) || (n->symbol == NULL)
+      || (n->edge_start == NULL) || (n->edge == NULL)
+      || (n->neighbour_start == NULL) || (n->neighbour_index == NULL) || (n->neighbour_edge == NULL)
+      || (n->gradient == NULL) || (n->transferred_amount == NULL)
+      || (n->mean_concentration == NULL) || (n->gradient_sum == NULL))
+  {
+    fprintf(stderr, "new_lsys_string_neighbourhood: malloc failed\n");
+    free_lsys_string_neighbourhood(n);
+    return (NULL);
+  }
+  return (n);
+}
+
+
+/*
+ * Allocate the contact graph of lstr for num_edges edges, in the
+ * arena of lstr if it has one.
+ */
+
+int alloc_lsys_string_contact_edges(LSYS_STRING *lstr, size_t num_edges)
+{
+  LSYS_STRING_CONTACT_GRAPH *g = &(lstr->contact_graph);
+
+  if (lstr->arena == NULL)
+  {
+    return (alloc_lsys_string_contact_graph_components(g, num_edges));
+  }
+  if (g->array_size > 0)
+  {
+    fprintf(stderr, "alloc_lsys_string_contact_edges: array already present\n");
+    return (-1);
+  }
+  if (num_edges == 0)
+  {
+    return (0);
+  }
+  if (num_edges > ((size_t) -1) / sizeof(LSYS_STRING_CONTACT_EDGE))
+  {
+    fprintf(stderr, "alloc_lsys_string_contact_edges: too many edges (%lu)\n", (unsigned long) num_edges);
+    return (-1);
+  }
+  g->edge = (LSYS_STRING_CONTACT_EDGE *) mem_arena_alloc(lstr->arena, num_edges * sizeof(LSYS_STRING_CONTACT_EDGE));
+  if (g->edge == NULL)
+  {
+    fprintf(stderr, "alloc_lsys_string_contact_edges: mem_arena_alloc failed\n");
+    return (-1);
+  }
+  g->array_size = num_edges;
+  g->num_edges = 0;
+  return (0);
+}
+
+
 int connect_lsys_string_symbols(LSYS_STRING *lstr, int i1, int i2, int distance)
 {
   SYMBOL_INSTANCE *s1 = lstr->symbol + i1, *s2 = lstr->symbol + i2;
   LSYS_STRING_CONTACT_EDGE *edge;
 
+  if (lstr->arena != NULL)
+  {
+    fprintf(stderr, "connect_lsys_string_symbols: cannot extend contact edge arrays in arena\n");
+    return (-1);
+  }
+  if (lstr->neighbourhood != NULL)
+  {
+    free_lsys_string_neighbourhood(lstr->neighbourhood);
+    lstr->neighbourhood = NULL;
+  }
   if (add_lsys_string_contact_edge(&(lstr->contact_graph), i1, i2, distance) != 0)
   {
     return (-1);
@@ -1909,10 +2347,92 @@ int connect_lsys_string_symbols(LSYS_STRING *lstr, int i1, int i2, int distance)
 }
 
 
+/*
+ * Set up the contact edge arrays of all symbols of lstr from the
+ * edges in the contact graph of lstr, so that each symbol refers to
+ * its edges in the order in which they appear in the contact graph.
+ * This is equivalent to connecting each edge individually using
+ * connect_lsys_string_symbols, but each symbol's array is allocated
+ * only once, or, for strings in an arena, the arrays of all symbols
+ * are parts of one array. The symbols must not have any contact edges
+ * yet.
+ */
+
+int connect_lsys_string_contact_graph(LSYS_STRING *lstr)
+{
+  LSYS_STRING_CONTACT_EDGE *edge, **edge_array = NULL;
+  SYMBOL_INSTANCE *s1, *s2;
+  size_t e, i, j;
+
+  if (lstr->neighbourhood != NULL)
+  {
+    free_lsys_string_neighbourhood(lstr->neighbourhood);
+    lstr->neighbourhood = NULL;
+  }
+  for (e = 0; e < lstr->contact_graph.num_edges; e++)
+  {
+    edge = lstr->contact_graph.edge + e;
+    lstr->symbol[edge->i1].num_contact_edges++;
+    lstr->symbol[edge->i2].num_contact_edges++;
+  }
+  if ((lstr->arena != NULL) && (lstr->contact_graph.num_edges > 0))
+  {
+    edge_array = (LSYS_STRING_CONTACT_EDGE **) mem_arena_alloc(lstr->arena, 2 * lstr->contact_graph.num_edges * sizeof(LSYS_STRING_CONTACT_EDGE *));
+    if (edge_array == NULL)
+    {
+      fprintf(stderr, "connect_lsys_string_contact_graph: mem_arena_alloc failed\n");
+      return (-1);
+    }
+  }
+  for (i = 0; i < lstr->num_symbols; i++)
+  {
+    if ((lstr->symbol[i].num_contact_edges > 0) && (edge_array != NULL))
+    {
+      lstr->symbol[i].contact_edge = edge_array;
+      edge_array += lstr->symbol[i].num_contact_edges;
+    }
+    else if (lstr->symbol[i].num_contact_edges > 0)
+    {
+      lstr->symbol[i].contact_edge = (LSYS_STRING_CONTACT_EDGE **) malloc(lstr->symbol[i].num_contact_edges * sizeof(LSYS_STRING_CONTACT_EDGE *));
+      if (lstr->symbol[i].contact_edge == NULL)
+      {
+	fprintf(stderr, "connect_lsys_string_contact_graph: malloc failed\n");
+	for (j = i; j < lstr->num_symbols; j++)
+	{
+	  lstr->symbol[j].num_contact_edges = 0;
+	}
+	return (-1);
+      }
+    }
+  }
+  for (i = 0; i < lstr->num_symbols; i++)
+  {
+    lstr->symbol[i].num_contact_edges = 0;
+  }
+  for (e = 0; e < lstr->contact_graph.num_edges; e++)
+  {
+    edge = lstr->contact_graph.edge + e;
+    s1 = lstr->symbol + edge->i1;
+    s2 = lstr->symbol + edge->i2;
+    s1->contact_edge[s1->num_contact_edges++] = edge;
+    s2->contact_edge[s2->num_contact_edges++] = edge;
+  }
+  return (0);
+}
+
+
 void free_lsys_string(LSYS_STRING *lstr)
 {
   size_t i;
 
+  if (lstr->neighbourhood != NULL)
+  {
+    free_lsys_string_neighbourhood(lstr->neighbourhood);
+  }
+  if (lstr->arena != NULL)
+  {
+    return;
+  }
   free_lsys_string_contact_graph_components(&(lstr->contact_graph));
   if (lstr->arrayed)
   {
@@ -1952,7 +2472,14 @@ int arrange_lsys_string_arrays(LSYS_STRING *lstr)
   }
   if (lstr->num_symbols > 0)
   {
-    si_arr = (SYMBOL_INSTANCE *) malloc(lstr->num_symbols * sizeof(SYMBOL_INSTANCE));
+    if (lstr->arena)
+    {
+      si_arr = (SYMBOL_INSTANCE *) mem_arena_alloc(lstr->arena, lstr->num_symbols * sizeof(SYMBOL_INSTANCE));
+    }
+    else
+    {
+      si_arr = (SYMBOL_INSTANCE *) malloc(lstr->num_symbols * sizeof(SYMBOL_INSTANCE));
+    }
     if (si_arr == NULL)
     {
       return (-1);
@@ -1964,7 +2491,10 @@ int arrange_lsys_string_arrays(LSYS_STRING *lstr)
       si_arr[i].next = NULL;
       si1 = si;
       si = si->next;
-      free(si1);
+      if (lstr->arena == NULL)
+      {
+	free(si1);
+      }
     }
     for (i = 1; i < lstr->num_symbols; i++)
     {
@@ -1982,20 +2512,94 @@ int arrange_lsys_string_arrays(LSYS_STRING *lstr)
 }
 
 
-LSYS_STRING *new_lsys_string(const LSYS *lsys)
+/*
+ * Allocate an array of num_symbols symbols for the empty lsys string
+ * lstr, in the arena of lstr if it has one, and make lstr arrayed.
+ * The symbols are linked, have no contact edges and no transsys
+ * instance components, and are to be set up by init_symbol_instance.
+ */
+
+int alloc_lsys_string_symbols(LSYS_STRING *lstr, size_t num_symbols)
+{
+  SYMBOL_INSTANCE *si_arr;
+  size_t i;
+
+  if (lstr->arrayed || (lstr->symbol != NULL))
+  {
+    fprintf(stderr, "alloc_lsys_string_symbols: lsys string not empty\n");
+    return (-1);
+  }
+  if (num_symbols > ((size_t) -1) / sizeof(SYMBOL_INSTANCE))
+  {
+    fprintf(stderr, "alloc_lsys_string_symbols: too many symbols (%lu)\n", (unsigned long) num_symbols);
+    return (-1);
+  }
+  if (num_symbols > 0)
+  {
+    if (lstr->arena)
+    {
+      si_arr = (SYMBOL_INSTANCE *) mem_arena_alloc(lstr->arena, num_symbols * sizeof(SYMBOL_INSTANCE));
+    }
+    else
+    {
+      si_arr = (SYMBOL_INSTANCE *) malloc(num_symbols * sizeof(SYMBOL_INSTANCE));
+    }
+    if (si_arr == NULL)
+    {
+      fprintf(stderr, "alloc_lsys_string_symbols: allocation failed\n");
+      return (-1);
+    }
+    for (i = 0; i < num_symbols; i++)
+    {
+      si_arr[i].next = (i + 1 < num_symbols) ? si_arr + i + 1 : NULL;
+      si_arr[i].lsys_string = lstr;
+      si_arr[i].num_contact_edges = 0;
+      si_arr[i].contact_edge = NULL;
+      init_transsys_instance_components(&(si_arr[i].transsys_instance));
+    }
+    lstr->symbol = si_arr;
+  }
+  lstr->num_symbols = num_symbols;
+  lstr->arrayed = 1;
+  return (0);
+}
+
+
+/*
+ * Create an empty lsys string, which is allocated in arena
+ * unless arena is NULL.
+ */
+
+LSYS_STRING *new_lsys_string_arena(const LSYS *lsys, MEM_ARENA *arena)
 {
   LSYS_STRING *lstr;
 
-  lstr = (LSYS_STRING *) malloc(sizeof(LSYS_STRING));
+  if (arena)
+  {
+    lstr = (LSYS_STRING *) mem_arena_alloc(arena, sizeof(LSYS_STRING));
+  }
+  else
+  {
+    lstr = (LSYS_STRING *) malloc(sizeof(LSYS_STRING));
+  }
   if (lstr == NULL)
   {
     return (NULL);
   }
   lstr->lsys = lsys;
+  lstr->urandom_state = NULL;
   lstr->num_symbols = 0;
   lstr->arrayed = 0;
   lstr->symbol = NULL;
   init_lsys_string_contact_graph_components(&(lstr->contact_graph));
+  lstr->neighbourhood = NULL;
+  lstr->arena = arena;
   return (lstr);
 }
 
+
+LSYS_STRING *new_lsys_string(const LSYS *lsys)
+{
+  return (new_lsys_string_arena(lsys, NULL));
+}
+
@@ -0,0 +1,654 @@
+/* Copyright (C) 2001 Jan T. Kim <kim@inb.mu-luebeck.de> */
+
+/*
+ * $Id$
+ */
+
+#include <limits.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "trconfig.h"
+#include "trtypes.h"
+#include "transsys.h"
+
+
+/*
+ * Binary snapshots of lsys strings, for checkpointing derivations and
+ * for resuming (or forking) them later on. A snapshot comprises:
+ *
+ *   magic               8 bytes, "TRLSNAP" and a terminating 0 byte
+ *   format version      uint32
+ *   lsys name           uint32 length, followed by the characters
+ *   lsys symbols        uint32 number of symbols, followed by the
+ *                       uint32 number of factors of each symbol
+ *   time step           uint64
+ *   random generator    uint32 flag, if nonzero followed by the table
+ *                       (URANDOM_STATE_DEGREE uint32 values), uint32
+ *                       front and rear, uint32 gauss_available and
+ *                       double gauss_value
+ *   symbols             uint64 number of symbols, followed by the
+ *                       uint32 symbol index and the factor
+ *                       concentrations (doubles) of each symbol
+ *   contact graph       uint64 number of edges, followed by uint32 i1,
+ *                       uint32 i2 and int32 distance of each edge
+ *
+ * All integers are stored in little endian byte order, signed ones in
+ * two's complement. Doubles are stored as their IEEE 754 bytes in
+ * little endian order, so they are restored exactly. The symbols of
+ * the lsys are stored only to check that a snapshot fits the lsys it
+ * is read for. Rule indices, successor information, new concentrations
+ * and amounts diffused are not stored, as they are set up anew in each
+ * derivation step.
+ */
+
+#define LSYS_STRING_SNAPSHOT_VERSION 1
+
+static const char lsys_string_snapshot_magic[8] = "TRLSNAP";
+
+
+static int host_is_little_endian(void)
+{
+  unsigned long one = 1;
+
+  return (*((const unsigned char *) &one) == 1);
+}
+
+
+static int write_snapshot_uint(FILE *f, unsigned long x, int num_bytes)
+{
+  int i;
+
+  for (i = 0; i < num_bytes; i++)
+  {
+    if (putc((int) (x & 0xff), f) == EOF)
+    {
+      return (-1);
+    }
+    x >>= 8;
+  }
+  return (0);
+}
+
+
+static int write_snapshot_uint32(FILE *f, unsigned long x)
+{
+  return (write_snapshot_uint(f, x & 0xffffffffUL, 4));
+}
+
+
+static int write_snapshot_int32(FILE *f, long x)
+{
+  return (write_snapshot_uint32(f, (unsigned long) x));
+}
+
+
+static int write_snapshot_uint64(FILE *f, unsigned long x)
+{
+  return (write_snapshot_uint(f, x, 8));
+}
+
+
+static int write_snapshot_double(FILE *f, double x)
+{
+  unsigned char b[sizeof(double)];
+  size_t i;
+
+  memcpy(b, &x, sizeof(double));
+  if (host_is_little_endian())
+  {
+    return ((fwrite(b, 1, sizeof(double), f) == sizeof(double)) ? 0 : -1);
+  }
+  for (i = sizeof(double); i > 0; i--)
+  {
+    if (putc(b[i - 1], f) == EOF)
+    {
+      return (-1);
+    }
+  }
+  return (0);
+}
+
+
+/*
+ * Values that do not fit into an unsigned long are an error, as
+ * are unexpected ends of file.
+ */
+
+static int read_snapshot_uint(FILE *f, unsigned long *x, int num_bytes)
+{
+  unsigned char b[8];
+  int i;
+
+  if (fread(b, 1, num_bytes, f) != (size_t) num_bytes)
+  {
+    return (-1);
+  }
+  *x = 0;
+  for (i = num_bytes; i > 0; i--)
+  {
+    if (*x > (ULONG_MAX >> 8))
+    {
+      return (-1);
+    }
+    *x = (*x << 8) | b[i - 1];
+  }
+  return (0);
+}
+
+
+static int read_snapshot_uint32(FILE *f, unsigned long *x)
+{
+  return (read_snapshot_uint(f, x, 4));
+}
+
+
+static int read_snapshot_int32(FILE *f, long *x)
+{
+  unsigned long u;
+
+  if (read_snapshot_uint32(f, &u) != 0)
+  {
+    return (-1);
+  }
+  if (u & 0x80000000UL)
+  {
+    *x = -1 - (long) (0xffffffffUL - u);
+  }
+  else
+  {
+    *x = (long) u;
+  }
+  return (0);
+}
+
+
+static int read_snapshot_uint64(FILE *f, unsigned long *x)
+{
+  return (read_snapshot_uint(f, x, 8));
+}
+
+
+/*
+ * Determine the number of bytes remaining in f. Returns -1 if f is
+ * not seekable.
+ */
+
+static int snapshot_bytes_remaining(FILE *f, unsigned long *remaining)
+{
+  long pos, end;
+
+  pos = ftell(f);
+  if ((pos < 0) || (fseek(f, 0, SEEK_END) != 0))
+  {
+    return (-1);
+  }
+  end = ftell(f);
+  if (fseek(f, pos, SEEK_SET) != 0)
+  {
+    return (-1);
+  }
+  *remaining = (end > pos) ? (unsigned long) (end - pos) : 0;
+  return (0);
+}
+
+
+static int read_snapshot_double(FILE *f, double *x)
+{
+  unsigned char b[sizeof(double)], c;
+  size_t i;
+
+  if (fread(b, 1, sizeof(double), f) != sizeof(double))
+  {
+    return (-1);
+  }
+  if (!host_is_little_endian())
+  {
+    for (i = 0; i < sizeof(double) / 2; i++)
+    {
+      c = b[i];
+      b[i] = b[sizeof(double) - 1 - i];
+      b[sizeof(double) - 1 - i] = c;
+    }
+  }
+  memcpy(x, b, sizeof(double));
+  return (0);
+}
+
+
+static int symbol_num_factors(const LSYS *lsys, int symbol_index)
+{
+  const TRANSSYS *transsys = lsys->symbol_list[symbol_index].transsys;
+
+  return ((transsys != NULL) ? transsys->num_factors : 0);
+}
+
+
+static int write_snapshot_urandom_state(FILE *f, const URANDOM_STATE *urandom_state)
+{
+  int i;
+
+  for (i = 0; i < URANDOM_STATE_DEGREE; i++)
+  {
+    if (write_snapshot_uint32(f, urandom_state->table[i]) != 0)
+    {
+      return (-1);
+    }
+  }
+  if (write_snapshot_uint32(f, urandom_state->front) != 0)
+  {
+    return (-1);
+  }
+  if (write_snapshot_uint32(f, urandom_state->rear) != 0)
+  {
+    return (-1);
+  }
+  if (write_snapshot_uint32(f, urandom_state->gauss_available) != 0)
+  {
+    return (-1);
+  }
+  return (write_snapshot_double(f, urandom_state->gauss_value));
+}
+
+
+static int read_snapshot_urandom_state(FILE *f, URANDOM_STATE *urandom_state)
+{
+  unsigned long front, rear, gauss_available;
+  int i;
+
+  for (i = 0; i < URANDOM_STATE_DEGREE; i++)
+  {
+    if (read_snapshot_uint32(f, urandom_state->table + i) != 0)
+    {
+      return (-1);
+    }
+  }
+  if (read_snapshot_uint32(f, &front) != 0)
+  {
+    return (-1);
+  }
+  if (read_snapshot_uint32(f, &rear) != 0)
+  {
+    return (-1);
+  }
+  if (read_snapshot_uint32(f, &gauss_available) != 0)
+  {
+    return (-1);
+  }
+  if ((front >= URANDOM_STATE_DEGREE) || (rear >= URANDOM_STATE_DEGREE))
+  {
+    fprintf(stderr, "read_lsys_string_snapshot: invalid random number generator state\n");
+    return (-1);
+  }
+  urandom_state->front = front;
+  urandom_state->rear = rear;
+  urandom_state->gauss_available = (gauss_available != 0);
+  return (read_snapshot_double(f, &(urandom_state->gauss_value)));
+}
+
+
+/*
+ * Write a snapshot of lstr at time step timestep to f. The state of
+ * the random number generator of lstr is included, unless lstr uses
+ * the global generator.
+ */
+
+int write_lsys_string_snapshot(FILE *f, const LSYS_STRING *lstr, unsigned long timestep)
+{
+  const LSYS *lsys = lstr->lsys;
+  const SYMBOL_INSTANCE *si;
+  const LSYS_STRING_CONTACT_EDGE *edge;
+  size_t i, e;
+  int s, n, return_value = 0;
+
+  if (!lstr->arrayed)
+  {
+    fprintf(stderr, "write_lsys_string_snapshot: cannot write non-arrayed string\n");
+    return (-1);
+  }
+  return_value |= (fwrite(lsys_string_snapshot_magic, 1, sizeof(lsys_string_snapshot_magic), f) != sizeof(lsys_string_snapshot_magic));
+  return_value |= write_snapshot_uint32(f, LSYS_STRING_SNAPSHOT_VERSION);
+  n = strlen(lsys->name);
+  return_value |= write_snapshot_uint32(f, n);
+  return_value |= (fwrite(lsys->name, 1, n, f) != (size_t) n);
+  return_value |= write_snapshot_uint32(f, lsys->num_symbols);
+  for (s = 0; s < lsys->num_symbols; s++)
+  {
+    return_value |= write_snapshot_uint32(f, symbol_num_factors(lsys, s));
+  }
+  return_value |= write_snapshot_uint64(f, timestep);
+  return_value |= write_snapshot_uint32(f, lstr->urandom_state != NULL);
+  if (lstr->urandom_state != NULL)
+  {
+    return_value |= write_snapshot_urandom_state(f, lstr->urandom_state);
+  }
+  return_value |= write_snapshot_uint64(f, lstr->num_symbols);
+  for (i = 0; (i < lstr->num_symbols) && (return_value == 0); i++)
+  {
+    si = lstr->symbol + i;
+    return_value |= write_snapshot_uint32(f, si->symbol_index);
+    n = symbol_num_factors(lsys, si->symbol_index);
+    for (s = 0; s < n; s++)
+    {
+      return_value |= write_snapshot_double(f, si->transsys_instance.factor_concentration[s]);
+    }
+  }
+  return_value |= write_snapshot_uint64(f, lstr->contact_graph.num_edges);
+  for (e = 0; (e < lstr->contact_graph.num_edges) && (return_value == 0); e++)
+  {
+    edge = lstr->contact_graph.edge + e;
+    return_value |= write_snapshot_uint32(f, edge->i1);
+    return_value |= write_snapshot_uint32(f, edge->i2);
+    return_value |= write_snapshot_int32(f, edge->distance);
+  }
+  if (return_value != 0)
+  {
+    fprintf(stderr, "write_lsys_string_snapshot: write error\n");
+    return (-1);
+  }
+  return (0);
+}
+
+
+static int read_snapshot_header(FILE *f, const LSYS *lsys)
+{
+  char magic[sizeof(lsys_string_snapshot_magic)], name[IDENTIFIER_MAX];
+  unsigned long version, n, num_factors;
+  int s;
+
+  if ((fread(magic, 1, sizeof(magic), f) != sizeof(magic)) || memcmp(magic, lsys_string_snapshot_magic, sizeof(magic)))
+  {
+    fprintf(stderr, "read_lsys_string_snapshot: not an lsys string snapshot\n");
+    return (-1);
+  }
+  if (read_snapshot_uint32(f, &version) != 0)
+  {
+    return (-1);
+  }
+  if (version != LSYS_STRING_SNAPSHOT_VERSION)
+  {
+    fprintf(stderr, "read_lsys_string_snapshot: unsupported snapshot version %lu\n", version);
+    return (-1);
+  }
+  if (read_snapshot_uint32(f, &n) != 0)
+  {
+    return (-1);
+  }
+  if ((n >= IDENTIFIER_MAX) || (fread(name, 1, n, f) != n))
+  {
+    fprintf(stderr, "read_lsys_string_snapshot: bad lsys name\n");
+    return (-1);
+  }
+  name[n] = '\0';
+  if (strcmp(name, lsys->name))
+  {
+    fprintf(stderr, "read_lsys_string_snapshot: snapshot of lsys \"%s\" cannot be read for lsys \"%s\"\n", name, lsys->name);
+    return (-1);
+  }
+  if (read_snapshot_uint32(f, &n) != 0)
+  {
+    return (-1);
+  }
+  if (n != (unsigned long) lsys->num_symbols)
+  {
+    fprintf(stderr, "read_lsys_string_snapshot: snapshot has %lu symbols, lsys \"%s\" has %d\n", n, lsys->name, lsys->num_symbols);
+    return (-1);
+  }
+  for (s = 0; s < lsys->num_symbols; s++)
+  {
+    if (read_snapshot_uint32(f, &num_factors) != 0)
+    {
+      return (-1);
+    }
+    if (num_factors != (unsigned long) symbol_num_factors(lsys, s))
+    {
+      fprintf(stderr, "read_lsys_string_snapshot: number of factors of symbol \"%s\" does not match\n", lsys->symbol_list[s].name);
+      return (-1);
+    }
+  }
+  return (0);
+}
+
+
+static int read_snapshot_symbols(FILE *f, LSYS_STRING *lstr)
+{
+  const LSYS *lsys = lstr->lsys;
+  SYMBOL_INSTANCE *si;
+  double *concentration;
+  unsigned long symbol_index;
+  size_t i;
+  int s, n;
+
+  for (i = 0; i < lstr->num_symbols; i++)
+  {
+    si = lstr->symbol + i;
+    if (read_snapshot_uint32(f, &symbol_index) != 0)
+    {
+      return (-1);
+    }
+    if (symbol_index >= (unsigned long) lsys->num_symbols)
+    {
+      fprintf(stderr, "read_lsys_string_snapshot: invalid symbol index %lu\n", symbol_index);
+      return (-1);
+    }
+    n = symbol_num_factors(lsys, (int) symbol_index);
+    concentration = NULL;
+    if ((lstr->arena != NULL) && (n > 0))
+    {
+      concentration = (double *) mem_arena_alloc(lstr->arena, 2 * n * sizeof(double));
+      if (concentration == NULL)
+      {
+	fprintf(stderr, "read_lsys_string_snapshot: mem_arena_alloc failed\n");
+	return (-1);
+      }
+    }
+    if (init_symbol_instance(si, lstr, (int) symbol_index, concentration) != 0)
+    {
+      fprintf(stderr, "read_lsys_string_snapshot: init_symbol_instance failed\n");
+      return (-1);
+    }
+    for (s = 0; s < n; s++)
+    {
+      if (read_snapshot_double(f, si->transsys_instance.factor_concentration + s) != 0)
+      {
+	return (-1);
+      }
+    }
+  }
+  return (0);
+}
+
+
+static int read_snapshot_contact_graph(FILE *f, LSYS_STRING *lstr)
+{
+  unsigned long num_edges, remaining, e, i1, i2;
+  long distance;
+
+  if (read_snapshot_uint64(f, &num_edges) != 0)
+  {
+    return (-1);
+  }
+  /* edges connect distinct pairs of symbols, and each takes 12 bytes in the file */
+  if (((double) num_edges > 0.5 * (double) lstr->num_symbols * (double) (lstr->num_symbols > 0 ? lstr->num_symbols - 1 : 0))
+      || ((snapshot_bytes_remaining(f, &remaining) == 0) && (num_edges > remaining / 12)))
+  {
+    fprintf(stderr, "read_lsys_string_snapshot: bad number of contact edges (%lu) for %lu symbols\n", num_edges, (unsigned long) lstr->num_symbols);
+    return (-1);
+  }
+  if (alloc_lsys_string_contact_edges(lstr, num_edges) != 0)
+  {
+    fprintf(stderr, "read_lsys_string_snapshot: alloc_lsys_string_contact_edges failed\n");
+    return (-1);
+  }
+  for (e = 0; e < num_edges; e++)
+  {
+    if ((read_snapshot_uint32(f, &i1) != 0) || (read_snapshot_uint32(f, &i2) != 0) || (read_snapshot_int32(f, &distance) != 0))
+    {
+      return (-1);
+    }
+    if ((i1 >= lstr->num_symbols) || (i2 >= lstr->num_symbols))
+    {
+      fprintf(stderr, "read_lsys_string_snapshot: invalid contact edge %lu -- %lu\n", i1, i2);
+      return (-1);
+    }
+    if (add_lsys_string_contact_edge(&(lstr->contact_graph), (int) i1, (int) i2, (int) distance) != 0)
+    {
+      return (-1);
+    }
+  }
+  return (connect_lsys_string_contact_graph(lstr));
+}
+
+
+/*
+ * Read a snapshot of a string of lsys from f, allocating the string
+ * in arena unless arena is NULL, and set *timestep to the time step
+ * of the snapshot. If the snapshot contains the state of a random
+ * number generator and urandom_state is not NULL, the state is restored
+ * to urandom_state, and the string uses urandom_state. Otherwise, the
+ * string uses the global random number generator.
+ */
+
+LSYS_STRING *read_lsys_string_snapshot(FILE *f, const LSYS *lsys, URANDOM_STATE *urandom_state, MEM_ARENA *arena, unsigned long *timestep)
+{
+  LSYS_STRING *lstr;
+  URANDOM_STATE snapshot_urandom_state;
+  unsigned long has_urandom_state, num_symbols;
+
+  if (read_snapshot_header(f, lsys) != 0)
+  {
+    fprintf(stderr, "read_lsys_string_snapshot: failed to read header\n");
+    return (NULL);
+  }
+  if ((read_snapshot_uint64(f, timestep) != 0) || (read_snapshot_uint32(f, &has_urandom_state) != 0))
+  {
+    fprintf(stderr, "read_lsys_string_snapshot: failed to read header\n");
+    return (NULL);
+  }
+  if (has_urandom_state)
+  {
+    if (read_snapshot_urandom_state(f, &snapshot_urandom_state) != 0)
+    {
+      fprintf(stderr, "read_lsys_string_snapshot: failed to read random number generator state\n");
+      return (NULL);
+    }
+  }
+  if ((read_snapshot_uint64(f, &num_symbols) != 0) || (num_symbols > INT_MAX))
+  {
+    fprintf(stderr, "read_lsys_string_snapshot: bad number of symbols\n");
+    return (NULL);
+  }
+  lstr = new_lsys_string_arena(lsys, arena);
+  if (lstr == NULL)
+  {
+    fprintf(stderr, "read_lsys_string_snapshot: new_lsys_string_arena failed\n");
+    return (NULL);
+  }
+  if (has_urandom_state && (urandom_state != NULL))
+  {
+    *urandom_state = snapshot_urandom_state;
+    lstr->urandom_state = urandom_state;
+  }
+  if (alloc_lsys_string_symbols(lstr, num_symbols) != 0)
+  {
+    fprintf(stderr, "read_lsys_string_snapshot: alloc_lsys_string_symbols failed\n");
+    free_lsys_string(lstr);
+    return (NULL);
+  }
+  if (read_snapshot_symbols(f, lstr) != 0)
+  {
+    fprintf(stderr, "read_lsys_string_snapshot: failed to read symbols\n");
+    free_lsys_string(lstr);
+    return (NULL);
+  }
+  if (read_snapshot_contact_graph(f, lstr) != 0)
+  {
+    fprintf(stderr, "read_lsys_string_snapshot: failed to read contact graph\n");
+    free_lsys_string(lstr);
+    return (NULL);
+  }
+  return (lstr);
+}
+
+
+/*
+ * Save a snapshot to the file filename. The snapshot is written to a
+ * temporary file which then replaces filename, so a previous snapshot
+ * in filename is kept intact if writing fails.
+ */
+
+int save_lsys_string_snapshot(const char *filename, const LSYS_STRING *lstr, unsigned long timestep)
+{
+  char *tmp_filename;
+  FILE *f;
+  int return_value;
+
+  tmp_filename = (char *) malloc(strlen(filename) + 5);
+  if (tmp_filename == NULL)
+  {
+    fprintf(stderr, "save_lsys_string_snapshot: malloc failed\n");
+    return (-1);
+  }
+  sprintf(tmp_filename, "%s.tmp", filename);
+  f = fopen(tmp_filename, "wb");
+  if (f == NULL)
+  {
+    fprintf(stderr, "save_lsys_string_snapshot: failed to open \"%s\"\n", tmp_filename);
+    free(tmp_filename);
+    return (-1);
+  }
+  return_value = write_lsys_string_snapshot(f, lstr, timestep);
+  if (fclose(f) != 0)
+  {
+    fprintf(stderr, "save_lsys_string_snapshot: failed to close \"%s\"\n", tmp_filename);
+    return_value = -1;
+  }
+  if ((return_value == 0) && (rename(tmp_filename, filename) != 0))
+  {
+    fprintf(stderr, "save_lsys_string_snapshot: failed to rename \"%s\" to \"%s\"\n", tmp_filename, filename);
+    return_value = -1;
+  }
+  if (return_value != 0)
+  {
+    remove(tmp_filename);
+  }
+  free(tmp_filename);
+  return (return_value);
+}
+
+
+LSYS_STRING *load_lsys_string_snapshot(const char *filename, const LSYS *lsys, URANDOM_STATE *urandom_state, MEM_ARENA *arena, unsigned long *timestep)
+{
+  LSYS_STRING *lstr;
+  FILE *f;
+
+  f = fopen(filename, "rb");
+  if (f == NULL)
+  {
+    fprintf(stderr, "load_lsys_string_snapshot: failed to open \"%s\"\n", filename);
+    return (NULL);
+  }
+  lstr = read_lsys_string_snapshot(f, lsys, urandom_state, arena, timestep);
+  fclose(f);
+  return (lstr);
+}
+
+
+/*
+ * Make lstr and its symbols use urandom_state, or the global random
+ * number generator if urandom_state is NULL, e.g. to continue a
+ * derivation resumed from a snapshot with a different random number
+ * sequence.
+ */
+
+void set_lsys_string_urandom_state(LSYS_STRING *lstr, URANDOM_STATE *urandom_state)
+{
+  SYMBOL_INSTANCE *si;
+
+  lstr->urandom_state = urandom_state;
+  for (si = lstr->symbol; si; si = si->next)
+  {
+    si->transsys_instance.urandom_state = urandom_state;
+  }
+}
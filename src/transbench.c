@@ -0,0 +1,237 @@
+/* Copyright (C) 2001 Jan T. Kim <kim@inb.mu-luebeck.de> */
+
+/*
+ * $Id$
+ *
+ * Benchmark of expression evaluation: time series are computed by
+ * process_expression, which evaluates the expression trees, and by
+ * process_expression_bytecode, and results are checked for identity.
+ */
+
+#include <getopt.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#include "trconfig.h"
+#include "trtypes.h"
+#include "transsys.h"
+
+
+static int run_timeseries(TRANSSYS_INSTANCE *ti, const TRANSSYS_BYTECODE *bc, double *value, unsigned long num_timesteps)
+{
+  unsigned long t;
+
+  for (t = 0; t < num_timesteps; t++)
+  {
+    if (bc)
+    {
+      if (process_expression_bytecode(ti, bc, value) != 0)
+      {
+	return (-1);
+      }
+    }
+    else
+    {
+      if (process_expression(ti) != 0)
+      {
+	return (-1);
+      }
+    }
+  }
+  return (0);
+}
+
+
+/*
+ * Run num_repeats time series of num_timesteps steps, all starting with
+ * uniform factor concentration factorconc_init and with random number
+ * generator seeded with rndseed. The final concentrations of the last
+ * repeat are stored in final_concentration. Returns the CPU time used,
+ * or a negative value upon failure.
+ */
+
+static double benchmark(const TRANSSYS *tr, const TRANSSYS_BYTECODE *bc, unsigned long num_timesteps, int num_repeats, unsigned int rndseed, double factorconc_init, double *final_concentration)
+{
+  TRANSSYS_INSTANCE ti;
+  URANDOM_STATE urandom_state;
+  double *value = NULL;
+  clock_t c;
+  int r, i;
+
+  init_transsys_instance_components(&ti);
+  if (alloc_transsys_instance_components(&ti, tr) != 0)
+  {
+    fprintf(stderr, "benchmark: alloc_transsys_instance_components failed\n");
+    return (-1.0);
+  }
+  if (bc)
+  {
+    value = new_bytecode_registers(bc);
+    if (value == NULL)
+    {
+      fprintf(stderr, "benchmark: new_bytecode_registers failed\n");
+      free_transsys_instance_components(&ti);
+      return (-1.0);
+    }
+  }
+  c = clock();
+  for (r = 0; r < num_repeats; r++)
+  {
+    for (i = 0; i < tr->num_factors; i++)
+    {
+      ti.factor_concentration[i] = factorconc_init;
+    }
+    urandom_state_seed(&urandom_state, rndseed);
+    ti.urandom_state = &urandom_state;
+    if (run_timeseries(&ti, bc, value, num_timesteps) != 0)
+    {
+      fprintf(stderr, "benchmark: run_timeseries failed\n");
+      if (value)
+      {
+	free(value);
+      }
+      free_transsys_instance_components(&ti);
+      return (-1.0);
+    }
+  }
+  c = clock() - c;
+  for (i = 0; i < tr->num_factors; i++)
+  {
+    final_concentration[i] = ti.factor_concentration[i];
+  }
+  if (value)
+  {
+    free(value);
+  }
+  free_transsys_instance_components(&ti);
+  return ((double) c / CLOCKS_PER_SEC);
+}
+
+
+static int benchmark_transsys(FILE *outfile, const TRANSSYS *tr, unsigned long num_timesteps, int num_repeats, unsigned int rndseed, double factorconc_init)
+{
+  TRANSSYS_BYTECODE *bc;
+  double *tree_concentration, *bytecode_concentration;
+  double tree_time, bytecode_time;
+  int i, identical = 1;
+
+  bc = new_transsys_bytecode(tr);
+  if (bc == NULL)
+  {
+    fprintf(stderr, "benchmark_transsys: failed to compile transsys \"%s\"\n", tr->name);
+    return (-1);
+  }
+  tree_concentration = (double *) malloc(2 * (tr->num_factors > 0 ? tr->num_factors : 1) * sizeof(double));
+  if (tree_concentration == NULL)
+  {
+    fprintf(stderr, "benchmark_transsys: malloc failed\n");
+    free_transsys_bytecode(bc);
+    return (-1);
+  }
+  bytecode_concentration = tree_concentration + tr->num_factors;
+  tree_time = benchmark(tr, NULL, num_timesteps, num_repeats, rndseed, factorconc_init, tree_concentration);
+  bytecode_time = benchmark(tr, bc, num_timesteps, num_repeats, rndseed, factorconc_init, bytecode_concentration);
+  if ((tree_time < 0.0) || (bytecode_time < 0.0))
+  {
+    free(tree_concentration);
+    free_transsys_bytecode(bc);
+    return (-1);
+  }
+  for (i = 0; i < tr->num_factors; i++)
+  {
+    if (memcmp(tree_concentration + i, bytecode_concentration + i, sizeof(double)))
+    {
+      fprintf(stderr, "benchmark_transsys: transsys \"%s\", factor \"%s\": tree: %.17g, bytecode: %.17g\n", tr->name, tr->factor_list[i].name, tree_concentration[i], bytecode_concentration[i]);
+      identical = 0;
+    }
+  }
+  fprintf(outfile, "%s: %d factors, %d genes, %d instructions (%d dynamic), tree: %g s, bytecode: %g s, speedup: %g, %s\n",
+	  tr->name, tr->num_factors, tr->num_genes, bc->num_instructions, bc->num_dynamic_instructions, tree_time, bytecode_time,
+	  bytecode_time > 0.0 ? tree_time / bytecode_time : 0.0, identical ? "identical" : "DIFFERENT");
+  free(tree_concentration);
+  free_transsys_bytecode(bc);
+  return (identical ? 0 : -1);
+}
+
+
+int main(int argc, char **argv)
+{
+  int oc;
+  extern char *optarg;
+  extern int optind;
+  int yyreturn;
+  unsigned long num_timesteps = 1000;
+  int num_repeats = 100;
+  unsigned int rndseed = 1;
+  double factorconc_init = 1.0;
+  const TRANSSYS *tr;
+  int return_value = 0;
+
+  while ((oc = getopt(argc, argv, "f:n:r:s:h")) != -1)
+  {
+    switch(oc)
+    {
+    case 'f':
+      factorconc_init = strtod(optarg, NULL);
+      break;
+    case 'n':
+      num_timesteps = strtoul(optarg, NULL, 10);
+      break;
+    case 'r':
+      num_repeats = strtol(optarg, NULL, 10);
+      break;
+    case 's':
+      rndseed = strtoul(optarg, NULL, 10);
+      break;
+    case 'h':
+      printf("-f <num>: specify uniform initial factor concentration\n");
+      printf("-n <num>: specify number of time steps\n");
+      printf("-r <num>: specify number of repeats\n");
+      printf("-s <num>: specify random seed\n");
+      printf("-h: print this help and exit\n");
+      exit(EXIT_SUCCESS);
+    }
+  }
+  if (optind < argc)
+    yyin_name = argv[optind++];
+  if (yyin_name)
+  {
+    if ((yyin = fopen(yyin_name, "r")) == NULL)
+    {
+      fprintf(stderr, "Failed to open \"%s\" for input -- exit\n", yyin_name);
+      exit(EXIT_FAILURE);
+    }
+  }
+  else
+  {
+    yyin = stdin;
+    yyin_name = "stdin";
+  }
+  yyreturn = yyparse();
+  if (yyreturn)
+  {
+    fprintf(stderr, "Failed to parse from \"%s\" -- exit\n", yyin_name);
+    if (yyin != stdin)
+      fclose(yyin);
+    exit(EXIT_FAILURE);
+  }
+  for (tr = parsed_transsys; tr; tr = tr->next)
+  {
+    if (benchmark_transsys(stdout, tr, num_timesteps, num_repeats, rndseed, factorconc_init) != 0)
+    {
+      return_value = -1;
+    }
+  }
+  free_lsys_list(parsed_lsys);
+  free_transsys_list(parsed_transsys);
+  if (yyin != stdin)
+    fclose(yyin);
+  if (return_value)
+  {
+    fprintf(stderr, "transbench: benchmark failed -- exit\n");
+    exit(EXIT_FAILURE);
+  }
+  return (EXIT_SUCCESS);
+}
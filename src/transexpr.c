@@ -145,20 +145,6 @@ static int factor_concentrations_from_string(TRANSSYS_INSTANCE *ti, const char *
 }
 
 
-static int fprint_null_expression_line(FILE *outfile, const TRANSSYS *transsys, unsigned long t)
-{
-  int i;
-
-  fprintf(outfile, "%lu 0", t);
-  for (i = 0; i < transsys->num_factors; i++)
-  {
-    fprintf(outfile, "  0.0 0.0");
-  }
-  fprintf(outfile, "\n");
-  return (0);
-}
-
-
 /*
  * expression_record_version *must* be incremented each time the record
  * format changes *semantically*. It should not be changed on other
@@ -178,11 +164,27 @@ static int fprint_null_expression_line(FILE *outfile, const TRANSSYS *transsys,
 
 static const char *expression_record_version = "1.0";
 
-static void fprint_expression_header(FILE *f, const TRANSSYS *transsys, const LSYS *lsys)
+static const char *expression_record_column[] = {"time", "n.instances"};
+static const char *expression_record_factor_suffix[] = {".avg", ".stddev", ".entropy"};
+
+
+/*
+ * With binary nonzero, the header of a binary table (see bintable.c)
+ * is written, and records are written as rows of that table.
+ */
+
+static void fprint_expression_header(FILE *f, const TRANSSYS *transsys, const LSYS *lsys, int binary)
 {
+  char kind[64];
   int i;
   time_t t;
 
+  if (binary)
+  {
+    sprintf(kind, "transexpr %s", expression_record_version);
+    fprint_binary_table_header(f, kind, transsys, lsys, 2, expression_record_column, 3, expression_record_factor_suffix);
+    return;
+  }
   fprintf(f, "# transsys expression records %s\n", expression_record_version);
   fprintf(f, "# transsys %s\n", transsys->name);
   if (lsys)
@@ -209,7 +211,18 @@ static void fprint_expression_header(FILE *f, const TRANSSYS *transsys, const LS
  * the record format.
  */
 
-int fprint_expression_record(FILE *outfile, TRANSSYS_INSTANCE **ti, unsigned long t)
+static size_t expression_record_size(const TRANSSYS *transsys)
+{
+  return (2 + 3 * transsys->num_factors);
+}
+
+
+/*
+ * Compute the values of the expression record of the instances ti
+ * at time step t, in the order of the record format, in record.
+ */
+
+static int compute_expression_record(TRANSSYS_INSTANCE **ti, unsigned long t, double *record)
 {
   size_t i, f, n;
   double d, *average, *stddev, *entropy;
@@ -218,14 +231,14 @@ int fprint_expression_record(FILE *outfile, TRANSSYS_INSTANCE **ti, unsigned lon
   average = (double *) malloc(2 * transsys->num_factors * sizeof(double));
   if (average == NULL)
   {
-    fprintf(stderr, "fprint_expression_record: malloc failed\n");
+    fprintf(stderr, "compute_expression_record: malloc failed\n");
     return (-1);
   }
   stddev = average + transsys->num_factors;
   entropy = transsys_collection_factor_entropy(ti);
   if (entropy == NULL)
   {
-    fprintf(stderr, "fprint_expression_record: transsys_collection_factor_entropy failed\n");
+    fprintf(stderr, "compute_expression_record: transsys_collection_factor_entropy failed\n");
     free(average);
     return (-1);
   }
@@ -260,18 +273,95 @@ int fprint_expression_record(FILE *outfile, TRANSSYS_INSTANCE **ti, unsigned lon
       stddev[f] = sqrt(stddev[f]) / (n - 1);
     }
   }
-  fprintf(outfile, "%lu %lu", t, (unsigned long) n);
+  record[0] = t;
+  record[1] = n;
   for (f = 0; f < transsys->num_factors; f++)
   {
-    fprintf(outfile, "  %g %g %g", average[f], stddev[f], entropy[f]);
+    record[2 + 3 * f] = average[f];
+    record[3 + 3 * f] = stddev[f];
+    record[4 + 3 * f] = entropy[f];
   }
-  fprintf(outfile, "\n");
   free(average);
   free(entropy);
   return (0);
 }
 
 
+/*
+ * Write the expression record of ti at time step t, as a line of
+ * text or, if binary is nonzero, as a row of a binary table.
+ */
+
+int fprint_expression_record(FILE *outfile, TRANSSYS_INSTANCE **ti, unsigned long t, int binary)
+{
+  const TRANSSYS *transsys = ti[0]->transsys;
+  double *record;
+  size_t f;
+
+  record = (double *) malloc(expression_record_size(transsys) * sizeof(double));
+  if (record == NULL)
+  {
+    fprintf(stderr, "fprint_expression_record: malloc failed\n");
+    return (-1);
+  }
+  if (compute_expression_record(ti, t, record) != 0)
+  {
+    free(record);
+    return (-1);
+  }
+  if (binary)
+  {
+    if (fwrite_binary_table_row(outfile, expression_record_size(transsys), record) != 0)
+    {
+      free(record);
+      return (-1);
+    }
+    free(record);
+    return (0);
+  }
+  fprintf(outfile, "%lu %lu", t, (unsigned long) record[1]);
+  for (f = 0; f < transsys->num_factors; f++)
+  {
+    fprintf(outfile, "  %g %g %g", record[2 + 3 * f], record[3 + 3 * f], record[4 + 3 * f]);
+  }
+  fprintf(outfile, "\n");
+  free(record);
+  return (0);
+}
+
+
+static int fprint_null_expression_line(FILE *outfile, const TRANSSYS *transsys, unsigned long t, int binary)
+{
+  double *record;
+  size_t i;
+
+  if (binary)
+  {
+    record = (double *) calloc(expression_record_size(transsys), sizeof(double));
+    if (record == NULL)
+    {
+      fprintf(stderr, "fprint_null_expression_line: calloc failed\n");
+      return (-1);
+    }
+    record[0] = t;
+    if (fwrite_binary_table_row(outfile, expression_record_size(transsys), record) != 0)
+    {
+      free(record);
+      return (-1);
+    }
+    free(record);
+    return (0);
+  }
+  fprintf(outfile, "%lu 0", t);
+  for (i = 0; i < transsys->num_factors; i++)
+  {
+    fprintf(outfile, "  0.0 0.0");
+  }
+  fprintf(outfile, "\n");
+  return (0);
+}
+
+
 void free_ti_array(TRANSSYS_INSTANCE **ti)
 {
   size_t i;
@@ -348,7 +438,7 @@ int init_ti_array(TRANSSYS_INSTANCE **ti, double factorconc_init, const char *fa
 }
 
 
-static int transexpr(FILE *outfile, const TRANSSYS *transsys, unsigned int rndseed, int num_repeats, unsigned long num_timesteps, unsigned long output_period, double factorconc_init, const char *factorconc_init_string, FILE *plotcmdfile, const char *outfile_name, int plot_extensiveness)
+static int transexpr(FILE *outfile, const TRANSSYS *transsys, unsigned int rndseed, int num_repeats, unsigned long num_timesteps, unsigned long output_period, double factorconc_init, const char *factorconc_init_string, FILE *plotcmdfile, const char *outfile_name, int plot_extensiveness, int binary)
 {
   TRANSSYS_INSTANCE **ti;
   unsigned long t;
@@ -375,12 +465,12 @@ static int transexpr(FILE *outfile, const TRANSSYS *transsys, unsigned int rndse
   {
     fprint_plotcommands(plotcmdfile, transsys, outfile_name, plot_extensiveness);
   }
-  fprint_expression_header(outfile, transsys, NULL);
+  fprint_expression_header(outfile, transsys, NULL, binary);
   for (t = 0; t < num_timesteps; t++)
   {
     if ((t % output_period) == 0)
     {
-      fprint_expression_record(outfile, ti, t);
+      fprint_expression_record(outfile, ti, t, binary);
     }
     for (r = 0; r < num_repeats; r++)
     {
@@ -430,12 +520,17 @@ static TRANSSYS_INSTANCE **lsys_transsys_instance_array(const LSYS_STRING *lstr,
 }
 
 
-static int transexpr_lsys(FILE *outfile, FILE *entropyfile, const LSYS *lsys, const TRANSSYS *transsys, const char *symbol_name, unsigned int rndseed, unsigned long num_timesteps, unsigned long output_period, FILE *plotcmdfile, const char *outfile_name, int plot_extensiveness)
+/*
+ * Checkpoints and resuming from snapshots are handled as in ltransexpr.
+ */
+
+static int transexpr_lsys(FILE *outfile, FILE *entropyfile, const LSYS *lsys, const TRANSSYS *transsys, const char *symbol_name, unsigned int rndseed, unsigned long num_timesteps, unsigned long output_period, FILE *plotcmdfile, const char *outfile_name, int plot_extensiveness, const char *checkpoint_filename, unsigned long checkpoint_period, const char *resume_filename, int reseed, int binary)
 {
+  URANDOM_STATE urandom_state;
   LSYS_STRING *lstr, *dstr;
   TRANSSYS_INSTANCE **ti = NULL;
   double *entropy_lsys = NULL, *entropy_expression = NULL, *entropy_diffusion = NULL;
-  unsigned long t;
+  unsigned long t, t_start = 0;
   size_t n, i, f;
   int symbol_index = -2;  /* initialiser pacifies -Wall */
   int return_value;
@@ -453,11 +548,36 @@ static int transexpr_lsys(FILE *outfile, FILE *entropyfile, const LSYS *lsys, co
   {
     fprint_plotcommands(plotcmdfile, transsys, outfile_name, plot_extensiveness);
   }
-  ulong_srandom(rndseed);
-  lstr = axiom_string(lsys);
-  fprint_expression_header(outfile, transsys, lsys);
-  for (t = 0; t < num_timesteps; t++)
+  urandom_state_seed(&urandom_state, rndseed);
+  if (resume_filename)
   {
+    lstr = load_lsys_string_snapshot(resume_filename, lsys, &urandom_state, NULL, &t_start);
+    if ((lstr != NULL) && (reseed || (lstr->urandom_state == NULL)))
+    {
+      urandom_state_seed(&urandom_state, rndseed);
+      set_lsys_string_urandom_state(lstr, &urandom_state);
+    }
+  }
+  else
+  {
+    lstr = axiom_string_urandom(lsys, &urandom_state);
+  }
+  if (lstr == NULL)
+  {
+    fprintf(stderr, "transexpr_lsys: failed to set up initial string of lsys \"%s\"\n", lsys->name);
+    return (-1);
+  }
+  fprint_expression_header(outfile, transsys, lsys, binary);
+  for (t = t_start; t < num_timesteps; t++)
+  {
+    if (checkpoint_filename && (t > t_start) && (checkpoint_period > 0) && ((t % checkpoint_period) == 0))
+    {
+      if (save_lsys_string_snapshot(checkpoint_filename, lstr, t) != 0)
+      {
+	free_lsys_string(lstr);
+	return (-1);
+      }
+    }
     if ((t % output_period) == 0)
     {
       ti = lsys_transsys_instance_array(lstr, transsys, symbol_index);
@@ -481,11 +601,11 @@ static int transexpr_lsys(FILE *outfile, FILE *entropyfile, const LSYS *lsys, co
       }
       if (n > 0)
       {
-	fprint_expression_record(outfile, ti, t);
+	fprint_expression_record(outfile, ti, t, binary);
       }
       else
       {
-	fprint_null_expression_line(outfile, transsys, t);
+	fprint_null_expression_line(outfile, transsys, t, binary);
       }
       if (entropyfile)
       {
@@ -545,6 +665,15 @@ static int transexpr_lsys(FILE *outfile, FILE *entropyfile, const LSYS *lsys, co
     }
     lstr = dstr;
   }
+  if (checkpoint_filename)
+  {
+    if (save_lsys_string_snapshot(checkpoint_filename, lstr, t) != 0)
+    {
+      free_lsys_string(lstr);
+      return (-1);
+    }
+  }
+  free_lsys_string(lstr);
   return (0);
 }
 
@@ -568,11 +697,27 @@ int main(int argc, char **argv)
   unsigned int rndseed = 1;
   int num_repeats = 1;
   const char *symbol_name = NULL;
+  const char *checkpoint_filename = NULL, *resume_filename = NULL;
+  unsigned long checkpoint_period = 0;
+  int reseed = 0;
+  int binary = 0;
 
-  while ((oc = getopt(argc, argv, "c:e:d:F:f:n:t:s:r:y:lh")) != -1)
+  while ((oc = getopt(argc, argv, "bC:c:e:d:F:f:k:n:R:t:s:r:y:lh")) != -1)
   {
     switch(oc)
     {
+    case 'b':
+      binary = 1;
+      break;
+    case 'C':
+      checkpoint_filename = optarg;
+      break;
+    case 'k':
+      checkpoint_period = strtoul(optarg, NULL, 10);
+      break;
+    case 'R':
+      resume_filename = optarg;
+      break;
     case 'l':
       lsys_mode = 1;
       break;
@@ -599,6 +744,7 @@ int main(int argc, char **argv)
       break;
     case 's':
       rndseed = strtoul(optarg, NULL, 10);
+      reseed = 1;
       break;
     case 'r':
       num_repeats = strtol(optarg, NULL, 10);
@@ -608,11 +754,15 @@ int main(int argc, char **argv)
       break;
     case 'h':
       printf("-l: run in lsys mode\n");
+      printf("-b: write output as binary table (header and rows of doubles)\n");
       printf("-c <filename>: specify gnuplot command file\n");
       printf("-f <num>: specify uniform initial factor concentration\n");
       printf("-d <intnum>: specify period of output (i.e. 0, d, 2*d etc. will be printed)\n");
       printf("-F <string>: specify initial factor concentrations (ws separated)\n");
       printf("-n <num>: specify number of time steps\n");
+      printf("-C <filename>: save snapshots of the lsys string to file (checkpoints, lsys mode)\n");
+      printf("-k <num>: specify period of checkpoints (default: only after last time step)\n");
+      printf("-R <filename>: resume derivation from snapshot in file (lsys mode, fork it if -s is given)\n");
       printf("-r <num>: specify number of repeats\n");
       printf("-t <name>: specify name of transsys to process\n");
       printf("-s <num>: specify random seed\n");
@@ -699,7 +849,12 @@ int main(int argc, char **argv)
       fclose(outfile);
     exit(EXIT_FAILURE);
   }
-  if (lsys_mode)
+  if (binary && ((lsys_mode && parsed_lsys && parsed_lsys->next) || (!lsys_mode && !transsys_name && parsed_transsys && parsed_transsys->next)))
+  {
+    fprintf(stderr, "transexpr: binary output is restricted to one table, specify transsys by name (-t) or use a file with one lsys\n");
+    return_value = -1;
+  }
+  else if (lsys_mode)
   {
     if (transsys_name)
     {
@@ -708,7 +863,7 @@ int main(int argc, char **argv)
       {
 	for (lsys = parsed_lsys; lsys; lsys = lsys->next)
 	{
-	  return_value = transexpr_lsys(outfile, entropyfile, lsys, tr, symbol_name, rndseed, num_timesteps, output_period, plotcmdfile, outfile_name, plot_extensiveness);
+	  return_value = transexpr_lsys(outfile, entropyfile, lsys, tr, symbol_name, rndseed, num_timesteps, output_period, plotcmdfile, outfile_name, plot_extensiveness, checkpoint_filename, checkpoint_period, resume_filename, reseed, binary);
 	  if (return_value != 0)
 	  {
 	    break;
@@ -734,7 +889,7 @@ int main(int argc, char **argv)
       tr = find_transsys_by_name(parsed_transsys, transsys_name);
       if (tr)
       {
-	transexpr(outfile, tr, rndseed, num_repeats, num_timesteps, output_period, factorconc_init, factorconc_init_string, plotcmdfile, outfile_name, plot_extensiveness);
+	transexpr(outfile, tr, rndseed, num_repeats, num_timesteps, output_period, factorconc_init, factorconc_init_string, plotcmdfile, outfile_name, plot_extensiveness, binary);
       }
       else
       {
@@ -746,7 +901,7 @@ int main(int argc, char **argv)
     {
       for (tr = parsed_transsys; tr; tr = tr->next)
       {
-	return_value = transexpr(outfile, tr, rndseed, num_repeats, num_timesteps, output_period, factorconc_init, factorconc_init_string, plotcmdfile, outfile_name, plot_extensiveness);
+	return_value = transexpr(outfile, tr, rndseed, num_repeats, num_timesteps, output_period, factorconc_init, factorconc_init_string, plotcmdfile, outfile_name, plot_extensiveness, binary);
 	if (return_value != 0)
 	{
 	  break;
@@ -81,6 +81,10 @@ extern long int ulong_random(void);
 extern unsigned long random_long(unsigned long range);
 extern double urandom_double(void);
 extern double urandom_gauss(void);
+extern void urandom_state_seed(URANDOM_STATE *urandom_state, unsigned int seed);
+extern long urandom_state_random(URANDOM_STATE *urandom_state);
+extern double urandom_state_double(URANDOM_STATE *urandom_state);
+extern double urandom_state_gauss(URANDOM_STATE *urandom_state);
 extern int write_rndgenerator_state(FILE *f);
 extern int read_rndgenerator_state(FILE *f);
 extern void seed_ulong_random(int seed);
@@ -141,19 +145,33 @@ extern void free_cell_components(CELL *cell);
 extern void free_cells(int num_cells, CELL *cell);
 extern int alloc_cell_components(CELL *c, const TRANSSYS *transsys);
 extern CELL *new_cells(int num_cells, const TRANSSYS *transsys);
+extern void init_mem_arena(MEM_ARENA *arena);
+extern void free_mem_arena_components(MEM_ARENA *arena);
+extern void *mem_arena_alloc(MEM_ARENA *arena, size_t size);
+extern void reset_mem_arena(MEM_ARENA *arena);
+extern void init_lsys_string_buffer(LSYS_STRING_BUFFER *buffer);
+extern void free_lsys_string_buffer_components(LSYS_STRING_BUFFER *buffer);
+extern MEM_ARENA *lsys_string_buffer_next_arena(LSYS_STRING_BUFFER *buffer);
 extern void free_symbol_instance_components(SYMBOL_INSTANCE *si);
 extern void free_symbol_instance_list(SYMBOL_INSTANCE *slist);
 extern SYMBOL_INSTANCE *new_symbol_instance(const LSYS_STRING *lsys_string, int symbol_index);
 extern SYMBOL_INSTANCE *clone_symbol_instance(const SYMBOL_INSTANCE *source, const LSYS_STRING *lsys_string);
+extern int init_symbol_instance(SYMBOL_INSTANCE *si, const LSYS_STRING *lsys_string, int symbol_index, double *concentration);
 extern void init_lsys_string_contact_graph_components(LSYS_STRING_CONTACT_GRAPH *g);
 extern void free_lsys_string_contact_graph_components(LSYS_STRING_CONTACT_GRAPH *g);
 extern void free_lsys_string_contact_graph(LSYS_STRING_CONTACT_GRAPH *g);
 extern int alloc_lsys_string_contact_graph_components(LSYS_STRING_CONTACT_GRAPH *g, size_t array_size);
 extern LSYS_STRING_CONTACT_GRAPH *new_lsys_string_contact_graph(size_t num_edges);
 extern int add_lsys_string_contact_edge(LSYS_STRING_CONTACT_GRAPH *g, int i1, int i2, int distance);
+extern void free_lsys_string_neighbourhood(LSYS_STRING_NEIGHBOURHOOD *n);
+extern LSYS_STRING_NEIGHBOURHOOD *new_lsys_string_neighbourhood(size_t num_symbols, size_t num_transsys, size_t num_group_symbols, size_t num_edges, size_t num_neighbours);
+extern int alloc_lsys_string_contact_edges(LSYS_STRING *lstr, size_t num_edges);
 extern int connect_lsys_string_symbols(LSYS_STRING *lstr, int i1, int i2, int distance);
+extern int connect_lsys_string_contact_graph(LSYS_STRING *lstr);
 extern void free_lsys_string(LSYS_STRING *lstr);
 extern int arrange_lsys_string_arrays(LSYS_STRING *lstr);
+extern int alloc_lsys_string_symbols(LSYS_STRING *lstr, size_t num_symbols);
+extern LSYS_STRING *new_lsys_string_arena(const LSYS *lsys, MEM_ARENA *arena);
 extern LSYS_STRING *new_lsys_string(const LSYS *lsys);
 
 extern int add_neighbor(CELL *cell1, CELL *cell2, double weight);
@@ -166,10 +184,23 @@ extern double max_concentration(int num_cells, const CELL *cell, int factor_no);
 extern size_t symbol_strlen(const SYMBOL_INSTANCE *symbol_string);
 extern size_t lsys_string_length(const LSYS_STRING *lstr);
 extern int lsys_string_expression(LSYS_STRING *lstr);
+extern int lsys_string_expression_threads(LSYS_STRING *lstr, int num_threads);
 extern int other_symbol_instance_index(const LSYS_STRING_CONTACT_EDGE *edge, int si_index);
 extern int lsys_string_diffusion(LSYS_STRING *lstr);
+extern int lsys_string_diffusion_threads(LSYS_STRING *lstr, int num_threads);
 extern LSYS_STRING *axiom_string(const LSYS *lsys);
+extern LSYS_STRING *axiom_string_urandom(const LSYS *lsys, URANDOM_STATE *urandom_state);
+extern LSYS_STRING *axiom_string_arena(const LSYS *lsys, URANDOM_STATE *urandom_state, MEM_ARENA *arena);
 extern LSYS_STRING *derived_string(LSYS_STRING *lstr);
+extern LSYS_STRING *derived_string_arena(LSYS_STRING *lstr, MEM_ARENA *arena);
+extern LSYS_STRING *derived_string_threads(LSYS_STRING *lstr, MEM_ARENA *arena, int num_threads);
+extern int lsys_uses_random(const LSYS *lsys);
+
+extern int write_lsys_string_snapshot(FILE *f, const LSYS_STRING *lstr, unsigned long timestep);
+extern LSYS_STRING *read_lsys_string_snapshot(FILE *f, const LSYS *lsys, URANDOM_STATE *urandom_state, MEM_ARENA *arena, unsigned long *timestep);
+extern int save_lsys_string_snapshot(const char *filename, const LSYS_STRING *lstr, unsigned long timestep);
+extern LSYS_STRING *load_lsys_string_snapshot(const char *filename, const LSYS *lsys, URANDOM_STATE *urandom_state, MEM_ARENA *arena, unsigned long *timestep);
+extern void set_lsys_string_urandom_state(LSYS_STRING *lstr, URANDOM_STATE *urandom_state);
 
 extern void fprint_transsys(FILE *f, int indent_depth, const TRANSSYS *transsys);
 
@@ -183,9 +214,23 @@ extern void fprint_symbol_instance(FILE *f, const SYMBOL_INSTANCE *si);
 extern void fprint_symbol_instance_list(FILE *f, const SYMBOL_INSTANCE *si, const char *sep);
 extern void fprint_lsys_string(FILE *f, const LSYS_STRING *lstr, const char *sep);
 extern void fprint_lsys_string_contact_graph(FILE *f, const LSYS_STRING *lstr);
+extern int fprint_binary_table_header(FILE *f, const char *kind, const TRANSSYS *transsys, const LSYS *lsys, int num_leading_columns, const char **leading_column, int num_factor_suffixes, const char **factor_suffix);
+extern int fwrite_binary_table_row(FILE *f, size_t num_columns, const double *row);
 extern double evaluate_expression(const EXPRESSION_NODE *expr, const TRANSSYS_INSTANCE **ti_list);
+extern double evaluate_expression_urandom(const EXPRESSION_NODE *expr, const TRANSSYS_INSTANCE **ti_list, URANDOM_STATE *urandom_state);
+extern int expression_uses_random(const EXPRESSION_NODE *expr);
+extern int transsys_uses_random(const TRANSSYS *transsys);
+extern int copy_transsys_values(TRANSSYS *dest, const TRANSSYS *src);
 
 extern int process_expression(TRANSSYS_INSTANCE *ti);
+extern int process_expression_bytecode(TRANSSYS_INSTANCE *ti, const TRANSSYS_BYTECODE *bc, double *value);
+extern int find_attractor(TRANSSYS_INSTANCE *ti, const TRANSSYS_BYTECODE *bc, double *value, long max_timesteps, double tolerance, int max_period, ATTRACTOR_INFO *attractor);
+
+extern int transsys_bytecode_compilable(const TRANSSYS *transsys);
+extern TRANSSYS_BYTECODE *new_transsys_bytecode(const TRANSSYS *transsys);
+extern void free_transsys_bytecode(TRANSSYS_BYTECODE *bc);
+extern double *new_bytecode_registers(const TRANSSYS_BYTECODE *bc);
+extern void evaluate_bytecode(const TRANSSYS_BYTECODE *bc, const TRANSSYS_INSTANCE *ti, double *value);
 
 extern int set_default_postscript_style(int eps, const TRANSSYS *transsys, POSTSCRIPT_STYLE *style);
 extern int postscript_transsys_init(FILE *f, const char *title, const POSTSCRIPT_STYLE *style);
@@ -186,12 +186,99 @@ struct tag_transsys
   char name[IDENTIFIER_MAX];
 };
 
+#define URANDOM_STATE_DEGREE 63
+
+/*
+ * state of a random number generator, equivalent to the global
+ * generator in urandom.c, for use in individual simulations
+ */
+typedef struct
+{
+  unsigned long table[URANDOM_STATE_DEGREE];
+  int front, rear;
+  int gauss_available;
+  double gauss_value;
+} URANDOM_STATE;
+
+/*
+ * Bytecode: a transsys program's expressions flattened into a
+ * sequence of instructions, each of which computes one value
+ * register from constants, factor concentrations or registers
+ * computed by preceding instructions. Common subexpressions are
+ * computed once per evaluation.
+ */
+typedef struct
+{
+  EXPR_NODE_TYPE type;
+  int argument[2];
+  int factor_index;
+  double value;
+} BYTECODE_INSTRUCTION;
+
+/*
+ * Registers are NO_INDEX for absent decay or synthesis expressions.
+ * dynamic_instruction lists the instructions that are not constant
+ * values, i.e. the ones that need to be evaluated in each step.
+ * Promoter elements are stored as parallel arrays, in order of genes
+ * and of elements within a gene's promoter: The promoter elements of
+ * gene i are the elements gene_promoter_start[i] up to (excluding)
+ * gene_promoter_start[i + 1], the binding factors of element p are
+ * binding_factor[promoter_binding_start[p]] up to (excluding)
+ * binding_factor[promoter_binding_start[p + 1]]. promoter_register1
+ * and promoter_register2 hold the values of expr1 and expr2, i.e.
+ * of the constitutive expression or of the Michaelis-Menten
+ * parameters km and vmax.
+ */
+typedef struct
+{
+  const TRANSSYS *transsys;
+  int num_instructions;
+  BYTECODE_INSTRUCTION *instruction;
+  int num_dynamic_instructions;
+  int *dynamic_instruction;
+  int *decay_register;
+  int *synthesis_register;
+  int *gene_product;
+  int *gene_promoter_start;
+  int num_promoters;
+  PROMOTERELEMENT_TYPE *promoter_type;
+  int *promoter_binding_start;
+  int *binding_factor;
+  int *promoter_register1;
+  int *promoter_register2;
+} TRANSSYS_BYTECODE;
+
+/*
+ * urandom_state is not owned by the transsys instance. If it is
+ * NULL, the global random number generator is used.
+ */
 typedef struct tag_transsys_instance
 {
   const TRANSSYS *transsys;
   double *factor_concentration, *new_concentration;
+  URANDOM_STATE *urandom_state;
 } TRANSSYS_INSTANCE;
 
+typedef enum
+{
+  ATTRACTOR_NONE,
+  ATTRACTOR_FIXEDPOINT,
+  ATTRACTOR_LIMITCYCLE
+} ATTRACTOR_TYPE;
+
+/*
+ * Attractor reached by a transsys instance, as found by find_attractor.
+ * timestep is the time step at which the attractor was detected, i.e.
+ * the state at timestep is within tolerance of the state at
+ * timestep - period. For a fixed point, period is 1.
+ */
+typedef struct
+{
+  ATTRACTOR_TYPE type;
+  long timestep;
+  int period;
+} ATTRACTOR_INFO;
+
 typedef struct tag_cell
 {
   int existing, alive;
@@ -305,6 +392,13 @@ typedef struct tag_lsys
   SYMBOL_PRODUCTION *axiom;
   RULE_ELEMENT *rule_list;
   const TRANSSYS **transsys_list;
+  /* rule dispatch index, set up when the lsys is arrayed: the rules
+     that can apply to symbol i are rule_dispatch[rule_dispatch_start[i]]
+     to rule_dispatch[rule_dispatch_start[i + 1] - 1], these are indices
+     into rule_list in ascending order */
+  int *rule_dispatch_start;
+  int *rule_dispatch;
+  int max_lhs_length;
 } LSYS;
 
 
@@ -359,15 +453,107 @@ typedef struct
   LSYS_STRING_CONTACT_EDGE *edge;
 } LSYS_STRING_CONTACT_GRAPH;
 
+/*
+ * Neighbourhoods of the symbol instances of an lsys string for
+ * diffusion, in compressed sparse row form. The neighbours of symbol i
+ * are the contacting symbols with the same transsys, their indices are
+ * neighbour_index[neighbour_start[i]] ... neighbour_index[neighbour_start[i + 1] - 1]
+ * and neighbour_edge contains the corresponding contact edges.
+ * The symbols with neighbours and the contact edges along which
+ * diffusion takes place (i.e. edges connecting symbols with the same
+ * transsys) are grouped by transsys: group g comprises the
+ * symbols symbol[symbol_start[g]] ... symbol[symbol_start[g + 1] - 1]
+ * and the edges edge[edge_start[g]] ... edge[edge_start[g + 1] - 1],
+ * with symbols and edges in the same order as in the lsys string and
+ * in the contact graph, respectively.
+ * gradient, transferred_amount, mean_concentration and gradient_sum
+ * are workspace for the concentration gradients and the amounts to be
+ * transferred along the edges of one factor, parallel to neighbour_index
+ * and to symbol, respectively. If there are no edges along which
+ * diffusion takes place, num_transsys is 0 and no neighbourhoods
+ * are stored.
+ */
+
+typedef struct
+{
+  size_t num_transsys;
+  const TRANSSYS **transsys;
+  size_t *symbol_start;
+  int *symbol;
+  size_t *edge_start;
+  LSYS_STRING_CONTACT_EDGE **edge;
+  size_t *neighbour_start;
+  int *neighbour_index;
+  LSYS_STRING_CONTACT_EDGE **neighbour_edge;
+  double *gradient;
+  double *transferred_amount;
+  double *mean_concentration;
+  double *gradient_sum;
+} LSYS_STRING_NEIGHBOURHOOD;
+
+/*
+ * Memory arena: memory is allocated sequentially from large blocks and
+ * is released all at once by resetting the arena. Resetting keeps the
+ * memory for reuse, merging multiple blocks into one, so allocating
+ * the same amount again does not require any malloc calls.
+ * num_allocations counts the allocations served by the arena,
+ * num_block_allocations counts the blocks allocated by malloc.
+ */
+
+typedef struct tag_mem_arena_block
+{
+  struct tag_mem_arena_block *next;
+  size_t size, used;
+} MEM_ARENA_BLOCK;
+
+typedef struct
+{
+  MEM_ARENA_BLOCK *block;
+  size_t block_size;
+  unsigned long num_allocations;
+  unsigned long num_block_allocations;
+} MEM_ARENA;
+
+/*
+ * Pair of arenas for deriving series of lsys strings: successive
+ * strings are allocated in alternate arenas, so that each string
+ * reuses the memory of the string two steps before.
+ */
+
+typedef struct
+{
+  MEM_ARENA arena[2];
+  int current;
+} LSYS_STRING_BUFFER;
+
+/*
+ * Implementation notice: the neighbourhood is computed from the
+ * contact graph when it is first needed and kept until the lsys string
+ * is freed. It is NULL if it has not been computed, and must be freed
+ * and reset to NULL whenever the contact graph is changed.
+ */
+
+/*
+ * Implementation notice: if arena is not NULL, the string itself, its
+ * symbol instances with their factor concentrations and contact edge
+ * arrays and the contact graph are allocated in arena. They are not
+ * freed individually by free_lsys_string, but by resetting the arena,
+ * and they must not be reallocated.
+ */
+
 struct tag_lsys_string
 {
   const LSYS *lsys;
+  URANDOM_STATE *urandom_state;
   int arrayed;
   size_t num_symbols;
   SYMBOL_INSTANCE *symbol;
   LSYS_STRING_CONTACT_GRAPH contact_graph;
+  LSYS_STRING_NEIGHBOURHOOD *neighbourhood;
+  MEM_ARENA *arena;
 };
 
+
 /*
  * use for parsing / interfacing purposes only.
  */
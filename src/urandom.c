@@ -374,6 +374,87 @@ double urandom_gauss(void)
 }
 
 
+/*
+ * Re-entrant versions of the random number functions, operating
+ * on an URANDOM_STATE rather than on the global state. Seeding an
+ * URANDOM_STATE with a seed results in the same sequence as seeding
+ * the global generator with ulong_srandom().
+ */
+
+void urandom_state_seed(URANDOM_STATE *urandom_state, unsigned int seed)
+{
+  int i;
+
+  urandom_state->table[0] = seed;
+  for (i = 1; i < URANDOM_STATE_DEGREE; i++)
+  {
+#ifdef LINUX_RANDOM
+    urandom_state->table[i] = 1103515145L * urandom_state->table[i - 1] + 12345;
+#else
+    urandom_state->table[i] = 1103515245L * urandom_state->table[i - 1] + 12345;
+#endif
+  }
+  urandom_state->front = SEP_4;
+  urandom_state->rear = 0;
+  urandom_state->gauss_available = 0;
+  urandom_state->gauss_value = 0.0;
+  for (i = 0; i < 10 * URANDOM_STATE_DEGREE; i++)
+  {
+    (void) urandom_state_random(urandom_state);
+  }
+}
+
+
+long urandom_state_random(URANDOM_STATE *urandom_state)
+{
+  unsigned long *f = urandom_state->table + urandom_state->front;
+  long i;
+
+  *f += urandom_state->table[urandom_state->rear];
+  *f &= 0xffffffff;
+  i = (*f >> 1) & 0x7fffffffUL;
+  if (++urandom_state->front >= URANDOM_STATE_DEGREE)
+  {
+    urandom_state->front = 0;
+    ++urandom_state->rear;
+  }
+  else if (++urandom_state->rear >= URANDOM_STATE_DEGREE)
+  {
+    urandom_state->rear = 0;
+  }
+  return (i);
+}
+
+
+double urandom_state_double(URANDOM_STATE *urandom_state)
+{
+  return ((double) (urandom_state_random(urandom_state) & 0x7fffff) / 0x800000);
+}
+
+
+double urandom_state_gauss(URANDOM_STATE *urandom_state)
+{
+  double fac, rsq, v1, v2;
+
+  if (urandom_state->gauss_available)
+  {
+    urandom_state->gauss_available = 0;
+    return (urandom_state->gauss_value);
+  }
+  do
+  {
+    v1 = 2.0 * urandom_state_random(urandom_state) / 0x7fffffff - 1.0;
+    v2 = 2.0 * urandom_state_random(urandom_state) / 0x7fffffff - 1.0;
+    rsq = v1 * v1 + v2 * v2;
+  }
+  while ((rsq >= 1.0) || (rsq == 0.0));
+  fac = sqrt(-2.0 * log(rsq) / rsq);
+  urandom_state->gauss_value = v1 * fac;
+  urandom_state->gauss_available = 1;
+  return (v2 * fac);
+}
+
+
 int write_urandom_state(FILE *f)
 {
   int i;
@@ -426,8 +426,7 @@ def referencestate_concentration_matrix(network, timesteps) :
   """
   gfd = gene_factor_dictionary(network)  
   ti = transsys.TranssysInstance(network)
-  tseries = ti.time_series(timesteps, timesteps - 1)
-  reference_state = tseries[max(tseries.keys())]
+  reference_state = ti.simulate(timesteps - 1)
   ref_conc_matrix = ExpressionSimilarityMatrix('ref_conc_matrix', gfd )
   for fi in network.factor_names() :
     for fj in network.factor_names() :
@@ -458,8 +457,7 @@ carried out for timesteps timesteps.
     knockout_network.do_knockout(knockout_network.find_gene_index(gi))
     initial_state = ref_state.perturbed_copy(identity_perturber)
     initial_state.transsys_program = knockout_network
-    m_tseries = initial_state.time_series(timesteps, timesteps - 1)
-    this_mutant = m_tseries[max(m_tseries.keys())]
+    this_mutant = initial_state.simulate(timesteps - 1)
     for fi in wildtype_factor_names :
       # expression of fi is affected by knockout of gi as quantified by concentration of fi
       conc_matrix.set_element(gfd_wildtype[gi], fi, this_mutant.factor_concentration[knockout_network.find_factor_index(fi)])